@@ -11,99 +11,115 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import functools
 import logging
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Set, Tuple
 from Databases.connect_to_db import connect_to_database
+from Job.change_detection import drop_tables, fingerprint, fingerprinted_tables, plan_fingerprints
 from Job.alerts import send_alerts
+from Job.incremental_validation import DEFAULT_STATE_FILE, ValidationState, plan_incremental
+from Job.sampled_validation import plan_sampled, split_sampled
+from Job.validation_planner import plan_validation, validation_sql
+from Job.validation_runner import run_concurrently
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 
 def generate_sql_command(tests: List[Dict[str, Any]]) -> str:
-    sql_commands = []
-    for test in tests:
-        for table in test['target_tables']:
-            for test_detail in test['tests']:
-                test_type = test_detail['type']
-                if test_type == 'row_count':
-                    threshold = test_detail.get('threshold', 1)  # Default threshold is 1
-                    sql_commands.append(f"""
-                        SELECT 'row_count' AS test_type, '{table}' AS table_name,
-                               COUNT(*) < {threshold} AS error
-                        FROM {table}
-                    """)
-                elif test_type == 'default_value_check':
-                    column = test_detail['column']
-                    default_value = test_detail['default_value']
-                    sql_commands.append(f"""
-                        SELECT 'default_value_check' AS test_type, '{table}' AS table_name,
-                               COUNT(*) > 0 AS error
-                        FROM {table}
-                        WHERE {column} != '{default_value}'
-                    """)
-                elif test_type == 'primary_key_uniqueness':
-                    column = test_detail['column']
-                    if isinstance(column, dict):
-                        column_name = column.get(table, None)
-                        if column_name:
-                            sql_commands.append(f"""
-                                SELECT 'primary_key_uniqueness' AS test_type, '{table}' AS table_name,
-                                       COUNT(*) > 1 AS error
-                                FROM {table}
-                                GROUP BY {column_name}
-                                HAVING COUNT(*) > 1
-                            """)
-                    else:
-                        sql_commands.append(f"""
-                            SELECT 'primary_key_uniqueness' AS test_type, '{table}' AS table_name,
-                                   COUNT(*) > 1 AS error
-                            FROM {table}
-                            GROUP BY {column}
-                            HAVING COUNT(*) > 1
-                        """)
-                elif test_type == 'foreign_key':
-                    foreign_key = test_detail['foreign_key']
-                    reference_table = test_detail['reference_table']
-                    reference_key = test_detail['reference_key']
-                    sql_commands.append(f"""
-                        SELECT 'foreign_key' AS test_type, '{table}' AS table_name,
-                               COUNT(*) > 0 AS error
-                        FROM {table}
-                        LEFT JOIN {reference_table} ON {table}.{foreign_key} = {reference_table}.{reference_key}
-                        WHERE {reference_table}.{reference_key} IS NULL
-                    """)
-                elif test_type == 'null_check':
-                    column = test_detail['column']
-                    sql_commands.append(f"""
-                        SELECT 'null_check' AS test_type, '{table}' AS table_name,
-                               COUNT(*) > 0 AS error
-                        FROM {table}
-                        WHERE {column} IS NULL
-                    """)
-                elif test_type == 'unique_value_check':
-                    column = test_detail['column']
-                    sql_commands.append(f"""
-                        SELECT 'unique_value_check' AS test_type, '{table}' AS table_name,
-                               COUNT(*) > 1 AS error
-                        FROM {table}
-                        GROUP BY {column}
-                        HAVING COUNT(*) > 1
-                    """)
-                elif test_type == 'data_range_check':
-                    column = test_detail['column']
-                    start_date = test_detail['start_date']
-                    end_date = test_detail['end_date']
-                    sql_commands.append(f"""
-                        SELECT 'data_range_check' AS test_type, '{table}' AS table_name,
-                               COUNT(*) > 0 AS error
-                        FROM {table}
-                        WHERE {column} < '{start_date}' OR {column} > '{end_date}'
-                    """)
-                elif test_type == 'custom_query':
-                    query = test_detail['query']
-                    sql_commands.append(query)
-    return ' UNION ALL '.join(sql_commands)
+    """
+    One statement returning (test_type, table_name, error) rows for `tests`. The row-level
+    checks of each table share one scan; see Job.validation_planner.
+    """
+    return validation_sql(tests)
+
+
+def _skip_unchanged(state: ValidationState, connect, sql_flavour: str, tests: List[Dict[str, Any]],
+                    max_connections: int, query_timeout: Optional[float], sampling: bool) -> Tuple[Dict[str, str], Set[str]]:
+    """Fingerprint the tables of `tests` that ask for it, returning the fingerprints and the unchanged tables."""
+    rows = {}
+    for outcome in run_concurrently(plan_fingerprints(tests, sql_flavour), connect, max_connections, query_timeout):
+        if outcome.failure is not None:
+            logger.warning(f"Could not fingerprint table '{outcome.query.table}', checking the tables it is part of: "
+                           f"{outcome.failure}")
+        else:
+            rows[outcome.query.table] = outcome.rows
+    fingerprints = {}
+    for table, references in fingerprinted_tables(tests).items():
+        if table in rows and references <= rows.keys():
+            fingerprints[table] = fingerprint(rows[table], tests, table, sampling,
+                                              {reference: rows[reference] for reference in references})
+    unchanged = {table for table, value in fingerprints.items() if state.fingerprint(table) == value}
+    if unchanged:
+        logger.info(f"Skipping tables unchanged since they last passed: {', '.join(sorted(unchanged))}")
+    return fingerprints, unchanged
+
+
+def _validate_concurrently(connect, sql_flavour: str, error_reporting: Optional[List[Dict[str, Any]]],
+                           tests: List[Dict[str, Any]], max_connections: int, query_timeout: Optional[float],
+                           state_file: str, sampling: bool) -> None:
+    """Run the planned queries side by side, alerting on each failing query as soon as it completes."""
+    stateful = any(test.get('incremental') or test.get('fingerprint') for test in tests)
+    state = ValidationState(state_file) if stateful else None
+    try:
+        fingerprints: Dict[str, str] = {}
+        if state is not None:
+            fingerprints, unchanged = _skip_unchanged(state, connect, sql_flavour, tests, max_connections,
+                                                      query_timeout, sampling)
+            tests = drop_tables(tests, unchanged)
+
+        exact = [test for test in tests if not test.get('incremental')]
+        sampled: List[Dict[str, Any]] = []
+        if sampling:
+            exact, sampled = split_sampled(exact)
+        plan = plan_validation(exact)
+        finishers, fetchers = {}, {}
+        for query, finish in plan_sampled(sampled, sql_flavour):
+            plan.append(query)
+            finishers[query] = finish
+        if state is not None:
+            for query, finish, fetch in plan_incremental(tests, state):
+                plan.append(query)
+                if finish is not None:
+                    finishers[query] = finish
+                if fetch is not None:
+                    fetchers[query] = fetch
+
+        failed_tables = set()
+        for outcome in run_concurrently(plan, connect, max_connections, query_timeout, fetchers):
+            failure, rows = outcome.failure, outcome.rows
+            if failure is None and outcome.query in finishers:
+                try:
+                    rows = finishers[outcome.query](rows)
+                except Exception as e:
+                    failure = f"{e.__class__.__name__}: {e}"
+            if failure is not None:
+                table = outcome.query.table or 'custom query'
+                failed_tables.add(table)
+                error_messages = [f"Test '{test_type}' could not run on table '{table}': {failure}."
+                                  for test_type in outcome.query.checks]
+            else:
+                error_messages = []
+                for result in rows:
+                    test_type, table_name, error = result[:3]
+                    if error:
+                        failed_tables.add(table_name)
+                        # Sampled checks add an estimate of the failure rate
+                        detail = f" ({result[3]})" if len(result) > 3 else ''
+                        error_messages.append(f"Test '{test_type}' failed on table '{table_name}'{detail}.")
+            if error_messages:
+                send_alerts(error_reporting, error_messages)
+        if not failed_tables:
+            logger.info("All tests passed successfully.")
+
+        if fingerprints:
+            with state:
+                for table, value in fingerprints.items():
+                    if table not in failed_tables:
+                        state.store_fingerprint(table, value)
+    finally:
+        if state is not None:
+            state.close()
 
 
 def data_validate(
@@ -115,8 +131,40 @@ def data_validate(
     oauth_token: Optional[str],
     saml_response: Optional[str],
     error_reporting: Optional[List[Dict[str, Any]]],
-    tests: List[Dict[str, Any]]
+    tests: List[Dict[str, Any]],
+    max_connections: int = 1,
+    query_timeout: Optional[float] = None,
+    state_file: str = DEFAULT_STATE_FILE,
+    sampling: bool = True
 ) -> None:
+    """
+    Run `tests` and send an alert listing the failed ones. With `max_connections` above 1
+    or a `query_timeout`, the planned queries run separately over that many connections,
+    each cancelled after `query_timeout` seconds, and alerts go out as queries complete.
+    Test groups with an `incremental` setting run the same way, checking only the rows
+    added since the watermarks kept in `state_file`, and checks with a `sample` option
+    count a sample of their table unless `sampling` is off, as for exact nightly runs.
+    Groups with a `fingerprint` setting skip the tables unchanged since they last passed.
+    """
+    staged = any(test.get('incremental') or test.get('fingerprint') for test in tests) or (
+        sampling and any(test_detail.get('sample') for test in tests for test_detail in test['tests']))
+    if max_connections > 1 or query_timeout is not None or staged:
+        connect = functools.partial(
+            connect_to_database,
+            sql_flavour=sql_flavour,
+            auth_method=auth_method,
+            secret_name=secret_name,
+            config_file=config_file,
+            encryption_key=encryption_key,
+            oauth_token=oauth_token,
+            saml_response=saml_response
+        )
+        try:
+            _validate_concurrently(connect, sql_flavour, error_reporting, tests, max_connections, query_timeout,
+                                   state_file, sampling)
+        except Exception as e:
+            logger.error(f"Error running tests: {e}")
+        return
 
     conn = connect_to_database(
         sql_flavour=sql_flavour,
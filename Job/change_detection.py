@@ -0,0 +1,117 @@
+# Copyright 2024 Sola Richard Olorunfemi
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Skips the checks of tables that have not changed since they last passed.
+
+A test group with `fingerprint: true`, or `fingerprint: {column: UPDATED_AT}` for tables
+whose rows are updated in place, has a cheap fingerprint of each of its tables taken
+before any check runs:
+
+- on SQLite, the row count and highest rowid;
+- on Snowflake, ROW_COUNT and LAST_ALTERED from INFORMATION_SCHEMA.TABLES, which change
+  with every DML statement;
+- with a column, the row count and the column's highest value on either flavour.
+
+When a fingerprint matches the one stored after the table's last passing run, the
+table's checks in those groups are skipped; groups without `fingerprint` always run.
+Custom queries are not tied to a table and always run. The stored fingerprint includes a
+digest of the table's checks, so editing them forces a run, and the fingerprints of the
+tables its foreign_key checks reference, so that deleting referenced rows does too.
+"""
+import hashlib
+import json
+from typing import Any, Dict, Iterable, List, Optional, Set
+from Job.validation_planner import PlannedQuery
+
+
+def fingerprint_query(table: str, columns: Iterable[Optional[str]], sql_flavour: str) -> PlannedQuery:
+    """The query fingerprinting `table`, by its row count and the highest value of each of `columns`."""
+    columns = sorted(column for column in columns if column)
+    flavour = sql_flavour.lower()
+    if flavour == 'sqlite':
+        sql = f"SELECT {', '.join(['COUNT(*)', 'MAX(rowid)'] + [f'MAX({column})' for column in columns])} FROM {table}"
+    elif flavour == 'snowflake':
+        if columns:
+            sql = f"SELECT {', '.join(['COUNT(*)'] + [f'MAX({column})' for column in columns])} FROM {table}"
+        else:
+            *schema, name = table.upper().split('.')
+            if len(schema) == 2:
+                source, schema_filter = f"{schema[0]}.INFORMATION_SCHEMA.TABLES", f"'{schema[1]}'"
+            else:
+                source = "INFORMATION_SCHEMA.TABLES"
+                schema_filter = f"'{schema[0]}'" if schema else "CURRENT_SCHEMA()"
+            sql = (f"SELECT ROW_COUNT, LAST_ALTERED FROM {source} "
+                   f"WHERE TABLE_SCHEMA = {schema_filter} AND TABLE_NAME = '{name}'")
+    else:
+        raise ValueError(f"Unsupported sql_flavour: {sql_flavour}")
+    return PlannedQuery(table, ('fingerprint',), sql)
+
+
+def fingerprinted_tables(tests: List[Dict[str, Any]]) -> Dict[str, Set[str]]:
+    """The tables of the test groups that set `fingerprint`, each with the tables its foreign_key checks reference."""
+    references: Dict[str, Set[str]] = {}
+    for test in tests:
+        if not test.get('fingerprint'):
+            continue
+        referenced = {test_detail['reference_table'] for test_detail in test['tests']
+                      if test_detail['type'] == 'foreign_key'}
+        for table in test['target_tables']:
+            references.setdefault(table, set()).update(referenced)
+    return references
+
+
+def plan_fingerprints(tests: List[Dict[str, Any]], sql_flavour: str) -> List[PlannedQuery]:
+    """One fingerprint query per table of the test groups that set `fingerprint`, and per table they reference."""
+    columns: Dict[str, Set[Optional[str]]] = {}
+    for test in tests:
+        setting = test.get('fingerprint')
+        if not setting:
+            continue
+        column = setting.get('column') if isinstance(setting, dict) else None
+        for table in test['target_tables']:
+            columns.setdefault(table, set()).add(column)
+    for referenced in fingerprinted_tables(tests).values():
+        for table in referenced:
+            columns.setdefault(table, set())
+    return [fingerprint_query(table, table_columns, sql_flavour) for table, table_columns in columns.items()]
+
+
+def fingerprint(rows: List[Any], tests: List[Dict[str, Any]], table: str, sampling: bool,
+                references: Optional[Dict[str, List[Any]]] = None) -> str:
+    """
+    Fingerprint of `table` from the rows of its fingerprint query, the fingerprinted
+    checks configured on it and the fingerprint query rows of the tables they reference.
+    """
+    checks = [{key: value for key, value in test.items() if key != 'target_tables'}
+              for test in tests if test.get('fingerprint') and table in test['target_tables']]
+    digest = hashlib.sha256(json.dumps([checks, sampling], sort_keys=True, default=str).encode()).hexdigest()
+    referenced = [[name, [list(row) for row in reference_rows]] for name, reference_rows in sorted((references or {}).items())]
+    return json.dumps([[list(row) for row in rows], digest] + ([referenced] if referenced else []), default=str)
+
+
+def drop_tables(tests: List[Dict[str, Any]], tables: Set[str]) -> List[Dict[str, Any]]:
+    """`tests` without the checks on `tables` in the groups that set `fingerprint`, keeping their custom queries."""
+    kept = []
+    for test in tests:
+        if not test.get('fingerprint'):
+            kept.append(test)
+            continue
+        remaining = [table for table in test['target_tables'] if table not in tables]
+        dropped = [table for table in test['target_tables'] if table in tables]
+        if remaining:
+            kept.append(dict(test, target_tables=remaining))
+        custom = [test_detail for test_detail in test['tests'] if test_detail['type'] == 'custom_query']
+        if dropped and custom:
+            kept.append(dict(test, target_tables=dropped, tests=custom))
+    return kept
@@ -0,0 +1,300 @@
+# Copyright 2024 Sola Richard Olorunfemi
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Incremental validation of append-only tables.
+
+A test group with `incremental: {column: CREATED_DATETIME}` only checks the rows added
+since its previous run. For every table and check, the highest value of that column
+already validated is kept in a local SQLite state file, and the next run looks at the
+rows above it:
+
+- the row-level checks of a table share one scan of the new rows, and row_count adds
+  their number to the count kept from earlier runs;
+- foreign_key checks look up the references of the new rows only;
+- uniqueness checks fetch the keys of the new rows in batches, staging each batch, and
+  look them up in an index of the keys seen so far, kept in the same file per table,
+  watermark column and key column, once the fetch completes. NULL keys are not indexed;
+- custom queries run over the whole table every time.
+
+A watermark moves forward once its query completes, failed or not, so a bad row is
+reported on one run only. Rows are new when their value is strictly above the
+watermark, so the column must be strictly increasing from one load to the next: a row
+that arrives later with a value equal to or below the watermark is never checked.
+"""
+import json
+import sqlite3
+import threading
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+from Job.validation_planner import ROW_LEVEL_CHECKS, UNIQUENESS_CHECKS, PlannedQuery, plan_validation, row_predicate
+
+DEFAULT_STATE_FILE = 'validation_state.sqlite'
+FETCH_BATCH = 10000  # Keys fetched and indexed at a time by a uniqueness check
+
+
+class ValidationState:
+    """
+    Watermarks and seen keys of incremental checks, and the fingerprints of tables that
+    last passed (see Job.change_detection). Use as a context manager to commit a batch of
+    updates; uniqueness checks write from the validation worker threads, so the context
+    also holds the state's lock.
+    """
+
+    def __init__(self, path: str = DEFAULT_STATE_FILE):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.RLock()
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(seen_keys)")]
+        if columns and 'watermark_column' not in columns:
+            # Keys indexed before they were kept per watermark column; index them again
+            with self.conn:
+                self.conn.execute("DROP TABLE seen_keys")
+                self.conn.execute("DELETE FROM watermarks WHERE check_key LIKE 'uniqueness:%'")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS watermarks (
+                table_name TEXT NOT NULL,
+                watermark_column TEXT NOT NULL,
+                check_key TEXT NOT NULL,
+                watermark TEXT,
+                row_count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (table_name, watermark_column, check_key)
+            );
+            CREATE TABLE IF NOT EXISTS seen_keys (
+                table_name TEXT NOT NULL,
+                watermark_column TEXT NOT NULL,
+                key_column TEXT NOT NULL,
+                key_value NOT NULL,
+                PRIMARY KEY (table_name, watermark_column, key_column, key_value)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS fingerprints (
+                table_name TEXT PRIMARY KEY,
+                fingerprint TEXT NOT NULL
+            );
+            CREATE TEMP TABLE staged_keys (
+                table_name TEXT NOT NULL,
+                watermark_column TEXT NOT NULL,
+                key_column TEXT NOT NULL,
+                key_value NOT NULL,
+                PRIMARY KEY (table_name, watermark_column, key_column, key_value)
+            ) WITHOUT ROWID;
+        """)
+
+    def __enter__(self) -> 'ValidationState':
+        self._lock.acquire()
+        self.conn.__enter__()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        try:
+            self.conn.__exit__(*exc_info)
+        finally:
+            self._lock.release()
+
+    def watermark(self, table: str, column: str, check: str) -> Tuple[Optional[str], int]:
+        """The watermark of a check and the rows counted up to it, (None, 0) before its first run."""
+        row = self.conn.execute(
+            "SELECT watermark, row_count FROM watermarks WHERE table_name = ? AND watermark_column = ? AND check_key = ?",
+            (table, column, check)).fetchone()
+        return (row[0], row[1]) if row else (None, 0)
+
+    def advance(self, table: str, column: str, check: str, watermark: Optional[str], row_count: int = 0) -> None:
+        self.conn.execute("INSERT OR REPLACE INTO watermarks VALUES (?, ?, ?, ?, ?)",
+                          (table, column, check, watermark, row_count))
+
+    def record_keys(self, table: str, watermark_column: str, column: str, keys: List[Any]) -> int:
+        """Add `keys` to the index of `table`.`column` under a watermark column, returning how many of them were already in it."""
+        return self.stage_keys(table, watermark_column, column, keys) + self.commit_keys(table, watermark_column, column)
+
+    def stage_keys(self, table: str, watermark_column: str, column: str, keys: List[Any]) -> int:
+        """
+        Stage `keys` for commit_keys(), returning how many of them were already staged.
+        Staged keys are kept in a temporary table, so committing them writes nothing to the state file.
+        """
+        keys = [key if isinstance(key, (int, float, str, bytes)) else str(key) for key in keys if key is not None]
+        before = self.conn.total_changes
+        self.conn.executemany("INSERT OR IGNORE INTO staged_keys VALUES (?, ?, ?, ?)",
+                              ((table, watermark_column, column, key) for key in keys))
+        return len(keys) - (self.conn.total_changes - before)
+
+    def commit_keys(self, table: str, watermark_column: str, column: str) -> int:
+        """Move the staged keys of `table`.`column` into its index, returning how many of them were already in it."""
+        staged = (table, watermark_column, column)
+        # CROSS JOIN keeps the staged keys as the outer loop, probing the larger index
+        seen = self.conn.execute(
+            "SELECT COUNT(*) FROM staged_keys CROSS JOIN seen_keys USING (table_name, watermark_column, key_column, key_value) "
+            "WHERE table_name = ? AND watermark_column = ? AND key_column = ?", staged).fetchone()[0]
+        self.conn.execute("INSERT OR IGNORE INTO seen_keys "
+                          "SELECT * FROM staged_keys WHERE table_name = ? AND watermark_column = ? AND key_column = ?", staged)
+        self.discard_keys(*staged)
+        return seen
+
+    def discard_keys(self, table: str, watermark_column: str, column: str) -> None:
+        self.conn.execute("DELETE FROM staged_keys WHERE table_name = ? AND watermark_column = ? AND key_column = ?",
+                          (table, watermark_column, column))
+
+    def fingerprint(self, table: str) -> Optional[str]:
+        row = self.conn.execute("SELECT fingerprint FROM fingerprints WHERE table_name = ?", (table,)).fetchone()
+        return row[0] if row else None
+
+    def store_fingerprint(self, table: str, fingerprint: str) -> None:
+        self.conn.execute("INSERT OR REPLACE INTO fingerprints VALUES (?, ?)", (table, fingerprint))
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+class IncrementalQuery(NamedTuple):
+    query: PlannedQuery
+    # Turns the rows of the query into (test_type, table_name, error) rows, advancing watermarks; None when they already are
+    finish: Optional[Callable[[List[Any]], List[Tuple[str, str, Any]]]]
+    # Reads the rows passed to `finish` from the executed cursor, in place of fetchall()
+    fetch: Optional[Callable[[Any], List[Any]]] = None
+
+
+def _check_key(test_detail: Dict[str, Any]) -> str:
+    return json.dumps(test_detail, sort_keys=True, default=str)
+
+
+def _watermark(value: Any) -> Optional[str]:
+    return None if value is None else str(value)
+
+
+def _newer(column: str, watermark: Optional[str]) -> Optional[str]:
+    # Strictly above: rows at the watermark were validated by the run that set it
+    return None if watermark is None else f"{column} > '{watermark}'"
+
+
+def _row_level(state: ValidationState, table: str, column: str, tests: List[Dict[str, Any]]) -> IncrementalQuery:
+    checks = []
+    for test_detail in tests:
+        key = _check_key(test_detail)
+        checks.append((test_detail, key) + state.watermark(table, column, key))
+
+    selected, filters = [], set()
+    for test_detail, _, watermark, _ in checks:
+        newer = _newer(column, watermark)
+        filters.add(newer)
+        condition = ' AND '.join(f"({part})" for part in (newer, row_predicate(test_detail['type'], test_detail)) if part)
+        count = f"COUNT(CASE WHEN {condition} THEN 1 END)" if condition else "COUNT(*)"
+        selected.append(count if test_detail['type'] == 'row_count' else f"{count} > 0")
+        selected.append(f"MAX(CASE WHEN {newer} THEN {column} END)" if newer else f"MAX({column})")
+    where = '' if None in filters else ' WHERE ' + ' OR '.join(sorted(filters))
+    sql = f"SELECT {', '.join(selected)} FROM {table}{where}"
+
+    def finish(rows: List[Any]) -> List[Tuple[str, str, Any]]:
+        results = []
+        with state:
+            for index, (test_detail, key, watermark, row_count) in enumerate(checks):
+                value, newest = rows[0][2 * index], rows[0][2 * index + 1]
+                newest = watermark if newest is None else _watermark(newest)
+                if test_detail['type'] == 'row_count':
+                    row_count += value or 0
+                    error = row_count < test_detail.get('threshold', 1)  # Default threshold is 1
+                else:
+                    error = bool(value)
+                state.advance(table, column, key, newest, row_count)
+                results.append((test_detail['type'], table, error))
+        return results
+
+    return IncrementalQuery(PlannedQuery(table, tuple(test_detail['type'] for test_detail in tests), sql), finish)
+
+
+def _uniqueness(state: ValidationState, table: str, column: str, key_column: str, test_types: List[str]) -> IncrementalQuery:
+    check = f"uniqueness:{key_column}"
+    watermark, _ = state.watermark(table, column, check)
+    newer = _newer(column, watermark)
+    sql = f"SELECT {key_column}, {column} FROM {table}" + (f" WHERE {newer}" if newer else '')
+
+    def fetch(cursor: Any) -> List[Any]:
+        # The first run reads every key of the table, so they are staged a batch at a time,
+        # holding the state's lock only while a batch is written so that other queries can
+        # finish meanwhile. The keys move into the index with the watermark in one commit,
+        # or are dropped if the fetch fails.
+        duplicates, newest = 0, None
+        try:
+            while True:
+                rows = cursor.fetchmany(FETCH_BATCH)
+                if not rows:
+                    break
+                with state:
+                    duplicates += state.stage_keys(table, column, key_column, [row[0] for row in rows])
+                values = [row[1] for row in rows if row[1] is not None] + ([] if newest is None else [newest])
+                newest = max(values, default=None)
+            with state:
+                duplicates += state.commit_keys(table, column, key_column)
+                state.advance(table, column, check, watermark if newest is None else _watermark(newest))
+        finally:
+            with state:
+                state.discard_keys(table, column, key_column)
+        return [(duplicates,)]
+
+    def finish(rows: List[Any]) -> List[Tuple[str, str, Any]]:
+        duplicates, = rows[0]
+        return [(test_type, table, duplicates > 0) for test_type in test_types]
+
+    return IncrementalQuery(PlannedQuery(table, tuple(test_types), sql), finish, fetch)
+
+
+def _foreign_key(state: ValidationState, table: str, column: str, test_detail: Dict[str, Any]) -> IncrementalQuery:
+    key = _check_key(test_detail)
+    watermark, _ = state.watermark(table, column, key)
+    reference_table = test_detail['reference_table']
+    reference_key = test_detail['reference_key']
+    newer = _newer(f"{table}.{column}", watermark)
+    sql = (f"SELECT COUNT(CASE WHEN {reference_table}.{reference_key} IS NULL THEN 1 END) > 0, MAX({table}.{column}) "
+           f"FROM {table} LEFT JOIN {reference_table} "
+           f"ON {table}.{test_detail['foreign_key']} = {reference_table}.{reference_key}"
+           + (f" WHERE {newer}" if newer else ''))
+
+    def finish(rows: List[Any]) -> List[Tuple[str, str, Any]]:
+        error, newest = rows[0]
+        with state:
+            state.advance(table, column, key, watermark if newest is None else _watermark(newest))
+        return [('foreign_key', table, bool(error))]
+
+    return IncrementalQuery(PlannedQuery(table, ('foreign_key',), sql), finish)
+
+
+def plan_incremental(tests: List[Dict[str, Any]], state: ValidationState) -> List[IncrementalQuery]:
+    """Plan the test groups of `tests` that have an `incremental` setting against the watermarks in `state`."""
+    row_level: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+    uniqueness: Dict[Tuple[str, str, str], List[str]] = {}
+    foreign_keys: List[IncrementalQuery] = []
+    custom: List[Dict[str, Any]] = []
+
+    for test in tests:
+        if not test.get('incremental'):
+            continue
+        column = test['incremental']['column']
+        for table in test['target_tables']:
+            for test_detail in test['tests']:
+                test_type = test_detail['type']
+                if test_type in ROW_LEVEL_CHECKS:
+                    row_level.setdefault((table, column), []).append(test_detail)
+                elif test_type in UNIQUENESS_CHECKS:
+                    key_column = test_detail['column']
+                    if isinstance(key_column, dict):
+                        key_column = key_column.get(table, None)
+                        if not key_column:
+                            continue
+                    uniqueness.setdefault((table, column, key_column), []).append(test_type)
+                elif test_type == 'foreign_key':
+                    foreign_keys.append(_foreign_key(state, table, column, test_detail))
+        custom.append({'target_tables': test['target_tables'],
+                       'tests': [test_detail for test_detail in test['tests'] if test_detail['type'] == 'custom_query']})
+
+    plan = [_row_level(state, table, column, details) for (table, column), details in row_level.items()]
+    plan.extend(_uniqueness(state, table, column, key_column, test_types)
+                for (table, column, key_column), test_types in uniqueness.items())
+    plan.extend(foreign_keys)
+    plan.extend(IncrementalQuery(query, None) for query in plan_validation(custom))
+    return plan
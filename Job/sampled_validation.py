@@ -0,0 +1,164 @@
+# Copyright 2024 Sola Richard Olorunfemi
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Sampled runs of the row-level checks on very large tables.
+
+A null_check, data_range_check or default_value_check with a `sample` option is counted
+over a reproducible sample of its table instead of the whole table:
+
+    sample: {fraction: 0.01, seed: 42}   # about 1% of the rows
+    sample: {rows: 100000, seed: 42}     # a fixed number of rows
+
+Checks of a table with the same sample share one scan of it. Snowflake samples with
+SAMPLE BERNOULLI ... SEED, or SAMPLE (n ROWS) for a fixed size, which Snowflake cannot
+seed. SQLite splits the rowids between MIN(rowid) and MAX(rowid) into as many equal
+strata as rows to sample, picks a seeded rowid in each and looks the picks up by rowid,
+so only the sampled rows are read. Rowids left by deleted rows are picked too and find
+nothing, so a table with many of them gives a smaller sample. A check fails when any
+sampled row fails, and reports the estimated failure rate of the table with its Wilson
+score interval, at the `confidence` of the sample option (0.95 by default).
+"""
+import json
+import logging
+from math import sqrt
+from statistics import NormalDist
+from typing import Any, Callable, Dict, List, NamedTuple, Tuple
+from Job.validation_planner import PlannedQuery, row_predicate
+
+logger = logging.getLogger(__name__)
+
+SAMPLED_CHECKS = ('default_value_check', 'null_check', 'data_range_check')
+
+# A 32-bit linear congruential generator, seeded by Knuth's multiplicative hash
+_SEED_STATE = "abs(({seed} + 1) * 2654435761) % 4294967296"
+_NEXT_STATE = "(state * 1664525 + 1013904223) % 4294967296"
+
+
+class Estimate(NamedTuple):
+    sampled: int
+    failing: int
+    low: float
+    high: float
+    confidence: float
+
+    @property
+    def rate(self) -> float:
+        return self.failing / self.sampled if self.sampled else 0.0
+
+    def __str__(self) -> str:
+        return (f"{self.failing} of {self.sampled} sampled rows failing, about {self.rate:.2%} of the table, "
+                f"{self.confidence:.0%} interval {self.low:.2%} to {self.high:.2%}")
+
+
+def wilson_interval(failing: int, sampled: int, confidence: float = 0.95) -> Tuple[float, float]:
+    """Wilson score interval of a failure rate, which stays meaningful when no sampled row fails."""
+    if not sampled:
+        return 0.0, 1.0
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    rate = failing / sampled
+    denominator = 1 + z * z / sampled
+    centre = (rate + z * z / (2 * sampled)) / denominator
+    half_width = z * sqrt(rate * (1 - rate) / sampled + z * z / (4 * sampled * sampled)) / denominator
+    return max(0.0, centre - half_width), min(1.0, centre + half_width)
+
+
+def _validate_sample(sample: Dict[str, Any]) -> None:
+    if ('fraction' in sample) == ('rows' in sample):
+        raise ValueError(f"A sample needs either fraction or rows: {sample}")
+    if 'fraction' in sample and not 0 < sample['fraction'] <= 1:
+        raise ValueError(f"Sample fraction must be in (0, 1]: {sample['fraction']}")
+    if 'rows' in sample and int(sample['rows']) < 1:
+        raise ValueError(f"Sample rows must be positive: {sample['rows']}")
+
+
+def _sqlite_rowids(table: str, size: str, seed: int) -> str:
+    """
+    A query of `size` seeded rowids of `table`, one in each of as many equal strata of its
+    rowids, found without reading the table. Each bound is its own subquery, as SQLite only
+    answers a lone MIN or MAX from the rowid b-tree. The generator state is scaled by the
+    stratum width rather than taken modulo it, as its high bits are the random ones.
+    """
+    start, end = "n * span / size", "(n + 1) * span / size"
+    return (f"WITH RECURSIVE bounds(low, span) AS (SELECT (SELECT MIN(rowid) FROM {table}), "
+            f"(SELECT MAX(rowid) FROM {table}) - (SELECT MIN(rowid) FROM {table}) + 1), "
+            f"strata(size) AS (SELECT {size} FROM bounds), "
+            f"picks(n, state) AS (SELECT 0, {_SEED_STATE.format(seed=seed)} "
+            f"UNION ALL SELECT n + 1, {_NEXT_STATE} FROM picks, strata WHERE n + 1 < size) "
+            f"SELECT low + {start} + state * ({end} - {start}) / 4294967296 FROM picks, bounds, strata")
+
+
+def sample_source(table: str, sample: Dict[str, Any], sql_flavour: str) -> str:
+    """A subquery selecting the sample of `table` described by `sample`."""
+    _validate_sample(sample)
+    seed = int(sample.get('seed', 0))
+    flavour = sql_flavour.lower()
+    if flavour == 'snowflake':
+        if 'fraction' in sample:
+            return f"(SELECT * FROM {table} SAMPLE BERNOULLI ({sample['fraction'] * 100:g}) SEED ({seed}))"
+        return f"(SELECT * FROM {table} SAMPLE ({int(sample['rows'])} ROWS))"
+    if flavour == 'sqlite':
+        if 'fraction' in sample:
+            size = f"MAX(1, CAST(round(span * {sample['fraction']!r}) AS INTEGER))"
+        else:
+            size = f"MIN(span, {int(sample['rows'])})"
+        return f"(SELECT * FROM {table} WHERE rowid IN ({_sqlite_rowids(table, size, seed)}))"
+    raise ValueError(f"Unsupported sql_flavour: {sql_flavour}")
+
+
+def split_sampled(tests: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Split the test groups of `tests` into the checks that run in full and those that run on a sample."""
+    exact, sampled = [], []
+    for test in tests:
+        in_sample = [test_detail for test_detail in test['tests']
+                     if test_detail.get('sample') and test_detail['type'] in SAMPLED_CHECKS]
+        if in_sample:
+            exact.append(dict(test, tests=[test_detail for test_detail in test['tests'] if test_detail not in in_sample]))
+            sampled.append(dict(test, tests=in_sample))
+        else:
+            exact.append(test)
+    return exact, sampled
+
+
+def plan_sampled(tests: List[Dict[str, Any]], sql_flavour: str
+                 ) -> List[Tuple[PlannedQuery, Callable[[List[Any]], List[Tuple[str, str, Any, Estimate]]]]]:
+    """
+    Plan the sampled checks of `tests`, as returned by split_sampled. Each query comes with
+    a function turning its row into (test_type, table_name, error, estimate) results.
+    """
+    groups: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+    for test in tests:
+        for table in test['target_tables']:
+            for test_detail in test['tests']:
+                groups.setdefault((table, json.dumps(test_detail['sample'], sort_keys=True)), []).append(test_detail)
+
+    plan = []
+    for (table, _), details in groups.items():
+        sample = details[0]['sample']
+        counts = ', '.join(f"COUNT(CASE WHEN {row_predicate(test_detail['type'], test_detail)} THEN 1 END)"
+                           for test_detail in details)
+        sql = f"SELECT COUNT(*), {counts} FROM {sample_source(table, sample, sql_flavour)} AS sampled"
+
+        def finish(rows: List[Any], table=table, details=details, confidence=sample.get('confidence', 0.95)):
+            sampled, failing_counts = rows[0][0] or 0, rows[0][1:]
+            results = []
+            for test_detail, failing in zip(details, failing_counts):
+                failing = failing or 0
+                estimate = Estimate(sampled, failing, *wilson_interval(failing, sampled, confidence), confidence)
+                if not failing:
+                    logger.info(f"Test '{test_detail['type']}' passed on a sample of table '{table}': {estimate}")
+                results.append((test_detail['type'], table, failing > 0, estimate))
+            return results
+
+        plan.append((PlannedQuery(table, tuple(test_detail['type'] for test_detail in details), sql), finish))
+    return plan
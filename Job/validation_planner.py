@@ -0,0 +1,120 @@
+# Copyright 2024 Sola Richard Olorunfemi
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Query planner for the checks of automated_test.
+
+The row-level checks of a table (row_count, default_value_check, null_check and
+data_range_check) are answered by one aggregate query with a conditional count per
+check, so the table is scanned once however many of them it has. Uniqueness checks
+stop at the first duplicate, and the two uniqueness check types share one query when
+they name the same column. Foreign keys are checked with an anti-join that stops at
+the first orphan row. Custom queries run as written.
+
+Every planned query returns (test_type, table_name, error) rows, one per check it
+answers, so the queries can be joined with UNION ALL or run on their own.
+"""
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+ROW_LEVEL_CHECKS = ('row_count', 'default_value_check', 'null_check', 'data_range_check')
+UNIQUENESS_CHECKS = ('primary_key_uniqueness', 'unique_value_check')
+
+
+class PlannedQuery(NamedTuple):
+    table: Optional[str]  # None for custom queries
+    checks: Tuple[str, ...]  # test types reported by the query
+    sql: str
+
+
+def row_predicate(test_type: str, test_detail: Dict[str, Any]) -> Optional[str]:
+    """Condition matching the rows that fail a row-level check; None for row_count, which counts all rows."""
+    if test_type == 'row_count':
+        return None
+    column = test_detail['column']
+    if test_type == 'default_value_check':
+        return f"{column} != '{test_detail['default_value']}'"
+    if test_type == 'null_check':
+        return f"{column} IS NULL"
+    return f"{column} < '{test_detail['start_date']}' OR {column} > '{test_detail['end_date']}'"
+
+
+def _row_level_condition(test_type: str, test_detail: Dict[str, Any]) -> str:
+    """Aggregate expression that is true when the check fails."""
+    if test_type == 'row_count':
+        threshold = test_detail.get('threshold', 1)  # Default threshold is 1
+        return f"COUNT(*) < {threshold}"
+    return f"COUNT(CASE WHEN {row_predicate(test_type, test_detail)} THEN 1 END) > 0"
+
+
+def _report(table: str, checks: List[Tuple[str, int]], source: str) -> str:
+    """
+    Rows of (test_type, table_name, error) from `source`, a query returning a single row
+    with a check_<n> column per result. Each check reads the column at its index.
+    """
+    if len(checks) == 1:
+        test_type, index = checks[0]
+        return (f"SELECT '{test_type}' AS test_type, '{table}' AS table_name, results.check_{index} AS error "
+                f"FROM ({source}) AS results")
+    labels = ' UNION ALL '.join(f"SELECT {position} AS position, '{test_type}' AS test_type"
+                                for position, (test_type, _) in enumerate(checks))
+    cases = ' '.join(f"WHEN {position} THEN results.check_{index}" for position, (_, index) in enumerate(checks))
+    return (f"SELECT checks.test_type, '{table}' AS table_name, CASE checks.position {cases} END AS error "
+            f"FROM ({source}) AS results CROSS JOIN ({labels}) AS checks")
+
+
+def plan_validation(tests: List[Dict[str, Any]]) -> List[PlannedQuery]:
+    """Plan the queries answering `tests`, the 'tests' list of a validation task."""
+    row_level: Dict[str, List[Tuple[str, str]]] = {}
+    uniqueness: Dict[Tuple[str, str], List[str]] = {}
+    other: List[PlannedQuery] = []
+
+    for test in tests:
+        for table in test['target_tables']:
+            for test_detail in test['tests']:
+                test_type = test_detail['type']
+                if test_type in ROW_LEVEL_CHECKS:
+                    row_level.setdefault(table, []).append((test_type, _row_level_condition(test_type, test_detail)))
+                elif test_type in UNIQUENESS_CHECKS:
+                    column = test_detail['column']
+                    if isinstance(column, dict):
+                        column = column.get(table, None)
+                        if not column:
+                            continue
+                    uniqueness.setdefault((table, column), []).append(test_type)
+                elif test_type == 'foreign_key':
+                    foreign_key = test_detail['foreign_key']
+                    reference_table = test_detail['reference_table']
+                    reference_key = test_detail['reference_key']
+                    source = (f"SELECT COUNT(*) > 0 AS check_0 FROM (SELECT 1 AS orphan FROM {table} WHERE NOT EXISTS "
+                              f"(SELECT 1 FROM {reference_table} WHERE {reference_table}.{reference_key} = {table}.{foreign_key}) "
+                              f"LIMIT 1) AS orphans")
+                    other.append(PlannedQuery(table, ('foreign_key',), _report(table, [('foreign_key', 0)], source)))
+                elif test_type == 'custom_query':
+                    other.append(PlannedQuery(None, ('custom_query',), test_detail['query']))
+
+    plan = []
+    for table, conditions in row_level.items():
+        columns = ', '.join(f"{condition} AS check_{index}" for index, (_, condition) in enumerate(conditions))
+        checks = [(test_type, index) for index, (test_type, _) in enumerate(conditions)]
+        plan.append(PlannedQuery(table, tuple(test_type for test_type, _ in conditions),
+                                 _report(table, checks, f"SELECT {columns} FROM {table}")))
+    for (table, column), test_types in uniqueness.items():
+        source = (f"SELECT COUNT(*) > 0 AS check_0 FROM (SELECT {column} FROM {table} "
+                  f"GROUP BY {column} HAVING COUNT(*) > 1 LIMIT 1) AS duplicates")
+        plan.append(PlannedQuery(table, tuple(test_types), _report(table, [(test_type, 0) for test_type in test_types], source)))
+    return plan + other
+
+
+def validation_sql(tests: List[Dict[str, Any]]) -> str:
+    """All the planned queries of `tests` as one statement."""
+    return ' UNION ALL '.join(query.sql for query in plan_validation(tests))
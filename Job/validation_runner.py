@@ -0,0 +1,136 @@
+# Copyright 2024 Sola Richard Olorunfemi
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Runs planned validation queries concurrently over a bounded set of connections.
+
+Each of the `max_connections` worker threads owns one connection, opened on its first
+query, so drivers whose connections are tied to the thread that created them (sqlite3)
+work unchanged. A query that runs past its timeout is cancelled through the driver when
+it supports it (sqlite3 interrupt(), a cancel() on the connection or cursor) and its
+connection is closed and reopened for the next query. Outcomes are yielded in completion
+order, so the caller can act on the fast checks while the slow ones still run. A query
+given a fetcher has its rows read by that fetcher, in the worker thread, instead of
+fetched all at once.
+"""
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional
+from Job.validation_planner import PlannedQuery
+
+logger = logging.getLogger(__name__)
+
+
+class QueryOutcome(NamedTuple):
+    query: PlannedQuery
+    rows: List[Any]  # (test_type, table_name, error) rows
+    failure: Optional[str]  # why the query did not complete, None when it did
+    duration: float
+
+
+def _cancel(conn: Any, cursor: Any) -> None:
+    for target, name in ((conn, 'interrupt'), (conn, 'cancel'), (cursor, 'cancel')):
+        method = getattr(target, name, None)
+        if callable(method):
+            try:
+                method()
+            except Exception as e:
+                logger.warning(f"Could not cancel validation query: {e}")
+            return
+    logger.warning("Connection has no way to cancel a query; waiting for it to finish")
+
+
+def _close(conn: Any) -> None:
+    try:
+        conn.close()
+    except Exception as e:
+        logger.warning(f"Error closing validation connection: {e}")
+
+
+def _worker(connect: Callable[[], Any], pending: queue.Queue, outcomes: queue.Queue,
+            timeout: Optional[float], stop: threading.Event,
+            fetchers: Dict[PlannedQuery, Callable[[Any], List[Any]]]) -> None:
+    conn = None
+    try:
+        while not stop.is_set():
+            try:
+                query = pending.get_nowait()
+            except queue.Empty:
+                return
+            started = time.perf_counter()
+            timer, timed_out = None, threading.Event()
+            try:
+                if conn is None:
+                    conn = connect()
+                cursor = conn.cursor()
+                try:
+                    if timeout is not None:
+                        def expire(conn=conn, cursor=cursor):
+                            timed_out.set()
+                            _cancel(conn, cursor)
+                        timer = threading.Timer(timeout, expire)
+                        timer.daemon = True
+                        timer.start()
+                    cursor.execute(query.sql)
+                    fetch = fetchers.get(query)
+                    rows = fetch(cursor) if fetch is not None else cursor.fetchall()
+                finally:
+                    if timer is not None:
+                        timer.cancel()
+                    cursor.close()
+                if timed_out.is_set():
+                    raise TimeoutError
+                outcome = QueryOutcome(query, rows, None, time.perf_counter() - started)
+            except Exception as e:
+                failure = f"timed out after {timeout}s" if timed_out.is_set() else f"{e.__class__.__name__}: {e}"
+                outcome = QueryOutcome(query, [], failure, time.perf_counter() - started)
+                if conn is not None:
+                    # The connection may still be busy or in a failed transaction; start afresh
+                    _close(conn)
+                    conn = None
+            outcomes.put(outcome)
+    finally:
+        if conn is not None:
+            _close(conn)
+
+
+def run_concurrently(plan: List[PlannedQuery], connect: Callable[[], Any], max_connections: int,
+                     timeout: Optional[float] = None,
+                     fetchers: Optional[Dict[PlannedQuery, Callable[[Any], List[Any]]]] = None) -> Iterator[QueryOutcome]:
+    """
+    Run the queries of `plan` over at most `max_connections` connections opened with
+    `connect`, each allowed `timeout` seconds, yielding an outcome as each one completes.
+
+    `fetchers` maps queries to functions that take the executed cursor and return the
+    rows of the outcome; the timeout covers them too.
+    """
+    if max_connections < 1:
+        raise ValueError(f"max_connections must be at least 1, got {max_connections}")
+    pending: queue.Queue = queue.Queue()
+    for query in plan:
+        pending.put(query)
+    outcomes: queue.Queue = queue.Queue()
+    stop = threading.Event()
+    workers = [threading.Thread(target=_worker, args=(connect, pending, outcomes, timeout, stop, fetchers or {}),
+                                name=f'Validation-{i}', daemon=True)
+               for i in range(min(max_connections, len(plan)))]
+    for worker in workers:
+        worker.start()
+    try:
+        for _ in plan:
+            yield outcomes.get()
+    finally:
+        # Stops the workers picking up new queries when the caller gives up early
+        stop.set()
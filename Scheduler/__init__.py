@@ -11,17 +11,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from .src import (
-    job_scheduler,
-    config,
-    copy_settings,
-    module_registry,
-    parse_create_task,
-    parse_modify_task,
-    utils,
-    SETTINGS
-)
+import importlib
+from typing import Any, List
 
+# Imported on first access, so that `import Scheduler` neither loads the settings
+# nor pulls in APScheduler and SQLAlchemy
 __all__ = [
     'job_scheduler',
     'config',
@@ -32,3 +26,15 @@ __all__ = [
     'utils',
     'SETTINGS'
 ]
+
+
+def __getattr__(name: str) -> Any:
+    if name not in __all__:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module = importlib.import_module(f'.src.{name}', __name__)
+    globals()[name] = module
+    return module
+
+
+def __dir__() -> List[str]:
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,73 @@
+# Copyright 2024 Sola Richard Olorunfemi
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import logging
+import threading
+from typing import Optional
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+
+logger = logging.getLogger(__name__)
+
+
+class ThreadedAsyncIOScheduler(AsyncIOScheduler):
+    """
+    AsyncIOScheduler that runs its own event loop in a background thread.
+
+    Orchestr8's entry points are synchronous, so the scheduler cannot share a loop
+    with them. Like BackgroundScheduler, start() returns immediately; `async def`
+    tasks then run as coroutines on the loop thread, so thousands of concurrent I/O
+    waits share one thread instead of occupying one pool thread each. Synchronous
+    tasks on an asyncio executor run in the loop's default thread pool.
+
+    Passing `event_loop` uses that loop instead, and the caller must run it.
+    """
+
+    def __init__(self, gconfig: Optional[dict] = None, **options) -> None:
+        self._loop_thread: Optional[threading.Thread] = None
+        super().__init__(gconfig or {}, **options)
+
+    def start(self, paused: bool = False) -> None:
+        if self._eventloop is None:
+            self._eventloop = asyncio.new_event_loop()
+            started = threading.Event()
+            self._loop_thread = threading.Thread(target=self._run_loop, args=(started,),
+                                                 name='AsyncIOScheduler', daemon=True)
+            self._loop_thread.start()
+            started.wait()
+        super().start(paused)
+
+    def shutdown(self, wait: bool = True) -> None:
+        super().shutdown(wait)  # runs on the loop thread
+        loop_thread, self._loop_thread = self._loop_thread, None
+        if loop_thread is not None:
+            self._eventloop.call_soon_threadsafe(self._eventloop.stop)
+            if threading.current_thread() is not loop_thread:
+                loop_thread.join()
+            self._eventloop = None
+
+    def _run_loop(self, started: threading.Event) -> None:
+        loop = self._eventloop
+        asyncio.set_event_loop(loop)
+        loop.call_soon(started.set)
+        try:
+            loop.run_forever()
+            # Let tasks cancelled by the executor's shutdown finish before closing the loop
+            pending = asyncio.all_tasks(loop)
+            for task in pending:
+                task.cancel()
+            if pending:
+                loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            loop.run_until_complete(loop.shutdown_asyncgens())
+        finally:
+            loop.close()
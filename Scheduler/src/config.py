@@ -11,9 +11,14 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import importlib.util
 import os
 import sys
 from pathlib import Path
+from types import ModuleType
+from typing import Any
+
+from .copy_settings import copy_default_settings
 
 
 def get_user_settings_dir() -> Path:
@@ -25,32 +30,85 @@ def get_user_settings_dir() -> Path:
     return Path(__file__).resolve().parent
 
 
-def load_user_settings():
+def load_user_settings() -> ModuleType:
+    # Seed the user's settings directory on the first run
+    copy_default_settings()
     user_settings_file = get_user_settings_dir() / 'SETTINGS.py'
 
     if user_settings_file.exists():
-        sys.path.insert(0, str(user_settings_file.parent))
-        settings = __import__('SETTINGS')
-        sys.path.pop(0)
+        spec = importlib.util.spec_from_file_location('SETTINGS', user_settings_file)
+        settings = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(settings)
         return settings
     else:
         raise FileNotFoundError(f"User settings file not found at {user_settings_file}")
 
 
-# Load the settings once and make them available as module-level variables
-settings = load_user_settings()
-COMMANDS_SQL = settings.COMMANDS_FILE
-PARAMETER_JSON = settings.PARAMETERS_FILE
-IMPORT_FILE = settings.IMPORT_FILE
-SCHEDULER_TYPE = getattr(settings, 'SCHEDULER_TYPE', 'BackgroundScheduler')
-MISFIRE_GRACE_TIME = getattr(settings, 'MISFIRE_GRACE_TIME', 30)
-SCHEDULER_START_PAUSED = getattr(settings, 'SCHEDULER_START_PAUSED', False)
-SCHEDULER_SHUTDOWN_WAIT = getattr(settings, 'SCHEDULER_SHUTDOWN_WAIT', False)
-JOBSTORE = getattr(settings, 'JOBSTORE', None)
-JOBSTORE_SQLALCHEMY_URL = getattr(settings, 'JOBSTORE_SQLALCHEMY_URL', None)
-TIMEZONE = getattr(settings, 'TIMEZONE', 'UTC')
-ERROR_LOG = getattr(settings, 'ERROR_LOG', 'sqlite')
-ERROR_LOG_SQLITE_URL = getattr(settings, 'ERROR_LOG_SQLITE_URL', 'sqlite:///error_log.sqlite')
-ERROR_LOG_SQLALCHEMY_URL = getattr(settings, 'ERROR_LOG_SQLALCHEMY_URL', '')
-DEBUG = getattr(settings, 'DEBUG', False)
-WORKSTATION = getattr(settings, 'WORKSTATION', {})
+# Settings that must be defined, by the name they are read under
+REQUIRED = {
+    'COMMANDS_SQL': 'COMMANDS_FILE',
+    'PARAMETER_JSON': 'PARAMETERS_FILE',
+    'IMPORT_FILE': 'IMPORT_FILE',
+}
+
+# Optional settings and their defaults
+DEFAULTS = {
+    'IMPORT_ENTRY_POINTS': 'orchestr8.tasks',
+    'SCHEDULER_TYPE': 'BackgroundScheduler',
+    'MISFIRE_GRACE_TIME': 30,
+    'SCHEDULER_START_PAUSED': False,
+    'SCHEDULER_SHUTDOWN_WAIT': False,
+    'JOBSTORE': None,
+    'JOBSTORE_SQLALCHEMY_URL': None,
+    'JOBSTORE_SNAPSHOT_INTERVAL': 5,
+    'SQLITE_JOURNAL_MODE': 'WAL',
+    'SQLITE_SYNCHRONOUS': 'NORMAL',
+    'SQLITE_BUSY_TIMEOUT': 5000,
+    'SQLITE_POOL_SIZE': 5,
+    'SQLITE_BATCH_UPDATES': True,
+    'WORKER_MODE': None,
+    'WORKER_ID': None,
+    'WORKER_LEASE_TTL': 30,
+    'WORKER_HEARTBEAT_INTERVAL': 10,
+    'WORKER_POLL_INTERVAL': 1,
+    'WORKER_MAX_CLAIMS': 20,
+    'EXECUTORS': {
+        'default': {'type': 'thread', 'max_workers': 20},
+        'processpool': {'type': 'process', 'max_workers': 5},
+    },
+    'RESULT_STORE_DIR': None,
+    'RESULT_STORE_MAX_BYTES': 512 * 1024 * 1024,
+    'RESULT_STORE_MAX_AGE': 24 * 3600,
+    'RESULT_SHARED_MIN_BYTES': 1024 * 1024,
+    'TASK_CACHE_URL': 'sqlite:///task_cache.sqlite',
+    'TASK_CACHE_MAX_BYTES': 256 * 1024 * 1024,
+    'METRICS_HOST': '127.0.0.1',
+    'METRICS_PORT': 9108,
+    'TRACE_EXPORTER': None,
+    'TRACE_FILE': 'traces.jsonl',
+    'TIMEZONE': 'UTC',
+    'ERROR_LOG': 'sqlite',
+    'ERROR_LOG_SQLITE_URL': 'sqlite:///error_log.sqlite',
+    'ERROR_LOG_SQLALCHEMY_URL': '',
+    'DEBUG': False,
+    'WORKSTATION': {},
+}
+
+
+def __getattr__(name: str) -> Any:
+    """
+    Load the settings on first access rather than when this module is imported.
+
+    `settings` is the user's SETTINGS module; every other setting is read from it
+    once and then kept as a module-level variable.
+    """
+    if name == 'settings':
+        value = load_user_settings()
+    elif name in REQUIRED:
+        value = getattr(sys.modules[__name__].settings, REQUIRED[name])
+    elif name in DEFAULTS:
+        value = getattr(sys.modules[__name__].settings, name, DEFAULTS[name])
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value
+    return value
@@ -32,6 +32,7 @@ def get_user_settings_dir() -> Path:
 
 
 def copy_default_settings():
+    """Copy the default SETTINGS.py to the user's settings directory unless one is there already."""
     user_settings_dir = get_user_settings_dir()
     default_settings_file = Path(__file__).resolve().parent / 'SETTINGS.py'
     user_settings_file = user_settings_dir / 'SETTINGS.py'
@@ -39,7 +40,3 @@ def copy_default_settings():
     if not user_settings_file.exists():
         logger.info(f"Copying default settings to {user_settings_file}")
         shutil.copy(default_settings_file, user_settings_file)
-
-
-# Copy the settings file during the first run
-copy_default_settings()
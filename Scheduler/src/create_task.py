@@ -13,71 +13,101 @@
 
 import logging
 import ast
-from typing import Dict, Union
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+from apscheduler.triggers.base import BaseTrigger
 from apscheduler.triggers.cron import CronTrigger
 from apscheduler.triggers.interval import IntervalTrigger
-from apscheduler.events import EVENT_JOB_EXECUTED, EVENT_JOB_ERROR, JobEvent
+from apscheduler.events import EVENT_JOB_EXECUTED, EVENT_JOB_ERROR, EVENT_SCHEDULER_SHUTDOWN, JobEvent
+from apscheduler.executors.asyncio import AsyncIOExecutor
+from apscheduler.schedulers.base import BaseScheduler
+from apscheduler.util import iscoroutinefunction_partial
 from .parse_create_task import parse_command
-from .job_scheduler import scheduler
+from .job_scheduler import add_jobs, get_scheduler, jobstore_engine
+from .job_index import definition_hash, job_index
+from .metrics import metrics
+from .tracing import get_tracer, traced
+from .dependency_store import persist_task_graph
 from .module_registry import get_function
+from .result_store import get_result_store, result_refs, run_async_with_results, run_with_results
+from .task_cache import CachePolicy, run_async_cached, run_cached
+from .task_graph import task_graph
 from datetime import datetime
 import pytz
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-sched = scheduler()
-task_conditions = {}
+# The process-wide scheduler, set up by _scheduler() on first use
+sched: Optional[BaseScheduler] = None
+_sched_lock = threading.Lock()
 
 
-def event_listener(event: JobEvent) -> None:
-    if event.exception:
-        logger.error(f"Job {event.job_id} failed")
-    else:
-        logger.info(f"Job {event.job_id} executed successfully")
+def _scheduler() -> BaseScheduler:
+    """
+    The process-wide scheduler, wired to the task graph, job index, metrics and tracer.
 
-        for task_name, conditions in task_conditions.items():
-            job = sched.get_job(task_name)
-            if conditions.get('after') and event.job_id in conditions['after'] and not event.exception:
-                conditions['after'].remove(event.job_id)
-                if not conditions['after']:
-                    job = sched.get_job(task_name)
+    Done on first use rather than on import, so that importing this module neither
+    starts a scheduler nor connects to the jobstore. Once the scheduler is shut down
+    the next call wires up the one that replaces it.
+    """
+    global sched
+    with _sched_lock:
+        if sched is None:
+            scheduler = get_scheduler()
+            persist_task_graph(task_graph, jobstore_engine(scheduler))
+            job_index.attach(scheduler)
+            metrics.attach(scheduler)
+            get_tracer().attach(scheduler)
+            scheduler.add_listener(event_listener, EVENT_JOB_EXECUTED | EVENT_JOB_ERROR)
+            scheduler.add_listener(lambda event: _forget_scheduler(scheduler), EVENT_SCHEDULER_SHUTDOWN)
+            _record_result_reads(scheduler)
+            sched = scheduler
+    return sched
 
-                    # Resume job only if it is paused
-                    if job and job.next_run_time is None:
-                        time_zone = conditions.get('time_zone', 'UTC')
-                        try:
-                            tz = pytz.timezone(time_zone)
-                        except pytz.UnknownTimeZoneError:
-                            logger.error(f"Unknown timezone: {time_zone}. Defaulting to UTC.")
-                            tz = pytz.UTC
 
-                        # Convert current time to user's timezone
-                        local_time = datetime.now(tz=tz)
-                        sched.modify_job(task_name, next_run_time=local_time)
+def _record_result_reads(scheduler: BaseScheduler) -> None:
+    """Record in the task graph the RESULT() arguments of jobs stored before it knew of them."""
+    reads = {job.id: result_refs(job.args, job.kwargs) for job in scheduler.get_jobs()}
+    task_graph.set_results({name: tasks for name, tasks in reads.items() if set(tasks) != task_graph.reads(name)})
 
 
-def add_task(task_name: str, params: Dict[str, Union[str, int, bool]]) -> None:
+def _forget_scheduler(scheduler: BaseScheduler) -> None:
+    global sched
+    with _sched_lock:
+        if sched is scheduler:
+            sched = None
 
-    function_name = params['function']
-    args = params['args']
-    kwargs = params['kwargs']
-    max_instances = int(params['server']) if params['server'] else 1
-    schedule_num = params.get('schedule')
-    cron_expr = params.get('cron_expr')
-    time_zone = params.get('time_zone')
-    after_tasks = params.get('after')
 
-    task_function = get_function(function_name)
+def _release_task(task_name: str) -> None:
+    """Run a task whose AFTER predecessors have all completed."""
+    job = job_index.get(task_name)
 
-    if after_tasks and (schedule_num or cron_expr):
-        raise ValueError("Only one of 'after' or 'schedule' can be used")
+    # Resume job only if it is paused
+    if job and job.next_run_time is None:
+        _scheduler().modify_job(task_name, next_run_time=datetime.now(tz=pytz.UTC))
+
+
+def event_listener(event: JobEvent) -> None:
+    if event.exception:
+        logger.error(f"Job {event.job_id} failed")
+    else:
+        logger.info(f"Job {event.job_id} executed successfully")
+        with get_tracer().span('release_dependents', job_id=event.job_id):
+            released = task_graph.complete(event.job_id)
+            # Only a result that a RESULT() argument or an AFTER dependent may read is kept,
+            # and it is stored before the dependents are released
+            if task_graph.result_needed(event.job_id):
+                try:
+                    get_result_store().put(event.job_id, event.retval)
+                except Exception as e:
+                    logger.warning(f"Result of job {event.job_id} was not stored: {e}")
+            for task_name in released:
+                _release_task(task_name)
 
-    # Check if job already exists
-    if sched.get_job(task_name):
-        logger.info(f"Job {task_name} already exists, skipping addition.")
-        return
 
+def _build_trigger(schedule_num: Optional[str], cron_expr: Optional[str], time_zone: Optional[str]) -> Optional[BaseTrigger]:
+    """Build the trigger of a SCHEDULE or USING CRON clause, or None when the task has neither."""
     trigger = None
     if schedule_num:
         time = schedule_num.split()[0].strip("'").strip('"')
@@ -97,49 +127,336 @@ def add_task(task_name: str, params: Dict[str, Union[str, int, bool]]) -> None:
             raise ValueError("Interval time not recognised")
     elif cron_expr:
         trigger = CronTrigger.from_crontab(cron_expr, timezone=time_zone)
+    return trigger
+
+
+_UNIT_SECONDS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400, 'week': 604800}
+
+
+def _cache_policy(params: Dict[str, Any]) -> Optional[CachePolicy]:
+    """The CachePolicy of a task declared with CACHE = '<ttl>' and an optional PROBE, or None."""
+    cache, probe = params.get('cache'), params.get('probe')
+    if probe and not cache:
+        raise ValueError("PROBE can only be used with CACHE")
+    if not cache:
+        return None
+    amount, unit = cache.strip("'").strip('"').split()
+    ttl = int(amount) * next(seconds for name, seconds in _UNIT_SECONDS.items() if unit.lower().startswith(name))
+    if not probe:
+        return CachePolicy(params['function'], ttl)
+    return CachePolicy(params['function'], ttl, get_function(probe['function']), tuple(probe['args']), probe['kwargs'])
+
+
+def _job_target(task_function: Any, params: Dict[str, Any]) -> Tuple[Any, List[Any]]:
+    """
+    The callable and positional arguments of a job.
+
+    Tasks declared with CACHE run through run_cached(), and tasks with RESULT()
+    arguments through run_with_results(); both take the task function first.
+    """
+    args, kwargs = params['args'], params['kwargs']
+    is_coroutine = iscoroutinefunction_partial(task_function)
+    policy = _cache_policy(params)
+    if policy is not None:
+        return run_async_cached if is_coroutine else run_cached, [policy, task_function] + list(args)
+    if result_refs(args, kwargs):
+        return run_async_with_results if is_coroutine else run_with_results, [task_function] + list(args)
+    return task_function, args
+
+
+def add_task(task_name: str, params: Dict[str, Union[str, int, bool]]) -> None:
+    sched = _scheduler()
+
+    function_name = params['function']
+    args = params['args']
+    kwargs = params['kwargs']
+    max_instances = int(params['server']) if params['server'] else 1
+    schedule_num = params.get('schedule')
+    cron_expr = params.get('cron_expr')
+    time_zone = params.get('time_zone')
+    after_tasks = params.get('after')
+
+    with get_tracer().span('get_function', function=function_name):
+        task_function = get_function(function_name)
+    executor = _executor(params, task_function)
+
+    if after_tasks and (schedule_num or cron_expr):
+        raise ValueError("Only one of 'after' or 'schedule' can be used")
+
+    with get_tracer().span('build_trigger'):
+        trigger = _build_trigger(schedule_num, cron_expr, time_zone)
+
+    reads = result_refs(args, kwargs)
+    for task in reads:
+        if task not in job_index and task != task_name:
+            raise ValueError(f"Task '{task}' referenced by RESULT({task}) does not exist to create {task_name}.")
+    job_function, args = _job_target(task_function, params)
+
+    # Check if job already exists, and whether its definition changed
+    with get_tracer().span('job_lookup'):
+        existing = job_index.get(task_name)
+    if existing:
+        with get_tracer().span('definition_check'):
+            changed = _definition_changed(task_name, existing.definition_hash, task_function, params, trigger, executor)
+        if not changed:
+            logger.info(f"Job {task_name} already exists, skipping addition.")
+            return
+        logger.info(f"Job {task_name} definition changed, replacing it.")
+        if not after_tasks:
+            task_graph.remove_dependencies(task_name)
+
+    if reads or task_graph.reads(task_name):
+        task_graph.set_results({task_name: reads})
 
     if after_tasks:
         after_tasks_list = after_tasks.split(', ')
         for task in after_tasks_list:
-            if not sched.get_job(task):
+            if task not in job_index:
                 raise ValueError(f"Required task '{task}' does not exist to create and schedule {task_name}.")
 
-        task_conditions[task_name] = {'after': after_tasks_list}
+        task_graph.add_task(task_name, after_tasks_list)
 
         # To do:
         # For thread safety, set trigger to an hour after the schedule time of latest after task
-        # Then reset next_run_time to now in event_lister() if the after task ran
+        # Then reset next_run_time to now in _release_task() if the after task ran
         # This is because when trigger is None next_run_time is None
         # This causes the job to fail as the task is removed causing JobLookUpError
         # checking get_job has not worked well for this
 
-        sched.add_job(task_function, trigger=None, id=task_name, replace_existing=True, args=args, kwargs=kwargs, max_instances=max_instances)
+        with get_tracer().span('add_job'):
+            job_index.record(sched.add_job(job_function, trigger=None, id=task_name, replace_existing=True, args=args, kwargs=kwargs, max_instances=max_instances, executor=executor, name=function_name))
         logger.info(f"Task_id {task_name} added as function {function_name} with args {args} and kwargs {kwargs}, scheduled after {after_tasks_list}")
         try:
-            sched.pause_job(task_name)
+            with get_tracer().span('pause_job'):
+                sched.pause_job(task_name)
         except Exception as e:
             logging.warning(f"WARNING: {e}")
     else:
-        sched.add_job(task_function, trigger=trigger, id=task_name, replace_existing=True, args=args, kwargs=kwargs, max_instances=max_instances)
-        sched.resume_job(task_name)  # task is resumed if no dependencies
+        with get_tracer().span('add_job'):
+            job_index.record(sched.add_job(job_function, trigger=trigger, id=task_name, replace_existing=True, args=args, kwargs=kwargs, max_instances=max_instances, executor=executor, name=function_name))
+        with get_tracer().span('resume_job'):
+            sched.resume_job(task_name)  # task is resumed if no dependencies
         logger.info(f"Task_id {task_name} added as function {function_name} with args {args} and kwargs {kwargs}, scheduled as {trigger}")
 
 
-def execute_command(command: str) -> None:
+def _after_tasks(params: Dict[str, Union[str, int, bool]]) -> List[str]:
+    after_tasks = params.get('after')
+    return [task.strip() for task in after_tasks.split(',') if task.strip()] if after_tasks else []
+
+
+def _executor(params: Dict[str, Union[str, int, bool]], task_function: Any, sched: Optional[BaseScheduler] = None) -> str:
+    """
+    The pool named by the EXECUTOR clause, or the default one for the function.
+
+    `async def` functions can only run on an asyncio pool; without an EXECUTOR clause
+    they go to the first one configured. Raises ValueError for a pool missing from
+    EXECUTORS or unable to run the function, including a warm process pool whose
+    workers do not register it. ALTER TASK ... SET EXECUTOR passes its own scheduler.
+    """
+    sched = sched or _scheduler()
+    executor = params.get('executor')
+    is_coroutine = iscoroutinefunction_partial(task_function)
+    if executor is None and is_coroutine:
+        executor = next((name for name, pool in sched._executors.items() if isinstance(pool, AsyncIOExecutor)), None)
+        if executor is None:
+            raise ValueError(f"{params['function']} is an async def function; it needs SCHEDULER_TYPE = 'AsyncIOScheduler'")
+    executor = executor or 'default'
     try:
-        action, task_name, params = parse_command(command)
+        pool = sched._lookup_executor(executor)
+    except KeyError:
+        raise ValueError(f"Executor '{executor}' is not configured in EXECUTORS")
+    if is_coroutine and not isinstance(pool, AsyncIOExecutor):
+        raise ValueError(f"{params['function']} is an async def function; executor '{executor}' cannot run it")
+    from .warm_pool import WarmProcessPoolExecutor
+    if isinstance(pool, WarmProcessPoolExecutor) and not pool.can_run(params['function']):
+        raise ValueError(f"{params['function']} is not registered by IMPORT_FILE or an entry point; "
+                         f"executor '{executor}' cannot run it in its worker processes")
+    return executor
 
-        if action == 'create_task':
-            add_task(task_name, params)
+
+def _definition_changed(task_name: str, indexed_hash: str, task_function: Any,
+                        params: Dict[str, Union[str, int, bool]], trigger: Optional[BaseTrigger], executor: str) -> bool:
+    """Compare a CREATE TASK definition with the indexed job and its AFTER edges, without reading the jobstore."""
+    max_instances = int(params['server']) if params['server'] else 1
+    job_function, args = _job_target(task_function, params)
+    new_hash = definition_hash(job_function, args, params['kwargs'], trigger, max_instances, executor)
+    return new_hash != indexed_hash or task_graph.upstream(task_name) != set(_after_tasks(params))
+
+
+@traced('apply_commands')
+def apply_commands(commands: Iterable[str]) -> Dict[str, Any]:
+    """
+    Apply a whole CREATE TASK script as one batch.
+
+    Every command is parsed and validated before anything is written: the function must
+    be registered, AFTER references must name a task that exists or is created by the
+    script, and the new AFTER edges must not form a cycle. The valid tasks are then
+    written in one jobstore transaction. Tasks that already exist are left unchanged
+    when their definition is the same and replaced when it differs; both checks are
+    answered by the job index without reading the jobstore.
+
+    Returns a summary with the 'created', 'updated' and 'unchanged' task names and a
+    'failed' dict mapping each failed task (or unparsable command) to the reason.
+    """
+    sched = _scheduler()
+    summary: Dict[str, Any] = {'created': [], 'updated': [], 'unchanged': [], 'failed': {}}
+    definitions: Dict[str, Dict[str, Any]] = {}
+    applied = 0
+
+    for command in commands:
+        command = command.strip()
+        if not command or command.startswith('--'):
+            continue
+        applied += 1
+        task_name = None
+        try:
+            action, task_name, params = parse_command(command)
+            if action != 'create_task':
+                raise ValueError("Unknown action")
+            if task_name in definitions:
+                raise ValueError(f"Task {task_name} is defined more than once")
+            after_tasks = _after_tasks(params)
+            if after_tasks and (params.get('schedule') or params.get('cron_expr')):
+                raise ValueError("Only one of 'after' or 'schedule' can be used")
+            _cache_policy(params)  # an unknown PROBE function fails here, before anything is written
+            definitions[task_name] = {
+                'function': get_function(params['function']),
+                'executor': _executor(params, get_function(params['function'])),
+                'params': params,
+                'after': after_tasks,
+                'trigger': _build_trigger(params.get('schedule'), params.get('cron_expr'), params.get('time_zone')),
+            }
+        except ValueError as e:
+            summary['failed'][task_name or command] = str(e)
+
+    # Every task the batch looks up, read from the jobstore in one query
+    looked_up = set(definitions)
+    for definition in definitions.values():
+        looked_up.update(definition['after'])
+        looked_up.update(result_refs(definition['params']['args'], definition['params']['kwargs']))
+    with job_index.batch(looked_up):
+        new_tasks, updated = {}, []
+        for task_name, definition in definitions.items():
+            indexed = job_index.get(task_name)
+            if indexed is None:
+                new_tasks[task_name] = definition
+            elif _definition_changed(task_name, indexed.definition_hash, definition['function'],
+                                     definition['params'], definition['trigger'], definition['executor']):
+                new_tasks[task_name] = definition
+                updated.append(task_name)
+            else:
+                summary['unchanged'].append(task_name)
+
+        # Drop tasks whose predecessors neither exist nor are created, including those
+        # that depended on a task dropped in an earlier pass
+        dropped = True
+        while dropped:
+            dropped = False
+            for task_name, definition in list(new_tasks.items()):
+                missing = [task for task in definition['after'] if task not in new_tasks and task not in job_index]
+                unknown = [task for task in result_refs(definition['params']['args'], definition['params']['kwargs'])
+                           if task not in new_tasks and task not in job_index]
+                if missing:
+                    summary['failed'][task_name] = f"Required task '{missing[0]}' does not exist to create and schedule {task_name}."
+                elif unknown:
+                    summary['failed'][task_name] = f"Task '{unknown[0]}' referenced by RESULT({unknown[0]}) does not exist to create {task_name}."
+                if missing or unknown:
+                    del new_tasks[task_name]
+                    dropped = True
+
+    # Kahn's algorithm over the new edges and the stored edges of the tasks they lead to
+    # that the batch keeps; whatever cannot be ordered is on a cycle
+    waiting = {name: set(definition['after']) for name, definition in new_tasks.items()}
+    kept = [task for after in waiting.values() for task in after if task not in new_tasks]
+    while kept:
+        task = kept.pop()
+        if task not in waiting:
+            waiting[task] = task_graph.upstream(task)
+            kept.extend(waiting[task])
+    successors: Dict[str, List[str]] = {}
+    for name, after in waiting.items():
+        for task in after:
+            successors.setdefault(task, []).append(name)
+    ready = [name for name, after in waiting.items() if not after]
+    while ready:
+        done = ready.pop()
+        del waiting[done]
+        for name in successors.get(done, ()):
+            after = waiting[name]
+            after.discard(done)
+            if not after:
+                ready.append(name)
+    for task_name in waiting:
+        if task_name in new_tasks:
+            summary['failed'][task_name] = f"Task {task_name} is part of a cyclic AFTER dependency"
+            del new_tasks[task_name]
+
+    jobs = []
+    for task_name, definition in new_tasks.items():
+        params = definition['params']
+        job_function, args = _job_target(definition['function'], params)
+        options = {
+            'func': job_function,
+            'trigger': definition['trigger'],
+            'id': task_name,
+            'name': params['function'],
+            'args': args,
+            'kwargs': params['kwargs'],
+            'max_instances': int(params['server']) if params['server'] else 1,
+            'executor': definition['executor'],
+        }
+        if definition['after']:
+            options['next_run_time'] = None  # paused until its predecessors have run
+        jobs.append(options)
+
+    if jobs:
+        # Replaced tasks get their AFTER edges rewritten too, including to none
+        dependencies = {name: definition['after'] for name, definition in new_tasks.items()
+                        if definition['after'] or name in updated}
+        results = {name: result_refs(definition['params']['args'], definition['params']['kwargs'])
+                   for name, definition in new_tasks.items()}
+        results = {name: reads for name, reads in results.items() if reads or name in updated}
+        previous = {name: task_graph.upstream(name) for name in updated if name in new_tasks}
+        previous_reads = {name: task_graph.reads(name) for name in results}
+
+        def write_graph(connection: Any) -> None:
+            task_graph.add_tasks(dependencies, connection)
+            task_graph.set_results(results, connection)
+
+        try:
+            # The edges are written in the jobs' transaction, so both are stored or neither is
+            for job in add_jobs(sched, jobs, replace_existing=bool(previous), in_transaction=write_graph):
+                job_index.record(job)
+        except Exception as e:
+            task_graph.add_tasks({name: previous.get(name, ()) for name in dependencies})
+            task_graph.set_results(previous_reads)
+            for task_name in new_tasks:
+                summary['failed'][task_name] = f"Batch was not applied: {e}"
         else:
-            raise ValueError("Unknown action")
-    except ValueError as e:
-        logger.error(f"Error: {e}")
+            summary['created'] = [name for name in new_tasks if name not in previous]
+            summary['updated'] = list(previous)
+
+    logger.info(
+        f"Applied {applied} commands: "
+        f"{len(summary['created'])} created, {len(summary['updated'])} updated, "
+        f"{len(summary['unchanged'])} unchanged, {len(summary['failed'])} failed"
+    )
+    for task_name, reason in summary['failed'].items():
+        logger.error(f"Failed to apply {task_name}: {reason}")
+    return summary
 
 
-# Register event listener
-sched.add_listener(event_listener, EVENT_JOB_EXECUTED | EVENT_JOB_ERROR)
+def execute_command(command: str) -> None:
+    with get_tracer().span('create_task') as span:
+        try:
+            with get_tracer().span('parse_command'):
+                action, task_name, params = parse_command(command)
+            span.set_attribute('task', task_name)
 
-if sched.state == 0:  # scheduler is paused
-    sched.resume()
-    logging.info("Scheduler resumed")
+            if action == 'create_task':
+                add_task(task_name, params)
+            else:
+                raise ValueError("Unknown action")
+        except ValueError as e:
+            span.set_attribute('error', str(e))
+            logger.error(f"Error: {e}")
@@ -0,0 +1,214 @@
+# Copyright 2024 Sola Richard Olorunfemi
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import (
+    Boolean, Column, Integer, MetaData, Table, Unicode, case, func, select
+)
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import IntegrityError
+
+if TYPE_CHECKING:
+    from .task_graph import TaskGraph
+
+logger = logging.getLogger(__name__)
+
+
+class DependencyStore:
+    """
+    Persists AFTER edges and per-run readiness next to the APScheduler jobstore.
+
+    One row per (task, upstream task) edge records whether the upstream task has
+    completed in the task's current run. A second table holds the tasks whose
+    results each task reads through RESULT() arguments. A revision counter is
+    bumped whenever either changes so that other processes know when to reload them.
+    """
+
+    def __init__(self, engine: Engine, tablename: str = 'orchestr8_task_dependencies') -> None:
+        self.engine = engine
+        metadata = MetaData()
+        # 191 matches the id length of the APScheduler jobs table
+        self.dependencies_t = Table(
+            tablename, metadata,
+            Column('task_id', Unicode(191), primary_key=True),
+            Column('upstream_id', Unicode(191), primary_key=True, index=True),
+            Column('satisfied', Boolean, nullable=False, default=False)
+        )
+        self.results_t = Table(
+            f'{tablename}_results', metadata,
+            Column('task_id', Unicode(191), primary_key=True),
+            Column('upstream_id', Unicode(191), primary_key=True, index=True)
+        )
+        self.revision_t = Table(
+            f'{tablename}_revision', metadata,
+            Column('id', Integer, primary_key=True, autoincrement=False),
+            Column('revision', Integer, nullable=False)
+        )
+        metadata.create_all(engine)
+
+    def load(self) -> Tuple[int, List[Tuple[str, str, bool]], List[Tuple[str, str]]]:
+        """Return the current revision, every (task, upstream, satisfied) row and every (task, read result) row."""
+        table, results = self.dependencies_t, self.results_t
+        with self.engine.begin() as connection:
+            revision = self._revision(connection)
+            rows = connection.execute(select(table.c.task_id, table.c.upstream_id, table.c.satisfied))
+            edges = [(row.task_id, row.upstream_id, bool(row.satisfied)) for row in rows]
+            reads = [(row.task_id, row.upstream_id) for row in connection.execute(select(results.c.task_id, results.c.upstream_id))]
+            return revision, edges, reads
+
+    def revision(self) -> int:
+        with self.engine.begin() as connection:
+            return self._revision(connection)
+
+    def set_dependencies(self, task_id: str, upstream_ids: Iterable[str]) -> int:
+        """Replace the predecessors of task_id. Returns the new revision."""
+        return self.set_many({task_id: upstream_ids})
+
+    def set_many(self, dependencies: Dict[str, Iterable[str]], connection: Optional[Connection] = None) -> int:
+        """
+        Replace the predecessors of several tasks in one transaction. Returns the new revision.
+
+        Given a `connection`, the edges are written in its open transaction, which the
+        caller commits, rather than in one of their own.
+        """
+        if connection is None:
+            with self.engine.begin() as connection:
+                return self.set_many(dependencies, connection)
+        table = self.dependencies_t
+        rows = [{'task_id': task_id, 'upstream_id': upstream_id, 'satisfied': False}
+                for task_id, upstream_ids in dependencies.items() for upstream_id in upstream_ids]
+        connection.execute(table.delete().where(table.c.task_id.in_(list(dependencies))))
+        if rows:
+            connection.execute(table.insert(), rows)
+        return self._bump(connection)
+
+    def set_results(self, results: Dict[str, Iterable[str]], connection: Optional[Connection] = None) -> int:
+        """Replace the tasks whose results each task reads, like set_many(). Returns the new revision."""
+        if connection is None:
+            with self.engine.begin() as connection:
+                return self.set_results(results, connection)
+        table = self.results_t
+        rows = [{'task_id': task_id, 'upstream_id': upstream_id}
+                for task_id, upstream_ids in results.items() for upstream_id in upstream_ids]
+        connection.execute(table.delete().where(table.c.task_id.in_(list(results))))
+        if rows:
+            connection.execute(table.insert(), rows)
+        return self._bump(connection)
+
+    def remove_dependencies(self, task_id: str, upstream_ids: Optional[Iterable[str]] = None) -> int:
+        """Remove predecessors of task_id, or all of them when upstream_ids is None."""
+        table = self.dependencies_t
+        delete = table.delete().where(table.c.task_id == task_id)
+        if upstream_ids is not None:
+            delete = delete.where(table.c.upstream_id.in_(list(upstream_ids)))
+        with self.engine.begin() as connection:
+            connection.execute(delete)
+            return self._bump(connection)
+
+    def remove_task(self, task_id: str) -> int:
+        """Remove every edge into or out of task_id, and the results it reads."""
+        table = self.dependencies_t
+        with self.engine.begin() as connection:
+            connection.execute(table.delete().where(
+                (table.c.task_id == task_id) | (table.c.upstream_id == task_id)
+            ))
+            connection.execute(self.results_t.delete().where(self.results_t.c.task_id == task_id))
+            return self._bump(connection)
+
+    def record_completion(self, upstream_id: str, task_ids: List[str]) -> List[str]:
+        """
+        Mark upstream_id as completed for each of task_ids.
+
+        Returns the tasks that have no pending predecessor left. Their readiness is reset
+        for the next run in the same transaction, so only one caller releases each run.
+        """
+        if not task_ids:
+            return []
+        table = self.dependencies_t
+        with self.engine.begin() as connection:
+            if connection.dialect.name != 'sqlite':
+                # Under READ COMMITTED two upstreams completing at once would each miss the
+                # other's uncommitted row and neither would release the task, so lock every
+                # row of the tasks first, in one order to avoid deadlocks. SQLite already
+                # serializes the transactions on the write lock its first UPDATE takes.
+                connection.execute(
+                    select(table.c.task_id)
+                    .where(table.c.task_id.in_(task_ids))
+                    .order_by(table.c.task_id, table.c.upstream_id)
+                    .with_for_update()
+                ).fetchall()
+            connection.execute(
+                table.update()
+                .where(table.c.upstream_id == upstream_id, table.c.task_id.in_(task_ids))
+                .values(satisfied=True)
+            )
+            waiting = func.sum(case((table.c.satisfied == False, 1), else_=0))  # noqa: E712
+            ready = [
+                row.task_id for row in connection.execute(
+                    select(table.c.task_id)
+                    .where(table.c.task_id.in_(task_ids))
+                    .group_by(table.c.task_id)
+                    .having(waiting == 0)
+                )
+            ]
+            if ready:
+                connection.execute(
+                    table.update().where(table.c.task_id.in_(ready)).values(satisfied=False)
+                )
+            return ready
+
+    def _revision(self, connection: Connection) -> int:
+        revision = connection.execute(
+            select(self.revision_t.c.revision).where(self.revision_t.c.id == 1)
+        ).scalar()
+        return revision or 0
+
+    def _bump(self, connection: Connection) -> int:
+        bump = (self.revision_t.update()
+                .where(self.revision_t.c.id == 1)
+                .values(revision=self.revision_t.c.revision + 1))
+        if connection.execute(bump).rowcount == 0:
+            # First write to this database. Another process may be creating the row too,
+            # so insert it only if it is still missing and bump whichever row won
+            self._insert_missing(connection, id=1, revision=0)
+            connection.execute(bump)
+        return self._revision(connection)
+
+    def _insert_missing(self, connection: Connection, **values: int) -> None:
+        """INSERT `values` into the revision table unless a row with the same key exists."""
+        table = self.revision_t
+        dialect = connection.dialect.name
+        if dialect == 'sqlite':
+            connection.execute(sqlite.insert(table).values(**values).on_conflict_do_nothing())
+        elif dialect == 'postgresql':
+            connection.execute(postgresql.insert(table).values(**values).on_conflict_do_nothing())
+        elif dialect in ('mysql', 'mariadb'):
+            connection.execute(table.insert().prefix_with('IGNORE').values(**values))
+        else:
+            try:
+                with connection.begin_nested():
+                    connection.execute(table.insert().values(**values))
+            except IntegrityError:
+                pass
+
+
+def persist_task_graph(graph: 'TaskGraph', engine: Optional[Engine]) -> None:
+    """Back `graph` with a DependencyStore on `engine`, once per process."""
+    if graph.persistent:
+        return
+    if engine is None:
+        logger.warning("Jobstore is not an SQLAlchemy database; AFTER dependencies are kept in memory only")
+        return
+    graph.attach(DependencyStore(engine))
@@ -11,6 +11,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+# Task functions, by the name CREATE TASK refers to them. The lines are read, not run:
+# a module is imported when a task first needs one of its functions. Either form works:
+#   from package.module import function [as name]
+#   name = package.module:function
+
 from Job.automated_test import data_validate
 from example_calculator import minus_task
 from example_calculator import times_task
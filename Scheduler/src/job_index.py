@@ -0,0 +1,254 @@
+# Copyright 2024 Sola Richard Olorunfemi
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, Iterator, NamedTuple, Optional, Set, Union
+from sqlalchemy import select
+from apscheduler.events import (
+    EVENT_ALL_JOBS_REMOVED, EVENT_JOB_ADDED, EVENT_JOB_MAX_INSTANCES, EVENT_JOB_MODIFIED,
+    EVENT_JOB_REMOVED, EVENT_JOB_SUBMITTED, EVENT_JOBSTORE_ADDED, EVENT_JOBSTORE_REMOVED, SchedulerEvent
+)
+from apscheduler.job import Job
+from apscheduler.jobstores.base import BaseJobStore
+from apscheduler.jobstores.memory import MemoryJobStore
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+from apscheduler.schedulers.base import BaseScheduler
+from apscheduler.triggers.base import BaseTrigger
+from apscheduler.triggers.date import DateTrigger
+from apscheduler.util import obj_to_ref
+
+
+class IndexedJob(NamedTuple):
+    trigger: Optional[BaseTrigger]
+    next_run_time: Optional[datetime]
+    definition_hash: str
+
+
+def _func_key(func: Union[str, Callable]) -> str:
+    if isinstance(func, str):
+        return func
+    try:
+        return obj_to_ref(func)
+    except ValueError:
+        # Not importable, e.g. a nested function; its qualified name is still stable
+        # across processes, unlike a repr() holding its address
+        qualname = getattr(func, '__qualname__', None)
+        return f"{func.__module__}:{qualname}" if qualname and hasattr(func, '__module__') else repr(func)
+
+
+def _arg_key(value: Any) -> Any:
+    """`value` with the callables in it, such as the task function of a RESULT() task, replaced by their reference."""
+    if callable(value) and not isinstance(value, type):
+        return 'callable', _func_key(value)
+    if isinstance(value, tuple):
+        return type(value).__name__, tuple(_arg_key(item) for item in value)
+    if isinstance(value, list):
+        return [_arg_key(item) for item in value]
+    if isinstance(value, dict):
+        return {key: _arg_key(item) for key, item in value.items()}
+    return value
+
+
+def _trigger_key(trigger: Optional[BaseTrigger]) -> Any:
+    # add_job() turns a missing trigger into a run-once DateTrigger, which is how
+    # AFTER tasks are stored, so both count as "no schedule"
+    if trigger is None or isinstance(trigger, DateTrigger):
+        return None
+    return type(trigger).__name__, str(trigger), str(getattr(trigger, 'timezone', None))
+
+
+def definition_hash(func: Union[str, Callable], args: Iterable[Any], kwargs: Dict[str, Any],
+                    trigger: Optional[BaseTrigger], max_instances: int, executor: str = 'default') -> str:
+    """Hash of what a task runs, when and where, ignoring its current run state."""
+    kwargs_key = sorted((key, _arg_key(value)) for key, value in kwargs.items())
+    definition = (_func_key(func), _arg_key(tuple(args)), kwargs_key, _trigger_key(trigger), max_instances, executor)
+    return hashlib.sha1(repr(definition).encode()).hexdigest()
+
+
+def job_definition_hash(job: Job) -> str:
+    return definition_hash(job.func_ref or job.func, job.args, job.kwargs, job.trigger, job.max_instances, job.executor)
+
+
+class JobIndex:
+    """
+    In-memory index of the scheduler's jobs: id to trigger, next run time and definition hash.
+
+    The jobstore is read once, on first use. Afterwards the index follows the
+    scheduler's job events: a removed job is dropped, and an added or modified job
+    is read again from the jobstore on its next lookup. Next run times are advanced
+    from the submission events the same way the scheduler computes them, so a job
+    that keeps running is never re-read. Existence checks for unknown ids are
+    answered from memory.
+
+    Events only report this process's writes, so the index is trusted on its own
+    only when the default jobstore is process-local (memory, or a snapshot of it).
+    With an SQLAlchemy jobstore every lookup reads the job's stored state and
+    reuses the indexed entry when that state is unchanged, sparing the unpickle;
+    inside batch() the states of all the ids a batch needs are read in one query
+    and lookups of those ids are answered from memory. With any other jobstore
+    lookups go to the jobstore. Jobstore reads are made outside the index's lock.
+    """
+
+    EVENTS = (EVENT_JOB_ADDED | EVENT_JOB_MODIFIED | EVENT_JOB_REMOVED | EVENT_JOB_SUBMITTED
+              | EVENT_JOB_MAX_INSTANCES | EVENT_ALL_JOBS_REMOVED | EVENT_JOBSTORE_ADDED | EVENT_JOBSTORE_REMOVED)
+
+    def __init__(self, sched: Optional[BaseScheduler] = None) -> None:
+        self._jobs: Dict[str, IndexedJob] = {}
+        self._stale: Set[str] = set()
+        self._loaded = False
+        self._lock = threading.RLock()
+        self._sched: Optional[BaseScheduler] = None
+        self._store: Optional[BaseJobStore] = None
+        self._digests: Dict[str, bytes] = {}
+        self._confirmed: Dict[str, int] = {}
+        if sched is not None:
+            self.attach(sched)
+
+    def __contains__(self, job_id: str) -> bool:
+        return self.get(job_id) is not None
+
+    def attach(self, sched: BaseScheduler) -> None:
+        """Follow the jobs of `sched`. Attaching the same scheduler again is a no-op."""
+        with self._lock:
+            if sched is self._sched:
+                return
+            self._sched = sched
+            self._loaded = False
+            sched.add_listener(self._on_event, self.EVENTS)
+
+    def refresh(self) -> None:
+        """Reload every job from the jobstore."""
+        with self._lock:
+            self._jobs = {job.id: self._entry(job) for job in self._sched.get_jobs()}
+            self._stale.clear()
+            self._digests.clear()
+            try:
+                self._store = self._sched._lookup_jobstore('default')
+            except KeyError:
+                self._store = None  # not started yet; added jobs are held by the scheduler
+            self._loaded = True
+
+    def get(self, job_id: str) -> Optional[IndexedJob]:
+        """The indexed job, or None when the scheduler has no job with this id."""
+        with self._lock:
+            if not self._loaded:
+                self.refresh()
+            store = self._store
+            if isinstance(store, MemoryJobStore):
+                if job_id in self._stale:
+                    self._stale.discard(job_id)
+                    job = self._sched.get_job(job_id)
+                    if job is None:
+                        self._jobs.pop(job_id, None)
+                    else:
+                        self._jobs[job_id] = self._entry(job)
+                return self._jobs.get(job_id)
+            if job_id in self._confirmed and job_id not in self._stale:
+                return self._jobs.get(job_id)
+        if isinstance(store, SQLAlchemyJobStore):
+            return self._confirm(store, [job_id]).get(job_id)
+        job = self._sched.get_job(job_id)
+        return None if job is None else self._entry(job)
+
+    @contextmanager
+    def batch(self, job_ids: Iterable[str]) -> Iterator[None]:
+        """
+        Answer lookups of `job_ids` inside the block from one read of the shared jobstore.
+
+        Writes of other processes made during the block are not seen until it ends;
+        this process's writes are, through its job events and record().
+        """
+        job_ids = set(job_ids)
+        with self._lock:
+            if not self._loaded:
+                self.refresh()
+            store = self._store
+        if not isinstance(store, SQLAlchemyJobStore):
+            yield
+            return
+        self._confirm(store, job_ids)
+        with self._lock:
+            for job_id in job_ids:
+                self._confirmed[job_id] = self._confirmed.get(job_id, 0) + 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                for job_id in job_ids:
+                    self._confirmed[job_id] -= 1
+                    if not self._confirmed[job_id]:
+                        del self._confirmed[job_id]
+
+    def record(self, job: Job) -> None:
+        """Index a job just written through the scheduler, sparing the read-back."""
+        with self._lock:
+            if self._loaded:
+                self._jobs[job.id] = self._entry(job)
+                self._stale.discard(job.id)
+                self._digests.pop(job.id, None)
+
+    def _confirm(self, store: SQLAlchemyJobStore, job_ids: Iterable[str]) -> Dict[str, IndexedJob]:
+        """
+        Check the indexed jobs against their rows in the shared jobstore, which other
+        processes also write, and return those that exist. Only jobs whose stored state
+        changed are unpickled again.
+        """
+        job_ids, jobs_t, states = list(job_ids), store.jobs_t, {}
+        with store.engine.begin() as connection:
+            for start in range(0, len(job_ids), 500):
+                chunk = job_ids[start:start + 500]
+                rows = connection.execute(select(jobs_t.c.id, jobs_t.c.job_state).where(jobs_t.c.id.in_(chunk)))
+                states.update((row.id, row.job_state) for row in rows)
+        digests = {job_id: hashlib.sha1(job_state).digest() for job_id, job_state in states.items()}
+        with self._lock:
+            changed = [job_id for job_id, digest in digests.items()
+                       if job_id not in self._jobs or self._digests.get(job_id) != digest]
+        entries = {job_id: self._entry(store._reconstitute_job(states[job_id])) for job_id in changed}
+        with self._lock:
+            for job_id in job_ids:
+                self._stale.discard(job_id)
+                if job_id not in states:
+                    self._jobs.pop(job_id, None)
+                    self._digests.pop(job_id, None)
+            for job_id, entry in entries.items():
+                self._jobs[job_id] = entry
+                self._digests[job_id] = digests[job_id]
+            return {job_id: self._jobs[job_id] for job_id in states if job_id in self._jobs}
+
+    @staticmethod
+    def _entry(job: Job) -> IndexedJob:
+        # Jobs added before the scheduler starts have no next run time yet
+        return IndexedJob(job.trigger, getattr(job, 'next_run_time', None), job_definition_hash(job))
+
+    def _on_event(self, event: SchedulerEvent) -> None:
+        with self._lock:
+            if event.code in (EVENT_ALL_JOBS_REMOVED, EVENT_JOBSTORE_ADDED, EVENT_JOBSTORE_REMOVED):
+                self._loaded = False
+            elif event.code == EVENT_JOB_REMOVED:
+                self._jobs.pop(event.job_id, None)
+                self._stale.discard(event.job_id)
+            elif event.code in (EVENT_JOB_ADDED, EVENT_JOB_MODIFIED):
+                self._stale.add(event.job_id)
+            elif event.job_id in self._jobs and event.job_id not in self._stale:
+                # EVENT_JOB_SUBMITTED / EVENT_JOB_MAX_INSTANCES: the scheduler has moved the
+                # job to the fire time following its last scheduled run
+                entry = self._jobs[event.job_id]
+                next_run_time = entry.trigger.get_next_fire_time(
+                    event.scheduled_run_times[-1], datetime.now(self._sched.timezone))
+                self._jobs[event.job_id] = entry._replace(next_run_time=next_run_time)
+
+
+job_index = JobIndex()
@@ -11,31 +11,259 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import pickle
+import threading
+from datetime import datetime
 from pytz import timezone
 import logging
+from typing import Any, Callable, Dict, List, Optional
+from sqlalchemy import bindparam, create_engine, event
+from sqlalchemy.engine import Connection, Engine, make_url
+from sqlalchemy.pool import QueuePool
+from apscheduler.events import EVENT_JOB_ADDED, JobEvent
+from apscheduler.job import Job
+from apscheduler.jobstores.base import ConflictingIdError
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+from apscheduler.schedulers.base import BaseScheduler, STATE_RUNNING
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.schedulers.blocking import BlockingScheduler
-from apscheduler.executors.pool import ThreadPoolExecutor, ProcessPoolExecutor
+from apscheduler.executors.base import BaseExecutor
+from .asyncio_scheduler import ThreadedAsyncIOScheduler
+from .metrics import MeteredAsyncIOExecutor, MeteredProcessPoolExecutor, MeteredThreadPoolExecutor
+from .tracing import get_tracer
+from apscheduler.util import datetime_to_utc_timestamp
+from sqlalchemy.exc import IntegrityError
 
 from .utils import (
     get_scheduler_type,
     get_scheduler_start_paused,
+    get_scheduler_shutdown_wait,
+    get_executor_settings,
+    get_import_file,
     get_jobstore_settings,
+    get_sqlite_settings,
     get_timezone,
+    get_worker_settings,
     get_error_log_settings
 )
 
 # logging.basicConfig(level=logging.DEBUG, file=get_error_log_settings())
+logger = logging.getLogger(__name__)
 
-jobstore_settings = get_jobstore_settings()
+SQLITE_JOURNAL_MODES = ('DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF')
+SQLITE_SYNCHRONOUS = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
 
-scheduler_time_zone = timezone(get_timezone().lower())
 
-jobstore_type = jobstore_settings.get('jobstore_type', 'sqlite')
-jobstore_url = jobstore_settings.get('jobstore_url', 'sqlite:///jobs.sqlite')
+def is_sqlite_file(url: str) -> bool:
+    """Whether `url` points at an SQLite database file rather than an in-memory one."""
+    url = make_url(url)
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:')
 
 
-def scheduler():
+def sqlite_engine(url: str, settings: Optional[Dict[str, Any]] = None) -> Engine:
+    """
+    Engine for an SQLite jobstore file, tuned for several processes sharing it.
+
+    Every pooled connection gets the configured journal_mode, synchronous and
+    busy_timeout pragmas, so a writer waits for a lock held by another process
+    instead of failing with "database is locked".
+    """
+    settings = get_sqlite_settings() if settings is None else settings
+    journal_mode = str(settings.get('journal_mode', 'WAL')).upper()
+    synchronous = str(settings.get('synchronous', 'NORMAL')).upper()
+    busy_timeout = int(settings.get('busy_timeout', 5000))
+    if journal_mode not in SQLITE_JOURNAL_MODES:
+        raise ValueError(f"SQLITE_JOURNAL_MODE must be one of {', '.join(SQLITE_JOURNAL_MODES)}")
+    if synchronous not in SQLITE_SYNCHRONOUS:
+        raise ValueError(f"SQLITE_SYNCHRONOUS must be one of {', '.join(SQLITE_SYNCHRONOUS)}")
+
+    engine = create_engine(
+        url,
+        poolclass=QueuePool,
+        pool_size=int(settings.get('pool_size', 5)),
+        max_overflow=10,
+        # The scheduler thread, executors and listeners all use the jobstore
+        connect_args={'check_same_thread': False, 'timeout': busy_timeout / 1000}
+    )
+
+    @event.listens_for(engine, 'connect')
+    def _set_pragmas(dbapi_connection, connection_record) -> None:
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f'PRAGMA journal_mode={journal_mode}')
+        cursor.execute(f'PRAGMA synchronous={synchronous}')
+        cursor.execute(f'PRAGMA busy_timeout={busy_timeout}')
+        cursor.close()
+
+    return engine
+
+
+class BatchedSQLAlchemyJobStore(SQLAlchemyJobStore):
+    """
+    SQLAlchemyJobStore writing the next run times of one wakeup in a single transaction.
+
+    On each wakeup the scheduler calls get_due_jobs(), then update_job() once per job
+    it ran, then get_next_run_time(). The updates in between are buffered and written
+    together when get_next_run_time() is called. Any other read or write flushes the
+    buffer first, so callers always see their own writes. The scheduler serializes
+    jobstore calls, so the buffer needs no lock of its own.
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._batching = False
+        self._pending: Dict[str, Job] = {}
+        self._batch_update = self.jobs_t.update().where(self.jobs_t.c.id == bindparam('job_id')).values(
+            next_run_time=bindparam('run_time'), job_state=bindparam('state'))
+
+    def get_due_jobs(self, now):
+        self.flush()
+        self._batching = True
+        return super().get_due_jobs(now)
+
+    def update_job(self, job):
+        if self._batching:
+            self._pending[job.id] = job
+        else:
+            with get_tracer().span('jobstore.update_job'):
+                super().update_job(job)
+
+    def get_next_run_time(self):
+        self._batching = False
+        self.flush()
+        return super().get_next_run_time()
+
+    def flush(self) -> None:
+        """Write the buffered updates."""
+        if not self._pending:
+            return
+        jobs, self._pending = list(self._pending.values()), {}
+        rows = [{
+            'job_id': job.id,
+            'run_time': datetime_to_utc_timestamp(job.next_run_time),
+            'state': pickle.dumps(job.__getstate__(), self.pickle_protocol)
+        } for job in jobs]
+        with self.engine.begin() as connection:
+            result = connection.execute(self._batch_update, rows)
+        if result.rowcount != -1 and result.rowcount < len(rows):
+            logger.warning(f"{len(rows) - result.rowcount} of {len(rows)} updated jobs were removed by another process")
+
+    def lookup_job(self, job_id):
+        self.flush()
+        return super().lookup_job(job_id)
+
+    def get_all_jobs(self):
+        self.flush()
+        return super().get_all_jobs()
+
+    def add_job(self, job):
+        self.flush()
+        # SQLAlchemyJobStore.add_job, with the serialization and the commit traced apart
+        with get_tracer().span('jobstore.serialize'):
+            state = pickle.dumps(job.__getstate__(), self.pickle_protocol)
+        insert = self.jobs_t.insert().values(
+            id=job.id, next_run_time=datetime_to_utc_timestamp(job.next_run_time), job_state=state)
+        with get_tracer().span('jobstore.commit'):
+            with self.engine.begin() as connection:
+                try:
+                    connection.execute(insert)
+                except IntegrityError:
+                    raise ConflictingIdError(job.id)
+
+    def remove_job(self, job_id):
+        self._pending.pop(job_id, None)
+        self.flush()
+        super().remove_job(job_id)
+
+    def remove_all_jobs(self):
+        self._pending.clear()
+        super().remove_all_jobs()
+
+    def shutdown(self):
+        self.flush()
+        super().shutdown()
+
+
+def _sqlalchemy_jobstore(url: str) -> SQLAlchemyJobStore:
+    """The default jobstore: the SQLite profile for SQLite files, a plain SQLAlchemyJobStore otherwise."""
+    if not is_sqlite_file(url):
+        return SQLAlchemyJobStore(url=url)
+    settings = get_sqlite_settings()
+    store_class = BatchedSQLAlchemyJobStore if settings.get('batch_updates', True) else SQLAlchemyJobStore
+    return store_class(engine=sqlite_engine(url, settings))
+
+
+WORKER_MODES = ('lease', 'leader')
+
+
+def _shared_jobstore(url: str, settings: Dict[str, Any]) -> SQLAlchemyJobStore:
+    """The jobstore of worker mode, shared with the other scheduler processes."""
+    mode = str(settings['mode']).lower()
+    if mode == 'lease':
+        from .leased_jobstore import LeasedJobStore as store_class
+    elif mode == 'leader':
+        from .leader_jobstore import LeaderJobStore as store_class
+    else:
+        raise ValueError(f"Unknown WORKER_MODE '{settings['mode']}'. Options: {', '.join(WORKER_MODES)}")
+
+    options = {
+        'worker_id': settings.get('worker_id'),
+        'lease_ttl': float(settings.get('lease_ttl', 30)),
+        'heartbeat_interval': float(settings.get('heartbeat_interval', 10)),
+        'poll_interval': float(settings.get('poll_interval', 1)),
+        'max_claims': int(settings.get('max_claims', 20)),
+    }
+    if is_sqlite_file(url):
+        return store_class(engine=sqlite_engine(url), **options)
+    return store_class(url=url, **options)
+
+
+EXECUTOR_TYPES = ('thread', 'process', 'warm_process', 'asyncio')
+
+
+def build_executors(settings: Dict[str, Dict[str, Any]], scheduler_type: str) -> Dict[str, BaseExecutor]:
+    """
+    Create the named executor pools of the EXECUTORS setting.
+
+    Each entry maps a pool name to its 'type' (thread, process, warm_process or asyncio)
+    and, for thread and process pools, its 'max_workers'. A warm_process pool may also
+    name the 'import_file' its workers load; IMPORT_FILE by default. Tasks pick a pool
+    by name with the EXECUTOR clause; those without one run on 'default'. Every pool
+    reports its run timings and load to the metrics registry.
+    """
+    executors: Dict[str, BaseExecutor] = {}
+    for name, options in settings.items():
+        executor_type = str(options.get('type', 'thread')).lower()
+        if executor_type == 'thread':
+            executors[name] = MeteredThreadPoolExecutor(int(options.get('max_workers', 10)))
+        elif executor_type == 'process':
+            executors[name] = MeteredProcessPoolExecutor(int(options.get('max_workers', 5)))
+        elif executor_type == 'warm_process':
+            from .warm_pool import WarmProcessPoolExecutor
+            executors[name] = WarmProcessPoolExecutor(int(options.get('max_workers', 5)),
+                                                      import_file=options.get('import_file', get_import_file()))
+        elif executor_type == 'asyncio':
+            if scheduler_type.lower() != 'asyncioscheduler':
+                raise ValueError(f"Executor '{name}': asyncio executors need SCHEDULER_TYPE = 'AsyncIOScheduler'")
+            executors[name] = MeteredAsyncIOExecutor()
+        else:
+            raise ValueError(f"Executor '{name}' has unknown type '{executor_type}'. Options: {', '.join(EXECUTOR_TYPES)}")
+    if 'default' not in executors:
+        raise ValueError("EXECUTORS must define a 'default' executor")
+    if scheduler_type.lower() == 'asyncioscheduler' and 'asyncio' not in executors:
+        # async def tasks without an EXECUTOR clause are routed here
+        executors['asyncio'] = MeteredAsyncIOExecutor()
+    return executors
+
+
+def _build_scheduler() -> BaseScheduler:
+    """Create (but do not start) a scheduler from the configured settings."""
+    jobstore_settings = get_jobstore_settings()
+    jobstore_type = jobstore_settings.get('jobstore_type', 'sqlite')
+    jobstore_url = jobstore_settings.get('jobstore_url', 'sqlite:///jobs.sqlite')
+    scheduler_time_zone = timezone(get_timezone().lower())
+    worker_settings = get_worker_settings()
+    if worker_settings.get('mode') and jobstore_type.lower() in ('mongodb', 'memory+snapshot'):
+        raise ValueError(f"WORKER_MODE needs an SQL jobstore, not JOBSTORE = '{jobstore_type}'")
 
     if jobstore_type.lower() == 'mongodb':
         from apscheduler.jobstores.mongodb import MongoDBJobStore
@@ -43,31 +271,216 @@ def scheduler():
         jobstores = {
             'mongo': MongoDBJobStore(client=jobstore_url)
         }
+    elif jobstore_type.lower() == 'memory+snapshot':
+        from .snapshot_jobstore import SnapshotJobStore
+
+        jobstores = {
+            'default': SnapshotJobStore(
+                engine=sqlite_engine(jobstore_url) if is_sqlite_file(jobstore_url) else None,
+                url=jobstore_url, flush_interval=jobstore_settings.get('snapshot_interval', 5)
+            )
+        }
+    elif worker_settings.get('mode'):
+        jobstores = {
+            'default': _shared_jobstore(jobstore_url, worker_settings)
+        }
     else:
-        from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
         jobstores = {
-            'default': SQLAlchemyJobStore(url=jobstore_url)
+            'default': _sqlalchemy_jobstore(jobstore_url)
         }
-    executors = {
-        'default': ThreadPoolExecutor(20),
-        'processpool': ProcessPoolExecutor(5)
-    }
+    scheduler_type = get_scheduler_type()
+    executors = build_executors(get_executor_settings(), scheduler_type)
     job_defaults = {
         'coalesce': True,
         'max_instances': 2
     }
 
-    scheduler_type = get_scheduler_type()
-
-    if scheduler_type.lower == 'BlockingScheduler':
+    if scheduler_type.lower() == 'blockingscheduler':
         scheduler = BlockingScheduler(
             jobstores=jobstores, executors=executors,
             job_defaults=job_defaults, timezone=scheduler_time_zone
         )
+    elif scheduler_type.lower() == 'asyncioscheduler':
+        scheduler = ThreadedAsyncIOScheduler(
+            jobstores=jobstores, executors=executors,
+            job_defaults=job_defaults, timezone=scheduler_time_zone
+        )
     else:
         scheduler = BackgroundScheduler(
             jobstores=jobstores, executors=executors,
             job_defaults=job_defaults, timezone=scheduler_time_zone
         )
-    scheduler.start(paused=get_scheduler_start_paused())
     return scheduler
+
+
+# Schedulers whose start() returns, running their loop in a thread of their own
+_THREADED_SCHEDULERS = (BackgroundScheduler, ThreadedAsyncIOScheduler)
+
+
+class SchedulerEngine:
+    """
+    Owns the single scheduler of this process.
+
+    Every module that schedules or inspects jobs shares the scheduler held here,
+    so a process runs one wakeup loop, one jobstore connection pool and one set
+    of executors. The scheduler is built and started on first use.
+    """
+
+    def __init__(self) -> None:
+        self._scheduler: Optional[BaseScheduler] = None
+        self._lock = threading.RLock()
+
+    @property
+    def running(self) -> bool:
+        """Whether the shared scheduler has been started."""
+        return self._scheduler is not None and self._scheduler.running
+
+    def get(self) -> BaseScheduler:
+        """Return the shared scheduler, building and starting it if needed."""
+        with self._lock:
+            scheduler = self._ensure_built()
+            # A blocking scheduler never returns from start(), so the caller starts it explicitly
+            if not scheduler.running and isinstance(scheduler, _THREADED_SCHEDULERS):
+                scheduler.start(paused=get_scheduler_start_paused())
+            return scheduler
+
+    def start(self, paused: Optional[bool] = None) -> BaseScheduler:
+        """Start the shared scheduler. A no-op if it is already running."""
+        paused = get_scheduler_start_paused() if paused is None else paused
+        with self._lock:
+            scheduler = self._ensure_built()
+            if scheduler.running:
+                return scheduler
+            if isinstance(scheduler, _THREADED_SCHEDULERS):
+                scheduler.start(paused=paused)
+                return scheduler
+        scheduler.start(paused=paused)  # blocks until the scheduler is shut down
+        return scheduler
+
+    def shutdown(self, wait: Optional[bool] = None) -> None:
+        """
+        Shut down the shared scheduler, its executors and jobstores.
+
+        A scheduler cannot be restarted once shut down, so the next get() builds a new one.
+        """
+        with self._lock:
+            scheduler, self._scheduler = self._scheduler, None
+        if scheduler is not None and scheduler.running:
+            scheduler.shutdown(get_scheduler_shutdown_wait() if wait is None else wait)
+            logger.info("Scheduler shut down")
+
+    def _ensure_built(self) -> BaseScheduler:
+        if self._scheduler is None:
+            self._scheduler = _build_scheduler()
+        return self._scheduler
+
+
+engine = SchedulerEngine()
+
+
+def get_scheduler() -> BaseScheduler:
+    """Return the process-wide scheduler, starting it on first use."""
+    return engine.get()
+
+
+def start_scheduler(paused: Optional[bool] = None) -> BaseScheduler:
+    """Start the process-wide scheduler."""
+    return engine.start(paused)
+
+
+def shutdown_scheduler(wait: Optional[bool] = None) -> None:
+    """Shut down the process-wide scheduler."""
+    engine.shutdown(wait)
+
+
+def jobstore_engine(sched: BaseScheduler) -> Optional[Engine]:
+    """SQLAlchemy engine of the default jobstore, or None when it is not an SQL database."""
+    try:
+        store = sched._lookup_jobstore('default')
+    except KeyError:
+        return None
+    return getattr(store, 'engine', None)
+
+
+def _batch_insertable(store: Any) -> bool:
+    """Whether jobs can be inserted into `store` with plain rows, as its add_job() would."""
+    return hasattr(store, 'jobs_t') and type(store).add_job in (SQLAlchemyJobStore.add_job,
+                                                                BatchedSQLAlchemyJobStore.add_job)
+
+
+def add_jobs(sched: BaseScheduler, jobs: List[Dict[str, Any]], replace_existing: bool = False,
+             in_transaction: Optional[Callable[[Optional[Connection]], None]] = None) -> List[Job]:
+    """
+    Add several jobs to the default jobstore in a single transaction.
+
+    Each item holds add_job() keyword arguments (trigger instances only). Either every
+    job is stored or none is. With replace_existing, stored jobs with the same ids are
+    replaced in the same transaction. `in_transaction` is called with the connection
+    of that transaction before it commits, so related rows such as AFTER edges are
+    written along with the jobs. Falls back to one add_job() call per job, after
+    calling `in_transaction` with None, when the scheduler is not running or its
+    jobstore is not an SQLAlchemy database or adds jobs its own way.
+    """
+    store = sched._lookup_jobstore('default') if sched.running else None
+    if store is None or not _batch_insertable(store):
+        if in_transaction is not None:
+            in_transaction(None)
+        return [sched.add_job(replace_existing=replace_existing, **options) for options in jobs]
+
+    now = datetime.now(sched.timezone)
+    built = []
+    for options in jobs:
+        options = dict(options)
+        options['trigger'] = sched._create_trigger(options.get('trigger'), {})
+        options['args'] = tuple(options.get('args') or ())
+        options['kwargs'] = dict(options.get('kwargs') or {})
+        options.setdefault('executor', 'default')
+        job = Job(sched, **options)
+
+        # Same defaults the scheduler fills in for add_job()
+        replacements = {key: value for key, value in sched._job_defaults.items() if not hasattr(job, key)}
+        if not hasattr(job, 'next_run_time'):
+            replacements['next_run_time'] = job.trigger.get_next_fire_time(None, now)
+        job._modify(**replacements)
+        job._jobstore_alias = 'default'
+
+        built.append(job)
+
+    with get_tracer().span('jobstore.serialize', jobs=len(built)):
+        rows = [{
+            'id': job.id,
+            'next_run_time': datetime_to_utc_timestamp(job.next_run_time),
+            'job_state': pickle.dumps(job.__getstate__(), store.pickle_protocol)
+        } for job in built]
+
+    # Holding the jobstore lock keeps the scheduler thread from buffering or writing run
+    # times of these jobs while they are replaced
+    with sched._jobstores_lock:
+        pending = getattr(store, '_pending', None)
+        if pending:
+            # A buffered run time update carries the old job state; it must not be
+            # written over the replacement
+            for row in rows:
+                pending.pop(row['id'], None)
+            store.flush()
+        with get_tracer().span('jobstore.commit', jobs=len(rows)), store.engine.begin() as connection:
+            if replace_existing:
+                connection.execute(store.jobs_t.delete().where(store.jobs_t.c.id.in_([row['id'] for row in rows])))
+            try:
+                connection.execute(store.jobs_t.insert(), rows)
+            except IntegrityError as e:
+                raise ConflictingIdError(', '.join(row['id'] for row in rows)) from e
+            if in_transaction is not None:
+                in_transaction(connection)
+
+    for job in built:
+        sched._dispatch_event(JobEvent(EVENT_JOB_ADDED, job.id, 'default'))
+    logger.info(f"Added {len(built)} jobs to job store \"default\" in one transaction")
+    if sched.state == STATE_RUNNING:
+        sched.wakeup()
+    return built
+
+
+def scheduler() -> BaseScheduler:
+    """Return the process-wide scheduler. Kept for callers of the original factory."""
+    return engine.get()
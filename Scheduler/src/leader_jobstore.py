@@ -0,0 +1,337 @@
+# Copyright 2024 Sola Richard Olorunfemi
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import pickle
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+from apscheduler.events import (
+    EVENT_JOB_ERROR, EVENT_JOB_EXECUTED, EVENT_JOB_MAX_INSTANCES, EVENT_JOB_MISSED, EVENT_JOB_REMOVED,
+    EVENT_JOB_SUBMITTED, JobEvent, JobExecutionEvent, JobSubmissionEvent
+)
+from apscheduler.executors.base import MaxInstancesReachedError
+from apscheduler.jobstores.base import JobLookupError
+from apscheduler.schedulers.base import STATE_PAUSED
+from apscheduler.util import datetime_to_utc_timestamp
+from sqlalchemy import Column, Float, Integer, LargeBinary, Table, Unicode, and_, case, func, or_, select
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import IntegrityError
+
+from .leased_jobstore import SharedJobStore
+
+logger = logging.getLogger(__name__)
+
+LEADER_NAME = 'scheduler'
+_DELETE_CHUNK = 500  # Ids per DELETE ... IN (...), below SQLite's bound-parameter limit
+
+
+class LeaderJobStore(SharedJobStore):
+    """
+    Shared jobstore where one elected worker computes triggers and every worker executes runs.
+
+    The leader holds the lease in the leader table and renews it on every scheduler
+    wakeup. Only the leader looks for due jobs. It pushes each due run onto the run
+    queue table and records the job's next run time, in the same transaction that
+    renews its lease, so a worker that has lost the lease cannot queue a run. Other
+    workers wake every `poll_interval` seconds to try to take over. When the leader
+    stops renewing, the first of them to wake after the lease has expired becomes
+    leader. A leader that shuts down cleanly gives up the lease at once.
+
+    Every worker, the leader included, drains the queue in a thread of its own. It
+    claims up to `max_claims` runs at a time and submits them to its own executors,
+    so listeners see the usual job events wherever a run executes. A run being
+    executed is leased to its worker and renewed by the heartbeat. If the worker
+    dies, the run goes back to the queue when its lease expires, so such a run can
+    execute twice. max_instances applies per worker. Removing a job drops its queued
+    runs that no worker is executing.
+    """
+
+    def __init__(self, *args, max_claims: int = 20, leader_tablename: str = 'apscheduler_leader',
+                 queue_tablename: str = 'apscheduler_run_queue', **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        if self.poll_interval >= self.lease_ttl:
+            raise ValueError('poll_interval must be shorter than lease_ttl')
+        self.max_claims = max_claims
+        metadata, schema = self.jobs_t.metadata, self.jobs_t.schema
+        self.leader_t = Table(
+            leader_tablename, metadata,
+            Column('name', Unicode(64), primary_key=True),
+            Column('holder', Unicode(191), nullable=False),
+            Column('expires_at', Float(25), nullable=False),
+            Column('term', Integer, nullable=False),
+            schema=schema
+        )
+        self.queue_t = Table(
+            queue_tablename, metadata,
+            Column('id', Integer, primary_key=True, autoincrement=True),
+            Column('job_id', Unicode(191), nullable=False, index=True),
+            Column('executor', Unicode(191), nullable=False),
+            Column('run_times', LargeBinary, nullable=False),
+            Column('job_state', LargeBinary, nullable=False),
+            Column('queued_at', Float(25), nullable=False),
+            # Set while a worker executes the run
+            Column('worker', Unicode(191), nullable=True),
+            Column('expires_at', Float(25), nullable=True, index=True),
+            schema=schema
+        )
+        self.is_leader = False
+        self.term: Optional[int] = None
+        self._running: Dict[Tuple[str, float], int] = {}
+        self._running_lock = threading.Lock()
+        self._drain_thread: Optional[threading.Thread] = None
+
+    def start(self, scheduler, alias) -> None:
+        super().start(scheduler, alias)
+        try:
+            with self.engine.begin() as connection:
+                connection.execute(self.leader_t.insert().values(name=LEADER_NAME, holder='', expires_at=0, term=0))
+        except IntegrityError:
+            pass  # Created by another worker
+        scheduler.add_listener(self._on_run_finished, EVENT_JOB_EXECUTED | EVENT_JOB_ERROR | EVENT_JOB_MISSED)
+        self._drain_thread = threading.Thread(target=self._drain_loop, name=f'RunQueue-{alias}', daemon=True)
+        self._drain_thread.start()
+
+    def shutdown(self) -> None:
+        self._stop.set()
+        if self._drain_thread is not None:
+            self._drain_thread.join()
+            self._drain_thread = None
+        self._scheduler.remove_listener(self._on_run_finished)
+        if self.is_leader:
+            # Let a follower take over without waiting for the lease to expire
+            with self.engine.begin() as connection:
+                connection.execute(self.leader_t.update().where(and_(
+                    self.leader_t.c.name == LEADER_NAME, self.leader_t.c.holder == self.worker_id
+                )).values(expires_at=0))
+            self._set_leader(False, None)
+        super().shutdown()
+
+    def remove_job(self, job_id):
+        self._pending.pop(job_id, None)
+        self.flush()
+        with self.engine.begin() as connection:
+            if connection.execute(self.jobs_t.delete().where(self.jobs_t.c.id == job_id)).rowcount == 0:
+                raise JobLookupError(job_id)
+            self._drop_waiting_runs(connection, self.queue_t.c.job_id == job_id)
+
+    def remove_all_jobs(self):
+        self._pending.clear()
+        with self.engine.begin() as connection:
+            connection.execute(self.jobs_t.delete())
+            self._drop_waiting_runs(connection)
+
+    def _drop_waiting_runs(self, connection: Connection, *where) -> None:
+        """Delete queued runs that no worker holds a live lease on, so they never start."""
+        queue = self.queue_t
+        connection.execute(queue.delete().where(
+            or_(queue.c.worker.is_(None), queue.c.expires_at < time.time()), *where))
+
+    # Leader side: trigger computation
+
+    def get_due_jobs(self, now):
+        if self._stopping:
+            return []
+        self.flush()
+        events = []
+        with self.engine.begin() as connection:
+            term = self._lead(connection, time.time())
+            if term is not None:
+                events = self._queue_due_runs(connection, now)
+        self._set_leader(term is not None, term)
+        for event in events:
+            self._scheduler._dispatch_event(event)
+        # The runs are executed by whichever worker takes them from the queue
+        return []
+
+    def get_next_run_time(self):
+        if self.is_leader:
+            return super().get_next_run_time()
+        # Followers only wake to check on the leader's lease
+        return datetime.now(timezone.utc) + timedelta(seconds=self.poll_interval)
+
+    def _lead(self, connection: Connection, now: float) -> Optional[int]:
+        """Renew or take the leader lease. Returns the leader term, or None when another worker holds it."""
+        leader = self.leader_t
+        result = connection.execute(leader.update().where(and_(
+            leader.c.name == LEADER_NAME,
+            or_(leader.c.holder == self.worker_id, leader.c.expires_at < now)
+        )).values(
+            holder=self.worker_id, expires_at=now + self.lease_ttl,
+            term=case((leader.c.holder == self.worker_id, leader.c.term), else_=leader.c.term + 1)
+        ))
+        if result.rowcount == 0:
+            return None
+        return connection.execute(select(leader.c.term).where(leader.c.name == LEADER_NAME)).scalar_one()
+
+    def _set_leader(self, leading: bool, term: Optional[int]) -> None:
+        if leading and not self.is_leader:
+            logger.info(f"Worker {self.worker_id} became the scheduler leader (term {term})")
+        elif self.is_leader and not leading:
+            logger.info(f"Worker {self.worker_id} is no longer the scheduler leader")
+        self.is_leader, self.term = leading, term
+
+    def current_leader(self) -> Optional[str]:
+        """Id of the worker holding an unexpired leader lease, if any."""
+        leader = self.leader_t
+        with self.engine.begin() as connection:
+            return connection.execute(select(leader.c.holder).where(and_(
+                leader.c.name == LEADER_NAME, leader.c.expires_at >= time.time()
+            ))).scalar_one_or_none()
+
+    def _queue_due_runs(self, connection: Connection, now: datetime) -> List[JobEvent]:
+        """Queue the due runs and advance their jobs, as the scheduler would when submitting them."""
+        jobs_t = self.jobs_t
+        rows = connection.execute(
+            select(jobs_t.c.id, jobs_t.c.job_state)
+            .where(jobs_t.c.next_run_time <= datetime_to_utc_timestamp(now))
+            .order_by(jobs_t.c.next_run_time)).all()
+        queued, updates, removed, events = [], [], [], []
+        queued_at = time.time()
+        for row in rows:
+            try:
+                job = self._reconstitute_job(row.job_state)
+            except BaseException:
+                logger.exception(f"Unable to restore job \"{row.id}\" -- removing it")
+                removed.append(row.id)
+                continue
+
+            run_times = job._get_run_times(now)
+            run_times = run_times[-1:] if run_times and job.coalesce else run_times
+            if not run_times:
+                continue
+            queued.append({
+                'job_id': job.id, 'executor': job.executor, 'queued_at': queued_at,
+                'run_times': pickle.dumps(run_times, self.pickle_protocol), 'job_state': row.job_state
+            })
+            events.append(JobSubmissionEvent(EVENT_JOB_SUBMITTED, job.id, self._alias, run_times))
+
+            next_run_time = job.trigger.get_next_fire_time(run_times[-1], now)
+            if next_run_time:
+                job._modify(next_run_time=next_run_time)
+                updates.append({
+                    'job_id': job.id,
+                    'run_time': datetime_to_utc_timestamp(next_run_time),
+                    'state': pickle.dumps(job.__getstate__(), self.pickle_protocol)
+                })
+            else:
+                removed.append(job.id)
+                events.append(JobEvent(EVENT_JOB_REMOVED, job.id, self._alias))
+
+        if queued:
+            connection.execute(self.queue_t.insert(), queued)
+        if updates:
+            connection.execute(self._batch_update, updates)
+        for start in range(0, len(removed), _DELETE_CHUNK):
+            connection.execute(jobs_t.delete().where(jobs_t.c.id.in_(removed[start:start + _DELETE_CHUNK])))
+        if queued:
+            logger.debug(f"Leader {self.worker_id} queued {len(queued)} runs")
+        return events
+
+    # Every worker: execution of queued runs
+
+    def drain(self) -> int:
+        """Take queued runs, up to this worker's free capacity, and submit them to its executors. Returns the number taken."""
+        with self._running_lock:
+            capacity = self.max_claims - len(self._running)
+        if capacity <= 0 or self._stopping or self._scheduler.state == STATE_PAUSED:
+            return 0
+
+        queue = self.queue_t
+        now = time.time()
+        # Queued, or taken by a worker that stopped renewing its lease
+        available = or_(queue.c.worker.is_(None), queue.c.expires_at < now)
+        with self.engine.begin() as connection:
+            ids = connection.execute(select(queue.c.id).where(available).order_by(queue.c.id).limit(capacity)).scalars().all()
+            taken = []
+            for run_id in ids:
+                result = connection.execute(queue.update().where(and_(queue.c.id == run_id, available)).values(
+                    worker=self.worker_id, expires_at=now + self.lease_ttl))
+                if result.rowcount == 1:
+                    taken.append(run_id)
+            rows = connection.execute(select(queue).where(queue.c.id.in_(taken)).order_by(queue.c.id)).all() if taken else []
+
+        for row in rows:
+            self._submit(row)
+        return len(rows)
+
+    def _submit(self, row) -> None:
+        try:
+            job = self._reconstitute_job(row.job_state)
+            run_times = pickle.loads(row.run_times)
+            executor = self._scheduler._lookup_executor(row.executor)
+        except BaseException:
+            logger.exception(f"Unable to run the queued run of job \"{row.job_id}\" -- removing it")
+            self._delete_run(row.id)
+            return
+
+        key = (job.id, datetime_to_utc_timestamp(run_times[-1]))
+        with self._running_lock:
+            self._running[key] = row.id
+        try:
+            executor.submit_job(job, run_times)
+        except MaxInstancesReachedError:
+            logger.warning(f"Execution of job \"{job}\" skipped: maximum number of running instances reached "
+                           f"({job.max_instances})")
+            self._scheduler._dispatch_event(JobSubmissionEvent(EVENT_JOB_MAX_INSTANCES, job.id, self._alias, run_times))
+            self._finish(key)
+        except BaseException:
+            if self._stopping:
+                # Shutting down; put the run back for another worker
+                self._finish(key, release=True)
+            else:
+                logger.exception(f"Error submitting job \"{job}\" to executor \"{row.executor}\"")
+                self._finish(key)
+
+    def _on_run_finished(self, event: JobExecutionEvent) -> None:
+        # Only the last of a run's scheduled times closes it
+        self._finish((event.job_id, datetime_to_utc_timestamp(event.scheduled_run_time)))
+
+    def _finish(self, key: Tuple[str, float], release: bool = False) -> None:
+        with self._running_lock:
+            run_id = self._running.pop(key, None)
+        if run_id is None:
+            return
+        try:
+            if release:
+                with self.engine.begin() as connection:
+                    connection.execute(self.queue_t.update().where(self.queue_t.c.id == run_id).values(
+                        worker=None, expires_at=None))
+            else:
+                self._delete_run(run_id)
+        except Exception as e:
+            logger.warning(f"Could not update queued run {run_id} of job {key[0]}: {e}")
+
+    def _delete_run(self, run_id: int) -> None:
+        with self.engine.begin() as connection:
+            connection.execute(self.queue_t.delete().where(self.queue_t.c.id == run_id))
+
+    def _renew(self, connection: Connection, now: float) -> None:
+        connection.execute(self.queue_t.update().where(self.queue_t.c.worker == self.worker_id).values(
+            expires_at=now + self.lease_ttl))
+
+    def queued_runs(self) -> int:
+        """Number of runs in the queue, waiting or being executed."""
+        with self.engine.begin() as connection:
+            return connection.execute(select(func.count()).select_from(self.queue_t)).scalar_one()
+
+    def _drain_loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                taken = self.drain()
+            except Exception as e:
+                logger.warning(f"Taking runs from the queue failed, retrying in {self.poll_interval}s: {e}")
+                taken = 0
+            if not taken:
+                self._stop.wait(self.poll_interval)
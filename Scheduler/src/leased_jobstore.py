@@ -0,0 +1,293 @@
+# Copyright 2024 Sola Richard Olorunfemi
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import os
+import random
+import socket
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Set
+from apscheduler.events import (
+    EVENT_JOB_ERROR, EVENT_JOB_EXECUTED, EVENT_JOB_MAX_INSTANCES, EVENT_JOB_MISSED, JobEvent
+)
+from apscheduler.job import Job
+from apscheduler.schedulers.base import STATE_STOPPED
+from apscheduler.util import datetime_to_utc_timestamp
+from sqlalchemy import (
+    Boolean, Column, Float, Integer, Table, Unicode, and_, bindparam, false, inspect, or_, select
+)
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import IntegrityError, OperationalError, ProgrammingError
+
+from .job_scheduler import BatchedSQLAlchemyJobStore
+
+logger = logging.getLogger(__name__)
+
+_CLAIM_CHUNK = 500  # Ids per SELECT ... IN (...), below SQLite's bound-parameter limit
+CLAIM_RETRY_INTERVAL = 0.1  # Seconds before looking again at runs claimed by another worker
+
+
+def default_worker_id() -> str:
+    """Identify this process among the workers sharing a jobstore."""
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+class SharedJobStore(BatchedSQLAlchemyJobStore):
+    """
+    Base of the jobstores shared by several scheduler processes ("workers").
+
+    Each worker registers in the workers table, and a heartbeat thread refreshes its
+    row every `heartbeat_interval` seconds. Subclasses renew their own leases in
+    `_renew()`, which runs in the same transaction. A worker that misses heartbeats
+    for `lease_ttl` seconds is treated as dead. The scheduler wakes at least every
+    `poll_interval` seconds, so it sees jobs added by other workers. Lease times come
+    from the hosts' clocks, so hosts must keep them in sync.
+    """
+
+    def __init__(self, *args, worker_id: Optional[str] = None, lease_ttl: float = 30.0,
+                 heartbeat_interval: float = 10.0, poll_interval: float = 1.0,
+                 workers_tablename: str = 'apscheduler_workers', **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        if heartbeat_interval >= lease_ttl:
+            raise ValueError('heartbeat_interval must be shorter than lease_ttl')
+        self.worker_id = worker_id or default_worker_id()
+        self.lease_ttl = lease_ttl
+        self.heartbeat_interval = heartbeat_interval
+        self.poll_interval = poll_interval
+        self.workers_t = Table(
+            workers_tablename, self.jobs_t.metadata,
+            Column('id', Unicode(191), primary_key=True),
+            Column('host', Unicode(255), nullable=False),
+            Column('pid', Integer, nullable=False),
+            Column('started_at', Float(25), nullable=False),
+            Column('heartbeat_at', Float(25), nullable=False, index=True),
+            schema=self.jobs_t.schema
+        )
+        self._started_at = time.time()
+        self._stop = threading.Event()
+        self._heartbeat_thread: Optional[threading.Thread] = None
+
+    def start(self, scheduler, alias) -> None:
+        self._create_tables()
+        super().start(scheduler, alias)
+        self.heartbeat()
+        self._stop.clear()
+        self._heartbeat_thread = threading.Thread(target=self._run, name=f'{self.__class__.__name__}-{alias}',
+                                                  daemon=True)
+        self._heartbeat_thread.start()
+        logger.info(f"Worker {self.worker_id} joined the shared jobstore")
+
+    def shutdown(self) -> None:
+        self._stop.set()
+        if self._heartbeat_thread is not None:
+            self._heartbeat_thread.join()
+            self._heartbeat_thread = None
+        self.flush()
+        with self.engine.begin() as connection:
+            connection.execute(self.workers_t.delete().where(self.workers_t.c.id == self.worker_id))
+        super().shutdown()
+
+    def _create_tables(self) -> None:
+        for table in self.jobs_t.metadata.sorted_tables:
+            try:
+                table.create(self.engine, checkfirst=True)
+            except (OperationalError, ProgrammingError):
+                # Workers starting together on a new database race between the check and the CREATE
+                if not inspect(self.engine).has_table(table.name, schema=table.schema):
+                    raise
+
+    @property
+    def _stopping(self) -> bool:
+        # The scheduler thread looks for jobs once more after shutdown() has stopped the
+        # executors; a run taken then would be recorded as done without being executed
+        return self._scheduler.state == STATE_STOPPED
+
+    def get_next_run_time(self):
+        next_run_time = super().get_next_run_time()
+        poll_time = datetime.now(timezone.utc) + timedelta(seconds=self.poll_interval)
+        if next_run_time is None or next_run_time > poll_time:
+            return poll_time
+        return next_run_time
+
+    def heartbeat(self) -> None:
+        """Register this worker and renew its leases."""
+        now = time.time()
+        workers = self.workers_t
+        with self.engine.begin() as connection:
+            result = connection.execute(
+                workers.update().where(workers.c.id == self.worker_id).values(heartbeat_at=now))
+            if result.rowcount == 0:
+                connection.execute(workers.insert().values(
+                    id=self.worker_id, host=socket.gethostname(), pid=os.getpid(),
+                    started_at=self._started_at, heartbeat_at=now))
+            self._renew(connection, now)
+            connection.execute(workers.delete().where(workers.c.heartbeat_at < now - 10 * self.lease_ttl))
+
+    def _renew(self, connection: Connection, now: float) -> None:
+        """Extend the leases this worker holds. Runs inside the heartbeat transaction."""
+
+    def live_workers(self) -> List[str]:
+        """Ids of the workers that sent a heartbeat within the lease TTL."""
+        since = time.time() - self.lease_ttl
+        with self.engine.begin() as connection:
+            return list(connection.execute(
+                select(self.workers_t.c.id).where(self.workers_t.c.heartbeat_at >= since)
+                .order_by(self.workers_t.c.id)).scalars())
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.heartbeat_interval):
+            try:
+                self.heartbeat()
+            except Exception as e:
+                logger.warning(f"Worker heartbeat failed, retrying in {self.heartbeat_interval}s: {e}")
+
+    def __repr__(self) -> str:
+        return f'<{self.__class__.__name__} (url={self.engine.url}, worker={self.worker_id})>'
+
+
+class LeasedJobStore(SharedJobStore):
+    """
+    Shared jobstore where every worker runs its own scheduler and each due run is executed by one of them.
+
+    When a job is due, the workers race to claim that run in the lease table, keyed by
+    the job id and its scheduled run time. A claim is one conditional UPDATE, or an
+    INSERT for a job that has never run, so exactly one worker wins it. get_due_jobs()
+    only returns the runs this worker won. Workers claim at most `max_claims` runs per
+    wakeup, in random order, so a burst of due jobs is shared out between them.
+
+    The lease covers the time between claiming a run and recording the job's next
+    run time. While a job runs, the heartbeat renews its lease. A lease expires
+    `lease_ttl` seconds after the last renewal. If a worker dies before recording the
+    next run time, another worker claims the same run once the lease has expired.
+    max_instances applies per worker.
+    """
+
+    def __init__(self, *args, max_claims: int = 20, leases_tablename: str = 'apscheduler_leases', **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.max_claims = max_claims
+        self.leases_t = Table(
+            leases_tablename, self.jobs_t.metadata,
+            Column('job_id', Unicode(191), primary_key=True),
+            Column('run_time', Float(25), nullable=False),
+            Column('worker', Unicode(191), nullable=False),
+            Column('expires_at', Float(25), nullable=False, index=True),
+            Column('finished', Boolean, nullable=False, default=False),
+            schema=self.jobs_t.schema
+        )
+        c = self.leases_t.c
+        self._claim_update = self.leases_t.update().where(and_(
+            c.job_id == bindparam('b_job_id'),
+            or_(
+                c.run_time < bindparam('b_run_time'),
+                # The same run, claimed by a worker that stopped renewing its lease
+                and_(c.run_time == bindparam('b_run_time'), c.expires_at < bindparam('b_now'))
+            )
+        )).values(run_time=bindparam('b_run_time'), worker=bindparam('b_worker'),
+                  expires_at=bindparam('b_expires_at'), finished=False)
+        self._lost_claims = False
+
+    def start(self, scheduler, alias) -> None:
+        super().start(scheduler, alias)
+        scheduler.add_listener(self._on_run_finished,
+                               EVENT_JOB_EXECUTED | EVENT_JOB_ERROR | EVENT_JOB_MISSED | EVENT_JOB_MAX_INSTANCES)
+
+    def shutdown(self) -> None:
+        self._scheduler.remove_listener(self._on_run_finished)
+        super().shutdown()
+
+    def get_due_jobs(self, now):
+        self._lost_claims = False
+        if self._stopping:
+            return []
+        due = super().get_due_jobs(now)
+        if not due:
+            return due
+        candidates = list(due)
+        random.shuffle(candidates)
+        claimed: Set[str] = set()
+        lost = 0
+        while candidates and len(claimed) < self.max_claims:
+            batch, candidates = candidates[:self.max_claims - len(claimed)], candidates[self.max_claims - len(claimed):]
+            won = self._claim(batch)
+            claimed |= won
+            lost += len(batch) - len(won)
+        self._lost_claims = lost > 0
+        if len(claimed) < len(due):
+            logger.debug(f"Worker {self.worker_id} claimed {len(claimed)} of {len(due)} due runs")
+        return [job for job in due if job.id in claimed]
+
+    def get_next_run_time(self):
+        next_run_time = super().get_next_run_time()
+        if self._lost_claims:
+            # Runs won by another worker stay due until it records their next run time
+            next_run_time = max(next_run_time, datetime.now(timezone.utc) + timedelta(seconds=CLAIM_RETRY_INTERVAL))
+        return next_run_time
+
+    def _claim(self, jobs: List[Job]) -> Set[str]:
+        """Claim the due run of each job. Returns the ids of the jobs this worker won."""
+        now = time.time()
+        run_times = {job.id: datetime_to_utc_timestamp(job.next_run_time) for job in jobs}
+        ids = list(run_times)
+        claimed: Set[str] = set()
+        leased: Set[str] = set()
+        with self.engine.begin() as connection:
+            for start in range(0, len(ids), _CLAIM_CHUNK):
+                chunk = ids[start:start + _CLAIM_CHUNK]
+                leased.update(connection.execute(
+                    select(self.leases_t.c.job_id).where(self.leases_t.c.job_id.in_(chunk))).scalars())
+            for job_id in ids:
+                if job_id not in leased:
+                    continue
+                result = connection.execute(self._claim_update, {
+                    'b_job_id': job_id, 'b_run_time': run_times[job_id], 'b_now': now,
+                    'b_worker': self.worker_id, 'b_expires_at': now + self.lease_ttl
+                })
+                if result.rowcount == 1:
+                    claimed.add(job_id)
+
+        # First run of a job: the primary key decides between workers inserting at once
+        for job_id in ids:
+            if job_id in leased:
+                continue
+            try:
+                with self.engine.begin() as connection:
+                    connection.execute(self.leases_t.insert().values(
+                        job_id=job_id, run_time=run_times[job_id], worker=self.worker_id,
+                        expires_at=now + self.lease_ttl, finished=False))
+            except IntegrityError:
+                continue
+            claimed.add(job_id)
+        return claimed
+
+    def _on_run_finished(self, event: JobEvent) -> None:
+        # Stop renewing the lease; it expires on its own
+        try:
+            with self.engine.begin() as connection:
+                connection.execute(self.leases_t.update().where(and_(
+                    self.leases_t.c.job_id == event.job_id, self.leases_t.c.worker == self.worker_id
+                )).values(finished=True))
+        except Exception as e:
+            logger.warning(f"Could not release the lease of job {event.job_id}: {e}")
+
+    def _renew(self, connection: Connection, now: float) -> None:
+        leases = self.leases_t
+        connection.execute(leases.update().where(and_(
+            leases.c.worker == self.worker_id, leases.c.finished == false()
+        )).values(expires_at=now + self.lease_ttl))
+        # Kept for a while after expiry so a worker with a stale view of the job cannot claim the run again
+        connection.execute(leases.delete().where(and_(
+            leases.c.expires_at < now - self.lease_ttl,
+            leases.c.job_id.not_in(select(self.jobs_t.c.id))
+        )))
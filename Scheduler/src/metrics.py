@@ -0,0 +1,418 @@
+# Copyright 2024 Sola Richard Olorunfemi
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import sys
+import threading
+import time
+import urllib.request
+from bisect import bisect_left
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+from apscheduler.events import (EVENT_JOB_ERROR, EVENT_JOB_EXECUTED, EVENT_JOB_MAX_INSTANCES, EVENT_JOB_MISSED,
+                                JobEvent)
+from apscheduler.executors.asyncio import AsyncIOExecutor
+from apscheduler.executors.base import run_job
+from apscheduler.executors.base_py3 import run_coroutine_job
+from apscheduler.executors.pool import BrokenProcessPool, ProcessPoolExecutor, ThreadPoolExecutor
+from apscheduler.util import iscoroutinefunction_partial
+
+from .result_store import get_result_store
+from .utils import get_metrics_settings
+
+logger = logging.getLogger(__name__)
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+DEPTH_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+FOLD_THRESHOLD = 10000  # Pending samples at which a writer folds them, if no reader is doing so
+
+Labels = Tuple[Tuple[str, str], ...]
+
+METRICS = {
+    'orchestr8_job_start_lag_seconds': ('histogram', 'Delay from the scheduled run time to the start of the run'),
+    'orchestr8_job_duration_seconds': ('histogram', 'Time spent in the job function'),
+    'orchestr8_job_runs_total': ('counter', 'Finished runs by outcome'),
+    'orchestr8_job_missed_total': ('counter', 'Runs dropped for starting later than the misfire grace time'),
+    'orchestr8_job_coalesced_total': ('counter', 'Overdue runs merged into a single run by coalescing'),
+    'orchestr8_job_max_instances_total': ('counter', 'Runs skipped because max_instances runs were in progress'),
+    'orchestr8_executor_queue_depth': ('histogram', 'Runs waiting for a free worker, sampled at each submission'),
+    'orchestr8_executor_in_flight': ('gauge', 'Runs submitted to the executor and not yet finished'),
+    'orchestr8_executor_max_workers': ('gauge', 'Worker threads or processes of the executor'),
+}
+
+
+class Histogram:
+    """Prometheus-style histogram: counts per upper bound, plus the sum and count of the samples."""
+
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds: Tuple[float, ...]) -> None:
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-quantile; inf past the last bound, None when empty."""
+        if not self.count:
+            return None
+        rank, seen = q * self.count, 0
+        for bound, count in zip(self.bounds + (float('inf'),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+
+class MetricsRegistry:
+    """
+    Job and executor metrics of this process.
+
+    Recording a sample only appends it to a deque, which is thread-safe without a
+    lock, so executor threads and the scheduler thread never wait on each other.
+    The samples are folded into histograms, counters and gauges when the metrics
+    are read, or by a writer when FOLD_THRESHOLD samples are pending and no reader
+    is folding.
+    """
+
+    def __init__(self) -> None:
+        self._samples: deque = deque()
+        self._fold_lock = threading.Lock()
+        self._histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self._values: Dict[Tuple[str, Labels], float] = {}
+
+    # Writers
+
+    def observe(self, name: str, labels: Labels, value: float) -> None:
+        self._record(('observe', name, labels, value))
+
+    def inc(self, name: str, labels: Labels, amount: float = 1) -> None:
+        self._record(('inc', name, labels, amount))
+
+    def set(self, name: str, labels: Labels, value: float) -> None:
+        self._record(('set', name, labels, value))
+
+    def _record(self, sample: Tuple[str, str, Labels, float]) -> None:
+        self._samples.append(sample)
+        if len(self._samples) >= FOLD_THRESHOLD and self._fold_lock.acquire(blocking=False):
+            try:
+                self._fold()
+            finally:
+                self._fold_lock.release()
+
+    def _fold(self) -> None:
+        samples = self._samples
+        while True:
+            try:
+                operation, name, labels, value = samples.popleft()
+            except IndexError:
+                return
+            key = (name, labels)
+            if operation == 'observe':
+                histogram = self._histograms.get(key)
+                if histogram is None:
+                    bounds = DEPTH_BUCKETS if name == 'orchestr8_executor_queue_depth' else SECONDS_BUCKETS
+                    histogram = self._histograms[key] = Histogram(bounds)
+                histogram.observe(value)
+            elif operation == 'inc':
+                self._values[key] = self._values.get(key, 0) + value
+            else:
+                self._values[key] = value
+
+    # Readers
+
+    def collect(self) -> Tuple[Dict[Tuple[str, Labels], Histogram], Dict[Tuple[str, Labels], float]]:
+        """Fold the pending samples and return the histograms and the counter and gauge values."""
+        with self._fold_lock:
+            self._fold()
+            return dict(self._histograms), dict(self._values)
+
+    def histogram(self, name: str, **labels: str) -> Optional[Histogram]:
+        return self.collect()[0].get((name, tuple(sorted(labels.items()))))
+
+    def value(self, name: str, **labels: str) -> float:
+        return self.collect()[1].get((name, tuple(sorted(labels.items()))), 0)
+
+    def render(self) -> str:
+        """The metrics in the Prometheus text exposition format."""
+        histograms, values = self.collect()
+        lines: List[str] = []
+        for name, (kind, description) in METRICS.items():
+            series = sorted(key for key in (histograms if kind == 'histogram' else values) if key[0] == name)
+            if not series:
+                continue
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} {kind}')
+            for key in series:
+                labels = key[1]
+                if kind != 'histogram':
+                    lines.append(f'{name}{_format_labels(labels)} {_format_value(values[key])}')
+                    continue
+                histogram, cumulative = histograms[key], 0
+                for bound, count in zip(histogram.bounds + (float('inf'),), histogram.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_format_labels(labels + (("le", _format_value(bound)),))} {cumulative}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(histogram.sum)}')
+                lines.append(f'{name}_count{_format_labels(labels)} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def reset(self) -> None:
+        with self._fold_lock:
+            self._samples.clear()
+            self._histograms.clear()
+            self._values.clear()
+
+    # Sources
+
+    def attach(self, sched) -> None:
+        """Count the outcomes of the scheduler's runs and record the timings set by the metered executors."""
+        sched.add_listener(self._on_event,
+                           EVENT_JOB_EXECUTED | EVENT_JOB_ERROR | EVENT_JOB_MISSED | EVENT_JOB_MAX_INSTANCES)
+
+    def _on_event(self, event: JobEvent) -> None:
+        labels = (('job', event.job_id),)
+        if event.code == EVENT_JOB_MISSED:
+            self.inc('orchestr8_job_missed_total', labels)
+        elif event.code == EVENT_JOB_MAX_INSTANCES:
+            self.inc('orchestr8_job_max_instances_total', labels)
+        else:
+            outcome = 'error' if event.code == EVENT_JOB_ERROR else 'success'
+            self.inc('orchestr8_job_runs_total', labels + (('outcome', outcome),))
+            started_at = getattr(event, 'started_at', None)
+            if started_at is not None:
+                self.observe('orchestr8_job_start_lag_seconds', labels,
+                             max(0.0, started_at - event.scheduled_run_time.timestamp()))
+                self.observe('orchestr8_job_duration_seconds', labels, event.duration)
+
+    def record_submission(self, alias: str, job, run_times: List[Any], in_flight: int,
+                          max_workers: Optional[int]) -> None:
+        """Sample the executor's load after a submission, and count the runs it coalesced."""
+        labels = (('executor', alias),)
+        self.set('orchestr8_executor_in_flight', labels, in_flight)
+        if max_workers:
+            self.set('orchestr8_executor_max_workers', labels, max_workers)
+            self.observe('orchestr8_executor_queue_depth', labels, max(0, in_flight - max_workers))
+        # The scheduler has not moved the job past this run yet; when coalescing,
+        # the fire times from its next run time up to the submitted run were merged
+        next_run_time = getattr(job, 'next_run_time', None)
+        if job.coalesce and next_run_time is not None and next_run_time < run_times[-1]:
+            merged = len(job._get_run_times(run_times[-1])) - 1
+            if merged > 0:
+                self.inc('orchestr8_job_coalesced_total', (('job', job.id),), merged)
+
+    def record_load(self, alias: str, in_flight: int) -> None:
+        self.set('orchestr8_executor_in_flight', (('executor', alias),), in_flight)
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ''
+    escaped = (value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for _, value in labels)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+metrics = MetricsRegistry()
+
+
+def _time_events(events: List[Any], started_at: float, duration: float) -> List[Any]:
+    for event in events:
+        if event.code != EVENT_JOB_MISSED:
+            event.started_at, event.duration = started_at, duration
+    return events
+
+
+def timed_run_job(job, jobstore_alias: str, run_times: List[Any], logger_name: str) -> List[Any]:
+    """run_job() that stamps each run's events with its start time and duration."""
+    events = []
+    for run_time in run_times:
+        started_at, started = time.time(), time.perf_counter()
+        run_events = run_job(job, jobstore_alias, [run_time], logger_name)
+        events.extend(_time_events(run_events, started_at, time.perf_counter() - started))
+    return events
+
+
+def timed_run_shared_job(job, jobstore_alias: str, run_times: List[Any], logger_name: str) -> List[Any]:
+    """
+    timed_run_job() for a process pool worker.
+
+    A large result is written to the result store in the worker and comes back as a
+    StoredResult, instead of being pickled back to the scheduler.
+    """
+    events = timed_run_job(job, jobstore_alias, run_times, logger_name)
+    for event in events:
+        if event.code == EVENT_JOB_EXECUTED:
+            event.retval = get_result_store().share(job.id, event.retval)
+    return events
+
+
+async def timed_run_coroutine_job(job, jobstore_alias: str, run_times: List[Any], logger_name: str) -> List[Any]:
+    """timed_run_job() for async def jobs."""
+    events = []
+    for run_time in run_times:
+        started_at, started = time.time(), time.perf_counter()
+        run_events = await run_coroutine_job(job, jobstore_alias, [run_time], logger_name)
+        events.extend(_time_events(run_events, started_at, time.perf_counter() - started))
+    return events
+
+
+class MeteredExecutorMixin:
+    """Reports the executor's load to `metrics` when runs are submitted and finish."""
+
+    _alias = 'default'
+
+    def start(self, scheduler, alias) -> None:
+        super().start(scheduler, alias)
+        self._alias = alias
+
+    def _max_workers(self) -> Optional[int]:
+        return getattr(self, 'max_workers', None) or getattr(getattr(self, '_pool', None), '_max_workers', None)
+
+    def _in_flight(self) -> int:
+        with self._lock:
+            return sum(self._instances.values())
+
+    def submit_job(self, job, run_times) -> None:
+        super().submit_job(job, run_times)
+        metrics.record_submission(self._alias, job, run_times, self._in_flight(), self._max_workers())
+
+    def _run_job_success(self, job_id, events) -> None:
+        super()._run_job_success(job_id, events)
+        metrics.record_load(self._alias, self._in_flight())
+
+    def _run_job_error(self, job_id, exc, traceback=None) -> None:
+        super()._run_job_error(job_id, exc, traceback)
+        metrics.record_load(self._alias, self._in_flight())
+
+
+class _MeteredPoolMixin(MeteredExecutorMixin):
+    _runner = staticmethod(timed_run_job)
+
+    def _do_submit_job(self, job, run_times) -> None:
+        # BasePoolExecutor._do_submit_job, running the timed job runner
+        def callback(f):
+            exc, tb = (f.exception_info() if hasattr(f, 'exception_info') else
+                       (f.exception(), getattr(f.exception(), '__traceback__', None)))
+            if exc:
+                self._run_job_error(job.id, exc, tb)
+            else:
+                self._run_job_success(job.id, f.result())
+
+        try:
+            f = self._pool.submit(self._runner, job, job._jobstore_alias, run_times, self._logger.name)
+        except BrokenProcessPool:
+            self._logger.warning('Process pool is broken; replacing pool with a fresh instance')
+            self._pool = self._pool.__class__(self._pool._max_workers)
+            f = self._pool.submit(self._runner, job, job._jobstore_alias, run_times, self._logger.name)
+
+        f.add_done_callback(callback)
+
+
+class MeteredThreadPoolExecutor(_MeteredPoolMixin, ThreadPoolExecutor):
+    """ThreadPoolExecutor reporting run timings and load to `metrics`."""
+
+
+class MeteredProcessPoolExecutor(_MeteredPoolMixin, ProcessPoolExecutor):
+    """ProcessPoolExecutor reporting run timings and load to `metrics`, sharing large results from the worker."""
+
+    _runner = staticmethod(timed_run_shared_job)
+
+
+class MeteredAsyncIOExecutor(MeteredExecutorMixin, AsyncIOExecutor):
+    """AsyncIOExecutor reporting run timings and load to `metrics`."""
+
+    def _do_submit_job(self, job, run_times) -> None:
+        # AsyncIOExecutor._do_submit_job, running the timed job runners
+        def callback(f):
+            self._pending_futures.discard(f)
+            try:
+                events = f.result()
+            except BaseException:
+                self._run_job_error(job.id, *sys.exc_info()[1:])
+            else:
+                self._run_job_success(job.id, events)
+
+        if iscoroutinefunction_partial(job.func):
+            coro = timed_run_coroutine_job(job, job._jobstore_alias, run_times, self._logger.name)
+            f = self._eventloop.create_task(coro)
+        else:
+            f = self._eventloop.run_in_executor(None, timed_run_job, job, job._jobstore_alias, run_times,
+                                                self._logger.name)
+
+        f.add_done_callback(callback)
+        self._pending_futures.add(f)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = metrics.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        logger.debug(format % args)
+
+
+def serve_metrics(host: Optional[str] = None, port: Optional[int] = None) -> Optional[ThreadingHTTPServer]:
+    """
+    Serve GET /metrics from a daemon thread; METRICS_HOST and METRICS_PORT by default.
+
+    Returns the server, or None when no port is configured or it cannot be bound.
+    """
+    settings = get_metrics_settings()
+    host = settings['host'] if host is None else host
+    port = settings['port'] if port is None else port
+    if port is None:
+        return None
+    try:
+        server = ThreadingHTTPServer((host, int(port)), _MetricsHandler)
+    except OSError as e:
+        logger.warning(f"Metrics endpoint not started on {host}:{port}: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='MetricsServer', daemon=True).start()
+    logger.info(f"Serving metrics on http://{host}:{server.server_address[1]}/metrics")
+    return server
+
+
+def fetch_metrics(job: Optional[str] = None, host: Optional[str] = None, port: Optional[int] = None) -> str:
+    """Read the /metrics endpoint of a running scheduler, keeping only the series of `job` if given."""
+    settings = get_metrics_settings()
+    host = settings['host'] if host is None else host
+    port = settings['port'] if port is None else port
+    if port is None:
+        raise ValueError("METRICS_PORT is not set")
+    with urllib.request.urlopen(f'http://{host}:{port}/metrics', timeout=5) as response:
+        text = response.read().decode()
+    if job is None:
+        return text
+    selector = _format_labels((('job', job),))[1:-1]
+    return '\n'.join(line for line in text.splitlines() if selector in line) + '\n'
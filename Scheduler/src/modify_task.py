@@ -12,26 +12,58 @@
 # limitations under the License.
 
 import logging
-from copy import deepcopy
+import threading
 from typing import Optional, Dict
+from apscheduler.events import EVENT_SCHEDULER_SHUTDOWN
+from apscheduler.schedulers.base import BaseScheduler
 from apscheduler.triggers.cron import CronTrigger
 from apscheduler.triggers.interval import IntervalTrigger
 from .parse_modify_task import modify_command
-from .job_scheduler import scheduler
+from .create_task import _executor
+from .job_scheduler import get_scheduler, jobstore_engine
+from .job_index import job_index
+from .dependency_store import persist_task_graph
+from .module_registry import get_function
+from .task_graph import task_graph
+from .tracing import get_tracer
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-scheduler = scheduler()
+# The process-wide scheduler, set up by _scheduler() on first use
+scheduler: Optional[BaseScheduler] = None
+_scheduler_lock = threading.Lock()
 
-task_conditions = {}
+
+def _scheduler() -> BaseScheduler:
+    """
+    The process-wide scheduler, wired to the task graph and job index on first use rather
+    than on import, and again for the scheduler that replaces it after a shutdown.
+    """
+    global scheduler
+    with _scheduler_lock:
+        if scheduler is None:
+            sched = get_scheduler()
+            persist_task_graph(task_graph, jobstore_engine(sched))
+            job_index.attach(sched)
+            sched.add_listener(lambda event: _forget_scheduler(sched), EVENT_SCHEDULER_SHUTDOWN)
+            scheduler = sched
+    return scheduler
+
+
+def _forget_scheduler(sched: BaseScheduler) -> None:
+    global scheduler
+    with _scheduler_lock:
+        if scheduler is sched:
+            scheduler = None
 
 
 def _alter_task(params: Dict) -> None:
+    scheduler = _scheduler()
     task_name = params['task_name']
-    job = scheduler.get_job(task_name)
-
-    if not job:
+    with get_tracer().span('job_lookup'):
+        exists = task_name in job_index
+    if not exists:
         logger.info(f'Specified job with id {task_name} cannot be found')
         return
 
@@ -43,35 +75,39 @@ def _alter_task(params: Dict) -> None:
 
     if action:
         if action == 'RESUME':
-            scheduler.resume_job(task_name)
+            with get_tracer().span('resume_job'):
+                scheduler.resume_job(task_name)
             return
         elif action == 'SUSPEND':
-            scheduler.pause_job(task_name)
+            with get_tracer().span('pause_job'):
+                scheduler.pause_job(task_name)
             return
         elif action == 'REMOVE':
             logger.info("Running action REMOVE")
 
-            if 'after' in params:
+            if params.get('after'):
                 logger.info(f"After in {params}")
 
                 """Remove specified predecessors."""
                 predecessors_to_remove = [pred.strip() for pred in params['after'].split(',')]
-                predecessors_to_remove_copy = deepcopy(predecessors_to_remove)
-                if task_name not in task_conditions:
-                    task_conditions[task_name] = {'after': predecessors_to_remove_copy}
-
-                _update_task_graph(task_name)
-
-                predecessors_left = task_conditions[task_name].get('after', [])
+                with get_tracer().span('remove_dependencies'):
+                    predecessors_left = task_graph.remove_dependencies(task_name, predecessors_to_remove)
+                logger.info(f"Removed predecessors {predecessors_to_remove} from {task_name}")
 
                 if not predecessors_left:
-                    del task_conditions[task_name]['after']
-                    logger.info(f"Removed predecessors {predecessors_to_remove} from {task_name}")
+                    _update_task_graph(task_name)
                 return
             else:
-                scheduler.remove_job(task_name)
+                with get_tracer().span('remove_job'):
+                    scheduler.remove_job(task_name)
+                    task_graph.remove_task(task_name)
                 return
 
+    if params.get('executor'):
+        # Refused the way CREATE TASK refuses it, before any other change is made
+        job = scheduler.get_job(task_name)
+        executor = _executor({'function': job.name, 'executor': params['executor']}, get_function(job.name), scheduler)
+
     if 'schedule' in params or 'cron_expr' in params:
         trigger = None
         if 'schedule' in params and params['schedule']:
@@ -95,42 +131,45 @@ def _alter_task(params: Dict) -> None:
 
         if trigger:
             try:
-                scheduler.modify_job(task_name, trigger=trigger)
+                with get_tracer().span('modify_job', field='trigger'):
+                    scheduler.modify_job(task_name, trigger=trigger)
             except Exception as e:
                 logger.warning(f"Error modifying job schedule: {e}")
 
+    if params.get('executor'):
+        try:
+            with get_tracer().span('modify_job', field='executor'):
+                scheduler.modify_job(task_name, executor=executor)
+        except Exception as e:
+            logger.warning(f"Error modifying job executor: {e}")
+
     if 'allow_overlapping_execution' in params:
         try:
             max_instances = int(params['allow_overlapping_execution'])
-            scheduler.modify_job(task_name, max_instances=max_instances)
+            with get_tracer().span('modify_job', field='max_instances'):
+                scheduler.modify_job(task_name, max_instances=max_instances)
         except Exception as e:
             logger.warning(f"Error modifying job max instances: {e}")
 
 
 def _update_task_graph(task_name: str) -> None:
     """
-    Update task graph and handle transitions of tasks becoming standalone or root tasks.
+    Handle a task that has lost its last predecessor and is now a standalone or root task.
     """
-    logger.debug(f"Task Conditions: {task_conditions}")  # Log task_conditions
-    if not task_conditions:
-        return
-
-    while task_conditions.get(task_name).get('after'):
-        task_conditions[task_name]['after'].pop()
-    scheduler.pause_job(task_name)
+    logger.debug(f"Predecessors of {task_name}: {task_graph.upstream(task_name)}")
+    _scheduler().pause_job(task_name)
     logger.info(f"Task {task_name} is now a root task and automatically suspended")
     return
 
 
 def execute_command(command: str) -> None:
-    try:
-        params = modify_command(command)
-        _alter_task(params)
-
-    except ValueError as e:
-        logger.error(f"Error: {e}")
-
-
-if scheduler.state == 0:
-    scheduler.resume()
-    logging.info("Scheduler resumed")
+    with get_tracer().span('alter_task') as span:
+        try:
+            with get_tracer().span('parse_command'):
+                params = modify_command(command)
+            span.set_attribute('task', params.get('task_name'))
+            _alter_task(params)
+
+        except ValueError as e:
+            span.set_attribute('error', str(e))
+            logger.error(f"Error: {e}")
@@ -11,18 +11,141 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from typing import Callable, Dict
+import ast
+import importlib
+import logging
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 
+logger = logging.getLogger(__name__)
+
+# Functions resolved so far, by registered name
 function_registry: Dict[str, Callable] = {}
 
+# Dotted paths of the functions registered but not imported yet, by registered name
+function_targets: Dict[str, str] = {}
+
 
 def register_function(name: str, func: Callable) -> None:
     """Register a function dynamically."""
     function_registry[name] = func
 
 
+def register_target(name: str, target: str) -> None:
+    """
+    Register `name` as the function at `target` without importing it.
+
+    `target` is 'package.module:function' or 'package.module.function'; an attribute
+    path such as 'module:Class.method' is also accepted. The module is imported by
+    the first get_function(name) call.
+    """
+    function_registry.pop(name, None)
+    function_targets[name] = target
+
+
+def resolve_target(target: str) -> Any:
+    """Import the module of `target` and return the object it names."""
+    if ':' in target:
+        module_name, attribute = target.split(':', 1)
+    else:
+        module_name, _, attribute = target.rpartition('.')
+    if not module_name or not attribute:
+        raise ValueError(f"Invalid function path '{target}'. Expected 'module:function' or 'module.function'")
+    value = importlib.import_module(module_name)
+    for part in attribute.split('.'):
+        value = getattr(value, part)
+    return value
+
+
 def get_function(name: str) -> Callable:
-    """Retrieve a function by name."""
-    if name not in function_registry:
+    """Retrieve a function by name, importing its module on first use."""
+    if name in function_registry:
+        return function_registry[name]
+    if name not in function_targets:
         raise ValueError(f"Unknown function: {name}")
-    return function_registry[name]
+    try:
+        func = resolve_target(function_targets[name])
+    except Exception as e:
+        raise ValueError(f"Function {name} could not be loaded from {function_targets[name]}: {e}") from e
+    function_registry[name] = func
+    return func
+
+
+def preload_functions() -> None:
+    """Import every registered function now rather than on first use. Failures are logged."""
+    for name in list(function_targets):
+        try:
+            get_function(name)
+        except ValueError as e:
+            logger.error(str(e))
+
+
+def _import_targets(statement: ast.stmt) -> Iterator[Tuple[str, str]]:
+    """(name, target) pairs bound by an import statement, without running it."""
+    if isinstance(statement, ast.ImportFrom) and statement.level == 0 and statement.module:
+        for alias in statement.names:
+            if alias.name == '*':
+                raise ValueError("Wildcard imports cannot be registered")
+            yield alias.asname or alias.name, f'{statement.module}:{alias.name}'
+    elif isinstance(statement, ast.Import):
+        for alias in statement.names:
+            if '.' not in alias.name:
+                raise ValueError(f"'import {alias.name}' names a module, not a function")
+            module_name, function_name = alias.name.rsplit('.', 1)
+            yield alias.asname or function_name, f'{module_name}:{function_name}'
+    else:
+        raise ValueError("Not an import statement")
+
+
+def import_file_targets(config_file: str) -> List[Tuple[str, str]]:
+    """
+    The (name, target) pairs listed in an import file, without importing their modules.
+
+    Each line is either an import statement naming the function, in any of the forms
+    `from module import function [as name][, ...]` or `import module.function [as name]`,
+    or a `name = module:function` entry. Invalid lines are logged and skipped.
+    """
+    with open(config_file, 'r') as file:
+        lines = [line.strip() for line in file if line.strip() and not line.startswith('#')]
+
+    found = []
+    for line in lines:
+        try:
+            if line.startswith(('from ', 'import ')):
+                targets = list(_import_targets(ast.parse(line).body[0]))
+            elif '=' in line:
+                name, target = (part.strip().strip('\'"') for part in line.split('=', 1))
+                if not name.isidentifier():
+                    raise ValueError(f"'{name}' is not a valid function name")
+                targets = [(name, target)]
+            else:
+                raise ValueError("Unrecognized statement format")
+        except (SyntaxError, ValueError) as e:
+            logger.error(f"Invalid import statement {line}: {e}")
+            continue
+        found.extend(targets)
+    return found
+
+
+def load_import_file(config_file: str) -> None:
+    """Register the functions listed in an import file, without importing their modules. Modules are imported by get_function()."""
+    for name, target in import_file_targets(config_file):
+        register_target(name, target)
+        logger.debug(f"Registered function {name} as {target}")
+
+
+def entry_point_targets(group: Optional[str]) -> List[Tuple[str, str]]:
+    """The (name, target) pairs that installed packages declare under the `group` entry point group."""
+    if not group:
+        return []
+    from importlib.metadata import entry_points
+
+    found = entry_points()
+    selected = found.select(group=group) if hasattr(found, 'select') else found.get(group, [])
+    return [(entry_point.name, entry_point.value) for entry_point in selected]
+
+
+def load_entry_points(group: Optional[str]) -> None:
+    """Register the functions that installed packages declare under the `group` entry point group."""
+    for name, target in entry_point_targets(group):
+        register_target(name, target)
+        logger.debug(f"Registered function {name} as {target} from entry point group {group}")
@@ -11,15 +11,47 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import ast
 import re
 from typing import Tuple, Union, Optional, Dict, List, Any
-import ast
+
+from Scheduler.src.result_store import ResultRef, result_ref
+from Scheduler.src.task_dsl import ParseCache, parse_create
+
+_cache = ParseCache()
+
+_QUOTED_RE = re.compile(r"""(?:'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")""")
+
+
+def _literal_eval(text: str) -> Any:
+    """
+    ast.literal_eval, answering the common cases without compiling the text.
+
+    Splitting arguments on commas tries many pieces such as "[1" or "mode='fast'";
+    an '=' or unbalanced brackets outside quoted strings rule those out. Text with
+    comments, backslashes, newlines or triple quotes is left to ast, as the pattern
+    cannot tell where its strings end.
+    """
+    if text.isdigit() and text.isascii() and (len(text) == 1 or text[0] != '0'):
+        return int(text)
+    if '#' in text or '\\' in text or '\n' in text or '\r' in text or "'''" in text or '"""' in text:
+        return ast.literal_eval(text)
+    if "'" in text or '"' in text:
+        if _QUOTED_RE.fullmatch(text):
+            return text[1:-1]
+        bare = _QUOTED_RE.sub('', text)
+    else:
+        bare = text
+    if ('=' in bare or bare.count('(') != bare.count(')') or bare.count('[') != bare.count(']')
+            or bare.count('{') != bare.count('}')):
+        raise ValueError(f"Not a literal: {text!r}")
+    return ast.literal_eval(text)
 
 
 def _separate_args_kwargs(input_data: Union[str, List[Any]]) -> Union[List[Any], Dict[Any, Any]]:
     if isinstance(input_data, str):
         try:
-            input_data = ast.literal_eval(input_data)
+            input_data = _literal_eval(input_data)
             if isinstance(input_data, tuple):
                 args = list(input_data)
                 kwargs = {}
@@ -27,9 +59,12 @@ def _separate_args_kwargs(input_data: Union[str, List[Any]]) -> Union[List[Any],
             elif isinstance(input_data, list):
                 args = input_data
                 kwargs = {}
-            else:
+            elif isinstance(input_data, dict):
                 args = []
                 kwargs = input_data
+            else:
+                # A single argument, such as f('sales')
+                return [input_data], {}
 
         except (ValueError, SyntaxError):
             # Split the string by commas to handle mixed positional and keyword arguments
@@ -40,12 +75,12 @@ def _separate_args_kwargs(input_data: Union[str, List[Any]]) -> Union[List[Any],
                 if '=' in item:
                     key, value = item.split('=', 1)
                     try:
-                        kwargs[key.strip()] = ast.literal_eval(value.strip())
+                        kwargs[key.strip()] = _literal_eval(value.strip())
                     except (ValueError, SyntaxError):
                         kwargs[key.strip()] = value.strip()
                 else:
                     try:
-                        args.append(ast.literal_eval(item))
+                        args.append(_literal_eval(item))
                     except (ValueError, SyntaxError):
                         args.append(item)
             return args, kwargs
@@ -60,7 +95,7 @@ def _separate_args_kwargs(input_data: Union[str, List[Any]]) -> Union[List[Any],
         if isinstance(item, str) and '=' in item:
             key, value = item.split('=', 1)
             try:
-                kwargs[key.strip()] = ast.literal_eval(value.strip())
+                kwargs[key.strip()] = _literal_eval(value.strip())
             except (ValueError, SyntaxError):
                 kwargs[key.strip()] = value.strip()
         else:
@@ -69,34 +104,38 @@ def _separate_args_kwargs(input_data: Union[str, List[Any]]) -> Union[List[Any],
     return args, kwargs
 
 
+# Values that are shared between copies as they are
+_IMMUTABLE = frozenset({str, int, float, complex, bool, bytes, type(None), ResultRef})
+
+
+def _copy_literal(value: Any) -> Any:
+    """Copy the containers ast.literal_eval can produce; cheaper than copy.deepcopy for parse results."""
+    if isinstance(value, list):
+        return [item if type(item) in _IMMUTABLE else _copy_literal(item) for item in value]
+    if isinstance(value, dict):
+        return {key: item if type(item) in _IMMUTABLE else _copy_literal(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return tuple(_copy_literal(item) for item in value)
+    if isinstance(value, set):
+        return set(value)  # Set members are hashable, so already immutable
+    return value
+
+
+def _parse_create(command: str) -> Tuple[str, str, Dict[str, Any]]:
+    params = parse_create(command)
+    task_name = params.pop('task_name')
+    args, kwargs = _separate_args_kwargs(params['args'] or [])
+    # RESULT(task) arguments are passed the latest result of that task when the job runs
+    params['args'] = [result_ref(value) for value in args]
+    params['kwargs'] = {key: result_ref(value) for key, value in kwargs.items()}
+    if params['probe'] is not None:
+        function, probe_args = params['probe']
+        probe_args, probe_kwargs = _separate_args_kwargs(probe_args or [])
+        params['probe'] = {'function': function, 'args': probe_args, 'kwargs': probe_kwargs}
+    return 'create_task', task_name, params
+
+
 def parse_command(command: str) -> Tuple[str, Optional[str], Optional[Dict[str, Union[str, int, bool]]]]:
-    print(command)
-    patterns = {
-        'create_task': r"""
-            \s*CREATE\s+TASK\s+(?P<task_name>\w+)\s*
-            \s*SERVER\s*=\s*(?P<server>\w+)\s*
-            \s*(?:(?:SCHEDULE\s*=\s*(?P<schedule>'\d+\s+(?:SECOND|MINUTE|HOUR|DAY|WEEK)')|USING\s+CRON\s+(?P<cron_expr>(?:(?:\d+|\*)\s+){4}(?:\d+|\*))\s+(?P<time_zone>\w+))?)\s*
-            \s*(?:ALLOW_OVERLAPPING_EXECUTION\s*=\s*(?P<allow_overlapping_execution>TRUE|FALSE))?\s*
-            \s*(?:AFTER\s+(?P<after>.*?)\s*)?\s*(?=AS)\s*
-            \s*AS\s+(?P<function>\w+)\s*\((?P<args>(?:[^)(]+|\((?:[^)(]+|\([^)(]*\))*\))*)\)\s*
-        """
-    }
-
-    for action, pattern in patterns.items():
-        match = re.match(pattern, command, re.IGNORECASE | re.VERBOSE)
-        if match:
-            if action == 'create_task':
-                params = {
-                    'server': match.group('server'),
-                    'schedule': match.group('schedule') if match.group('schedule') else None,
-                    'cron_expr': match.group('cron_expr'),
-                    'time_zone': match.group('time_zone') if match.group('time_zone') else 'UTC',
-                    'allow_overlapping_execution': match.group('allow_overlapping_execution') == 'TRUE' if match.group('allow_overlapping_execution') else None,
-                    'after': match.group('after') if match.group('after') else None,
-                    'function': match.group('function').split('(')[0].strip(),  # Function name
-                    'args': match.group('args') if match.group('args') else []  # Arguments
-                }
-
-                params['args'], params['kwargs'] = _separate_args_kwargs(params['args'])
-                return action, match.group('task_name'), params
-        raise ValueError("Invalid command format")
+    action, task_name, params = _cache.get_or_parse(command, _parse_create)
+    # Cached entries are shared, so hand out a copy the caller is free to mutate
+    return action, task_name, _copy_literal(params)
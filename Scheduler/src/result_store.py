@@ -0,0 +1,333 @@
+# Copyright 2024 Sola Richard Olorunfemi
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import mmap
+import os
+import pickle
+import re
+import struct
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .utils import get_result_store_settings
+
+logger = logging.getLogger(__name__)
+
+_RESULT_RE = re.compile(r'^RESULT\(\s*([A-Za-z_][A-Za-z0-9_]*)\s*\)$', re.IGNORECASE)
+_HEADER = struct.Struct('<Q')  # Length of the pickled header that starts every result file
+_SUFFIX = '.result'
+
+
+class ResultRef:
+    """The latest result of a task, written RESULT(task) in another task's arguments."""
+
+    __slots__ = ('task',)
+
+    def __init__(self, task: str) -> None:
+        self.task = task
+
+    def __eq__(self, other: Any) -> bool:
+        return type(other) is type(self) and other.task == self.task
+
+    def __hash__(self) -> int:
+        return hash((type(self), self.task))
+
+    def __repr__(self) -> str:
+        return f'RESULT({self.task})'
+
+    def __reduce__(self):
+        return type(self), (self.task,)
+
+
+class StoredResult(ResultRef):
+    """Returned by a worker process in place of a large result it has already written to the store."""
+
+    __slots__ = ()
+
+    def __repr__(self) -> str:
+        return f'StoredResult({self.task})'
+
+
+def result_ref(value: Any) -> Any:
+    """The ResultRef written as `value` in a task's arguments, or `value` itself."""
+    if isinstance(value, str):
+        match = _RESULT_RE.match(value.strip())
+        if match:
+            return ResultRef(match.group(1))
+    return value
+
+
+def result_refs(args: List[Any], kwargs: Dict[str, Any]) -> List[str]:
+    """Names of the tasks whose results the arguments refer to."""
+    return [value.task for value in list(args) + list(kwargs.values()) if isinstance(value, ResultRef)]
+
+
+def _numpy_array(value: Any) -> bool:
+    # An ndarray can only exist once numpy has been imported; do not import it for the check
+    numpy = sys.modules.get('numpy')
+    return numpy is not None and isinstance(value, numpy.ndarray)
+
+
+class ResultStore:
+    """
+    Latest return value of each task, shared by every process on the host.
+
+    Each task has one file in `directory`, replaced atomically when the task returns.
+    The default directory is under /dev/shm when available, so the files live in
+    memory. Small values are pickled. bytes, bytearray, memoryview and NumPy arrays of
+    at least `shared_min_bytes` are written raw and memory-mapped by readers. A task
+    running in a process pool therefore gets a large upstream result from the page
+    cache, not pickled through the pool's pipe, and NumPy arrays come back as
+    read-only views of the mapping without a copy. bytes and bytearray are copied
+    once out of the mapping.
+
+    Results older than `max_age` seconds are dropped. When the files together
+    exceed `max_bytes`, the oldest are dropped first. The store keeps a running
+    total of the files it writes rather than listing the directory on every put.
+    Worker processes write to the same directory, so it is listed again at most
+    every `rescan_interval` seconds, and before anything is dropped.
+    """
+
+    rescan_interval = 60.0
+
+    def __init__(self, directory: Optional[str] = None, max_bytes: int = 512 * 1024 * 1024,
+                 max_age: Optional[float] = 24 * 3600, shared_min_bytes: int = 1024 * 1024) -> None:
+        self.directory = directory or self.default_directory()
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.shared_min_bytes = shared_min_bytes
+        self._lock = threading.Lock()
+        # path: (mtime, size) of each result file, oldest first; None until the directory is first listed
+        self._entries: Optional[Dict[str, Tuple[float, int]]] = None
+        self._total = 0
+        self._scanned_at = 0.0
+
+    @staticmethod
+    def default_directory() -> str:
+        base = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+        return os.path.join(base, 'orchestr8-results')
+
+    def _path(self, task: str) -> str:
+        return os.path.join(self.directory, task + _SUFFIX)
+
+    def is_shared(self, value: Any) -> bool:
+        """Whether `value` is written raw and memory-mapped rather than pickled."""
+        if _numpy_array(value):
+            return value.nbytes >= self.shared_min_bytes and not value.dtype.hasobject
+        return isinstance(value, (bytes, bytearray, memoryview)) and memoryview(value).nbytes >= self.shared_min_bytes
+
+    def share(self, task: str, value: Any) -> Any:
+        """
+        Store a large result where it was produced, returning a StoredResult for it.
+
+        A process pool worker calls this so the value is not pickled back to the
+        scheduler; smaller values are returned unchanged.
+        """
+        if not self.is_shared(value):
+            return value
+        self.put(task, value)
+        return StoredResult(task)
+
+    def put(self, task: str, value: Any) -> None:
+        """Store `value` as the latest result of `task`."""
+        if isinstance(value, StoredResult):
+            # Already written by the worker process that produced it; only count it
+            self._track(self._path(task))
+            return
+        payload: Any
+        if self.is_shared(value) and _numpy_array(value):
+            header = {'kind': 'ndarray', 'dtype': value.dtype.str, 'shape': value.shape}
+            payload = memoryview(value if value.flags.c_contiguous else value.copy()).cast('B')
+        elif self.is_shared(value):
+            header = {'kind': type(value).__name__}
+            view = memoryview(value)
+            payload = view.cast('B') if view.c_contiguous else memoryview(view.tobytes())
+        else:
+            header = {'kind': 'pickle'}
+            payload = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+        header_bytes = pickle.dumps(header, pickle.HIGHEST_PROTOCOL)
+        # Raw payloads start on a page boundary so readers can map them directly
+        offset = _HEADER.size + len(header_bytes)
+        if header['kind'] != 'pickle':
+            offset = -(-offset // mmap.ALLOCATIONGRANULARITY) * mmap.ALLOCATIONGRANULARITY
+        path = self._path(task)
+        os.makedirs(self.directory, exist_ok=True)  # created by the first result, not the store
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix=f'.{task}.')
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                file.write(_HEADER.pack(len(header_bytes)))
+                file.write(header_bytes)
+                file.seek(offset)
+                file.write(payload)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        self._track(path)
+
+    def _track(self, path: str) -> None:
+        """Count the result file at `path` in the store's size, then evict to make room for it."""
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return
+        with self._lock:
+            if self._entries is not None:
+                self._total -= self._entries.pop(path, (0, 0))[1]
+                self._entries[path] = (stat.st_mtime, stat.st_size)
+                self._total += stat.st_size
+        self.evict(keep=path)
+
+    def get(self, task: str) -> Any:
+        """The latest result of `task`. Raises LookupError when there is none or it has expired."""
+        path = self._path(task)
+        try:
+            with open(path, 'rb') as file:
+                age = time.time() - os.fstat(file.fileno()).st_mtime
+                if self.max_age is not None and age > self.max_age:
+                    raise LookupError(f"Result of task {task} expired {age - self.max_age:.0f}s ago")
+                header_length, = _HEADER.unpack(file.read(_HEADER.size))
+                header = pickle.loads(file.read(header_length))
+                if header['kind'] == 'pickle':
+                    return pickle.loads(file.read())
+                offset = -(-(_HEADER.size + header_length) // mmap.ALLOCATIONGRANULARITY) * mmap.ALLOCATIONGRANULARITY
+                size = os.fstat(file.fileno()).st_size - offset
+                if size == 0:
+                    view = memoryview(b'')
+                else:
+                    # The mapping outlives the file being replaced or evicted
+                    view = memoryview(mmap.mmap(file.fileno(), size, access=mmap.ACCESS_READ, offset=offset))
+        except FileNotFoundError:
+            raise LookupError(f"Task {task} has no result yet") from None
+
+        if header['kind'] == 'ndarray':
+            import numpy
+            return numpy.frombuffer(view, dtype=numpy.dtype(header['dtype'])).reshape(header['shape'])
+        if header['kind'] == 'memoryview':
+            return view
+        if header['kind'] == 'bytearray':
+            return bytearray(view)
+        return bytes(view)
+
+    def resolve(self, args: Any, kwargs: Dict[str, Any]) -> Tuple[List[Any], Dict[str, Any]]:
+        """Replace the ResultRefs in a task's arguments with the results they refer to."""
+        return ([self.get(value.task) if isinstance(value, ResultRef) else value for value in args],
+                {key: self.get(value.task) if isinstance(value, ResultRef) else value for key, value in kwargs.items()})
+
+    def remove(self, task: str) -> None:
+        path = self._path(task)
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        with self._lock:
+            if self._entries is not None:
+                self._total -= self._entries.pop(path, (0, 0))[1]
+
+    def clear(self) -> None:
+        if not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            if name.endswith(_SUFFIX):
+                self.remove(name[:-len(_SUFFIX)])
+
+    def _scan(self) -> None:
+        """List the result files in the directory, replacing the running total. The caller holds the lock."""
+        entries = []
+        if os.path.isdir(self.directory):
+            for entry in os.scandir(self.directory):
+                if not entry.name.endswith(_SUFFIX):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+        self._entries = {path: (mtime, size) for mtime, size, path in entries}
+        self._total = sum(size for _, size, _ in entries)
+        self._scanned_at = time.time()
+
+    def _over_limits(self, now: float) -> bool:
+        if self._total > self.max_bytes:
+            return True
+        oldest = next(iter(self._entries.values()), None)
+        return self.max_age is not None and oldest is not None and now - oldest[0] > self.max_age
+
+    def evict(self, keep: Optional[str] = None) -> int:
+        """Drop expired results, then the oldest until the store fits in max_bytes. Returns the number dropped."""
+        with self._lock:
+            now = time.time()
+            if self._entries is None or now - self._scanned_at > self.rescan_interval:
+                self._scan()
+            elif self._over_limits(now):
+                self._scan()  # Count other processes' results and their current times before dropping any
+            if not self._over_limits(now):
+                return 0
+
+            dropped = 0
+            for path, (mtime, size) in list(self._entries.items()):
+                expired = self.max_age is not None and now - mtime > self.max_age
+                if path == keep or not (expired or self._total > self.max_bytes):
+                    continue
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                del self._entries[path]
+                self._total -= size
+                dropped += 1
+            if dropped:
+                logger.debug(f"Evicted {dropped} task results")
+            return dropped
+
+
+def _build_result_store() -> ResultStore:
+    settings = get_result_store_settings()
+    return ResultStore(settings.get('directory'), int(settings.get('max_bytes', 512 * 1024 * 1024)),
+                       settings.get('max_age', 24 * 3600), int(settings.get('shared_min_bytes', 1024 * 1024)))
+
+
+_result_store_lock = threading.Lock()
+
+
+def __getattr__(name: str) -> Any:
+    """Build `result_store` on first access, so that importing the parser reads no settings."""
+    if name != 'result_store':
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    with _result_store_lock:
+        if name not in globals():
+            globals()[name] = _build_result_store()
+    return globals()[name]
+
+
+def get_result_store() -> ResultStore:
+    """The process-wide result store, built on first use."""
+    return sys.modules[__name__].result_store
+
+
+def run_with_results(func: Callable, *args: Any, **kwargs: Any) -> Any:
+    """Run a task whose arguments refer to other tasks' results."""
+    args, kwargs = get_result_store().resolve(args, kwargs)
+    return func(*args, **kwargs)
+
+
+async def run_async_with_results(func: Callable, *args: Any, **kwargs: Any) -> Any:
+    """run_with_results() for async def tasks."""
+    args, kwargs = get_result_store().resolve(args, kwargs)
+    return await func(*args, **kwargs)
@@ -0,0 +1,182 @@
+# Copyright 2024 Sola Richard Olorunfemi
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import pickle
+import threading
+from typing import Any, Dict, Optional, Set
+from apscheduler.job import Job
+from apscheduler.jobstores.memory import MemoryJobStore
+from apscheduler.util import datetime_to_utc_timestamp
+from sqlalchemy import Column, Float, LargeBinary, MetaData, Table, Unicode, create_engine, select
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+_FLUSH_CHUNK = 500  # Ids per DELETE ... IN (...), below SQLite's bound-parameter limit
+
+
+class SnapshotJobStore(MemoryJobStore):
+    """
+    Jobs kept in memory and written behind to an SQL table.
+
+    The scheduler reads and updates jobs in memory only, so a job firing costs no
+    database write. Ids of added, updated and removed jobs are collected and written
+    every `flush_interval` seconds, and at shutdown, in one transaction. A crash
+    loses at most the changes since the last flush. A flush is all or nothing, so
+    the table always holds a consistent snapshot, and start() recovers from it.
+
+    The table has the layout of SQLAlchemyJobStore, so a snapshot can be opened with
+    the plain store. `engine` is exposed so that the AFTER dependency store can live
+    in the same database.
+    """
+
+    def __init__(self, url: Optional[str] = None, engine: Optional[Engine] = None, flush_interval: float = 5.0,
+                 tablename: str = 'apscheduler_jobs', pickle_protocol: int = pickle.HIGHEST_PROTOCOL,
+                 engine_options: Optional[Dict[str, Any]] = None) -> None:
+        super().__init__()
+        if engine is None:
+            if not url:
+                raise ValueError('Need either "engine" or "url" defined')
+            engine = create_engine(url, **(engine_options or {}))
+        self.engine = engine
+        self.flush_interval = flush_interval
+        self.pickle_protocol = pickle_protocol
+        # Same layout as SQLAlchemyJobStore.jobs_t
+        self.snapshot_t = Table(
+            tablename, MetaData(),
+            Column('id', Unicode(191), primary_key=True),
+            Column('next_run_time', Float(25), index=True),
+            Column('job_state', LargeBinary, nullable=False)
+        )
+        self._dirty: Set[str] = set()
+        self._cleared = False
+        self._dirty_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+
+    def start(self, scheduler, alias) -> None:
+        super().start(scheduler, alias)
+        self.snapshot_t.create(self.engine, checkfirst=True)
+        self._recover()
+        self._stop.clear()
+        self._flusher = threading.Thread(target=self._run, name=f'SnapshotJobStore-{alias}', daemon=True)
+        self._flusher.start()
+
+    def shutdown(self) -> None:
+        self._stop.set()
+        if self._flusher is not None:
+            self._flusher.join()
+            self._flusher = None
+        self.flush()
+        # Not remove_all_jobs(): that would mark the snapshot itself for deletion
+        MemoryJobStore.remove_all_jobs(self)
+        self.engine.dispose()
+
+    # Writes are applied in memory and remembered for the next flush
+
+    def add_job(self, job: Job) -> None:
+        super().add_job(job)
+        self._mark(job.id)
+
+    def update_job(self, job: Job) -> None:
+        super().update_job(job)
+        self._mark(job.id)
+
+    def remove_job(self, job_id: str) -> None:
+        super().remove_job(job_id)
+        self._mark(job_id)
+
+    def remove_all_jobs(self) -> None:
+        super().remove_all_jobs()
+        with self._dirty_lock:
+            self._dirty.clear()
+            self._cleared = True
+
+    def _mark(self, job_id: str) -> None:
+        with self._dirty_lock:
+            self._dirty.add(job_id)
+
+    def flush(self) -> int:
+        """Write the pending changes to the snapshot table. Returns the number of jobs written or deleted."""
+        with self._flush_lock:
+            with self._dirty_lock:
+                dirty, self._dirty = self._dirty, set()
+                cleared, self._cleared = self._cleared, False
+            if not dirty and not cleared:
+                return 0
+
+            rows = []
+            for job_id in dirty:
+                job = self.lookup_job(job_id)
+                if job is not None:
+                    rows.append({
+                        'id': job.id,
+                        'next_run_time': datetime_to_utc_timestamp(job.next_run_time),
+                        'job_state': pickle.dumps(job.__getstate__(), self.pickle_protocol)
+                    })
+
+            table = self.snapshot_t
+            try:
+                with self.engine.begin() as connection:
+                    if cleared:
+                        connection.execute(table.delete())
+                    ids = sorted(dirty)
+                    for start in range(0, len(ids), _FLUSH_CHUNK):
+                        connection.execute(table.delete().where(table.c.id.in_(ids[start:start + _FLUSH_CHUNK])))
+                    if rows:
+                        connection.execute(table.insert(), rows)
+            except Exception:
+                # Keep the changes for the next attempt; newer marks are merged in
+                with self._dirty_lock:
+                    self._dirty |= dirty
+                    self._cleared = self._cleared or cleared
+                raise
+            logger.debug(f"Flushed {len(dirty)} jobs to the snapshot")
+            return len(dirty)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning(f"Job snapshot flush failed, retrying in {self.flush_interval}s: {e}")
+
+    def _recover(self) -> None:
+        """Load the last snapshot into memory, dropping jobs that can no longer be restored."""
+        failed = []
+        with self.engine.begin() as connection:
+            for row in connection.execute(select(self.snapshot_t.c.id, self.snapshot_t.c.job_state)):
+                try:
+                    job = self._reconstitute_job(row.job_state)
+                except BaseException:
+                    logger.exception(f"Unable to restore job \"{row.id}\" -- removing it")
+                    failed.append(row.id)
+                    continue
+                MemoryJobStore.add_job(self, job)
+            if failed:
+                connection.execute(self.snapshot_t.delete().where(self.snapshot_t.c.id.in_(failed)))
+        if self._jobs:
+            logger.info(f"Restored {len(self._jobs)} jobs from the snapshot")
+
+    def _reconstitute_job(self, job_state: bytes) -> Job:
+        job_state = pickle.loads(job_state)
+        job = Job.__new__(Job)
+        job.__setstate__(job_state)
+        job._scheduler = self._scheduler
+        job._jobstore_alias = self._alias
+        return job
+
+    def __repr__(self) -> str:
+        return f'<{self.__class__.__name__} (url={self.engine.url})>'
@@ -0,0 +1,205 @@
+# Copyright 2024 Sola Richard Olorunfemi
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import logging
+import os
+import pickle
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, NamedTuple, Optional, Tuple
+
+from sqlalchemy import Column, Float, Integer, LargeBinary, MetaData, Table, Unicode, create_engine, func, select
+from sqlalchemy.engine import Engine
+
+from .result_store import get_result_store
+from .utils import get_task_cache_settings
+
+logger = logging.getLogger(__name__)
+
+
+class CachePolicy(NamedTuple):
+    """How the runs of a task declared with CACHE = '<ttl>' are reused."""
+    function: str
+    ttl: float
+    probe: Optional[Callable] = None
+    probe_args: Tuple[Any, ...] = ()
+    probe_kwargs: Optional[Dict[str, Any]] = None
+
+    def key(self, args: Any, kwargs: Dict[str, Any]) -> Optional[str]:
+        """
+        Key of a run: the function name, its arguments and the probe's current value.
+
+        The probe is a registered function reporting the freshness of what the task
+        reads, such as the max(CREATED_DATETIME) of a source table. Returns None when
+        the arguments or the probe's value cannot be pickled; such runs are not cached.
+        """
+        freshness = self.probe(*self.probe_args, **(self.probe_kwargs or {})) if self.probe else None
+        try:
+            state = pickle.dumps((self.function, tuple(args), sorted(kwargs.items()), freshness), pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            return None
+        return hashlib.sha256(state).hexdigest()
+
+
+class TaskCache:
+    """
+    Results of cached task runs, in an SQL table bounded to `max_bytes`.
+
+    Entries expire after the ttl of their task. When the table grows past
+    `max_bytes`, the least recently used entries are deleted. The engine is created
+    on first use in each process, so forked pool workers open their own connections.
+    """
+
+    def __init__(self, url: str, max_bytes: int = 256 * 1024 * 1024, tablename: str = 'task_cache',
+                 engine_options: Optional[Dict[str, Any]] = None) -> None:
+        self.url = url
+        self.max_bytes = max_bytes
+        self.engine_options = engine_options or {}
+        self.cache_t = Table(
+            tablename, MetaData(),
+            Column('key', Unicode(64), primary_key=True),
+            Column('function', Unicode(191), nullable=False),
+            Column('value', LargeBinary, nullable=False),
+            Column('size', Integer, nullable=False),
+            Column('expires_at', Float, nullable=False),
+            Column('used_at', Float, nullable=False, index=True)
+        )
+        self._engine: Optional[Engine] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @property
+    def engine(self) -> Engine:
+        with self._lock:
+            if self._engine is None or self._pid != os.getpid():
+                # Connections inherited through fork belong to the parent
+                self._engine = create_engine(self.url, **self.engine_options)
+                self._pid = os.getpid()
+                self.cache_t.create(self._engine, checkfirst=True)
+            return self._engine
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        """(True, value) for a live entry, refreshing its LRU position; (False, None) otherwise."""
+        table, now = self.cache_t, time.time()
+        with self.engine.begin() as connection:
+            value = connection.execute(
+                select(table.c.value).where(table.c.key == key, table.c.expires_at > now)).scalar()
+            if value is None:
+                return False, None
+            connection.execute(table.update().where(table.c.key == key).values(used_at=now))
+        return True, pickle.loads(value)
+
+    def put(self, key: str, function: str, ttl: float, value: Any) -> bool:
+        """Store the result of a run. Returns False when the value cannot be pickled or exceeds max_bytes."""
+        try:
+            data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            logger.warning(f"Result of {function} was not cached: {e}")
+            return False
+        if len(data) > self.max_bytes:
+            return False
+        table, now = self.cache_t, time.time()
+        with self.engine.begin() as connection:
+            connection.execute(table.delete().where(table.c.key == key))
+            connection.execute(table.insert().values(key=key, function=function, value=data, size=len(data),
+                                                     expires_at=now + ttl, used_at=now))
+            self._evict(connection, now)
+        return True
+
+    def _evict(self, connection, now: float) -> None:
+        table = self.cache_t
+        connection.execute(table.delete().where(table.c.expires_at <= now))
+        total = connection.execute(select(func.coalesce(func.sum(table.c.size), 0))).scalar()
+        if total <= self.max_bytes:
+            return
+        evicted = []
+        for key, size in connection.execute(select(table.c.key, table.c.size).order_by(table.c.used_at)):
+            if total <= self.max_bytes:
+                break
+            evicted.append(key)
+            total -= size
+        connection.execute(table.delete().where(table.c.key.in_(evicted)))
+        logger.debug(f"Evicted {len(evicted)} cached task results")
+
+    def clear(self, function: Optional[str] = None) -> None:
+        """Drop the cached results of one task function, or all of them."""
+        table = self.cache_t
+        with self.engine.begin() as connection:
+            statement = table.delete()
+            if function is not None:
+                statement = statement.where(table.c.function == function)
+            connection.execute(statement)
+
+
+def _build_task_cache() -> TaskCache:
+    settings = get_task_cache_settings()
+    return TaskCache(settings['url'], int(settings['max_bytes']))
+
+
+_task_cache_lock = threading.Lock()
+
+
+def __getattr__(name: str) -> Any:
+    """Open the `task_cache` database on first access rather than when this module is imported."""
+    if name != 'task_cache':
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    with _task_cache_lock:
+        if name not in globals():
+            globals()[name] = _build_task_cache()
+    return globals()[name]
+
+
+def get_task_cache() -> TaskCache:
+    """The process-wide task cache, built on first use."""
+    return sys.modules[__name__].task_cache
+
+
+def _lookup(policy: CachePolicy, args: Any, kwargs: Dict[str, Any]) -> Tuple[Optional[str], bool, Any]:
+    key = policy.key(args, kwargs)
+    if key is None:
+        return None, False, None
+    hit, value = get_task_cache().get(key)
+    if hit:
+        logger.info(f"Reused the cached result of {policy.function}")
+    return key, hit, value
+
+
+def call_cached(policy: CachePolicy, func: Callable, args: Any, kwargs: Dict[str, Any]) -> Any:
+    """Run `func` unless a run with the same key is cached, and cache the result."""
+    args, kwargs = get_result_store().resolve(args, kwargs)
+    key, hit, value = _lookup(policy, args, kwargs)
+    if hit:
+        return value
+    value = func(*args, **kwargs)
+    if key is not None:
+        get_task_cache().put(key, policy.function, policy.ttl, value)
+    return value
+
+
+def run_cached(policy: CachePolicy, func: Callable, *args: Any, **kwargs: Any) -> Any:
+    """Job function of a task declared with CACHE."""
+    return call_cached(policy, func, args, kwargs)
+
+
+async def run_async_cached(policy: CachePolicy, func: Callable, *args: Any, **kwargs: Any) -> Any:
+    """run_cached() for async def tasks."""
+    args, kwargs = get_result_store().resolve(args, kwargs)
+    key, hit, value = _lookup(policy, args, kwargs)
+    if hit:
+        return value
+    value = await func(*args, **kwargs)
+    if key is not None:
+        get_task_cache().put(key, policy.function, policy.ttl, value)
+    return value
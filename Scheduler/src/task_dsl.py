@@ -0,0 +1,395 @@
+# Copyright 2024 Sola Richard Olorunfemi
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tokenizer and grammar for the CREATE TASK and ALTER TASK statements.
+
+    create  := CREATE TASK name clause* AS function '(' args ')' [';']
+    clause  := SERVER '=' value
+             | EXECUTOR '=' name
+             | SCHEDULE '=' 'n unit'
+             | USING CRON field field field field field [time_zone]
+             | ALLOW_OVERLAPPING_EXECUTION '=' (TRUE | FALSE)
+             | AFTER name (',' name)*
+             | CACHE '=' 'n unit'
+             | PROBE '=' function '(' args ')'
+    alter   := ALTER TASK name (RESUME | SUSPEND | REMOVE [AFTER name (',' name)*] | SET clause*) [';']
+
+Keywords are case-insensitive. Clauses may appear in any order, each at most once.
+Statements are tokenized with one precompiled pattern and parsed by recursive
+descent; errors carry the offset, line and column of the offending token.
+"""
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar
+
+PARSE_CACHE_SIZE = 1024  # Parsed statements kept per statement type
+
+_TOKEN_PATTERN = r"""(?:
+    (?P<string>'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")
+  | (?P<word>[A-Za-z_][\w./+\-]*)
+  | (?P<field>[\d*][\d*/,\-]*)
+  | (?P<op>[=(),;\[\]{}])
+  | (?P<other>\S)
+)"""
+
+# Each token is also captured with its leading whitespace, so that findall returns a run
+# of them in one call
+_SCAN_RE = re.compile(r'(\s*' + _TOKEN_PATTERN + ')', re.VERBOSE)
+_SCANNED, _STRING, _WORD, _FIELD, _OP = range(5)
+
+# Text up to the next '(' outside quoted strings, where the parser stops tokenizing
+_UNTIL_CALL_RE = re.compile(r"""(?:[^('"]+|'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*"|['"])*""")
+
+# Inside an argument list only quoted strings and brackets matter
+_ARGS_RE = re.compile(r"""'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*"|[()\[\]{}]""")
+
+_QUOTED_RE = re.compile(r"""('(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")""")
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+_NAME_RE = re.compile(r'\w+$')
+
+_SCHEDULE_RE = re.compile(r"""['"]\s*\d+\s+(?:SECOND|MINUTE|HOUR|DAY|WEEK)S?\s*['"]$""", re.IGNORECASE)
+
+_CLAUSE_KEYWORDS = frozenset({'SERVER', 'EXECUTOR', 'SCHEDULE', 'USING', 'ALLOW_OVERLAPPING_EXECUTION', 'AFTER',
+                              'CACHE', 'PROBE', 'AS'})
+
+_OPENING = {'(': ')', '[': ']', '{': '}'}
+
+_CLOSING = frozenset(_OPENING.values())
+
+
+class ParseError(ValueError):
+    """A statement that does not match the grammar, with the location of the problem."""
+
+    def __init__(self, message: str, text: str = '', position: Optional[int] = None) -> None:
+        super().__init__(message)
+        self.text = text
+        self.position = position
+        if position is None:
+            self.line = self.column = None
+        else:
+            self.line = text.count('\n', 0, position) + 1
+            self.column = position - (text.rfind('\n', 0, position) + 1) + 1
+
+
+def normalize_command(command: str) -> str:
+    """Collapse whitespace outside quoted strings, so reformatted statements share a cache entry."""
+    if "'" not in command and '"' not in command:
+        return _WHITESPACE_RE.sub(' ', command).strip()
+    parts = _QUOTED_RE.split(command)
+    # Odd indices are the quoted strings captured by the split
+    parts[::2] = [_WHITESPACE_RE.sub(' ', part) for part in parts[::2]]
+    return ''.join(parts).strip()
+
+
+def _cache_key(command: str) -> str:
+    # A statement on one line with single spaces is its own key without normalizing it.
+    # Rarer whitespace left in a key only stops reformatted copies sharing its entry.
+    if ('  ' in command or '\n' in command or '\t' in command or '\r' in command
+            or command[:1] == ' ' or command[-1:] == ' '):
+        return normalize_command(command)
+    return command
+
+
+class _Parser:
+    """
+    Recursive-descent parser over the tokens of a statement, with one token of lookahead.
+
+    Tokens are the raw tuples of _SCAN_RE.findall: the token with its leading whitespace,
+    then one group per kind of which only the matching one is set. The text is
+    tokenized a run at a time up to the next '(', so that an argument list is skipped
+    by call() rather than tokenized. Offsets are only needed for errors, so they are
+    recovered from the token lengths when one is raised.
+    """
+
+    def __init__(self, text: str) -> None:
+        self.text = text
+        self.tokens: List[Tuple[str, ...]] = []
+        self.runs: List[Tuple[int, int]] = []  # (index of the first token, offset) of each run
+        self.scanned = 0
+        self.index = 0
+        self.scan()
+        self.token: Optional[Tuple[str, ...]] = self.tokens[0] if self.tokens else None
+
+    # Token helpers
+
+    def scan(self) -> None:
+        text = self.text
+        if text.find('(', self.scanned) < 0:
+            end = len(text)
+        else:
+            end = min(_UNTIL_CALL_RE.match(text, self.scanned).end() + 1, len(text))
+        self.runs.append((len(self.tokens), self.scanned))
+        self.tokens.extend(_SCAN_RE.findall(text, self.scanned, end))
+        self.scanned = end
+
+    def advance(self) -> Tuple[str, ...]:
+        previous = self.token
+        index = self.index = self.index + 1
+        try:
+            self.token = self.tokens[index]
+        except IndexError:
+            if self.scanned < len(self.text):
+                self.scan()
+            self.token = self.tokens[index] if index < len(self.tokens) else None
+        return previous
+
+    def position(self, index: int) -> int:
+        if index >= len(self.tokens):
+            return len(self.text)
+        first, offset = next(run for run in reversed(self.runs) if run[0] <= index)
+        scanned = self.tokens[index][_SCANNED]
+        return offset + sum(len(token[_SCANNED]) for token in self.tokens[first:index + 1]) - len(scanned.lstrip())
+
+    def peek_keyword(self, *keywords: str) -> Optional[str]:
+        token = self.token
+        if token is not None and token[_WORD]:
+            keyword = token[_WORD].upper()
+            if keyword in keywords:
+                return keyword
+        return None
+
+    def peek_op(self, op: str) -> bool:
+        return self.token is not None and self.token[_OP] == op
+
+    def error(self, expected: str) -> ParseError:
+        token = self.token
+        if token is None:
+            return ParseError(f"Invalid command format: expected {expected} at end of command",
+                              self.text, len(self.text))
+        return ParseError(f"Invalid command format: expected {expected} but found {token[_SCANNED].lstrip()!r}",
+                          self.text, self.position(self.index))
+
+    def expect_keyword(self, keyword: str) -> None:
+        if not self.peek_keyword(keyword):
+            raise self.error(keyword)
+        self.advance()
+
+    def expect_op(self, op: str) -> None:
+        if not self.peek_op(op):
+            raise self.error(repr(op))
+        self.advance()
+
+    def expect_name(self, what: str = 'a task name') -> str:
+        token = self.token
+        name = token is not None and (token[_WORD] or token[_FIELD])
+        if not name or not _NAME_RE.match(name):
+            raise self.error(what)
+        self.advance()
+        return name
+
+    def expect_end(self) -> None:
+        if self.peek_op(';'):
+            self.advance()
+        if self.token is not None:
+            raise self.error('end of command')
+
+    # Grammar
+
+    def name_list(self) -> str:
+        names = []
+        while True:
+            if self.peek_keyword(*_CLAUSE_KEYWORDS):
+                raise self.error('a task name')
+            names.append(self.expect_name())
+            if not self.peek_op(','):
+                return ', '.join(names)
+            self.advance()
+
+    def clauses(self, allowed: Tuple[str, ...], stop: Optional[str] = None) -> Dict[str, Any]:
+        clauses: Dict[str, Any] = {}
+        while True:
+            keyword = self.peek_keyword(*allowed)
+            if keyword is None:
+                break
+            name = 'cron' if keyword == 'USING' else keyword.lower()
+            if name in clauses or (name in ('schedule', 'cron') and ('schedule' in clauses or 'cron' in clauses)):
+                raise ParseError(f"Invalid command format: duplicate {keyword} clause",
+                                 self.text, self.position(self.index))
+            self.advance()
+
+            if keyword == 'SERVER':
+                self.expect_op('=')
+                clauses[name] = self.expect_name('a SERVER value')
+            elif keyword == 'EXECUTOR':
+                self.expect_op('=')
+                clauses[name] = self.expect_name('an executor name')
+            elif keyword in ('SCHEDULE', 'CACHE'):
+                self.expect_op('=')
+                value = self.token
+                if value is None or not value[_STRING] or not _SCHEDULE_RE.match(value[_STRING]):
+                    raise self.error(f"a {name} such as '5 MINUTE'")
+                clauses[name] = self.advance()[_STRING]
+            elif keyword == 'PROBE':
+                self.expect_op('=')
+                clauses[name] = self.call()
+            elif keyword == 'USING':
+                self.expect_keyword('CRON')
+                fields = []
+                for _ in range(5):
+                    value = self.token
+                    if value is None or not value[_FIELD]:
+                        raise self.error('a cron field')
+                    fields.append(self.advance()[_FIELD])
+                time_zone = None
+                value = self.token
+                if value is not None and value[_WORD] and value[_WORD].upper() not in _CLAUSE_KEYWORDS:
+                    time_zone = self.advance()[_WORD]
+                clauses[name] = (' '.join(fields), time_zone)
+            elif keyword == 'ALLOW_OVERLAPPING_EXECUTION':
+                self.expect_op('=')
+                value = self.peek_keyword('TRUE', 'FALSE')
+                if value is None:
+                    raise self.error('TRUE or FALSE')
+                self.advance()
+                clauses[name] = value == 'TRUE'
+            elif keyword == 'AFTER':
+                clauses[name] = self.name_list()
+        if stop is not None and not self.peek_keyword(stop):
+            raise self.error(' or '.join(allowed + (stop,)))
+        return clauses
+
+    def call(self) -> Tuple[str, str]:
+        function = self.expect_name('a function name')
+        if not self.peek_op('('):
+            raise self.error("'('")
+        # A run of tokens ends at the first '(', so the arguments start where scanning stopped
+        start = self.scanned
+        expected = [')']
+        for match in _ARGS_RE.finditer(self.text, start):
+            value = match.group()
+            if value in _OPENING:
+                expected.append(_OPENING[value])
+            elif value in _CLOSING:
+                if value != expected.pop():
+                    raise ParseError("Invalid command format: unbalanced parentheses in arguments",
+                                     self.text, match.start())
+                if not expected:
+                    self.scanned = match.end()
+                    self.advance()
+                    return function, self.text[start:match.start()].strip()
+        raise ParseError("Invalid command format: unbalanced parentheses in arguments",
+                         self.text, start - 1)
+
+    def create_task(self) -> Dict[str, Any]:
+        for keyword in ('CREATE', 'TASK'):
+            if not self.peek_keyword(keyword):
+                raise ParseError("Invalid command format", self.text, 0)
+            self.advance()
+        task_name = self.expect_name()
+        clauses = self.clauses(('SERVER', 'EXECUTOR', 'SCHEDULE', 'USING', 'ALLOW_OVERLAPPING_EXECUTION', 'AFTER',
+                                'CACHE', 'PROBE'), stop='AS')
+        self.expect_keyword('AS')
+        function, args = self.call()
+        self.expect_end()
+        cron_expr, time_zone = clauses.get('cron', (None, None))
+        return {
+            'task_name': task_name,
+            'server': clauses.get('server'),
+            'executor': clauses.get('executor'),
+            'schedule': clauses.get('schedule'),
+            'cron_expr': cron_expr,
+            'time_zone': time_zone or 'UTC',
+            'allow_overlapping_execution': clauses.get('allow_overlapping_execution'),
+            'after': clauses.get('after'),
+            'cache': clauses.get('cache'),
+            'probe': clauses.get('probe'),
+            'function': function,
+            'args': args,
+        }
+
+    def alter_task(self) -> Dict[str, Any]:
+        for keyword in ('ALTER', 'TASK'):
+            if not self.peek_keyword(keyword):
+                raise ParseError("Unknown command type", self.text, 0)
+            self.advance()
+        task_name = self.token[_SCANNED].lstrip() if self.token is not None else ''
+        if not _NAME_RE.match(task_name):
+            raise ParseError("Unknown command type", self.text, 0)
+        self.advance()
+        params: Dict[str, Any] = {'task_name': task_name}
+
+        action = self.peek_keyword('RESUME', 'SUSPEND', 'REMOVE', 'SET')
+        if action is None:
+            raise ParseError("Unknown command type", self.text, self.position(self.index))
+        token = self.advance()
+
+        if action in ('RESUME', 'SUSPEND'):
+            params['action'] = token[_WORD]
+        elif action == 'REMOVE':
+            params['action'] = 'REMOVE'
+            params['after'] = None
+            if self.peek_keyword('AFTER'):
+                self.advance()
+                params['after'] = self.name_list()
+        else:
+            clauses = self.clauses(('SERVER', 'EXECUTOR', 'SCHEDULE', 'USING', 'ALLOW_OVERLAPPING_EXECUTION'))
+            cron_expr, time_zone = clauses.get('cron', (None, None))
+            params['server'] = clauses.get('server')
+            params['executor'] = clauses.get('executor')
+            params['schedule'] = clauses.get('schedule')
+            params['cron_expr'] = cron_expr
+            params['time_zone'] = time_zone or 'UTC'
+            params['allow_overlapping_execution'] = clauses.get('allow_overlapping_execution')
+        self.expect_end()
+        return params
+
+
+def parse_create(command: str) -> Dict[str, Any]:
+    """Parse a CREATE TASK statement into its clauses; the arguments are returned as raw text."""
+    return _Parser(command).create_task()
+
+
+def parse_alter(command: str) -> Dict[str, Any]:
+    """Parse an ALTER TASK statement into the parameters expected by modify_task."""
+    return _Parser(command).alter_task()
+
+
+T = TypeVar('T')
+
+
+class ParseCache:
+    """
+    Bounded LRU cache of parse results keyed by normalized statement text.
+
+    Parse errors are not cached. Callers get results back as stored, so they must
+    copy anything they intend to mutate.
+    """
+
+    def __init__(self, maxsize: int = PARSE_CACHE_SIZE) -> None:
+        self.maxsize = maxsize
+        self._entries: 'OrderedDict[str, Any]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_or_parse(self, command: str, parse: Callable[[str], T]) -> T:
+        key = _cache_key(command)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        # Parse the original text so that error positions match what the user wrote
+        result = parse(command)
+        with self._lock:
+            self._entries[key] = result
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return result
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,257 @@
+# Copyright 2024 Sola Richard Olorunfemi
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Set
+
+if TYPE_CHECKING:
+    from sqlalchemy.engine import Connection
+    from .dependency_store import DependencyStore
+
+
+class TaskGraph:
+    """
+    AFTER dependencies between tasks.
+
+    Edges are indexed in both directions, so a completed task only visits its
+    direct successors. Each successor keeps the set of upstream tasks still
+    pending for its current run; when that set empties the successor is
+    released and the set is re-armed for the next run. A set is used rather
+    than a bare counter so that an upstream task completing twice before its
+    successor is released is only counted once. The graph also records which
+    tasks' results each task reads through RESULT() arguments, so a completed
+    task's result is only kept when something will read it.
+
+    When attached to a DependencyStore the graph is a write-through cache of the
+    persisted edges. Readiness is then decided by the store, so processes sharing
+    the jobstore agree on when a task is released, and edges changed by another
+    process are reloaded when the store's revision moves. A completion reads the
+    revision when the task has successors or readers, and otherwise at most once every
+    `revision_interval` seconds, so a task nothing depends on costs no query
+    and picks up edges added to it elsewhere within that interval.
+    """
+
+    def __init__(self, store: Optional['DependencyStore'] = None, revision_interval: float = 5.0) -> None:
+        self._upstream: Dict[str, Set[str]] = {}
+        self._downstream: Dict[str, Set[str]] = {}
+        self._pending: Dict[str, Set[str]] = {}
+        self._reads: Dict[str, Set[str]] = {}
+        self._readers: Dict[str, Set[str]] = {}
+        self._lock = threading.RLock()
+        self._store: Optional['DependencyStore'] = None
+        self._revision = 0
+        self._revision_checked = 0.0
+        self.revision_interval = revision_interval
+        if store is not None:
+            self.attach(store)
+
+    def __contains__(self, task_name: str) -> bool:
+        return task_name in self._upstream
+
+    def __len__(self) -> int:
+        return len(self._upstream)
+
+    @property
+    def persistent(self) -> bool:
+        """Whether the graph is backed by a DependencyStore."""
+        return self._store is not None
+
+    def attach(self, store: 'DependencyStore') -> None:
+        """Back the graph with `store`, replacing its contents with the persisted state."""
+        with self._lock:
+            self._store = store
+            self._load()
+
+    def add_task(self, task_name: str, after: Iterable[str]) -> None:
+        """Make task_name run after every task in `after`, replacing its previous predecessors."""
+        self.add_tasks({task_name: after})
+
+    def add_tasks(self, dependencies: Dict[str, Iterable[str]], connection: Optional['Connection'] = None) -> None:
+        """
+        add_task() for several tasks, persisted in one write. Given a `connection`, the
+        edges are written in its open transaction, such as the one storing the tasks' jobs.
+        """
+        dependencies = {
+            task_name: {task.strip() for task in after if task.strip()}
+            for task_name, after in dependencies.items()
+        }
+        with self._lock:
+            if self._store is not None and self._written(
+                    self._store.set_many({name: sorted(after) for name, after in dependencies.items()}, connection)):
+                return
+            for task_name, after in dependencies.items():
+                self._unlink(task_name)
+                if not after:
+                    continue
+                self._upstream[task_name] = set(after)
+                self._pending[task_name] = set(after)
+                for upstream in after:
+                    self._downstream.setdefault(upstream, set()).add(task_name)
+
+    def set_results(self, results: Dict[str, Iterable[str]], connection: Optional['Connection'] = None) -> None:
+        """
+        Record the tasks whose results each task reads, replacing what it read before.
+        Persisted like add_tasks(), in `connection`'s transaction when one is given.
+        """
+        if not results:
+            return
+        results = {task_name: set(reads) for task_name, reads in results.items()}
+        with self._lock:
+            if self._store is not None and self._written(
+                    self._store.set_results({name: sorted(reads) for name, reads in results.items()}, connection)):
+                return
+            for task_name, reads in results.items():
+                self._unlink_reads(task_name)
+                if reads:
+                    self._reads[task_name] = reads
+                    for upstream in reads:
+                        self._readers.setdefault(upstream, set()).add(task_name)
+
+    def reads(self, task_name: str) -> Set[str]:
+        """Tasks whose results task_name reads."""
+        with self._lock:
+            return set(self._reads.get(task_name, ()))
+
+    def result_needed(self, task_name: str) -> bool:
+        """Whether a RESULT() argument or an AFTER dependent may read the result of task_name."""
+        with self._lock:
+            return task_name in self._readers or task_name in self._downstream
+
+    def remove_dependencies(self, task_name: str, after: Optional[Iterable[str]] = None) -> Set[str]:
+        """
+        Remove predecessors from task_name, or all of them when `after` is None.
+
+        Returns the predecessors that are left.
+        """
+        with self._lock:
+            current = self._upstream.get(task_name, set())
+            to_remove = set(current) if after is None else {task.strip() for task in after} & current
+            if not to_remove:
+                return set(current)
+            if self._store is not None and self._written(
+                    self._store.remove_dependencies(task_name, sorted(to_remove))):
+                return self.upstream(task_name)
+            for upstream in to_remove:
+                current.discard(upstream)
+                self._pending[task_name].discard(upstream)
+                self._discard_downstream(upstream, task_name)
+            if not current:
+                del self._upstream[task_name]
+                del self._pending[task_name]
+            return set(current)
+
+    def remove_task(self, task_name: str) -> None:
+        """Forget task_name together with every edge into or out of it."""
+        with self._lock:
+            if self._store is not None and self._written(self._store.remove_task(task_name)):
+                return
+            self._unlink(task_name)
+            self._unlink_reads(task_name)
+            for downstream in self._downstream.pop(task_name, set()):
+                self._pending[downstream].discard(task_name)
+                self._upstream[downstream].discard(task_name)
+                if not self._upstream[downstream]:
+                    del self._upstream[downstream]
+                    del self._pending[downstream]
+
+    def upstream(self, task_name: str) -> Set[str]:
+        """Tasks that task_name runs after."""
+        with self._lock:
+            return set(self._upstream.get(task_name, ()))
+
+    def downstream(self, task_name: str) -> Set[str]:
+        """Tasks that run after task_name."""
+        with self._lock:
+            return set(self._downstream.get(task_name, ()))
+
+    def pending(self, task_name: str) -> Set[str]:
+        """Predecessors of task_name that have not completed in its current run."""
+        with self._lock:
+            return set(self._pending.get(task_name, ()))
+
+    def complete(self, task_name: str) -> List[str]:
+        """
+        Record a successful run of task_name.
+
+        Returns the successors whose predecessors have now all completed.
+        """
+        with self._lock:
+            if self._store is not None and (
+                    task_name in self._downstream or task_name in self._readers
+                    or time.monotonic() - self._revision_checked >= self.revision_interval):
+                self._revision_checked = time.monotonic()
+                if self._store.revision() != self._revision:
+                    self._load()
+            successors = list(self._downstream.get(task_name, ()))
+            for downstream in successors:
+                self._pending[downstream].discard(task_name)
+
+            if self._store is not None:
+                released = self._store.record_completion(task_name, successors)
+            else:
+                released = [downstream for downstream in successors if not self._pending[downstream]]
+
+            for downstream in released:
+                self._pending[downstream] = set(self._upstream[downstream])
+        return released
+
+    def _load(self) -> None:
+        revision, rows, reads = self._store.load()
+        self._revision_checked = time.monotonic()
+        self._upstream.clear()
+        self._downstream.clear()
+        self._pending.clear()
+        self._reads.clear()
+        self._readers.clear()
+        for task_name, upstream, satisfied in rows:
+            self._upstream.setdefault(task_name, set()).add(upstream)
+            self._downstream.setdefault(upstream, set()).add(task_name)
+            pending = self._pending.setdefault(task_name, set())
+            if not satisfied:
+                pending.add(upstream)
+        for task_name, upstream in reads:
+            self._reads.setdefault(task_name, set()).add(upstream)
+            self._readers.setdefault(upstream, set()).add(task_name)
+        self._revision = revision
+
+    def _written(self, revision: int) -> bool:
+        """Record our own write; reload (and return True) if another process also wrote."""
+        if revision != self._revision + 1:
+            self._load()
+            return True
+        self._revision = revision
+        return False
+
+    def _unlink(self, task_name: str) -> None:
+        for upstream in self._upstream.pop(task_name, set()):
+            self._discard_downstream(upstream, task_name)
+        self._pending.pop(task_name, None)
+
+    def _unlink_reads(self, task_name: str) -> None:
+        for upstream in self._reads.pop(task_name, set()):
+            readers = self._readers[upstream]
+            readers.discard(task_name)
+            if not readers:
+                del self._readers[upstream]
+
+    def _discard_downstream(self, upstream: str, task_name: str) -> None:
+        successors = self._downstream.get(upstream)
+        if successors is not None:
+            successors.discard(task_name)
+            if not successors:
+                del self._downstream[upstream]
+
+
+# Dependency graph shared by every module of this process
+task_graph = TaskGraph()
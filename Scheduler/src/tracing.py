@@ -0,0 +1,245 @@
+# Copyright 2024 Sola Richard Olorunfemi
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import contextvars
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, TextIO
+
+from apscheduler.events import EVENT_JOB_ERROR, EVENT_JOB_EXECUTED, JobExecutionEvent
+from apscheduler.util import ref_to_obj
+
+from .utils import get_tracing_settings
+
+logger = logging.getLogger(__name__)
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar('orchestr8_span', default=None)
+
+
+class Span:
+    """One timed phase. Spans opened inside another span's block become its children."""
+
+    __slots__ = ('name', 'trace_id', 'span_id', 'parent_id', 'start_time', 'duration', 'attributes', 'error')
+
+    def __init__(self, name: str, attributes: Dict[str, Any], parent: Optional['Span'] = None) -> None:
+        self.name = name
+        self.trace_id = parent.trace_id if parent is not None else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent is not None else None
+        self.start_time = time.time()
+        self.duration: Optional[float] = None
+        self.attributes = attributes
+        self.error: Optional[str] = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'start_time': self.start_time,
+            'duration': self.duration,
+            'attributes': self.attributes,
+            'error': self.error,
+        }
+
+
+class _ActiveSpan:
+    """Context manager opening a span as the current one and exporting it on exit."""
+
+    __slots__ = ('_tracer', '_span', '_started', '_token')
+
+    def __init__(self, tracer: 'Tracer', name: str, attributes: Dict[str, Any]) -> None:
+        self._tracer = tracer
+        self._span = Span(name, attributes, _current_span.get())
+
+    def __enter__(self) -> Span:
+        self._token = _current_span.set(self._span)
+        self._started = time.perf_counter()
+        return self._span
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        span = self._span
+        span.duration = time.perf_counter() - self._started
+        if exc is not None:
+            span.error = f'{exc_type.__name__}: {exc}'
+        _current_span.reset(self._token)
+        self._tracer.export(span)
+
+
+class _NoopSpan:
+    """Returned while tracing is off: entering, attributes and exiting do nothing."""
+
+    __slots__ = ()
+
+    def __enter__(self) -> '_NoopSpan':
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        return None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class SpanExporter:
+    """Receives every finished span. Subclasses must be safe to call from several threads."""
+
+    def export(self, span: Span) -> None:
+        raise NotImplementedError
+
+    def shutdown(self) -> None:
+        pass
+
+
+class JsonLinesExporter(SpanExporter):
+    """Appends each span to `path` as one JSON object per line, for offline analysis."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._file: Optional[TextIO] = None  # opened by the first span
+
+    def export(self, span: Span) -> None:
+        line = json.dumps(span.to_dict(), default=str)
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, 'a', buffering=1, encoding='utf-8')
+            self._file.write(line + '\n')
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class InMemoryExporter(SpanExporter):
+    """Keeps the finished spans in `spans`."""
+
+    def __init__(self) -> None:
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        with self._lock:
+            self.spans.append(span)
+
+
+class Tracer:
+    """
+    Opens spans around the phases of applying commands and running jobs.
+
+    Tracing is off while there is no exporter: span() then returns a shared no-op
+    context manager, so an instrumented phase costs one method call. Exporter
+    errors are logged and never reach the traced code.
+    """
+
+    def __init__(self, exporter: Optional[SpanExporter] = None) -> None:
+        self.exporter = exporter
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    def span(self, name: str, **attributes: Any):
+        if self.exporter is None:
+            return _NOOP_SPAN
+        return _ActiveSpan(self, name, attributes)
+
+    def export(self, span: Span) -> None:
+        exporter = self.exporter
+        if exporter is None:
+            return
+        try:
+            exporter.export(span)
+        except Exception as e:
+            logger.warning(f"Span {span.name} was not exported: {e}")
+
+    def set_exporter(self, exporter: Optional[SpanExporter]) -> None:
+        """Replace the exporter, shutting down the previous one; None turns tracing off."""
+        previous, self.exporter = self.exporter, exporter
+        if previous is not None and previous is not exporter:
+            previous.shutdown()
+
+    def attach(self, sched) -> None:
+        """Record a 'job.run' span for every run timed by the metered executors."""
+        sched.add_listener(self._on_event, EVENT_JOB_EXECUTED | EVENT_JOB_ERROR)
+
+    def _on_event(self, event: JobExecutionEvent) -> None:
+        started_at = getattr(event, 'started_at', None)
+        if self.exporter is None or started_at is None:
+            return
+        span = Span('job.run', {
+            'job_id': event.job_id,
+            'scheduled_run_time': event.scheduled_run_time.isoformat(),
+            'start_lag': max(0.0, started_at - event.scheduled_run_time.timestamp()),
+        })
+        span.start_time, span.duration = started_at, event.duration
+        if event.exception is not None:
+            span.error = f'{type(event.exception).__name__}: {event.exception}'
+        self.export(span)
+
+
+def build_exporter(exporter: Optional[str], trace_file: str = 'traces.jsonl') -> Optional[SpanExporter]:
+    """The exporter named by TRACE_EXPORTER: None, 'jsonl', or a 'package.module:factory' reference."""
+    if not exporter:
+        return None
+    if exporter.lower() == 'jsonl':
+        return JsonLinesExporter(trace_file)
+    return ref_to_obj(exporter)()
+
+
+def _build_tracer() -> Tracer:
+    settings = get_tracing_settings()
+    return Tracer(build_exporter(settings['exporter'], settings['file']))
+
+
+_tracer_lock = threading.Lock()
+
+
+def __getattr__(name: str) -> Any:
+    """Build `tracer`, and open its exporter, when first used rather than on import."""
+    if name != 'tracer':
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    with _tracer_lock:
+        if name not in globals():
+            globals()[name] = _build_tracer()
+    return globals()[name]
+
+
+def get_tracer() -> Tracer:
+    """The process-wide tracer, built on first use."""
+    return sys.modules[__name__].tracer
+
+
+def traced(name: str) -> Callable[[Callable], Callable]:
+    """Decorator running the function inside a span of `tracer`."""
+    def decorate(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with get_tracer().span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
@@ -32,6 +32,11 @@ def get_import_file():
     return get_setting('IMPORT_FILE', 'Scheduler/src/import_file.py')
 
 
+def get_import_entry_points():
+    """Get the entry point group that installed packages register task functions under."""
+    return get_setting('IMPORT_ENTRY_POINTS', 'orchestr8.tasks')
+
+
 def get_parameter_file():
     """Get parameter file for automated tests."""
     return get_setting('PARAMETER_JSON', 'Job/test_parameter.json')
@@ -62,9 +67,75 @@ def get_jobstore_settings():
     jobstore_config = {}
     jobstore_config['jobstore_type'] = get_setting('JOBSTORE')
     jobstore_config['jobstore_url'] = get_setting('JOBSTORE_SQLALCHEMY_URL')
+    jobstore_config['snapshot_interval'] = get_setting('JOBSTORE_SNAPSHOT_INTERVAL', 5)
     return jobstore_config
 
 
+def get_sqlite_settings():
+    """Get the tuning profile applied to an SQLite jobstore file."""
+    return {
+        'journal_mode': get_setting('SQLITE_JOURNAL_MODE', 'WAL'),
+        'synchronous': get_setting('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'busy_timeout': get_setting('SQLITE_BUSY_TIMEOUT', 5000),
+        'pool_size': get_setting('SQLITE_POOL_SIZE', 5),
+        'batch_updates': get_setting('SQLITE_BATCH_UPDATES', True),
+    }
+
+
+def get_worker_settings():
+    """Get the settings of the multi-process worker mode."""
+    return {
+        'mode': get_setting('WORKER_MODE'),
+        'worker_id': get_setting('WORKER_ID'),
+        'lease_ttl': get_setting('WORKER_LEASE_TTL', 30),
+        'heartbeat_interval': get_setting('WORKER_HEARTBEAT_INTERVAL', 10),
+        'poll_interval': get_setting('WORKER_POLL_INTERVAL', 1),
+        'max_claims': get_setting('WORKER_MAX_CLAIMS', 20),
+    }
+
+
+def get_executor_settings():
+    """Get the named executor pools tasks can run on."""
+    return get_setting('EXECUTORS', {
+        'default': {'type': 'thread', 'max_workers': 20},
+        'processpool': {'type': 'process', 'max_workers': 5},
+    })
+
+
+def get_result_store_settings():
+    """Get where task results are kept for RESULT() arguments, and how long."""
+    return {
+        'directory': get_setting('RESULT_STORE_DIR'),
+        'max_bytes': get_setting('RESULT_STORE_MAX_BYTES', 512 * 1024 * 1024),
+        'max_age': get_setting('RESULT_STORE_MAX_AGE', 24 * 3600),
+        'shared_min_bytes': get_setting('RESULT_SHARED_MIN_BYTES', 1024 * 1024),
+    }
+
+
+def get_task_cache_settings():
+    """Get where the results of tasks declared with CACHE are kept."""
+    return {
+        'url': get_setting('TASK_CACHE_URL', 'sqlite:///task_cache.sqlite'),
+        'max_bytes': get_setting('TASK_CACHE_MAX_BYTES', 256 * 1024 * 1024),
+    }
+
+
+def get_metrics_settings():
+    """Get the address of the /metrics endpoint; no endpoint when the port is None."""
+    return {
+        'host': get_setting('METRICS_HOST', '127.0.0.1'),
+        'port': get_setting('METRICS_PORT', 9108),
+    }
+
+
+def get_tracing_settings():
+    """Get the span exporter; tracing is off when it is None."""
+    return {
+        'exporter': get_setting('TRACE_EXPORTER'),
+        'file': get_setting('TRACE_FILE', 'traces.jsonl'),
+    }
+
+
 def get_timezone():
     """Get the timezone setting."""
     return get_setting('TIMEZONE', 'UTC')
@@ -0,0 +1,182 @@
+# Copyright 2024 Sola Richard Olorunfemi
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import concurrent.futures
+import logging
+import pickle
+import sys
+import time
+import traceback
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta, timezone
+from traceback import format_tb
+from typing import Any, Dict, List, Optional, Set
+from apscheduler.events import EVENT_JOB_ERROR, EVENT_JOB_EXECUTED, EVENT_JOB_MISSED, JobExecutionEvent
+from apscheduler.executors.base import BaseExecutor
+
+from .metrics import MeteredExecutorMixin
+from .module_registry import (
+    entry_point_targets, get_function, import_file_targets, load_entry_points, load_import_file, preload_functions
+)
+from .result_store import get_result_store, run_async_with_results, run_with_results
+from .task_cache import CachePolicy, call_cached, run_async_cached, run_cached
+from .utils import get_import_entry_points
+
+logger = logging.getLogger(__name__)
+
+
+def _init_worker(import_file: Optional[str]) -> None:
+    """Populate the function registry of a new worker process, importing every function up front."""
+    if import_file:
+        load_import_file(import_file)
+    load_entry_points(get_import_entry_points())
+    preload_functions()
+
+
+def _ready() -> None:
+    pass
+
+
+def _run_registered(job_id: str, jobstore_alias: str, name: str, args: Any, kwargs: Dict[str, Any],
+                    run_times: List[datetime], misfire_grace_time: Optional[int],
+                    logger_name: str, cache: Optional[CachePolicy] = None) -> List[JobExecutionEvent]:
+    """run_job() for a task looked up in the worker's registry instead of unpickled with the job."""
+    events = []
+    run_logger = logging.getLogger(logger_name)
+    for run_time in run_times:
+        if misfire_grace_time is not None:
+            difference = datetime.now(timezone.utc) - run_time
+            if difference > timedelta(seconds=misfire_grace_time):
+                events.append(JobExecutionEvent(EVENT_JOB_MISSED, job_id, jobstore_alias, run_time))
+                run_logger.warning(f"Run time of job \"{job_id}\" was missed by {difference}")
+                continue
+
+        run_logger.info(f"Running job \"{job_id}\" (scheduled at {run_time})")
+        started_at, started = time.time(), time.perf_counter()
+        try:
+            if cache is not None:
+                retval = call_cached(cache, get_function(name), args, kwargs)
+            else:
+                run_args, run_kwargs = get_result_store().resolve(args, kwargs)
+                retval = get_function(name)(*run_args, **run_kwargs)
+            retval = get_result_store().share(job_id, retval)
+        except BaseException:
+            exc, tb = sys.exc_info()[1:]
+            formatted_tb = ''.join(format_tb(tb))
+            try:
+                pickle.dumps(exc)
+            except Exception:
+                # Results travel back pickled; keep the error readable rather than losing the run's events
+                exc = RuntimeError(f'{exc.__class__.__name__}: {exc}')
+            events.append(JobExecutionEvent(EVENT_JOB_ERROR, job_id, jobstore_alias, run_time,
+                                            exception=exc, traceback=formatted_tb))
+            run_logger.exception(f"Job \"{job_id}\" raised an exception")
+            traceback.clear_frames(tb)
+            del tb
+        else:
+            events.append(JobExecutionEvent(EVENT_JOB_EXECUTED, job_id, jobstore_alias, run_time, retval=retval))
+            run_logger.info(f"Job \"{job_id}\" executed successfully")
+        # Read by the metrics registry
+        events[-1].started_at, events[-1].duration = started_at, time.perf_counter() - started
+    return events
+
+
+class WarmProcessPoolExecutor(MeteredExecutorMixin, BaseExecutor):
+    """
+    Process pool whose workers load IMPORT_FILE once and run tasks by registry name.
+
+    APScheduler's ProcessPoolExecutor pickles the whole job, callable included, for
+    every run. A worker process imports the task's module on its first run, and a
+    lambda or closure cannot be sent at all. Here each worker process loads
+    `import_file` when it starts, so its function registry is populated before the
+    first run. A run then sends only the job's registry name, its arguments, and its
+    run times and misfire grace time. The worker looks the function up and returns
+    the job events.
+
+    The registry name is the job's name; create_task names every job after its
+    function. The function must be registered by `import_file` or the IMPORT_ENTRY_POINTS
+    group. A function registered at runtime with register_function() exists only in
+    the scheduler's process, so such a task is refused by CREATE TASK and its runs
+    are not submitted. With `prewarm`, the worker processes start along with the
+    scheduler rather than on the first run.
+    """
+
+    def __init__(self, max_workers: int = 5, import_file: Optional[str] = None, prewarm: bool = True,
+                 pool_kwargs: Optional[Dict[str, Any]] = None) -> None:
+        super().__init__()
+        self.max_workers = int(max_workers)
+        self.import_file = import_file
+        self.prewarm = prewarm
+        self._pool_kwargs = dict(pool_kwargs or {})
+        self._pool: Optional[concurrent.futures.ProcessPoolExecutor] = None
+        self._names: Optional[Set[str]] = None
+
+    def can_run(self, name: str) -> bool:
+        """Whether the worker processes register `name`, from the import file or an entry point."""
+        if self._names is None:
+            targets = entry_point_targets(get_import_entry_points())
+            if self.import_file:
+                targets += import_file_targets(self.import_file)
+            self._names = {target_name for target_name, _ in targets}
+        return name in self._names
+
+    def start(self, scheduler, alias) -> None:
+        super().start(scheduler, alias)
+        self._pool = self._create_pool()
+        if self.prewarm:
+            for _ in range(self.max_workers):
+                self._pool.submit(_ready)
+
+    def shutdown(self, wait: bool = True) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait)
+
+    def _create_pool(self) -> concurrent.futures.ProcessPoolExecutor:
+        return concurrent.futures.ProcessPoolExecutor(
+            self.max_workers, initializer=_init_worker, initargs=(self.import_file,), **self._pool_kwargs)
+
+    def submit_job(self, job, run_times) -> None:
+        if not self.can_run(job.name):
+            # Fail the runs here rather than send them to workers that cannot look the function up
+            exc = ValueError(f"Function {job.name} of job {job.id} is not registered by the import file "
+                             f"or an entry point, so the worker processes cannot run it")
+            self._logger.error(f"Error running job {job.id}: {exc}")
+            for run_time in run_times:
+                self._scheduler._dispatch_event(
+                    JobExecutionEvent(EVENT_JOB_ERROR, job.id, job._jobstore_alias, run_time, exception=exc))
+            return
+        super().submit_job(job, run_times)
+
+    def _do_submit_job(self, job, run_times) -> None:
+        def callback(f):
+            exc = f.exception()
+            if exc:
+                self._run_job_error(job.id, exc, getattr(exc, '__traceback__', None))
+            else:
+                self._run_job_success(job.id, f.result())
+
+        # Tasks with RESULT() arguments or CACHE are wrapped; the worker applies those itself
+        args, cache = job.args, None
+        if job.func in (run_with_results, run_async_with_results):
+            args = job.args[1:]
+        elif job.func in (run_cached, run_async_cached):
+            cache, args = job.args[0], job.args[2:]
+        arguments = (job.id, job._jobstore_alias, job.name, args, job.kwargs, run_times,
+                     job.misfire_grace_time, self._logger.name, cache)
+        try:
+            f = self._pool.submit(_run_registered, *arguments)
+        except BrokenProcessPool:
+            self._logger.warning('Process pool is broken; replacing pool with a fresh instance')
+            self._pool = self._create_pool()
+            f = self._pool.submit(_run_registered, *arguments)
+        f.add_done_callback(callback)
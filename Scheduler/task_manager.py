@@ -16,11 +16,6 @@ import signal
 from typing import Optional
 import sys
 from argparse import ArgumentParser
-from src.modify_task import execute_command
-from src.job_scheduler import scheduler
-from src.utils import get_scheduler_shutdown_wait
-
-scheduler = scheduler()
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -28,8 +23,10 @@ logger = logging.getLogger(__name__)
 
 def signal_handler(signum: int, frame: Optional[object]) -> None:
     """Handle shutdown signals."""
+    from Scheduler.src.job_scheduler import shutdown_scheduler
+
     logger.info('Signal received, shutting down scheduler...')
-    scheduler.shutdown(get_scheduler_shutdown_wait())
+    shutdown_scheduler()
     sys.exit(0)
 
 
@@ -41,6 +38,10 @@ def main() -> None:
     - remove_all_tasks: Removes all scheduled tasks.
     - get_all_tasks: Prints all scheduled tasks.
     - get_task <task_name>: Retrieves details of a specific task.
+    - metrics [task_name]: Prints the run timings and executor load of the running scheduler.
+
+    Each command imports only what it needs, and the scheduler is only started by the
+    commands that read or change jobs, so that the tool starts quickly.
     """
     parser = ArgumentParser(description='Command-line tool for task management.')
     parser.add_argument('command', type=str, help='The command to execute')
@@ -57,23 +58,40 @@ def main() -> None:
         logger.info(f"Command received: {input_command}")
 
         if input_command.lower() == "remove_all_tasks":
-            scheduler.remove_all_jobs()
+            from Scheduler.src.job_scheduler import get_scheduler
+
+            get_scheduler().remove_all_jobs()
             logger.info("All tasks removed")
 
         elif input_command.lower() == "get_all_tasks":
-            scheduler.print_jobs()
+            from Scheduler.src.job_scheduler import get_scheduler
+
+            get_scheduler().print_jobs()
 
         elif input_command.lower() == "get_task":
             task_name = args.task_name.strip()
             if task_name:
-                job = scheduler.get_job(task_name)
+                from Scheduler.src.job_scheduler import get_scheduler
+
+                job = get_scheduler().get_job(task_name)
                 if job:
                     logger.info(f"{task_name} detail is:\n{job}")
                 else:
                     logger.info(f"No task found with name {task_name}")
             else:
                 logger.error("No task name provided for 'get_task' command")
+
+        elif input_command.lower() == "metrics":
+            from Scheduler.src.metrics import fetch_metrics
+
+            task_name = args.task_name.strip() if args.task_name else None
+            try:
+                print(fetch_metrics(task_name), end='')
+            except (OSError, ValueError) as e:
+                logger.error(f"Could not read the scheduler's metrics endpoint: {e}")
         else:
+            from Scheduler.src.modify_task import execute_command
+
             try:
                 execute_command(input_command)
             except Exception as e:
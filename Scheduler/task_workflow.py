@@ -18,10 +18,11 @@ from typing import Optional
 import sys
 import time
 from argparse import ArgumentParser
-from Scheduler.src.create_task import execute_command
-from Scheduler.src.module_registry import register_function
-from Scheduler.src.job_scheduler import scheduler
-from Scheduler.src.utils import get_scheduler_shutdown_wait, get_import_file
+from Scheduler.src.create_task import apply_commands, execute_command
+from Scheduler.src.module_registry import load_entry_points, load_import_file
+from Scheduler.src.job_scheduler import shutdown_scheduler
+from Scheduler.src.metrics import serve_metrics
+from Scheduler.src.utils import get_import_entry_points, get_import_file
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -30,54 +31,18 @@ logger = logging.getLogger(__name__)
 def signal_handler(signum: int, frame: Optional[object]) -> None:
     """Handle shutdown signals."""
     logger.info('Signal received, shutting down scheduler...')
-    # scheduler().shutdown(get_scheduler_shutdown_wait())
+    shutdown_scheduler()
     sys.exit(0)
 
 
 def load_and_register_modules(config_file: str) -> None:
-    """Load modules and register functions specified in the configuration file."""
-    with open(config_file, 'r') as file:
-        lines = [line.strip() for line in file if line.strip() and not line.startswith('#')]
+    """
+    Register the functions of the import file and of installed packages' entry points.
 
-    for line in lines:
-        try:
-            exec(line, globals())
-            # Extract function or module.function name for registration
-            if line.startswith('from '):
-                # from module import function
-                parts = line.split()
-                if len(parts) == 4 and parts[0] == 'from' and parts[2] == 'import':
-                    method_name = parts[3]
-                    # Register the function
-                    if method_name in globals():
-                        register_function(method_name, globals()[method_name])
-                        logger.info(f"Successfully registered function: {method_name}")
-                    else:
-                        logger.error(f"Method {method_name} not found in globals after import.")
-                else:
-                    logger.error(f"Invalid import statement format: {line}")
-            elif line.startswith('import '):
-                # import module.function
-                parts = line.split()
-                if len(parts) == 2 and parts[0] == 'import':
-                    module_function = parts[1]
-                    module_name, function_name = module_function.rsplit('.', 1)
-                    if function_name in globals():
-                        register_function(function_name, globals()[function_name])
-                        logger.info(f"Successfully registered function: {function_name}")
-                    else:
-                        exec(f'from {module_name} import {function_name}', globals())
-                        if function_name in globals():
-                            register_function(function_name, globals()[function_name])
-                            logger.info(f"Successfully registered function: {function_name}")
-                        else:
-                            logger.error(f"Function {function_name} not found after import.")
-                else:
-                    logger.error(f"Invalid import statement format: {line}")
-            else:
-                logger.error(f"Unrecognized import statement format: {line}")
-        except Exception as e:
-            logger.error(f"Error executing import statement {line}: {e}")
+    Their modules are imported when a task first uses them.
+    """
+    load_import_file(config_file)
+    load_entry_points(get_import_entry_points())
 
 
 def read_input(source: str) -> str:
@@ -110,10 +75,12 @@ def main() -> None:
     Main function to handle command-line arguments and execute commands.
 
     Usage:
-    python parse.py <string_or_file_path>
+    python parse.py <string_or_file_path> [--batch]
     """
     parser = ArgumentParser(description='Command-line tool for parsing and executing commands.')
     parser.add_argument('source', type=str, help='The source sql string or file path to read sql commands from')
+    parser.add_argument('--batch', action='store_true',
+                        help='Validate the whole script first, then create every task in one jobstore transaction')
 
     args = parser.parse_args()
 
@@ -122,6 +89,7 @@ def main() -> None:
         signal.signal(signal.SIGTERM, signal_handler)
 
         load_and_register_modules(get_import_file())
+        serve_metrics()
 
         source = args.source.strip()
 
@@ -132,8 +100,11 @@ def main() -> None:
         try:
             input_content = read_input(source)
             commands = input_content.splitlines()
-            for input_command in commands:
-                execute_command(input_command)
+            if args.batch:
+                apply_commands(commands)
+            else:
+                for input_command in commands:
+                    execute_command(input_command)
             time.sleep(1)
         except (KeyboardInterrupt, SystemExit):
             # Graceful shutdown handled by signal_handler
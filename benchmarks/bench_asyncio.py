@@ -0,0 +1,100 @@
+# Copyright 2024 Sola Richard Olorunfemi
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Makespan of simulated I/O-bound tasks under the thread and asyncio modes.
+
+Submits N one-off jobs that each wait `IO_WAIT` seconds, the shape of a
+data_validate query or an alert HTTP call, and times how long it takes until
+every job has executed. BackgroundScheduler runs blocking `time.sleep` jobs on
+a ThreadPoolExecutor of `THREADS` workers, so N jobs take roughly
+N / THREADS * IO_WAIT. The asyncio mode runs `asyncio.sleep` coroutines on the
+scheduler's event loop, where all waits overlap.
+
+Usage:
+    python -m benchmarks.bench_asyncio
+"""
+import asyncio
+import logging
+import threading
+import time
+from typing import Callable, Dict, List
+from apscheduler.events import EVENT_JOB_ERROR, EVENT_JOB_EXECUTED
+from apscheduler.executors.asyncio import AsyncIOExecutor
+from apscheduler.executors.pool import ThreadPoolExecutor
+from apscheduler.jobstores.memory import MemoryJobStore
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.schedulers.base import BaseScheduler
+from Scheduler.src.asyncio_scheduler import ThreadedAsyncIOScheduler
+
+SIZES = [100, 1000]
+IO_WAIT = 0.1  # Seconds each task waits on simulated I/O
+THREADS = 20
+
+
+def blocking_io() -> None:
+    time.sleep(IO_WAIT)
+
+
+async def async_io() -> None:
+    await asyncio.sleep(IO_WAIT)
+
+
+def _makespan(tasks: int, sched: BaseScheduler, func: Callable) -> float:
+    done = threading.Event()
+    finished = []
+    lock = threading.Lock()
+
+    def count(event) -> None:
+        with lock:
+            finished.append(event.job_id)
+            if len(finished) == tasks:
+                done.set()
+
+    sched.add_listener(count, EVENT_JOB_EXECUTED | EVENT_JOB_ERROR)
+    sched.start(paused=True)
+    for i in range(tasks):
+        sched.add_job(func, id=f'io_{i}', misfire_grace_time=None)
+
+    started = time.perf_counter()
+    sched.resume()
+    done.wait()
+    elapsed = time.perf_counter() - started
+    sched.shutdown(wait=True)
+    return elapsed
+
+
+def run() -> List[Dict[str, float]]:
+    results = []
+    for size in SIZES:
+        threaded = BackgroundScheduler(jobstores={'default': MemoryJobStore()},
+                                       executors={'default': ThreadPoolExecutor(THREADS)}, timezone='UTC')
+        asyncio_mode = ThreadedAsyncIOScheduler(jobstores={'default': MemoryJobStore()},
+                                                executors={'default': AsyncIOExecutor()}, timezone='UTC')
+        results.append({
+            'tasks': size,
+            'thread_pool_s': _makespan(size, threaded, blocking_io),
+            'asyncio_s': _makespan(size, asyncio_mode, async_io),
+        })
+    return results
+
+
+def main() -> None:
+    logging.getLogger('apscheduler').setLevel(logging.WARNING)
+    print(f"{'tasks':>6} {f'thread pool ({THREADS}) s':>20} {'asyncio s':>10} {'speedup':>8}")
+    for row in run():
+        print(f"{row['tasks']:>6} {row['thread_pool_s']:>20.2f} {row['asyncio_s']:>10.2f} "
+              f"{row['thread_pool_s'] / row['asyncio_s']:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
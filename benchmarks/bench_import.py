@@ -0,0 +1,79 @@
+# Copyright 2024 Sola Richard Olorunfemi
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Startup cost of importing the package and the modules behind its command-line tools.
+
+Each import runs in a fresh interpreter, from an empty working directory, as a
+task_manager.py command run from cron would. Besides the wall time it records the
+threads alive after the import and whether a jobstore file was created, neither of
+which an import should cause.
+
+Usage:
+    python -m benchmarks.bench_import
+"""
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from typing import Any, Dict, List
+
+MODULES = [
+    'Scheduler',
+    'Scheduler.src.parse_create_task',
+    'Scheduler.src.create_task',
+    'Scheduler.src.modify_task',
+    'Scheduler.task_manager',
+    'Scheduler.task_workflow',
+]
+REPEAT = 5
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_PROBE = (
+    "import threading, time; start = time.perf_counter(); import {module}; "
+    "print(time.perf_counter() - start, threading.active_count())"
+)
+
+
+def _import(module: str, directory: str) -> Dict[str, float]:
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get('PYTHONPATH')])))
+    wall = []
+    for _ in range(REPEAT):
+        output = subprocess.run(
+            [sys.executable, '-c', _PROBE.format(module=module)], cwd=directory, env=env,
+            capture_output=True, text=True, check=True
+        ).stdout.split()
+        wall.append(float(output[-2]))
+    return {'import_ms': statistics.median(wall) * 1000, 'threads': float(output[-1])}
+
+
+def run() -> List[Dict[str, Any]]:
+    results = []
+    for module in MODULES:
+        with tempfile.TemporaryDirectory() as directory:
+            row: Dict[str, Any] = {'module': module}
+            row.update(_import(module, directory))
+            row['created_files'] = float(len(os.listdir(directory)))
+            results.append(row)
+    return results
+
+
+def main() -> None:
+    print(f"{'module':<34} {'import ms':>10} {'threads':>8} {'files created':>14}")
+    for row in run():
+        print(f"{row['module']:<34} {row['import_ms']:>10.1f} {row['threads']:>8.0f} {row['created_files']:>14.0f}")
+
+
+if __name__ == '__main__':
+    main()
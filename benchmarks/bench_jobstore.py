@@ -0,0 +1,102 @@
+# Copyright 2024 Sola Richard Olorunfemi
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Job fire rate of the SQLAlchemy, tuned SQLite and memory+snapshot jobstores.
+
+Schedules N one-second interval jobs on a running scheduler and counts how many
+times they fire over a fixed window. Every firing updates the job's next run
+time in the jobstore; with SQLAlchemyJobStore that is an UPDATE on the SQLite
+file, with the SQLite profile (WAL, batched updates) one UPDATE per wakeup, and
+with SnapshotJobStore an in-memory write flushed every `FLUSH_INTERVAL` seconds.
+
+Usage:
+    python -m benchmarks.bench_jobstore
+"""
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List
+from apscheduler.events import EVENT_JOB_SUBMITTED
+from apscheduler.executors.pool import ThreadPoolExecutor
+from apscheduler.jobstores.base import BaseJobStore
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+from apscheduler.schedulers.background import BackgroundScheduler
+from Scheduler.src.job_scheduler import BatchedSQLAlchemyJobStore, sqlite_engine
+from Scheduler.src.snapshot_jobstore import SnapshotJobStore
+
+SIZES = [100, 1000, 3000]
+DURATION = 5  # Seconds measured
+FLUSH_INTERVAL = 1
+
+
+def noop() -> None:
+    pass
+
+
+def _fire_rate(jobs: int, make_store: Callable[[], BaseJobStore]) -> float:
+    sched = BackgroundScheduler(
+        jobstores={'default': make_store()}, executors={'default': ThreadPoolExecutor(20)},
+        job_defaults={'coalesce': True, 'misfire_grace_time': 60}, timezone='UTC'
+    )
+    sched.start(paused=True)
+    start = datetime.now(sched.timezone) + timedelta(seconds=1)
+    # Count from half a second after the first due time, between two firing rounds
+    window_start = time.perf_counter() + (start - datetime.now(sched.timezone)).total_seconds() + 0.5
+    for i in range(jobs):
+        sched.add_job(noop, 'interval', seconds=1, id=f'job_{i}', next_run_time=start)
+
+    fired = []
+    lock = threading.Lock()
+
+    def count(event) -> None:
+        with lock:
+            fired.append(time.perf_counter())
+
+    sched.add_listener(count, EVENT_JOB_SUBMITTED)
+    sched.resume()
+    time.sleep(max(0.0, window_start + DURATION - time.perf_counter()))
+    with lock:
+        in_window = sum(1 for t in fired if window_start <= t < window_start + DURATION)
+    sched.shutdown(wait=True)
+    return in_window / DURATION
+
+
+def run() -> List[Dict[str, float]]:
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for size in SIZES:
+            sqlalchemy_url = f"sqlite:///{os.path.join(directory, f'sqlalchemy_{size}.sqlite')}"
+            profile_url = f"sqlite:///{os.path.join(directory, f'profile_{size}.sqlite')}"
+            snapshot_url = f"sqlite:///{os.path.join(directory, f'snapshot_{size}.sqlite')}"
+            results.append({
+                'jobs': size,
+                'demand_per_s': float(size),
+                'sqlalchemy_per_s': _fire_rate(size, lambda: SQLAlchemyJobStore(url=sqlalchemy_url)),
+                'sqlite_profile_per_s': _fire_rate(size, lambda: BatchedSQLAlchemyJobStore(engine=sqlite_engine(profile_url))),
+                'snapshot_per_s': _fire_rate(size, lambda: SnapshotJobStore(url=snapshot_url, flush_interval=FLUSH_INTERVAL)),
+            })
+    return results
+
+
+def main() -> None:
+    print(f"{'jobs':>6} {'demand fires/s':>15} {'sqlalchemy fires/s':>19} {'sqlite profile fires/s':>23} "
+          f"{'memory+snapshot fires/s':>24}")
+    for row in run():
+        print(f"{row['jobs']:>6} {row['demand_per_s']:>15.0f} {row['sqlalchemy_per_s']:>19.0f} "
+              f"{row['sqlite_profile_per_s']:>23.0f} {row['snapshot_per_s']:>24.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+# Copyright 2024 Sola Richard Olorunfemi
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Throughput of the CREATE TASK / ALTER TASK parsers.
+
+Parses a script of distinct statements with an empty cache (cold) and again
+with the statements already cached (warm), as a workflow reloaded by
+task_workflow.py or repeated task_manager.py commands would.
+
+Usage:
+    python -m benchmarks.bench_parser
+"""
+import time
+from typing import Callable, Dict, List
+from Scheduler.src import parse_create_task, parse_modify_task
+
+STATEMENTS = 500
+REPEAT = 5
+
+
+def _script(size: int) -> List[str]:
+    statements = []
+    for i in range(size):
+        statements.append(
+            f"CREATE TASK task_{i} SERVER = 1 SCHEDULE = '{i % 59 + 1} MINUTE' "
+            f"ALLOW_OVERLAPPING_EXECUTION = FALSE AFTER root_{i % 10}, root "
+            f"AS calculate({i}, [1, 2, 3], mode='fast', limits={{'low': 0, 'high': {i}}})"
+        )
+        statements.append(f"ALTER TASK task_{i} SET USING CRON {i % 60} 12 * * * UTC")
+    return statements
+
+
+def _parse_all(statements: List[str]) -> None:
+    for statement in statements:
+        if statement.startswith('CREATE'):
+            parse_create_task.parse_command(statement)
+        else:
+            parse_modify_task.modify_command(statement)
+
+
+def _clear_caches() -> None:
+    for module in (parse_create_task, parse_modify_task):
+        cache = getattr(module, '_cache', None)
+        if cache is not None:
+            cache.clear()
+
+
+def _rate(statements: List[str], before: Callable[[], None]) -> float:
+    elapsed = 0.0
+    for _ in range(REPEAT):
+        before()
+        start = time.perf_counter()
+        _parse_all(statements)
+        elapsed += time.perf_counter() - start
+    return len(statements) * REPEAT / elapsed
+
+
+def run() -> Dict[str, float]:
+    statements = _script(STATEMENTS)
+    cold = _rate(statements, _clear_caches)
+    _parse_all(statements)
+    warm = _rate(statements, lambda: None)
+    return {'statements': len(statements), 'cold_per_s': cold, 'warm_per_s': warm}
+
+
+def main() -> None:
+    result = run()
+    print(f"{'statements':>12} {'cold statements/s':>18} {'warm statements/s':>18}")
+    print(f"{result['statements']:>12} {result['cold_per_s']:>18.0f} {result['warm_per_s']:>18.0f}")
+
+
+if __name__ == '__main__':
+    main()
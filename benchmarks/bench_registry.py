@@ -0,0 +1,100 @@
+# Copyright 2024 Sola Richard Olorunfemi
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Startup time and memory of registering task functions from an import file.
+
+Writes MODULES generated task modules and an import file naming one function of
+each, then registers them the former way (exec() of every import statement) and
+through the lazy registry, which imports a module on the first get_function()
+call. Both are timed up to the first run of USED of the functions, which is all
+that a typical workflow process calls; the lazy registry imports only those.
+
+Usage:
+    python -m benchmarks.bench_registry
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List
+from Scheduler.src import module_registry
+
+MODULES = [100, 500]
+USED = 10
+# Module body standing in for a task module's own imports and constants
+_BODY = "TABLE = {{i: str(i) * 8 for i in range(2000)}}\n\n\ndef task_{index}(x=0):\n    return x + {index}\n"
+
+
+def _exec_import_file(path: str) -> None:
+    """The former loader: run every import statement and register what it bound."""
+    namespace: Dict[str, Any] = {}
+    with open(path) as file:
+        for line in file:
+            line = line.strip()
+            if line.startswith('from '):
+                exec(line, namespace)
+                module_registry.register_function(line.split()[3], namespace[line.split()[3]])
+
+
+def _measure(load: Callable[[], None], used: List[str]) -> Dict[str, float]:
+    tracemalloc.start()
+    start = time.perf_counter()
+    load()
+    for name in used:
+        module_registry.get_function(name)()
+    elapsed = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return {'ms': elapsed * 1000, 'memory_kb': memory / 1024}
+
+
+def run() -> List[Dict[str, float]]:
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        sys.path.insert(0, directory)
+        try:
+            for size in MODULES:
+                rows: Dict[str, Dict[str, float]] = {}
+                for variant in ('exec', 'lazy'):
+                    import_file = os.path.join(directory, f'{variant}_{size}.py')
+                    with open(import_file, 'w') as file:
+                        for index in range(size):
+                            module = f'bench_{variant}_{size}_{index}'
+                            with open(os.path.join(directory, f'{module}.py'), 'w') as task_file:
+                                task_file.write(_BODY.format(index=index))
+                            file.write(f'from {module} import task_{index}\n')
+                    module_registry.function_registry.clear()
+                    module_registry.function_targets.clear()
+                    load = (lambda: _exec_import_file(import_file)) if variant == 'exec' else \
+                        (lambda: module_registry.load_import_file(import_file))
+                    rows[variant] = _measure(load, [f'task_{index}' for index in range(USED)])
+                results.append({
+                    'modules': size,
+                    'exec_load_ms': rows['exec']['ms'], 'lazy_load_ms': rows['lazy']['ms'],
+                    'exec_memory_kb': rows['exec']['memory_kb'], 'lazy_memory_kb': rows['lazy']['memory_kb'],
+                })
+        finally:
+            sys.path.remove(directory)
+    return results
+
+
+def main() -> None:
+    print(f"{'modules':>8} {'exec ms':>9} {'lazy ms':>9} {'exec KiB':>10} {'lazy KiB':>10}")
+    for row in run():
+        print(f"{row['modules']:>8} {row['exec_load_ms']:>9.1f} {row['lazy_load_ms']:>9.1f} "
+              f"{row['exec_memory_kb']:>10.0f} {row['lazy_memory_kb']:>10.0f}")
+
+
+if __name__ == '__main__':
+    main()
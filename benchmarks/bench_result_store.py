@@ -0,0 +1,76 @@
+# Copyright 2024 Sola Richard Olorunfemi
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Cost of handing a large upstream result to a task in a worker process.
+
+For each payload size, a worker process receives a bytes result and touches
+every page of it, REPEAT times. In the "pickled" rows the payload goes as a task argument, so
+it is pickled through the pool's pipe the way APScheduler's process pool sends
+job arguments. The "result store" rows write it once with ResultStore.put() (timed) and pass
+RESULT(upstream); the worker maps the file instead of receiving the bytes.
+
+Usage:
+    python -m benchmarks.bench_result_store
+"""
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List
+
+from Scheduler.src.result_store import ResultRef, ResultStore
+
+SIZES_MB = [1, 16, 128]
+REPEAT = 5
+
+
+def consume(payload) -> int:
+    return sum(memoryview(payload)[::4096])
+
+
+def consume_result(directory: str, ref: ResultRef) -> int:
+    return consume(ResultStore(directory).get(ref.task))
+
+
+def run() -> List[Dict[str, float]]:
+    results = []
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(ResultStore.default_directory())) as directory, \
+            ProcessPoolExecutor(max_workers=1) as pool:
+        store = ResultStore(directory)
+        pool.submit(consume, b'').result()  # start the worker
+        for size_mb in SIZES_MB:
+            payload = bytes(range(256)) * (size_mb * 4096)
+
+            started = time.perf_counter()
+            for _ in range(REPEAT):
+                pool.submit(consume, payload).result()
+            results.append({'transfer': 'pickled', 'size_mb': size_mb,
+                            'ms_per_run': (time.perf_counter() - started) * 1000 / REPEAT})
+
+            started = time.perf_counter()
+            store.put('upstream', payload)
+            for _ in range(REPEAT):
+                pool.submit(consume_result, directory, ResultRef('upstream')).result()
+            results.append({'transfer': 'result store', 'size_mb': size_mb,
+                            'ms_per_run': (time.perf_counter() - started) * 1000 / REPEAT})
+    return results
+
+
+def main() -> None:
+    print(f"{'transfer':>13} {'MB':>5} {'ms/run':>8}")
+    for row in run():
+        print(f"{row['transfer']:>13} {row['size_mb']:>5} {row['ms_per_run']:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
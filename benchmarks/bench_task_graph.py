@@ -0,0 +1,100 @@
+# Copyright 2024 Sola Richard Olorunfemi
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Completion-handling cost of AFTER dependencies as unrelated tasks grow.
+
+Compares the former scan over every AFTER condition (one jobstore lookup per
+condition) with the indexed TaskGraph, which only visits direct successors.
+
+Usage:
+    python -m benchmarks.bench_task_graph
+"""
+import os
+import tempfile
+import time
+from typing import Callable, Dict, List
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+from apscheduler.schedulers.background import BackgroundScheduler
+from Scheduler.src.task_graph import TaskGraph
+
+SIZES = [10, 100, 1000, 5000]
+REPEAT = 5
+
+
+def noop() -> None:
+    pass
+
+
+def _scheduler(unrelated: int, directory: str) -> BackgroundScheduler:
+    url = f"sqlite:///{os.path.join(directory, f'jobs_{unrelated}.sqlite')}"
+    sched = BackgroundScheduler(jobstores={'default': SQLAlchemyJobStore(url=url)})
+    sched.start(paused=True)
+    for i in range(unrelated):
+        sched.add_job(noop, 'interval', minutes=1, id=f'task_{i}', next_run_time=None)
+    sched.add_job(noop, 'interval', minutes=1, id='upstream')
+    sched.add_job(noop, 'interval', minutes=1, id='downstream', next_run_time=None)
+    return sched
+
+
+def _scan(sched: BackgroundScheduler, task_conditions: Dict[str, Dict[str, List[str]]], job_id: str) -> None:
+    """The pre-index completion handler: one get_job per AFTER condition."""
+    for task_name, conditions in task_conditions.items():
+        sched.get_job(task_name)
+        if job_id in conditions['after']:
+            conditions['after'].remove(job_id)
+            if not conditions['after']:
+                sched.get_job(task_name)
+                conditions['after'].append(job_id)
+
+
+def _indexed(sched: BackgroundScheduler, graph: TaskGraph, job_id: str) -> None:
+    for task_name in graph.complete(job_id):
+        sched.get_job(task_name)
+
+
+def _time(handler: Callable[[], None]) -> float:
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        handler()
+    return (time.perf_counter() - start) / REPEAT * 1000
+
+
+def run() -> List[Dict[str, float]]:
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for size in SIZES:
+            sched = _scheduler(size, directory)
+            task_conditions = {f'task_{i}': {'after': [f'other_{i}']} for i in range(size)}
+            task_conditions['downstream'] = {'after': ['upstream']}
+            graph = TaskGraph()
+            for i in range(size):
+                graph.add_task(f'task_{i}', [f'other_{i}'])
+            graph.add_task('downstream', ['upstream'])
+
+            results.append({
+                'unrelated_tasks': size,
+                'scan_ms': _time(lambda: _scan(sched, task_conditions, 'upstream')),
+                'indexed_ms': _time(lambda: _indexed(sched, graph, 'upstream')),
+            })
+            sched.shutdown(wait=False)
+    return results
+
+
+def main() -> None:
+    print(f"{'unrelated tasks':>16} {'scan ms/completion':>20} {'indexed ms/completion':>22}")
+    for row in run():
+        print(f"{row['unrelated_tasks']:>16} {row['scan_ms']:>20.3f} {row['indexed_ms']:>22.3f}")
+
+
+if __name__ == '__main__':
+    main()
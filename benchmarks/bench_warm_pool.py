@@ -0,0 +1,135 @@
+# Copyright 2024 Sola Richard Olorunfemi
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Dispatch cost of APScheduler's process pool against the warm, registry-preloaded pool.
+
+Runs N one-off jobs of a small CPU-bound task on each pool and reports the bytes
+pickled per run, the time until every run has executed, and the latency of the
+first run after the scheduler starts. The standard pool sends the whole job,
+trigger and callable reference included; the warm pool sends the registry name,
+the arguments and the run times. Both are measured with forked workers (the
+Linux default), which inherit the scheduler's imports, and with spawned workers
+(the macOS and Windows default), which do not.
+
+Usage:
+    python -m benchmarks.bench_warm_pool
+"""
+import logging
+import multiprocessing
+import os
+import pickle
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List
+from apscheduler.events import EVENT_JOB_ERROR, EVENT_JOB_EXECUTED
+from apscheduler.executors.base import BaseExecutor, run_job
+from apscheduler.executors.pool import ProcessPoolExecutor
+from apscheduler.jobstores.memory import MemoryJobStore
+from apscheduler.schedulers.background import BackgroundScheduler
+from Scheduler.src.warm_pool import WarmProcessPoolExecutor, _run_registered
+
+RUNS = 500
+WORKERS = 4
+ARGS = [2000]
+
+
+def checksum(n: int) -> int:
+    return sum(value * value for value in range(n)) % 65521
+
+
+def _scheduler(executor: BaseExecutor) -> BackgroundScheduler:
+    return BackgroundScheduler(jobstores={'default': MemoryJobStore()}, executors={'default': executor}, timezone='UTC')
+
+
+def _wait_for_runs(sched: BackgroundScheduler, runs: int) -> threading.Event:
+    done = threading.Event()
+    finished = []
+    lock = threading.Lock()
+
+    def count(event) -> None:
+        with lock:
+            finished.append(event.job_id)
+            if len(finished) == runs:
+                done.set()
+
+    sched.add_listener(count, EVENT_JOB_EXECUTED | EVENT_JOB_ERROR)
+    return done
+
+
+def _payload_bytes(executor: BaseExecutor) -> int:
+    sched = _scheduler(executor)
+    sched.start(paused=True)
+    job = sched.add_job(checksum, args=ARGS, id='size', name='checksum')
+    sched.shutdown()
+    run_times = [datetime.now(timezone.utc)]
+    if isinstance(executor, WarmProcessPoolExecutor):
+        call = (_run_registered, job.id, 'default', job.name, job.args, job.kwargs, run_times,
+                job.misfire_grace_time, 'apscheduler.executors.default')
+    else:
+        call = (run_job, job, 'default', run_times, 'apscheduler.executors.default')
+    return len(pickle.dumps(call))
+
+
+def _measure(executor: BaseExecutor, runs: int) -> Dict[str, float]:
+    sched = _scheduler(executor)
+    first = _wait_for_runs(sched, 1)
+    started = time.perf_counter()
+    sched.start()
+    sched.add_job(checksum, args=ARGS, id='first', name='checksum', misfire_grace_time=None)
+    first.wait()
+    first_run = time.perf_counter() - started
+
+    done = _wait_for_runs(sched, runs)
+    sched.pause()
+    for i in range(runs):
+        sched.add_job(checksum, args=ARGS, id=f'run_{i}', name='checksum', misfire_grace_time=None)
+    started = time.perf_counter()
+    sched.resume()
+    done.wait()
+    elapsed = time.perf_counter() - started
+    sched.shutdown(wait=True)
+    return {'first_run_s': first_run, 'runs_per_s': runs / elapsed}
+
+
+def run() -> List[Dict[str, float]]:
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        import_file = os.path.join(directory, 'import_file.py')
+        with open(import_file, 'w') as file:
+            file.write('from benchmarks.bench_warm_pool import checksum\n')
+        for context in ('fork', 'spawn'):
+            pool_kwargs = {'mp_context': multiprocessing.get_context(context)}
+            pools = {
+                'processpool': lambda: ProcessPoolExecutor(WORKERS, pool_kwargs=pool_kwargs),
+                'warm_process': lambda: WarmProcessPoolExecutor(WORKERS, import_file=import_file,
+                                                                pool_kwargs=pool_kwargs),
+            }
+            for name, make_pool in pools.items():
+                row = {'pool': name, 'context': context, 'bytes_per_run': _payload_bytes(make_pool())}
+                row.update(_measure(make_pool(), RUNS))
+                results.append(row)
+    return results
+
+
+def main() -> None:
+    logging.getLogger('apscheduler').setLevel(logging.WARNING)
+    print(f"{'pool':>13} {'workers':>8} {'bytes/run':>10} {'first run s':>12} {'runs/s':>8}")
+    for row in run():
+        print(f"{row['pool']:>13} {row['context']:>8} {row['bytes_per_run']:>10} {row['first_run_s']:>12.3f} "
+              f"{row['runs_per_s']:>8.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,428 @@
+# Copyright 2024 Sola Richard Olorunfemi
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Scheduler benchmark suite, written as JSON to track regressions between releases.
+
+For every scale N it measures:
+
+- parse: CREATE TASK / ALTER TASK statements parsed per second, cold and warm cache
+- apply: time to apply a script of N CREATE TASK statements with apply_commands()
+- fire: jobs fired per second by N one-second interval jobs
+- fanout: completion-to-dependent-start latency of one task with N AFTER dependents
+  (wide) and of a chain of min(N, MAX_DEPTH) AFTER tasks (deep)
+- memory: bytes held per job by the scheduler process, and on disk for SQLite
+
+and once, independent of scale:
+
+- import: startup time of the package and its command-line tools (see bench_import)
+
+Jobs are stored with the SQLite profile of the default jobstore and run on the metered
+thread pool, as a scheduler built from the default SETTINGS would. The suite works in
+a scratch directory, so the jobstore, result store and caches of SETTINGS are left alone.
+
+Metrics ending in '_per_s' are better when higher, every other metric when lower. With
+--baseline, the results are compared to an earlier run and the exit status is 1 when a
+metric is worse by more than --tolerance.
+
+Usage:
+    python -m benchmarks.suite [--scale 1000 10000 100000] [--only parse apply ...]
+                               [--output results.json] [--baseline previous.json]
+"""
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from apscheduler.events import EVENT_JOB_EXECUTED, EVENT_JOB_SUBMITTED
+from apscheduler.jobstores.base import BaseJobStore
+from apscheduler.jobstores.memory import MemoryJobStore
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.triggers.interval import IntervalTrigger
+
+SCALES = [1000, 10000]
+REPEAT = 3  # Parser passes per cache state
+DURATION = 5  # Seconds of firing measured
+MAX_DEPTH = 1000  # Longest AFTER chain of the deep fan-out
+TIMEOUT = 600  # Seconds to wait for a fan-out to finish
+MAX_WORKERS = 20
+TOLERANCE = 0.1
+
+BENCHMARKS = ('parse', 'apply', 'fire', 'fanout', 'memory', 'import')
+UNSCALED = ('import',)
+
+
+def noop(*args: Any, **kwargs: Any) -> None:
+    pass
+
+
+def _script(size: int) -> List[str]:
+    """CREATE TASK statements for `size` tasks, one in ten of them AFTER another task."""
+    statements = []
+    for i in range(size):
+        if i % 10:
+            clause = f"SCHEDULE = '{i % 59 + 1} MINUTE'"
+        else:
+            clause = f"AFTER task_{i + 1}" if i + 1 < size else "SCHEDULE = '1 HOUR'"
+        statements.append(f"CREATE TASK task_{i} SERVER = 1 {clause} AS noop({i}, mode='fast')")
+    return statements
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def _scheduler(store: BaseJobStore) -> BackgroundScheduler:
+    from Scheduler.src.job_scheduler import build_executors
+
+    sched = BackgroundScheduler(
+        jobstores={'default': store},
+        executors=build_executors({'default': {'type': 'thread', 'max_workers': MAX_WORKERS}}, 'BackgroundScheduler'),
+        job_defaults={'coalesce': True, 'max_instances': 2, 'misfire_grace_time': 60}, timezone='UTC'
+    )
+    sched.start(paused=True)
+    return sched
+
+
+def _sqlite_store(directory: str, name: str) -> BaseJobStore:
+    from Scheduler.src.job_scheduler import _sqlalchemy_jobstore
+
+    return _sqlalchemy_jobstore(f"sqlite:///{os.path.join(directory, f'{name}.sqlite')}")
+
+
+@contextmanager
+def _bound(sched: BackgroundScheduler, directory: str) -> Iterator[Any]:
+    """Point create_task at `sched` with an empty job index, task graph and result store, and register noop()."""
+    from Scheduler.src import create_task, result_store
+    from Scheduler.src.job_index import JobIndex
+    from Scheduler.src.module_registry import register_function
+    from Scheduler.src.result_store import ResultStore
+    from Scheduler.src.task_graph import TaskGraph
+
+    register_function('noop', noop)
+    names = ('sched', 'job_index', 'task_graph')
+    saved = {name: getattr(create_task, name) for name in names}
+    saved_store = result_store.get_result_store()
+    create_task.sched = sched
+    create_task.job_index = JobIndex(sched)
+    create_task.task_graph = TaskGraph()
+    result_store.result_store = ResultStore(directory=os.path.join(directory, 'results'))
+    try:
+        yield create_task
+    finally:
+        for name, value in saved.items():
+            setattr(create_task, name, value)
+        result_store.result_store = saved_store
+
+
+def bench_parse(size: int, directory: str) -> Dict[str, float]:
+    from Scheduler.src import parse_create_task, parse_modify_task
+
+    creates = _script(size)
+    alters = [f"ALTER TASK task_{i} SET USING CRON {i % 60} 12 * * * UTC" for i in range(size)]
+
+    def rate(parse: Callable[[str], Any], statements: List[str], cold: bool) -> float:
+        elapsed = 0.0
+        for _ in range(REPEAT):
+            if cold:
+                parse_create_task._cache.clear()
+                parse_modify_task._cache.clear()
+            start = time.perf_counter()
+            for statement in statements:
+                parse(statement)
+            elapsed += time.perf_counter() - start
+        return len(statements) * REPEAT / elapsed
+
+    return {
+        'parse_command_cold_per_s': rate(parse_create_task.parse_command, creates, cold=True),
+        'parse_command_warm_per_s': rate(parse_create_task.parse_command, creates, cold=False),
+        'modify_command_cold_per_s': rate(parse_modify_task.modify_command, alters, cold=True),
+        'modify_command_warm_per_s': rate(parse_modify_task.modify_command, alters, cold=False),
+    }
+
+
+def bench_apply(size: int, directory: str) -> Dict[str, float]:
+    from Scheduler.src import parse_create_task, parse_modify_task
+
+    script = _script(size)
+    parse_create_task._cache.clear()
+    parse_modify_task._cache.clear()
+    sched = _scheduler(_sqlite_store(directory, f'apply_{size}'))
+    try:
+        with _bound(sched, directory) as create_task:
+            start = time.perf_counter()
+            summary = create_task.apply_commands(script)
+            elapsed = time.perf_counter() - start
+            if len(summary['created']) != size:
+                raise RuntimeError(f"apply_commands created {len(summary['created'])} of {size} tasks")
+            # The same script again: every task is answered as unchanged by the job index
+            start = time.perf_counter()
+            create_task.apply_commands(script)
+            reapplied = time.perf_counter() - start
+    finally:
+        sched.shutdown(wait=False)
+    return {
+        'apply_ms': elapsed * 1000,
+        'apply_tasks_per_s': size / elapsed,
+        'reapply_unchanged_ms': reapplied * 1000,
+    }
+
+
+def bench_fire(size: int, directory: str) -> Dict[str, float]:
+    from Scheduler.src.job_scheduler import add_jobs
+
+    sched = _scheduler(_sqlite_store(directory, f'fire_{size}'))
+    fired = []
+    lock = threading.Lock()
+
+    def count(event: Any) -> None:
+        with lock:
+            fired.append(time.perf_counter())
+
+    try:
+        start = datetime.now(sched.timezone) + timedelta(seconds=1)
+        add_jobs(sched, [{'func': noop, 'trigger': IntervalTrigger(seconds=1), 'id': f'job_{i}', 'next_run_time': start}
+                         for i in range(size)])
+        # Adding many jobs takes a while; the first round is due once they are all stored
+        start = max(start, datetime.now(sched.timezone))
+        # Count from half a second after the first due time, between two firing rounds
+        window_start = time.perf_counter() + (start - datetime.now(sched.timezone)).total_seconds() + 0.5
+        sched.add_listener(count, EVENT_JOB_SUBMITTED)
+        sched.resume()
+        time.sleep(max(0.0, window_start + DURATION - time.perf_counter()))
+        with lock:
+            in_window = sum(1 for t in fired if window_start <= t < window_start + DURATION)
+    finally:
+        sched.shutdown(wait=False)
+    return {'demand_per_s': float(size), 'fired_per_s': in_window / DURATION}
+
+
+def _run_graph(size: int, directory: str, name: str, script: List[str]) -> Dict[str, Dict[str, float]]:
+    """Apply `script`, run its root 'task_0' and collect the start and end time of every task."""
+    sched = _scheduler(_sqlite_store(directory, f'{name}_{size}'))
+    runs: Dict[str, Dict[str, float]] = {}
+    lock = threading.Lock()
+    finished = threading.Event()
+
+    def record(event: Any) -> None:
+        with lock:
+            runs[event.job_id] = {'start': event.started_at, 'end': event.started_at + event.duration}
+            if len(runs) == len(script):
+                finished.set()
+
+    try:
+        with _bound(sched, directory) as create_task:
+            summary = create_task.apply_commands(script)
+            if summary['failed']:
+                raise RuntimeError(f"Fan-out graph was not applied: {summary['failed']}")
+            # Timings are recorded before create_task's listener releases the dependents
+            sched.add_listener(record, EVENT_JOB_EXECUTED)
+            sched.add_listener(create_task.event_listener, EVENT_JOB_EXECUTED)
+            sched.resume()
+            sched.modify_job('task_0', next_run_time=datetime.now(timezone.utc))
+            if not finished.wait(TIMEOUT):
+                raise RuntimeError(f"{name} fan-out of {size} tasks did not finish within {TIMEOUT} seconds")
+    finally:
+        sched.shutdown(wait=False)
+    return runs
+
+
+def bench_fanout(size: int, directory: str) -> Dict[str, float]:
+    # Wide: task_1 .. task_N all run after task_0
+    wide = ["CREATE TASK task_0 SCHEDULE = '1 HOUR' AS noop()"]
+    wide += [f"CREATE TASK task_{i} AFTER task_0 AS noop({i})" for i in range(1, size + 1)]
+    runs = _run_graph(size, directory, 'wide', wide)
+    completed = runs['task_0']['end']
+    wide_latency = [runs[f'task_{i}']['start'] - completed for i in range(1, size + 1)]
+
+    # Deep: task_i runs after task_(i - 1)
+    depth = min(size, MAX_DEPTH)
+    deep = ["CREATE TASK task_0 SCHEDULE = '1 HOUR' AS noop()"]
+    deep += [f"CREATE TASK task_{i} AFTER task_{i - 1} AS noop({i})" for i in range(1, depth + 1)]
+    runs = _run_graph(size, directory, 'deep', deep)
+    deep_latency = [runs[f'task_{i}']['start'] - runs[f'task_{i - 1}']['end'] for i in range(1, depth + 1)]
+
+    return {
+        'wide_p50_ms': _percentile(wide_latency, 0.5) * 1000,
+        'wide_p95_ms': _percentile(wide_latency, 0.95) * 1000,
+        'wide_max_ms': max(wide_latency) * 1000,
+        'deep_depth': float(depth),
+        'deep_hop_p50_ms': _percentile(deep_latency, 0.5) * 1000,
+        'deep_hop_p95_ms': _percentile(deep_latency, 0.95) * 1000,
+        'deep_total_ms': (runs[f'task_{depth}']['start'] - runs['task_0']['end']) * 1000,
+    }
+
+
+def _retained(size: int, store: BaseJobStore, directory: str) -> float:
+    """Bytes per task still allocated after applying `size` tasks to a scheduler with `store`."""
+    script = _script(size)
+    sched = _scheduler(store)
+    try:
+        with _bound(sched, directory) as create_task:
+            gc.collect()
+            tracemalloc.start()
+            try:
+                before = tracemalloc.get_traced_memory()[0]
+                create_task.apply_commands(script)
+                gc.collect()
+                after = tracemalloc.get_traced_memory()[0]
+            finally:
+                tracemalloc.stop()
+    finally:
+        sched.shutdown(wait=False)
+    return (after - before) / size
+
+
+def bench_memory(size: int, directory: str) -> Dict[str, float]:
+    path = os.path.join(directory, f'memory_{size}.sqlite')
+    sqlite_bytes = _retained(size, _sqlite_store(directory, f'memory_{size}'), directory)
+    disk_bytes = sum(os.path.getsize(path + suffix) for suffix in ('', '-wal') if os.path.exists(path + suffix))
+    return {
+        'memory_jobstore_bytes_per_job': _retained(size, MemoryJobStore(), directory),
+        'sqlite_jobstore_bytes_per_job': sqlite_bytes,
+        'sqlite_disk_bytes_per_job': disk_bytes / size,
+    }
+
+
+def bench_import(size: Optional[int], directory: str) -> Dict[str, float]:
+    from benchmarks import bench_import
+
+    metrics = {}
+    for row in bench_import.run():
+        metrics[f"{row['module']}_import_ms"] = row['import_ms']
+        metrics[f"{row['module']}_threads"] = row['threads']
+        metrics[f"{row['module']}_created_files"] = row['created_files']
+    return metrics
+
+
+def _environment(scales: List[int]) -> Dict[str, Any]:
+    try:
+        from importlib.metadata import version
+        package_version: Optional[str] = version('Orchestr8')
+    except Exception:
+        package_version = None
+    try:
+        commit: Optional[str] = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        commit = None
+    return {
+        'version': package_version,
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'started_at': datetime.now(timezone.utc).isoformat(),
+        'scales': scales,
+    }
+
+
+def run(scales: List[int], benchmarks: List[str]) -> Dict[str, Any]:
+    """Run `benchmarks` at every scale, or once when unscaled; returns the environment and one result per run."""
+    functions = {'parse': bench_parse, 'apply': bench_apply, 'fire': bench_fire,
+                 'fanout': bench_fanout, 'memory': bench_memory, 'import': bench_import}
+    report: Dict[str, Any] = {'environment': _environment(scales), 'results': []}
+    workdir = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        # Relative paths of SETTINGS, such as the task cache's SQLite file, resolve here
+        os.chdir(directory)
+        try:
+            for name in benchmarks:
+                for size in [None] if name in UNSCALED else scales:
+                    started = time.perf_counter()
+                    metrics = functions[name](size, directory)
+                    report['results'].append({
+                        'benchmark': name, 'scale': size, 'metrics': metrics,
+                        'elapsed_s': time.perf_counter() - started,
+                    })
+                    print(f"{name:>8} {size or '':>8}  " + '  '.join(f"{key}={value:.1f}" for key, value in metrics.items()),
+                          file=sys.stderr)
+        finally:
+            os.chdir(workdir)
+    return report
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], tolerance: float = TOLERANCE) -> List[Dict[str, Any]]:
+    """
+    Changes of every metric measured in both reports at the same scale.
+
+    'change' is the relative difference to the baseline, positive when better; a
+    metric is a regression when it is worse by more than `tolerance`.
+    """
+    previous = {(result['benchmark'], result['scale']): result['metrics'] for result in baseline['results']}
+    changes = []
+    for result in current['results']:
+        before = previous.get((result['benchmark'], result['scale']), {})
+        for metric, value in result['metrics'].items():
+            if metric not in before:
+                continue
+            if before[metric]:
+                change = (value - before[metric]) / before[metric]
+                if not metric.endswith('_per_s'):
+                    change = -change
+            elif metric.endswith('_per_s') or not value:
+                change = 0.0
+            else:
+                change = -1.0  # e.g. threads or files that an import did not use to create
+            changes.append({
+                'benchmark': result['benchmark'], 'scale': result['scale'], 'metric': metric,
+                'baseline': before[metric], 'current': value, 'change': change, 'regression': change < -tolerance,
+            })
+    return changes
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Run the scheduler benchmark suite and write its results as JSON.')
+    parser.add_argument('--scale', type=int, nargs='+', default=SCALES, help='Numbers of tasks to measure with')
+    parser.add_argument('--only', nargs='+', choices=BENCHMARKS, default=list(BENCHMARKS), help='Benchmarks to run')
+    parser.add_argument('--output', help='File to write the results to; standard output by default')
+    parser.add_argument('--baseline', help='Results of an earlier run to compare with')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE, help='Relative worsening reported as a regression')
+    options = parser.parse_args(argv)
+
+    # One INFO line per applied task and run would dominate the measurements
+    logging.disable(logging.INFO)
+    output = os.path.abspath(options.output) if options.output else None
+    report = run(options.scale, options.only)
+    if options.baseline:
+        with open(options.baseline) as file:
+            report['comparison'] = compare(json.load(file), report, options.tolerance)
+
+    if output:
+        with open(output, 'w') as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    regressions = [change for change in report.get('comparison', []) if change['regression']]
+    for change in regressions:
+        print(f"Regression: {change['benchmark']} {change['metric']} at {change['scale']}: "
+              f"{change['baseline']:.1f} -> {change['current']:.1f} ({change['change']:+.0%})", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
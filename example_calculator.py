@@ -21,8 +21,7 @@ import sys
 import time
 from Scheduler.src.create_task import execute_command
 from Scheduler.src.module_registry import register_function
-from Scheduler.src.job_scheduler import scheduler
-from Scheduler.src.utils import get_scheduler_shutdown_wait
+from Scheduler.src.job_scheduler import shutdown_scheduler
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -31,7 +30,7 @@ logger = logging.getLogger(__name__)
 def signal_handler(signum: int, frame: Optional[object]) -> None:
     """Handle shutdown signals."""
     logger.info('Signal received, shutting down scheduler...')
-    # scheduler().shutdown(get_scheduler_shutdown_wait())
+    shutdown_scheduler()
     sys.exit(0)
 
 
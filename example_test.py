@@ -23,10 +23,11 @@ import sys
 import time
 from Scheduler.src.create_task import execute_command
 from Scheduler.src.module_registry import register_function
-from Scheduler.src.job_scheduler import scheduler
-from Scheduler.src.utils import get_scheduler_shutdown_wait, get_parameter_file
+from Scheduler.src.job_scheduler import shutdown_scheduler
+from Scheduler.src.utils import get_parameter_file
 from Job.test_context_manager import ConfigManager
 from Job.automated_test import data_validate
+from Job.incremental_validation import DEFAULT_STATE_FILE
 from Databases.SQLite.scripts.example_loader import run_script
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -36,7 +37,7 @@ logger = logging.getLogger(__name__)
 def signal_handler(signum: int, frame: Optional[object]) -> None:
     """Handle shutdown signals."""
     logger.info('Signal received, shutting down scheduler...')
-    scheduler().shutdown(get_scheduler_shutdown_wait())
+    shutdown_scheduler()
     sys.exit(0)
 
 
@@ -74,7 +75,8 @@ def main() -> None:
                 args.secret_name, args.config_file,
                 args.encryption_key, args.oauth_token,
                 args.saml_response, config_manager.get_error_reporting(),
-                task['tests']
+                task['tests'], task.get('max_connections', 1), task.get('query_timeout'),
+                task.get('state_file', DEFAULT_STATE_FILE), task.get('sampling', True)
             ]
 
             task_name = task['task_name']
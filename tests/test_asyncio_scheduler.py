@@ -0,0 +1,85 @@
+# Copyright 2024 Sola Richard Olorunfemi
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import threading
+import time
+import unittest
+from apscheduler.events import EVENT_JOB_ERROR, EVENT_JOB_EXECUTED
+from apscheduler.executors.asyncio import AsyncIOExecutor
+from apscheduler.jobstores.memory import MemoryJobStore
+from Scheduler.src.asyncio_scheduler import ThreadedAsyncIOScheduler
+
+
+async def wait_for_io(delay):
+    await asyncio.sleep(delay)
+    return threading.current_thread().name
+
+
+def blocking_call():
+    return threading.current_thread().name
+
+
+class TestThreadedAsyncIOScheduler(unittest.TestCase):
+    def setUp(self):
+        self.sched = ThreadedAsyncIOScheduler(jobstores={'default': MemoryJobStore()},
+                                              executors={'default': AsyncIOExecutor()}, timezone='UTC')
+        self.results = []
+        self.done = threading.Event()
+        self.expected = 0
+
+        def listener(event):
+            self.results.append(event)
+            if len(self.results) >= self.expected:
+                self.done.set()
+
+        self.sched.add_listener(listener, EVENT_JOB_EXECUTED | EVENT_JOB_ERROR)
+
+    def tearDown(self):
+        if self.sched.running:
+            self.sched.shutdown(wait=False)
+
+    def test_start_returns_and_shutdown_stops_the_loop(self):
+        self.sched.start()
+        loop_thread = self.sched._loop_thread
+        self.assertTrue(loop_thread.is_alive())
+
+        self.sched.shutdown()
+        self.assertFalse(loop_thread.is_alive())
+        self.assertFalse(self.sched.running)
+
+    def test_concurrent_coroutines_share_the_loop_thread(self):
+        self.expected = 200
+        self.sched.start(paused=True)
+        for i in range(self.expected):
+            self.sched.add_job(wait_for_io, args=[0.2], id=f'io_{i}')
+
+        started = time.perf_counter()
+        self.sched.resume()
+        self.assertTrue(self.done.wait(10))
+        elapsed = time.perf_counter() - started
+
+        # Sequentially the waits alone would take 40 seconds
+        self.assertLess(elapsed, 5)
+        self.assertEqual({event.retval for event in self.results}, {'AsyncIOScheduler'})
+
+    def test_synchronous_tasks_run_off_the_loop_thread(self):
+        self.expected = 1
+        self.sched.start()
+        self.sched.add_job(blocking_call, id='sync')
+        self.assertTrue(self.done.wait(5))
+        self.assertNotEqual(self.results[0].retval, 'AsyncIOScheduler')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+# Copyright 2024 Sola Richard Olorunfemi
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sqlite3
+import tempfile
+import unittest
+from Job.change_detection import drop_tables, fingerprint, fingerprint_query, fingerprinted_tables, plan_fingerprints
+from Job.incremental_validation import ValidationState
+
+TESTS = [
+    {'target_tables': ['menus', 'menu_items'], 'fingerprint': True, 'tests': [
+        {'type': 'null_check', 'column': 'name'},
+        {'type': 'custom_query', 'query': "SELECT 'custom_query', 'menus', 0"},
+    ]},
+    {'target_tables': ['menu_items'], 'fingerprint': {'column': 'updated'}, 'tests': [{'type': 'row_count'}]},
+    {'target_tables': ['orders'], 'tests': [{'type': 'row_count'}]},
+]
+
+
+class TestChangeDetection(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.db = sqlite3.connect(':memory:')
+        self.db.executescript("""
+            CREATE TABLE menus (id INTEGER, name TEXT);
+            INSERT INTO menus VALUES (1, 'a');
+            CREATE TABLE menu_items (id INTEGER, name TEXT, updated TEXT);
+            INSERT INTO menu_items VALUES (1, 'x', '2024-07-01'), (2, 'y', '2024-07-02');
+        """)
+        self.state = ValidationState(os.path.join(self.dir.name, 'state.sqlite'))
+
+    def tearDown(self):
+        self.state.close()
+        self.db.close()
+        self.dir.cleanup()
+
+    def fingerprints(self, tests=TESTS, sampling=True):
+        return {query.table: fingerprint(self.db.execute(query.sql).fetchall(), tests, query.table, sampling)
+                for query in plan_fingerprints(tests, 'sqlite')}
+
+    def test_one_query_per_fingerprinted_table(self):
+        plan = plan_fingerprints(TESTS, 'sqlite')
+        self.assertEqual([query.table for query in plan], ['menus', 'menu_items'])
+        self.assertEqual(plan[0].sql, "SELECT COUNT(*), MAX(rowid) FROM menus")
+        self.assertEqual(plan[1].sql, "SELECT COUNT(*), MAX(rowid), MAX(updated) FROM menu_items")
+
+    def test_fingerprint_changes_with_the_data_and_the_checks(self):
+        before = self.fingerprints()
+        self.assertEqual(before, self.fingerprints())
+        self.db.execute("UPDATE menu_items SET name = 'z', updated = '2024-07-03' WHERE id = 1")
+        after = self.fingerprints()
+        self.assertEqual(before['menus'], after['menus'])
+        self.assertNotEqual(before['menu_items'], after['menu_items'])
+        self.assertNotEqual(after['menus'], self.fingerprints(sampling=False)['menus'])
+        edited = [dict(TESTS[0], tests=[{'type': 'null_check', 'column': 'id'}])] + TESTS[1:]
+        self.assertNotEqual(after['menus'], self.fingerprints(edited)['menus'])
+
+    def test_foreign_keys_follow_the_referenced_table(self):
+        tests = [{'target_tables': ['menu_items'], 'fingerprint': True, 'tests': [
+            {'type': 'foreign_key', 'foreign_key': 'id', 'reference_table': 'menus', 'reference_key': 'id'},
+        ]}]
+        self.assertEqual(fingerprinted_tables(tests), {'menu_items': {'menus'}})
+        self.assertEqual([query.table for query in plan_fingerprints(tests, 'sqlite')], ['menu_items', 'menus'])
+
+        def fingerprints():
+            rows = {query.table: self.db.execute(query.sql).fetchall() for query in plan_fingerprints(tests, 'sqlite')}
+            return fingerprint(rows['menu_items'], tests, 'menu_items', True, {'menus': rows['menus']})
+
+        before = fingerprints()
+        # Orphaning menu_items leaves its own fingerprint as it was
+        self.db.execute("DELETE FROM menus")
+        self.assertNotEqual(before, fingerprints())
+
+    def test_stored_fingerprints(self):
+        self.assertIsNone(self.state.fingerprint('menus'))
+        with self.state:
+            self.state.store_fingerprint('menus', 'abc')
+        self.assertEqual(self.state.fingerprint('menus'), 'abc')
+
+    def test_drop_tables_keeps_custom_queries(self):
+        kept = drop_tables(TESTS, {'menus', 'menu_items'})
+        self.assertEqual(kept[0]['target_tables'], ['menus', 'menu_items'])
+        self.assertEqual([test['type'] for test in kept[0]['tests']], ['custom_query'])
+        self.assertEqual(kept[1:], [TESTS[2]])
+        self.assertEqual(drop_tables(TESTS, set()), TESTS)
+        # Groups that did not opt in keep every table
+        self.assertEqual(drop_tables(TESTS, {'orders'}), TESTS)
+
+    def test_snowflake_fingerprints(self):
+        self.assertEqual(fingerprint_query('db.raw.menu', [None], 'snowflake').sql,
+                         "SELECT ROW_COUNT, LAST_ALTERED FROM DB.INFORMATION_SCHEMA.TABLES "
+                         "WHERE TABLE_SCHEMA = 'RAW' AND TABLE_NAME = 'MENU'")
+        self.assertEqual(fingerprint_query('menu', [None], 'snowflake').sql,
+                         "SELECT ROW_COUNT, LAST_ALTERED FROM INFORMATION_SCHEMA.TABLES "
+                         "WHERE TABLE_SCHEMA = CURRENT_SCHEMA() AND TABLE_NAME = 'MENU'")
+        self.assertEqual(fingerprint_query('menu', [None, 'updated'], 'snowflake').sql,
+                         "SELECT COUNT(*), MAX(updated) FROM menu")
+        with self.assertRaises(ValueError):
+            fingerprint_query('menu', [], 'oracle')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,166 @@
+# Copyright 2024 Sola Richard Olorunfemi
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+from sqlalchemy import create_engine, event
+from Scheduler.src.dependency_store import DependencyStore, persist_task_graph
+from Scheduler.src.task_graph import TaskGraph
+
+
+class TestDependencyStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.url = f"sqlite:///{os.path.join(self.directory.name, 'jobs.sqlite')}"
+        self.engines = []
+
+    def tearDown(self):
+        for engine in self.engines:
+            engine.dispose()
+        self.directory.cleanup()
+
+    def _graph(self, revision_interval=5.0):
+        # Each graph gets its own engine, like a separate process sharing the jobstore
+        engine = create_engine(self.url)
+        self.engines.append(engine)
+        return TaskGraph(DependencyStore(engine), revision_interval)
+
+    def test_edges_and_readiness_survive_restart(self):
+        graph = self._graph()
+        graph.add_task('divides_task', ['plus', 'minus'])
+        graph.complete('plus')
+
+        restarted = self._graph()
+        self.assertEqual(restarted.upstream('divides_task'), {'plus', 'minus'})
+        self.assertEqual(restarted.pending('divides_task'), {'minus'})
+        self.assertEqual(restarted.complete('minus'), ['divides_task'])
+
+    def test_readiness_is_shared_between_processes(self):
+        first = self._graph()
+        second = self._graph(revision_interval=0)
+        first.add_task('divides_task', ['plus', 'minus'])
+
+        self.assertEqual(first.complete('plus'), [])
+        # The second graph picks the new edges up from the revision and releases the task
+        self.assertEqual(second.complete('minus'), ['divides_task'])
+        self.assertEqual(first.complete('minus'), [])
+
+    def test_completion_without_successors_polls_the_revision(self):
+        first = self._graph()
+        second = self._graph()
+        store = second._store
+        statements = []
+        event.listen(store.engine, 'before_cursor_execute',
+                     lambda conn, cursor, statement, *args: statements.append(statement))
+        first.add_task('divides_task', ['plus'])
+
+        # 'plus' has no successors in the second graph, so within the interval its
+        # completion reads nothing and misses the edge added by the first graph
+        self.assertEqual(second.complete('plus'), [])
+        self.assertEqual(statements, [])
+
+        with patch('Scheduler.src.task_graph.time.monotonic', return_value=time.monotonic() + 5):
+            self.assertEqual(second.complete('plus'), ['divides_task'])
+        statements.clear()
+        self.assertEqual(second.complete('plus'), ['divides_task'])
+        self.assertTrue(any('_revision' in statement for statement in statements))
+
+    def test_concurrent_completions_release_the_task_once(self):
+        # Set ORCHESTR8_TEST_DATABASE_URL to run this against a READ COMMITTED database server
+        url = os.environ.get('ORCHESTR8_TEST_DATABASE_URL', self.url)
+        stores = []
+        for _ in range(2):
+            engine = create_engine(url)
+            self.engines.append(engine)
+            stores.append(DependencyStore(engine, tablename=f'orchestr8_test_{os.getpid()}'))
+        first, second = stores
+        if url != self.url:
+            for table in (first.dependencies_t, first.results_t, first.revision_t):
+                self.addCleanup(table.drop, first.engine)
+        first.set_dependencies('divides_task', ['plus', 'minus'])
+        updated, released = threading.Event(), []
+
+        def pause(conn, cursor, statement, *args):
+            if statement.startswith('UPDATE') and not updated.is_set():
+                updated.set()
+                time.sleep(0.5)  # the second completion runs while the first is uncommitted
+
+        event.listen(first.engine, 'after_cursor_execute', pause)
+        thread = threading.Thread(target=lambda: released.extend(first.record_completion('plus', ['divides_task'])))
+        thread.start()
+        updated.wait()
+        released.extend(second.record_completion('minus', ['divides_task']))
+        thread.join()
+        self.assertEqual(released, ['divides_task'])
+
+    def test_first_revision_is_created_once(self):
+        store = DependencyStore(create_engine(self.url))
+        self.engines.append(store.engine)
+        with store.engine.begin() as connection:
+            # Another process created the row between our UPDATE and INSERT
+            store._insert_missing(connection, id=1, revision=0)
+            store._insert_missing(connection, id=1, revision=0)
+            self.assertEqual(store._bump(connection), 1)
+        self.assertEqual(store.set_dependencies('divides_task', ['plus']), 2)
+
+    def test_result_reads_are_persisted(self):
+        graph = self._graph()
+        graph.set_results({'report': ['plus', 'minus'], 'summary': ['plus']})
+        graph.remove_task('summary')
+
+        restarted = self._graph()
+        self.assertEqual(restarted.reads('report'), {'plus', 'minus'})
+        self.assertEqual(restarted.reads('summary'), set())
+        self.assertTrue(restarted.result_needed('minus'))
+
+    def test_removed_edges_are_persisted(self):
+        graph = self._graph()
+        graph.add_task('divides_task', ['plus', 'minus'])
+        graph.add_task('plusminus_task', ['times_task'])
+        graph.remove_dependencies('divides_task', ['minus'])
+        graph.remove_task('times_task')
+
+        restarted = self._graph()
+        self.assertEqual(restarted.upstream('divides_task'), {'plus'})
+        self.assertNotIn('plusminus_task', restarted)
+
+    def test_load_is_one_query_over_the_edges(self):
+        graph = self._graph()
+        for i in range(500):
+            graph.add_task(f'task_{i}', [f'upstream_{i}', 'shared'])
+
+        engine = create_engine(self.url)
+        self.engines.append(engine)
+        store = DependencyStore(engine)
+        statements = []
+        event.listen(engine, 'before_cursor_execute',
+                     lambda conn, cursor, statement, *args: statements.append(statement))
+
+        restarted = TaskGraph(store)
+
+        self.assertEqual(len(restarted), 500)
+        self.assertEqual(len(restarted.downstream('shared')), 500)
+        self.assertEqual(sum('orchestr8_task_dependencies.task_id' in s for s in statements), 1)
+
+    def test_persist_task_graph_without_sql_jobstore(self):
+        graph = TaskGraph()
+        persist_task_graph(graph, None)
+        self.assertFalse(graph.persistent)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -12,8 +12,16 @@
 # limitations under the License.
 
 from typing import Callable, Dict
+import os
+import sys
+import tempfile
 import unittest
-from Scheduler.src.module_registry import get_function, register_function, function_registry
+from importlib.metadata import EntryPoint
+from unittest.mock import patch
+from Scheduler.src.module_registry import (
+    get_function, load_entry_points, load_import_file, preload_functions, register_function, register_target,
+    function_registry, function_targets
+)
 
 
 # Sample functions for testing
@@ -29,6 +37,7 @@ class TestFunctionRegistry(unittest.TestCase):
     def setUp(self):
         # Clear the function registry before each test
         function_registry.clear()
+        function_targets.clear()
 
     def test_register_function(self):
         # Register functions
@@ -59,6 +68,89 @@ class TestFunctionRegistry(unittest.TestCase):
             get_function("unknown_func")
         self.assertEqual(str(cm.exception), "Unknown function: unknown_func")
 
+    def test_load_import_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            import_file = os.path.join(directory, 'import_file.py')
+            with open(import_file, 'w') as file:
+                file.write("# Registered tasks\n"
+                           "from tests.test_function_registry import sample_function_2\n"
+                           "from missing_module import nothing\n")
+            load_import_file(import_file)
+
+        self.assertEqual(get_function("sample_function_2")('x'), "Function 2 with x")
+        self.assertNotIn("nothing", function_registry)
+        with self.assertRaises(ValueError):
+            get_function("nothing")
+
+    def _task_module(self, directory: str, name: str) -> None:
+        with open(os.path.join(directory, f'{name}.py'), 'w') as file:
+            file.write("def double(x):\n    return 2 * x\n\n\ndef triple(x):\n    return 3 * x\n")
+        sys.path.insert(0, directory)
+        self.addCleanup(sys.path.remove, directory)
+        self.addCleanup(sys.modules.pop, name, None)
+
+    def test_modules_are_imported_on_first_use(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self._task_module(directory, 'lazy_registry_tasks')
+            import_file = os.path.join(directory, 'import_file.py')
+            with open(import_file, 'w') as file:
+                file.write("from lazy_registry_tasks import double\n")
+            load_import_file(import_file)
+            self.assertNotIn('lazy_registry_tasks', sys.modules)
+
+            double = get_function('double')
+            self.assertIn('lazy_registry_tasks', sys.modules)
+            self.assertEqual(double(2), 4)
+            self.assertIs(get_function('double'), double)
+
+    def test_import_file_forms(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self._task_module(directory, 'registry_form_tasks')
+            import_file = os.path.join(directory, 'import_file.py')
+            with open(import_file, 'w') as file:
+                file.write("from registry_form_tasks import double as twice, triple\n"
+                           "import registry_form_tasks.double as doubled\n"
+                           "thrice = registry_form_tasks:triple\n"
+                           "quadruple = 'tests.test_function_registry.sample_function_2'\n")
+            load_import_file(import_file)
+
+            self.assertEqual(get_function('twice')(1), 2)
+            self.assertEqual(get_function('triple')(1), 3)
+            self.assertEqual(get_function('doubled')(1), 2)
+            self.assertEqual(get_function('thrice')(1), 3)
+            self.assertEqual(get_function('quadruple')('y'), "Function 2 with y")
+
+    def test_invalid_import_file_lines_are_skipped(self):
+        with tempfile.TemporaryDirectory() as directory:
+            import_file = os.path.join(directory, 'import_file.py')
+            with open(import_file, 'w') as file:
+                file.write("import json\nfrom os.path import *\nprint('hello')\nfrom tests.test_function_registry import sample_function_1\n")
+            with self.assertLogs('Scheduler.src.module_registry', level='ERROR') as logs:
+                load_import_file(import_file)
+
+        self.assertEqual(len(logs.output), 3)
+        self.assertEqual(list(function_targets), ['sample_function_1'])
+
+    def test_unknown_module(self):
+        register_target('missing', 'no_such_module:missing')
+        with self.assertRaises(ValueError):
+            get_function('missing')
+
+    def test_entry_points(self):
+        entry_point = EntryPoint('entry_function', 'tests.test_function_registry:sample_function_1', 'orchestr8.tasks')
+        with patch('importlib.metadata.entry_points', return_value={'orchestr8.tasks': [entry_point]}):
+            load_entry_points('orchestr8.tasks')
+        self.assertEqual(function_targets['entry_function'], 'tests.test_function_registry:sample_function_1')
+        self.assertEqual(get_function('entry_function')(), "Function 1")
+
+    def test_preload_functions(self):
+        register_target('func1', 'tests.test_function_registry:sample_function_1')
+        register_target('missing', 'no_such_module:missing')
+        with self.assertLogs('Scheduler.src.module_registry', level='ERROR'):
+            preload_functions()
+        self.assertIn('func1', function_registry)
+        self.assertNotIn('missing', function_registry)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,182 @@
+# Copyright 2024 Sola Richard Olorunfemi
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+from Job.incremental_validation import ValidationState, plan_incremental
+
+TESTS = [
+    {
+        'target_tables': ['menu_items'],
+        'incremental': {'column': 'created'},
+        'tests': [
+            {'type': 'row_count', 'threshold': 4},
+            {'type': 'null_check', 'column': 'name'},
+            {'type': 'primary_key_uniqueness', 'column': 'id'},
+            {'type': 'unique_value_check', 'column': 'id'},
+            {'type': 'foreign_key', 'foreign_key': 'menu_id', 'reference_table': 'menus', 'reference_key': 'id'},
+            {'type': 'custom_query', 'query': "SELECT 'custom_query', 'menu_items', COUNT(*) > 100 FROM menu_items"},
+        ]
+    },
+]
+
+
+class TestIncrementalValidation(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.db = sqlite3.connect(os.path.join(self.dir.name, 'data.db'))
+        self.db.executescript("""
+            CREATE TABLE menus (id INTEGER);
+            INSERT INTO menus VALUES (1), (2);
+            CREATE TABLE menu_items (id INTEGER, name TEXT, menu_id INTEGER, created TEXT);
+            INSERT INTO menu_items VALUES (1, NULL, 1, '2024-07-01 10:00:00'), (2, 'b', 1, '2024-07-01 11:00:00');
+        """)
+        self.state = ValidationState(os.path.join(self.dir.name, 'state.sqlite'))
+
+    def tearDown(self):
+        self.state.close()
+        self.db.close()
+        self.dir.cleanup()
+
+    def validate(self, tests=TESTS):
+        results, sql = [], []
+        for query, finish, fetch in plan_incremental(tests, self.state):
+            sql.append(query.sql)
+            cursor = self.db.execute(query.sql)
+            rows = fetch(cursor) if fetch else cursor.fetchall()
+            results.extend(finish(rows) if finish else rows)
+        return sorted((test_type, bool(error)) for test_type, _, error in results), sql
+
+    def test_only_new_rows_are_checked(self):
+        results, sql = self.validate()
+        self.assertEqual(results, [('custom_query', False), ('foreign_key', False), ('null_check', True),
+                                   ('primary_key_uniqueness', False), ('row_count', True), ('unique_value_check', False)])
+        self.assertTrue(all('WHERE' not in statement for statement in sql[:3]))
+
+        # The NULL name of row 1 is behind the watermark now; the count carries over
+        self.db.execute("INSERT INTO menu_items VALUES (3, 'c', 2, '2024-07-02 09:00:00'), (4, 'd', 1, '2024-07-02 10:00:00')")
+        results, sql = self.validate()
+        self.assertEqual([error for _, error in results], [False] * 6)
+        self.assertTrue(all("created > '2024-07-01 11:00:00'" in statement for statement in sql[:3]))
+        self.assertNotIn('WHERE', sql[-1])
+
+    def test_new_rows_are_checked_against_seen_keys_and_references(self):
+        self.validate()
+        self.db.execute("INSERT INTO menu_items VALUES (2, 'e', 3, '2024-07-03 09:00:00')")
+        results, _ = self.validate()
+        self.assertEqual(dict(results), {'custom_query': False, 'foreign_key': True, 'null_check': False,
+                                         'primary_key_uniqueness': True, 'row_count': True, 'unique_value_check': True})
+        # Reported once; the next run has nothing new
+        results, _ = self.validate()
+        self.assertEqual(dict(results)['unique_value_check'], False)
+        self.assertEqual(dict(results)['foreign_key'], False)
+
+    def test_watermarks_stay_put_when_a_query_is_not_finished(self):
+        plan = plan_incremental(TESTS, self.state)
+        self.assertEqual(self.state.watermark('menu_items', 'created', 'uniqueness:id'), (None, 0))
+        plan[1].fetch(self.db.execute(plan[1].query.sql))
+        self.assertEqual(self.state.watermark('menu_items', 'created', 'uniqueness:id'), ('2024-07-01 11:00:00', 0))
+        self.assertEqual(self.state.record_keys('menu_items', 'created', 'id', [2, 5, 5, None]), 2)
+
+    def test_keys_are_fetched_in_batches_and_kept_only_once_fetched(self):
+        self.db.execute("INSERT INTO menu_items VALUES (3, 'c', 2, '2024-07-02 09:00:00')")
+        uniqueness = plan_incremental(TESTS, self.state)[1]
+
+        class FailingCursor:
+            def __init__(self, cursor):
+                self.cursor, self.batches = cursor, 0
+
+            def fetchmany(self, size):
+                self.batches += 1
+                if self.batches == 3:
+                    raise sqlite3.OperationalError('interrupted')
+                return self.cursor.fetchmany(size)
+
+        cursor = FailingCursor(self.db.execute(uniqueness.query.sql))
+        with patch('Job.incremental_validation.FETCH_BATCH', 1), self.assertRaises(sqlite3.OperationalError):
+            uniqueness.fetch(cursor)
+        # Neither the keys of the first two batches nor the watermark were kept
+        self.assertEqual(self.state.watermark('menu_items', 'created', 'uniqueness:id'), (None, 0))
+        with patch('Job.incremental_validation.FETCH_BATCH', 2):
+            self.assertEqual(uniqueness.finish(uniqueness.fetch(self.db.execute(uniqueness.query.sql))),
+                             [('primary_key_uniqueness', 'menu_items', False), ('unique_value_check', 'menu_items', False)])
+        self.assertEqual(self.state.watermark('menu_items', 'created', 'uniqueness:id'), ('2024-07-02 09:00:00', 0))
+
+    def test_state_is_free_while_keys_are_fetched(self):
+        uniqueness = plan_incremental(TESTS, self.state)[1]
+        state = self.state
+
+        class ProbingCursor:
+            def __init__(self, cursor):
+                self.cursor, self.free = cursor, []
+
+            def fetchmany(self, size):
+                # Another thread, like the one finishing the other queries, can take the state meanwhile
+                thread = threading.Thread(target=self.probe)
+                thread.start()
+                thread.join()
+                return self.cursor.fetchmany(size)
+
+            def probe(self):
+                acquired = state._lock.acquire(timeout=0.2)
+                if acquired:
+                    state._lock.release()
+                self.free.append(acquired)
+
+        cursor = ProbingCursor(self.db.execute(uniqueness.query.sql))
+        with patch('Job.incremental_validation.FETCH_BATCH', 1):
+            self.assertEqual(uniqueness.fetch(cursor), [(0,)])
+        self.assertEqual(cursor.free, [True, True, True])
+        self.assertEqual(self.state.record_keys('menu_items', 'created', 'id', [1, 2]), 2)
+
+    def test_seen_keys_are_kept_per_watermark_column(self):
+        self.db.execute("ALTER TABLE menu_items ADD COLUMN loaded INTEGER")
+        self.db.execute("UPDATE menu_items SET loaded = id")
+        self.validate()
+        # A second group over the same table with its own watermark starts from no seen keys
+        by_load = [dict(TESTS[0], incremental={'column': 'loaded'},
+                        tests=[{'type': 'primary_key_uniqueness', 'column': 'id'}])]
+        results, _ = self.validate(by_load)
+        self.assertEqual(results, [('primary_key_uniqueness', False)])
+
+    def test_seen_keys_of_an_older_state_file_are_indexed_again(self):
+        self.state.close()
+        path = os.path.join(self.dir.name, 'old_state.sqlite')
+        old = sqlite3.connect(path)
+        old.executescript("""
+            CREATE TABLE watermarks (table_name TEXT NOT NULL, watermark_column TEXT NOT NULL, check_key TEXT NOT NULL,
+                                     watermark TEXT, row_count INTEGER NOT NULL DEFAULT 0,
+                                     PRIMARY KEY (table_name, watermark_column, check_key));
+            CREATE TABLE seen_keys (table_name TEXT NOT NULL, key_column TEXT NOT NULL, key_value NOT NULL,
+                                    PRIMARY KEY (table_name, key_column, key_value)) WITHOUT ROWID;
+            INSERT INTO watermarks VALUES ('menu_items', 'created', 'uniqueness:id', '2024-07-01 11:00:00', 0),
+                                          ('menu_items', 'created', 'row_count', '2024-07-01 11:00:00', 2);
+            INSERT INTO seen_keys VALUES ('menu_items', 'id', 1), ('menu_items', 'id', 2);
+        """)
+        old.close()
+
+        self.state = ValidationState(path)
+        self.assertEqual(self.state.watermark('menu_items', 'created', 'uniqueness:id'), (None, 0))
+        self.assertEqual(self.state.watermark('menu_items', 'created', 'row_count'), ('2024-07-01 11:00:00', 2))
+        self.assertEqual(self.state.record_keys('menu_items', 'created', 'id', [1, 2]), 0)
+
+    def test_groups_without_incremental_are_left_out(self):
+        self.assertEqual(plan_incremental([dict(TESTS[0], incremental=None)], self.state), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+# Copyright 2024 Sola Richard Olorunfemi
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import tempfile
+import unittest
+from datetime import timedelta
+from unittest.mock import patch
+from sqlalchemy import event
+from apscheduler.events import EVENT_JOB_SUBMITTED, JobSubmissionEvent
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.triggers.date import DateTrigger
+from apscheduler.triggers.interval import IntervalTrigger
+from Scheduler.src.job_index import JobIndex, definition_hash, job_definition_hash
+
+
+def job_function(*args, **kwargs):
+    pass
+
+
+class TestDefinitionHash(unittest.TestCase):
+    def test_hash_follows_definition(self):
+        trigger = IntervalTrigger(minutes=1, timezone='UTC')
+        base = definition_hash(job_function, [1], {'a': 2}, trigger, 1)
+
+        self.assertEqual(base, definition_hash(job_function, (1,), {'a': 2}, IntervalTrigger(minutes=1, timezone='UTC'), 1))
+        self.assertNotEqual(base, definition_hash(job_function, [2], {'a': 2}, trigger, 1))
+        self.assertNotEqual(base, definition_hash(job_function, [1], {'a': 2}, IntervalTrigger(minutes=2, timezone='UTC'), 1))
+        self.assertNotEqual(base, definition_hash(job_function, [1], {'a': 2}, trigger, 2))
+
+    def test_run_once_trigger_counts_as_no_schedule(self):
+        self.assertEqual(definition_hash(job_function, [], {}, None, 1),
+                         definition_hash(job_function, [], {}, DateTrigger(), 1))
+
+
+class TestJobIndex(unittest.TestCase):
+    def setUp(self):
+        self.sched = BackgroundScheduler(timezone='UTC')
+        self.sched.start(paused=True)
+        self.job = self.sched.add_job(job_function, 'interval', minutes=1, id='job', args=[1])
+        self.index = JobIndex(self.sched)
+
+    def tearDown(self):
+        self.sched.shutdown(wait=False)
+
+    def test_loads_once_and_answers_from_memory(self):
+        with patch.object(self.sched, 'get_jobs', wraps=self.sched.get_jobs) as get_jobs, \
+                patch.object(self.sched, 'get_job', wraps=self.sched.get_job) as get_job:
+            self.assertEqual(self.index.get('job').definition_hash, job_definition_hash(self.job))
+            self.assertNotIn('missing', self.index)
+            self.assertIn('job', self.index)
+        self.assertEqual(get_jobs.call_count, 1)
+        get_job.assert_not_called()
+
+    def test_writes_invalidate_entries(self):
+        self.index.get('job')
+        self.sched.modify_job('job', args=[2])
+        self.assertEqual(self.index.get('job').definition_hash, job_definition_hash(self.sched.get_job('job')))
+
+        self.sched.remove_job('job')
+        with patch.object(self.sched, 'get_job') as get_job:
+            self.assertIsNone(self.index.get('job'))
+        get_job.assert_not_called()
+
+    def test_record_spares_the_read_back(self):
+        self.index.get('job')
+        job = self.sched.add_job(job_function, 'interval', minutes=5, id='other')
+        self.index.record(job)
+        with patch.object(self.sched, 'get_job') as get_job:
+            self.assertEqual(self.index.get('other').trigger, job.trigger)
+        get_job.assert_not_called()
+
+    def test_submission_advances_next_run_time(self):
+        run_time = self.index.get('job').next_run_time
+        self.sched._dispatch_event(JobSubmissionEvent(EVENT_JOB_SUBMITTED, 'job', 'default', [run_time]))
+        self.assertEqual(self.index.get('job').next_run_time, run_time + timedelta(minutes=1))
+
+
+class TestSharedJobIndex(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        url = f"sqlite:///{os.path.join(self.directory.name, 'jobs.sqlite')}"
+        # Two schedulers on one database, like two processes sharing the jobstore
+        self.sched = BackgroundScheduler(jobstores={'default': SQLAlchemyJobStore(url=url)}, timezone='UTC')
+        self.other = BackgroundScheduler(jobstores={'default': SQLAlchemyJobStore(url=url)}, timezone='UTC')
+        self.sched.start(paused=True)
+        self.other.start(paused=True)
+        self.sched.add_job(job_function, 'interval', minutes=1, id='job', args=[1])
+        self.index = JobIndex(self.sched)
+
+    def tearDown(self):
+        self.sched.shutdown(wait=False)
+        self.other.shutdown(wait=False)
+        self.directory.cleanup()
+
+    def test_sees_writes_of_other_processes(self):
+        self.assertIsNotNone(self.index.get('job'))
+        self.assertNotIn('other', self.index)
+
+        self.other.add_job(job_function, 'interval', minutes=5, id='other')
+        self.other.modify_job('job', args=[2])
+        self.assertIn('other', self.index)
+        self.assertEqual(self.index.get('job').definition_hash, job_definition_hash(self.other.get_job('job')))
+
+        self.other.remove_job('job')
+        self.assertIsNone(self.index.get('job'))
+
+    def test_batch_reads_the_jobstore_once(self):
+        self.index.refresh()
+        store = self.sched._lookup_jobstore('default')
+        statements = []
+        event.listen(store.engine, 'before_cursor_execute',
+                     lambda conn, cursor, statement, *args: statements.append(statement))
+        with self.index.batch(['job', 'missing']):
+            self.other.remove_job('job')
+            for _ in range(3):
+                self.assertIsNotNone(self.index.get('job'))
+                self.assertNotIn('missing', self.index)
+        self.assertEqual(len([statement for statement in statements if statement.startswith('SELECT')]), 1)
+
+        # Outside the batch lookups see the other process's writes again
+        self.assertIsNone(self.index.get('job'))
+
+    def test_unchanged_job_is_not_unpickled_again(self):
+        entry = self.index.get('job')
+        store = self.sched._lookup_jobstore('default')
+        with patch.object(store, '_reconstitute_job', wraps=store._reconstitute_job) as reconstitute:
+            self.assertEqual(self.index.get('job'), entry)
+            self.assertIn('job', self.index)
+        reconstitute.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
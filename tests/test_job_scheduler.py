@@ -0,0 +1,315 @@
+# Copyright 2024 Sola Richard Olorunfemi
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from apscheduler.executors.pool import ProcessPoolExecutor, ThreadPoolExecutor
+from apscheduler.jobstores.base import ConflictingIdError
+from apscheduler.jobstores.memory import MemoryJobStore
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.schedulers.blocking import BlockingScheduler
+from apscheduler.triggers.interval import IntervalTrigger
+from sqlalchemy import event, select
+from Scheduler.src.asyncio_scheduler import ThreadedAsyncIOScheduler
+from Scheduler.src.job_scheduler import (
+    BatchedSQLAlchemyJobStore, SchedulerEngine, _build_scheduler, _sqlalchemy_jobstore, add_jobs, build_executors,
+    is_sqlite_file, sqlite_engine
+)
+
+
+def _memory_scheduler():
+    return BackgroundScheduler(jobstores={'default': MemoryJobStore()})
+
+
+def job_function(a, b=0):
+    return a + b
+
+
+class TestSchedulerEngine(unittest.TestCase):
+    def setUp(self):
+        self.engine = SchedulerEngine()
+        patch('Scheduler.src.job_scheduler._build_scheduler', side_effect=_memory_scheduler).start()
+
+    def tearDown(self):
+        self.engine.shutdown(wait=False)
+        patch.stopall()
+
+    def test_get_returns_one_started_scheduler(self):
+        first = self.engine.get()
+        second = self.engine.get()
+
+        self.assertIs(first, second)
+        self.assertTrue(first.running)
+        self.assertTrue(self.engine.running)
+
+    def test_start_is_idempotent(self):
+        started = self.engine.start(paused=True)
+        self.assertIs(self.engine.start(), started)
+        self.assertIs(self.engine.get(), started)
+
+    def test_shutdown_builds_a_fresh_scheduler_on_next_get(self):
+        first = self.engine.get()
+        self.engine.shutdown(wait=False)
+
+        self.assertFalse(first.running)
+        self.assertFalse(self.engine.running)
+        self.assertIsNot(self.engine.get(), first)
+
+    def test_shutdown_without_scheduler_is_a_noop(self):
+        self.engine.shutdown(wait=False)
+        self.assertFalse(self.engine.running)
+
+    @patch('Scheduler.src.job_scheduler._build_scheduler')
+    def test_blocking_scheduler_is_not_started_by_get(self, mock_build):
+        mock_build.return_value = BlockingScheduler(jobstores={'default': MemoryJobStore()})
+
+        self.assertFalse(self.engine.get().running)
+
+
+class TestBuildScheduler(unittest.TestCase):
+    @patch('Scheduler.src.job_scheduler.get_scheduler_type', return_value='BlockingScheduler')
+    def test_blocking_scheduler(self, _):
+        self.assertIsInstance(_build_scheduler(), BlockingScheduler)
+
+    @patch('Scheduler.src.job_scheduler.get_scheduler_type', return_value='AsyncIOScheduler')
+    def test_asyncio_scheduler_gets_an_asyncio_pool(self, _):
+        sched = _build_scheduler()
+        self.assertIsInstance(sched, ThreadedAsyncIOScheduler)
+        self.assertIn('asyncio', sched._executors)
+
+    @patch('Scheduler.src.job_scheduler.get_worker_settings', return_value={'mode': 'lease', 'worker_id': 'w1'})
+    def test_lease_mode_uses_the_leased_jobstore(self, _):
+        from Scheduler.src.leased_jobstore import LeasedJobStore
+
+        store = _build_scheduler()._lookup_jobstore('default')
+        self.assertIsInstance(store, LeasedJobStore)
+        self.assertEqual(store.worker_id, 'w1')
+
+    @patch('Scheduler.src.job_scheduler.get_worker_settings', return_value={'mode': 'Leader'})
+    def test_leader_mode_uses_the_leader_jobstore(self, _):
+        from Scheduler.src.leader_jobstore import LeaderJobStore
+
+        self.assertIsInstance(_build_scheduler()._lookup_jobstore('default'), LeaderJobStore)
+
+    @patch('Scheduler.src.job_scheduler.get_worker_settings', return_value={'mode': 'swarm'})
+    def test_unknown_worker_mode(self, _):
+        with self.assertRaises(ValueError):
+            _build_scheduler()
+
+    @patch('Scheduler.src.job_scheduler.get_jobstore_settings', return_value={'jobstore_type': 'memory+snapshot', 'jobstore_url': 'sqlite://'})
+    @patch('Scheduler.src.job_scheduler.get_worker_settings', return_value={'mode': 'lease'})
+    def test_worker_mode_needs_an_sql_jobstore(self, *_):
+        with self.assertRaises(ValueError):
+            _build_scheduler()
+
+    @patch('Scheduler.src.job_scheduler.get_scheduler_type', return_value='AsyncIOScheduler')
+    def test_engine_starts_the_asyncio_scheduler(self, _):
+        engine = SchedulerEngine()
+        with patch('Scheduler.src.job_scheduler.get_jobstore_settings', return_value={'jobstore_type': 'sqlite', 'jobstore_url': 'sqlite://'}):
+            sched = engine.get()
+        self.assertTrue(sched.running)
+        engine.shutdown(wait=False)
+        self.assertFalse(sched.running)
+
+
+class TestBuildExecutors(unittest.TestCase):
+    def test_named_pools(self):
+        executors = build_executors({
+            'default': {'type': 'thread', 'max_workers': 4},
+            'cpu': {'type': 'process', 'max_workers': 2},
+        }, 'BackgroundScheduler')
+        self.assertIsInstance(executors['default'], ThreadPoolExecutor)
+        self.assertIsInstance(executors['cpu'], ProcessPoolExecutor)
+        self.assertEqual(executors['cpu']._pool._max_workers, 2)
+
+    def test_invalid_pools_are_rejected(self):
+        with self.assertRaises(ValueError):
+            build_executors({'cpu': {'type': 'process'}}, 'BackgroundScheduler')  # no default
+        with self.assertRaises(ValueError):
+            build_executors({'default': {'type': 'gpu'}}, 'BackgroundScheduler')
+        with self.assertRaises(ValueError):
+            build_executors({'default': {'type': 'asyncio'}}, 'BackgroundScheduler')
+
+
+class TestAddJobs(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        url = f"sqlite:///{os.path.join(self.directory.name, 'jobs.sqlite')}"
+        self.sched = BackgroundScheduler(jobstores={'default': SQLAlchemyJobStore(url=url)})
+        self.sched.start(paused=True)
+
+    def tearDown(self):
+        self.sched.shutdown(wait=False)
+        self.directory.cleanup()
+
+    def test_add_jobs_stores_every_job(self):
+        added = []
+        self.sched.add_listener(lambda event: added.append(event.job_id))
+
+        add_jobs(self.sched, [
+            {'func': job_function, 'trigger': IntervalTrigger(minutes=1), 'id': 'scheduled', 'args': [1]},
+            {'func': job_function, 'trigger': None, 'id': 'paused', 'kwargs': {'a': 1}, 'next_run_time': None},
+        ])
+
+        scheduled = self.sched.get_job('scheduled')
+        self.assertEqual(scheduled.args, (1,))
+        self.assertIsNotNone(scheduled.next_run_time)
+        self.assertIsNone(self.sched.get_job('paused').next_run_time)
+        self.assertEqual(added, ['scheduled', 'paused'])
+
+    def test_add_jobs_is_all_or_nothing(self):
+        self.sched.add_job(job_function, 'interval', minutes=1, id='existing', args=[1])
+
+        with self.assertRaises(ConflictingIdError):
+            add_jobs(self.sched, [
+                {'func': job_function, 'trigger': IntervalTrigger(minutes=1), 'id': 'new', 'args': [1]},
+                {'func': job_function, 'trigger': IntervalTrigger(minutes=1), 'id': 'existing', 'args': [1]},
+            ])
+
+        self.assertIsNone(self.sched.get_job('new'))
+
+    def test_in_transaction_rows_commit_and_roll_back_with_the_jobs(self):
+        store = self.sched._lookup_jobstore('default')
+        tables = []
+
+        def write(connection):
+            connection.exec_driver_sql('CREATE TABLE IF NOT EXISTS edges (task TEXT)')
+            connection.exec_driver_sql("INSERT INTO edges VALUES ('first')")
+            tables.append(connection)
+
+        job = {'func': job_function, 'trigger': None, 'id': 'first', 'args': [1], 'next_run_time': None}
+        add_jobs(self.sched, [job], in_transaction=write)
+        with self.assertRaises(ConflictingIdError):
+            add_jobs(self.sched, [job], in_transaction=write)
+
+        with store.engine.connect() as connection:
+            self.assertEqual(connection.exec_driver_sql('SELECT task FROM edges').fetchall(), [('first',)])
+        self.assertEqual(len(tables), 1)
+
+    def test_replacing_drops_buffered_updates_of_the_old_job(self):
+        url = f"sqlite:///{os.path.join(self.directory.name, 'batched.sqlite')}"
+        self.sched.remove_jobstore('default')
+        self.sched.add_jobstore(BatchedSQLAlchemyJobStore(url=url), 'default')
+        default = self.sched._lookup_jobstore('default')
+        self.sched.add_job(job_function, 'interval', minutes=1, id='task', args=[1])
+
+        old = default.lookup_job('task')
+        default._batching = True
+        default.update_job(old)  # a run time update the scheduler has not flushed yet
+        default._batching = False
+        add_jobs(self.sched, [{'func': job_function, 'trigger': IntervalTrigger(minutes=1), 'id': 'task', 'args': [2]}],
+                 replace_existing=True)
+        default.flush()
+
+        self.assertEqual(self.sched.get_job('task').args, (2,))
+
+    def test_stores_with_their_own_add_job_get_one_call_per_job(self):
+        class CountingJobStore(SQLAlchemyJobStore):
+            def add_job(self, job):
+                calls.append(job.id)
+                super().add_job(job)
+
+        calls, written = [], []
+        url = f"sqlite:///{os.path.join(self.directory.name, 'counting.sqlite')}"
+        self.sched.remove_jobstore('default')
+        self.sched.add_jobstore(CountingJobStore(url=url), 'default')
+        add_jobs(self.sched, [{'func': job_function, 'trigger': None, 'id': 'a', 'args': [1], 'next_run_time': None},
+                              {'func': job_function, 'trigger': None, 'id': 'b', 'args': [1], 'next_run_time': None}],
+                 in_transaction=written.append)
+
+        self.assertEqual(calls, ['a', 'b'])
+        self.assertEqual(written, [None])
+
+
+class TestSqliteProfile(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.url = f"sqlite:///{os.path.join(self.directory.name, 'jobs.sqlite')}"
+        self.settings = {'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'busy_timeout': 2500,
+                         'pool_size': 2, 'batch_updates': True}
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_pragmas_are_set_on_every_connection(self):
+        engine = sqlite_engine(self.url, self.settings)
+        with engine.connect() as connection:
+            self.assertEqual(connection.exec_driver_sql('PRAGMA journal_mode').scalar(), 'wal')
+            self.assertEqual(connection.exec_driver_sql('PRAGMA synchronous').scalar(), 1)  # NORMAL
+            self.assertEqual(connection.exec_driver_sql('PRAGMA busy_timeout').scalar(), 2500)
+        engine.dispose()
+
+    def test_invalid_pragma_values_are_rejected(self):
+        with self.assertRaises(ValueError):
+            sqlite_engine(self.url, dict(self.settings, journal_mode='WAL; DROP TABLE x'))
+        with self.assertRaises(ValueError):
+            sqlite_engine(self.url, dict(self.settings, synchronous='SOMETIMES'))
+
+    def test_profile_only_applies_to_sqlite_files(self):
+        self.assertTrue(is_sqlite_file(self.url))
+        self.assertFalse(is_sqlite_file('sqlite://'))
+        self.assertFalse(is_sqlite_file('postgresql://user@localhost/jobs'))
+        with patch('Scheduler.src.job_scheduler.get_sqlite_settings', return_value=self.settings):
+            store = _sqlalchemy_jobstore(self.url)
+        self.assertIsInstance(store, BatchedSQLAlchemyJobStore)
+        store.engine.dispose()
+
+    def test_updates_of_one_wakeup_are_written_together(self):
+        store = BatchedSQLAlchemyJobStore(engine=sqlite_engine(self.url, self.settings))
+        sched = BackgroundScheduler(jobstores={'default': store}, timezone='UTC')
+        sched.start(paused=True)
+        self.addCleanup(sched.shutdown, False)
+        for name in ('a', 'b'):
+            sched.add_job(job_function, 'interval', minutes=1, id=name, args=[1])
+
+        def stored_run_times():
+            with store.engine.connect() as connection:
+                return dict(connection.execute(select(store.jobs_t.c.id, store.jobs_t.c.next_run_time)).all())
+
+        before = stored_run_times()
+        jobs = store.get_due_jobs(max(job.next_run_time for job in sched.get_jobs()))
+        for job in jobs:
+            job._modify(next_run_time=job.trigger.get_next_fire_time(job.next_run_time, job.next_run_time))
+            store.update_job(job)
+        self.assertEqual(stored_run_times(), before)
+
+        updates = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith('UPDATE'):
+                updates.append(len(parameters) if executemany else 1)
+
+        event.listen(store.engine, 'before_cursor_execute', record)
+        store.get_next_run_time()
+        self.assertEqual(updates, [2])  # one executemany for both jobs
+        self.assertEqual({name: run_time - before[name] for name, run_time in stored_run_times().items()},
+                         {'a': 60.0, 'b': 60.0})
+
+    def test_reads_see_buffered_updates(self):
+        store = BatchedSQLAlchemyJobStore(engine=sqlite_engine(self.url, self.settings))
+        sched = BackgroundScheduler(jobstores={'default': store}, timezone='UTC')
+        sched.start(paused=True)
+        self.addCleanup(sched.shutdown, False)
+        sched.add_job(job_function, 'interval', minutes=1, id='a', args=[1])
+
+        job = store.get_due_jobs(sched.get_job('a').next_run_time)[0]
+        job._modify(args=(2,))
+        store.update_job(job)
+        self.assertEqual(store.lookup_job('a').args, (2,))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+# Copyright 2024 Sola Richard Olorunfemi
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _run(code: str, directory: str, **env: str) -> dict:
+    """Run `code` in a fresh interpreter in `directory` and return the JSON it prints."""
+    environment = {key: value for key, value in os.environ.items() if key != 'PACKAGE_PROJECT_DIR'}
+    environment.update(PYTHONPATH=ROOT, **env)
+    output = subprocess.run([sys.executable, '-c', code], cwd=directory, env=environment,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+class TestLazyImport(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def test_package_import_loads_nothing(self):
+        result = _run(
+            "import json, sys, Scheduler; "
+            "print(json.dumps({name: name in sys.modules for name in "
+            "('apscheduler', 'sqlalchemy', 'Scheduler.src.config', 'Scheduler.src.job_scheduler')}))",
+            self.directory.name
+        )
+        self.assertEqual(result, {'apscheduler': False, 'sqlalchemy': False,
+                                  'Scheduler.src.config': False, 'Scheduler.src.job_scheduler': False})
+
+    def test_submodules_are_imported_on_access(self):
+        result = _run(
+            "import json, Scheduler; print(json.dumps(Scheduler.parse_create_task.__name__))",
+            self.directory.name
+        )
+        self.assertEqual(result, 'Scheduler.src.parse_create_task')
+
+    def test_task_modules_start_no_scheduler(self):
+        result = _run(
+            "import json, sys, threading; path = list(sys.path); "
+            "import Scheduler.src.create_task, Scheduler.src.modify_task, Scheduler.task_manager; "
+            "from Scheduler.src.job_scheduler import engine; "
+            "print(json.dumps({'built': engine._scheduler is not None, 'threads': threading.active_count(), "
+            "'path_changed': sys.path != path}))",
+            self.directory.name
+        )
+        self.assertEqual(result, {'built': False, 'threads': 1, 'path_changed': False})
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+    def test_parser_import_reads_no_settings(self):
+        home = os.path.join(self.directory.name, 'home')
+        os.mkdir(home)
+        result = _run(
+            "import json, sys, Scheduler; Scheduler.parse_create_task; Scheduler.parse_modify_task; "
+            "config = sys.modules.get('Scheduler.src.config'); "
+            "print(json.dumps({'apscheduler': 'apscheduler' in sys.modules, 'sqlalchemy': 'sqlalchemy' in sys.modules, "
+            "'settings': config is not None and 'settings' in vars(config)}))",
+            self.directory.name, HOME=home
+        )
+        self.assertEqual(result, {'apscheduler': False, 'sqlalchemy': False, 'settings': False})
+        self.assertEqual(os.listdir(home), [])
+
+    def test_task_modules_seed_no_settings(self):
+        home = os.path.join(self.directory.name, 'home')
+        os.mkdir(home)
+        result = _run(
+            "import json, sys; import Scheduler.src.create_task, Scheduler.src.modify_task, Scheduler.src.warm_pool; "
+            "print(json.dumps('settings' in vars(sys.modules['Scheduler.src.config'])))",
+            self.directory.name, HOME=home
+        )
+        self.assertFalse(result)
+        self.assertEqual(os.listdir(home), [])
+        self.assertEqual(os.listdir(self.directory.name), ['home'])
+
+    def test_settings_are_loaded_and_seeded_on_first_access(self):
+        settings_dir = os.path.join(self.directory.name, 'settings')
+        result = _run(
+            "import json, os; from Scheduler.src import config, copy_settings; "
+            "before = 'settings' in vars(config) or os.path.exists(os.path.join(os.environ['PACKAGE_PROJECT_DIR'], 'SETTINGS.py')); "
+            "print(json.dumps({'before': before, 'timezone': config.TIMEZONE, 'after': 'settings' in vars(config)}))",
+            self.directory.name, PACKAGE_PROJECT_DIR=settings_dir
+        )
+        self.assertEqual(result, {'before': False, 'timezone': 'UTC', 'after': True})
+        self.assertTrue(os.path.exists(os.path.join(settings_dir, 'SETTINGS.py')))
+
+
+if __name__ == '__main__':
+    unittest.main()
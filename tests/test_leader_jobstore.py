@@ -0,0 +1,228 @@
+# Copyright 2024 Sola Richard Olorunfemi
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta, timezone
+from apscheduler.events import EVENT_JOB_EXECUTED
+from apscheduler.schedulers.background import BackgroundScheduler
+from sqlalchemy.exc import OperationalError
+from Scheduler.src.job_scheduler import sqlite_engine
+from Scheduler.src.leader_jobstore import LeaderJobStore
+
+logger = logging.getLogger(__name__)
+
+SQLITE_SETTINGS = {'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'busy_timeout': 10000, 'pool_size': 5}
+LEASE_TTL = 1.0
+POLL_INTERVAL = 0.1
+
+
+def job_function():
+    time.sleep(0.02)
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def _store(url, worker_id, **options):
+    options = dict({'lease_ttl': LEASE_TTL, 'heartbeat_interval': 0.25, 'poll_interval': POLL_INTERVAL}, **options)
+    return LeaderJobStore(engine=sqlite_engine(url, SQLITE_SETTINGS), worker_id=worker_id, **options)
+
+
+def run_leader(url, worker_id):
+    """Lead until the process is killed."""
+    sched = BackgroundScheduler(jobstores={'default': _store(url, worker_id)}, timezone='UTC')
+    sched.start()
+    while True:
+        time.sleep(1)
+
+
+def _leader(store):
+    try:
+        return store.current_leader()
+    except OperationalError:
+        return None  # Tables not created yet
+
+
+def _wait_for(condition, timeout=10.0, interval=0.01):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if condition():
+            return True
+        time.sleep(interval)
+    return False
+
+
+class TestLeaderJobStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.url = f"sqlite:///{os.path.join(self.directory.name, 'jobs.sqlite')}"
+        self.schedulers = []
+        self.executed = []
+        self.lock = threading.Lock()
+
+    def tearDown(self):
+        for sched in self.schedulers:
+            if sched.running:
+                sched.shutdown(wait=False)
+        self.directory.cleanup()
+
+    def _worker(self, worker_id, paused=True, **options):
+        store = _store(self.url, worker_id, **options)
+        sched = BackgroundScheduler(jobstores={'default': store}, timezone='UTC')
+
+        def record(event):
+            with self.lock:
+                self.executed.append((worker_id, event.job_id))
+
+        sched.add_listener(record, EVENT_JOB_EXECUTED)
+        sched.start(paused=paused)
+        self.schedulers.append(sched)
+        return sched, store
+
+    def test_only_the_leader_queues_due_runs(self):
+        sched_a, store_a = self._worker('a')
+        _, store_b = self._worker('b')
+        sched_a.add_job(job_function, 'date', run_date=_now(), id='once')
+        sched_a.add_job(job_function, 'interval', seconds=60, id='repeat', next_run_time=_now())
+
+        self.assertEqual(store_a.get_due_jobs(_now()), [])
+        self.assertEqual(store_b.get_due_jobs(_now()), [])
+
+        self.assertTrue(store_a.is_leader)
+        self.assertFalse(store_b.is_leader)
+        self.assertEqual(store_b.current_leader(), 'a')
+        self.assertEqual(store_a.queued_runs(), 2)
+        # The date job is done with; the interval job moved on to its next run
+        self.assertIsNone(store_a.lookup_job('once'))
+        self.assertGreater(store_a.lookup_job('repeat').next_run_time, _now() + timedelta(seconds=50))
+        # Followers do not wait on job times they do not compute
+        self.assertLessEqual(store_b.get_next_run_time(), _now() + timedelta(seconds=POLL_INTERVAL))
+
+    def test_queued_runs_execute_once_across_workers(self):
+        sched_a, _ = self._worker('a', paused=False, max_claims=4)
+        self._worker('b', paused=False, max_claims=4)
+        run_date = _now() + timedelta(seconds=0.5)
+        for i in range(40):
+            sched_a.add_job(job_function, 'date', run_date=run_date, id=f'job_{i}', misfire_grace_time=None)
+
+        self.assertTrue(_wait_for(lambda: len(self.executed) >= 40))
+        time.sleep(0.2)
+        job_ids = [job_id for _, job_id in self.executed]
+        self.assertEqual(sorted(job_ids), sorted(f'job_{i}' for i in range(40)))
+        self.assertEqual({worker for worker, _ in self.executed}, {'a', 'b'})
+
+    def test_removed_jobs_drop_their_queued_runs(self):
+        sched_a, store_a = self._worker('a')
+        for job_id in ('first', 'second', 'third'):
+            sched_a.add_job(job_function, 'interval', seconds=60, id=job_id, next_run_time=_now())
+        store_a.get_due_jobs(_now())
+        self.assertEqual(store_a.queued_runs(), 3)
+
+        sched_a.remove_job('first')
+        self.assertEqual(store_a.queued_runs(), 2)
+        self.assertIsNotNone(store_a.lookup_job('second'))
+
+        sched_a.remove_all_jobs()
+        self.assertEqual(store_a.queued_runs(), 0)
+        sched_a.resume()
+        self.assertEqual(store_a.drain(), 0)
+
+    def test_run_of_a_dead_worker_is_queued_again(self):
+        sched_a, store_a = self._worker('a')
+        sched_b, _ = self._worker('b')
+        sched_a.add_job(job_function, 'date', run_date=_now(), id='job', misfire_grace_time=None)
+        store_a.get_due_jobs(_now())
+        # a takes the run, then stops renewing its lease without running it
+        store_a._stop.set()
+        store_a._heartbeat_thread.join()
+        store_a._drain_thread.join()
+        sched_a.resume()
+        with patch_submit(sched_a):
+            self.assertEqual(store_a.drain(), 1)
+        taken_at = time.perf_counter()
+
+        sched_b.resume()
+        self.assertTrue(_wait_for(lambda: ('b', 'job') in self.executed, timeout=LEASE_TTL * 3))
+        self.assertGreater(time.perf_counter() - taken_at, LEASE_TTL - 0.1)
+
+    def test_leader_hands_over_on_shutdown(self):
+        sched_a, store_a = self._worker('a', paused=False)
+        _, store_b = self._worker('b', paused=False)
+        self.assertTrue(_wait_for(lambda: store_a.current_leader() == 'a'))
+
+        sched_a.shutdown()
+        self.assertTrue(_wait_for(lambda: store_b.is_leader, timeout=POLL_INTERVAL * 5))
+
+    def test_poll_interval_must_be_shorter_than_the_lease(self):
+        with self.assertRaises(ValueError):
+            LeaderJobStore(url=self.url, lease_ttl=1, heartbeat_interval=0.5, poll_interval=1)
+
+
+class patch_submit:
+    """Keep a scheduler's default executor from running what it is given."""
+
+    def __init__(self, sched):
+        self.executor = sched._lookup_executor('default')
+
+    def __enter__(self):
+        self.original, self.executor._do_submit_job = self.executor._do_submit_job, lambda job, run_times: None
+
+    def __exit__(self, *exc_info):
+        self.executor._do_submit_job = self.original
+
+
+class TestLeaderFailover(unittest.TestCase):
+    def test_failover_time_after_the_leader_is_killed(self):
+        with tempfile.TemporaryDirectory() as directory:
+            url = f"sqlite:///{os.path.join(directory, 'jobs.sqlite')}"
+            context = multiprocessing.get_context('spawn')
+            leader = context.Process(target=run_leader, args=(url, 'leader'), daemon=True)
+            leader.start()
+
+            store = _store(url, 'follower')
+            sched = BackgroundScheduler(jobstores={'default': store}, timezone='UTC')
+            executed = threading.Event()
+            sched.add_listener(lambda event: executed.set(), EVENT_JOB_EXECUTED)
+            try:
+                # Start following only once the other process leads
+                self.assertTrue(_wait_for(lambda: _leader(store) == 'leader', timeout=30))
+                sched.start()
+                self.assertTrue(_wait_for(lambda: store.live_workers() == ['follower', 'leader']))
+                self.assertFalse(store.is_leader)
+
+                leader.kill()
+                killed_at = time.perf_counter()
+                self.assertTrue(_wait_for(lambda: store.is_leader, timeout=LEASE_TTL * 5))
+                failover = time.perf_counter() - killed_at
+                logger.info(f"Leader failover took {failover:.3f}s (lease TTL {LEASE_TTL}s, poll {POLL_INTERVAL}s)")
+
+                # At most one lease TTL plus one follower poll, with slack for a loaded machine
+                self.assertLess(failover, LEASE_TTL + POLL_INTERVAL + 0.5)
+                sched.add_job(job_function, 'date', run_date=_now(), id='after_failover')
+                self.assertTrue(executed.wait(5))
+            finally:
+                leader.kill()
+                leader.join()
+                if sched.running:
+                    sched.shutdown(wait=False)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,194 @@
+# Copyright 2024 Sola Richard Olorunfemi
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import multiprocessing
+import os
+import tempfile
+import time
+import unittest
+from datetime import datetime, timedelta, timezone
+from apscheduler.events import EVENT_JOB_EXECUTED
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+from apscheduler.schedulers.background import BackgroundScheduler
+from Scheduler.src.job_scheduler import sqlite_engine
+from Scheduler.src.leased_jobstore import LeasedJobStore
+
+SQLITE_SETTINGS = {'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'busy_timeout': 10000, 'pool_size': 5}
+
+
+def job_function():
+    pass
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def run_worker(url, worker_id, stop_at, results):
+    """Run one scheduler process over the shared jobstore until `stop_at` and report what it executed."""
+    store = LeasedJobStore(engine=sqlite_engine(url, SQLITE_SETTINGS), worker_id=worker_id, lease_ttl=5,
+                           heartbeat_interval=1, poll_interval=0.2, max_claims=10)
+    sched = BackgroundScheduler(jobstores={'default': store}, timezone='UTC')
+    executed = []
+    sched.add_listener(lambda event: executed.append((event.job_id, event.scheduled_run_time.timestamp())),
+                       EVENT_JOB_EXECUTED)
+    sched.start()
+    time.sleep(max(0.0, stop_at - time.time()))
+    sched.shutdown(wait=True)
+    results.put((worker_id, executed))
+
+
+class TestLeasedJobStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.url = f"sqlite:///{os.path.join(self.directory.name, 'jobs.sqlite')}"
+        self.schedulers = []
+
+    def tearDown(self):
+        for sched in self.schedulers:
+            if sched.running:
+                sched.shutdown(wait=False)
+        self.directory.cleanup()
+
+    def _worker(self, worker_id, **options):
+        options = dict({'lease_ttl': 30, 'heartbeat_interval': 10, 'poll_interval': 1}, **options)
+        store = LeasedJobStore(engine=sqlite_engine(self.url, SQLITE_SETTINGS), worker_id=worker_id, **options)
+        sched = BackgroundScheduler(jobstores={'default': store}, timezone='UTC')
+        sched.start(paused=True)
+        self.schedulers.append(sched)
+        return sched, store
+
+    def test_each_run_is_claimed_by_one_worker(self):
+        sched_a, store_a = self._worker('a')
+        _, store_b = self._worker('b')
+        for i in range(5):
+            sched_a.add_job(job_function, 'date', run_date=_now(), id=f'job_{i}')
+
+        now = _now()
+        due_a = {job.id for job in store_a.get_due_jobs(now)}
+        due_b = {job.id for job in store_b.get_due_jobs(now)}
+
+        self.assertEqual(due_a, {f'job_{i}' for i in range(5)})
+        self.assertEqual(due_b, set())
+        # b waits briefly for a to record the next run times instead of spinning
+        self.assertGreater(store_b.get_next_run_time(), now)
+
+    def test_max_claims_leaves_runs_to_other_workers(self):
+        sched_a, store_a = self._worker('a', max_claims=3)
+        _, store_b = self._worker('b', max_claims=3)
+        for i in range(5):
+            sched_a.add_job(job_function, 'date', run_date=_now(), id=f'job_{i}')
+
+        now = _now()
+        due_a = {job.id for job in store_a.get_due_jobs(now)}
+        due_b = {job.id for job in store_b.get_due_jobs(now)}
+
+        self.assertEqual(len(due_a), 3)
+        self.assertEqual(len(due_b), 2)
+        self.assertFalse(due_a & due_b)
+
+    def test_next_run_is_claimable_by_another_worker(self):
+        sched_a, store_a = self._worker('a')
+        _, store_b = self._worker('b')
+        job = sched_a.add_job(job_function, 'interval', seconds=1, id='job', next_run_time=_now())
+
+        now = _now()
+        self.assertEqual(len(store_a.get_due_jobs(now)), 1)
+        job._modify(next_run_time=job.next_run_time + timedelta(seconds=1))
+        store_a.update_job(job)
+        store_a.get_next_run_time()
+
+        self.assertEqual([due.id for due in store_b.get_due_jobs(now + timedelta(seconds=1))], ['job'])
+
+    def test_run_of_a_dead_worker_is_claimed_after_the_lease_expires(self):
+        sched_a, store_a = self._worker('a', lease_ttl=0.5, heartbeat_interval=0.1)
+        _, store_b = self._worker('b', lease_ttl=0.5, heartbeat_interval=0.1)
+        sched_a.add_job(job_function, 'date', run_date=_now(), id='job')
+
+        self.assertEqual(len(store_a.get_due_jobs(_now())), 1)
+        # a stops sending heartbeats before recording the run
+        store_a._stop.set()
+        store_a._heartbeat_thread.join()
+        self.assertEqual(store_b.get_due_jobs(_now()), [])
+
+        time.sleep(0.6)
+        self.assertEqual([due.id for due in store_b.get_due_jobs(_now())], ['job'])
+
+    def test_heartbeat_renews_the_lease_of_a_running_job(self):
+        sched_a, store_a = self._worker('a', lease_ttl=0.5, heartbeat_interval=0.1)
+        _, store_b = self._worker('b', lease_ttl=0.5, heartbeat_interval=0.1)
+        sched_a.add_job(job_function, 'date', run_date=_now(), id='job')
+
+        self.assertEqual(len(store_a.get_due_jobs(_now())), 1)
+        time.sleep(0.6)
+        self.assertEqual(store_b.get_due_jobs(_now()), [])
+
+    def test_workers_register_and_leave(self):
+        sched_a, store_a = self._worker('a')
+        sched_b, _ = self._worker('b')
+        self.assertEqual(store_a.live_workers(), ['a', 'b'])
+
+        sched_b.shutdown(wait=False)
+        self.assertEqual(store_a.live_workers(), ['a'])
+
+    def test_poll_interval_bounds_the_wakeup(self):
+        _, store = self._worker('a', poll_interval=0.5)
+        self.assertLessEqual(store.get_next_run_time(), _now() + timedelta(seconds=0.5))
+
+    def test_heartbeat_must_be_shorter_than_the_lease(self):
+        with self.assertRaises(ValueError):
+            LeasedJobStore(url=self.url, lease_ttl=5, heartbeat_interval=5)
+
+
+class TestMultiProcessWorkers(unittest.TestCase):
+    WORKERS = 3
+
+    def test_runs_execute_exactly_once_across_processes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            url = f"sqlite:///{os.path.join(directory, 'jobs.sqlite')}"
+            first_run = _now() + timedelta(seconds=3)
+            expected = set()
+
+            setup = BackgroundScheduler(jobstores={'default': SQLAlchemyJobStore(engine=sqlite_engine(url, SQLITE_SETTINGS))},
+                                        timezone='UTC')
+            setup.start(paused=True)
+            for i in range(40):
+                setup.add_job(job_function, 'date', run_date=first_run, id=f'once_{i}', misfire_grace_time=None)
+                expected.add((f'once_{i}', first_run.timestamp()))
+            for i in range(5):
+                setup.add_job(job_function, 'interval', seconds=0.5, start_date=first_run,
+                              end_date=first_run + timedelta(seconds=1), id=f'interval_{i}',
+                              coalesce=False, misfire_grace_time=None)
+                for n in range(3):
+                    expected.add((f'interval_{i}', (first_run + timedelta(seconds=0.5 * n)).timestamp()))
+            setup.shutdown()
+
+            context = multiprocessing.get_context('spawn')
+            results = context.Queue()
+            stop_at = first_run.timestamp() + 3
+            processes = [context.Process(target=run_worker, args=(url, f'worker_{n}', stop_at, results))
+                         for n in range(self.WORKERS)]
+            for process in processes:
+                process.start()
+            reports = dict(results.get(timeout=60) for _ in processes)
+            for process in processes:
+                process.join(timeout=10)
+
+        executed = [run for runs in reports.values() for run in runs]
+        self.assertEqual(len(executed), len(set(executed)), 'a run was executed more than once')
+        self.assertEqual(set(executed), expected)
+        self.assertGreater(sum(1 for runs in reports.values() if runs), 1, 'one worker executed every run')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,194 @@
+# Copyright 2024 Sola Richard Olorunfemi
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+from apscheduler.events import EVENT_JOB_EXECUTED, EVENT_JOB_MAX_INSTANCES, EVENT_JOB_MISSED, JobEvent
+from apscheduler.jobstores.memory import MemoryJobStore
+from apscheduler.schedulers.background import BackgroundScheduler
+
+from Scheduler.src.metrics import (Histogram, MeteredProcessPoolExecutor, MeteredThreadPoolExecutor, MetricsRegistry,
+                                   fetch_metrics, serve_metrics)
+from Scheduler.src.result_store import StoredResult, result_store
+
+
+def sleeper(seconds):
+    time.sleep(seconds)
+
+
+def sized_result(size):
+    return b'x' * size
+
+
+class TestHistogram(unittest.TestCase):
+    def test_observe_and_quantile(self):
+        histogram = Histogram((0.1, 1.0))
+        for value in (0.05, 0.5, 0.5, 5.0):
+            histogram.observe(value)
+
+        self.assertEqual(histogram.counts, [1, 2, 1])
+        self.assertEqual((histogram.count, histogram.sum), (4, 6.05))
+        self.assertEqual(histogram.quantile(0.5), 1.0)
+        self.assertEqual(histogram.quantile(1.0), float('inf'))
+        self.assertIsNone(Histogram((1.0,)).quantile(0.5))
+
+
+class TestMetricsRegistry(unittest.TestCase):
+    def setUp(self):
+        self.registry = MetricsRegistry()
+
+    def test_render_prometheus_text(self):
+        self.registry.inc('orchestr8_job_runs_total', (('job', 'a'), ('outcome', 'success')))
+        self.registry.inc('orchestr8_job_runs_total', (('job', 'a'), ('outcome', 'success')))
+        self.registry.set('orchestr8_executor_max_workers', (('executor', 'default'),), 20)
+        self.registry.observe('orchestr8_job_duration_seconds', (('job', 'a'),), 0.2)
+
+        text = self.registry.render()
+
+        self.assertIn('# TYPE orchestr8_job_runs_total counter', text)
+        self.assertIn('orchestr8_job_runs_total{job="a",outcome="success"} 2', text)
+        self.assertIn('orchestr8_executor_max_workers{executor="default"} 20', text)
+        self.assertIn('orchestr8_job_duration_seconds_bucket{job="a",le="0.1"} 0', text)
+        self.assertIn('orchestr8_job_duration_seconds_bucket{job="a",le="0.25"} 1', text)
+        self.assertIn('orchestr8_job_duration_seconds_bucket{job="a",le="+Inf"} 1', text)
+        self.assertIn('orchestr8_job_duration_seconds_count{job="a"} 1', text)
+        self.assertNotIn('orchestr8_job_missed_total', text)
+
+    def test_concurrent_writers_lose_no_samples(self):
+        def write():
+            for _ in range(5000):
+                self.registry.inc('orchestr8_job_runs_total', (('job', 'a'),))
+                self.registry.observe('orchestr8_job_duration_seconds', (('job', 'a'),), 0.01)
+
+        with patch('Scheduler.src.metrics.FOLD_THRESHOLD', 100):
+            threads = [threading.Thread(target=write) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(self.registry.value('orchestr8_job_runs_total', job='a'), 40000)
+        self.assertEqual(self.registry.histogram('orchestr8_job_duration_seconds', job='a').count, 40000)
+
+    def test_missed_and_max_instances_events_are_counted(self):
+        self.registry._on_event(JobEvent(EVENT_JOB_MISSED, 'a', 'default'))
+        self.registry._on_event(JobEvent(EVENT_JOB_MAX_INSTANCES, 'a', 'default'))
+        self.registry._on_event(JobEvent(EVENT_JOB_MAX_INSTANCES, 'a', 'default'))
+
+        self.assertEqual(self.registry.value('orchestr8_job_missed_total', job='a'), 1)
+        self.assertEqual(self.registry.value('orchestr8_job_max_instances_total', job='a'), 2)
+
+
+class TestMeteredExecutor(unittest.TestCase):
+    def setUp(self):
+        self.registry = MetricsRegistry()
+        patch('Scheduler.src.metrics.metrics', self.registry).start()
+        self.sched = BackgroundScheduler(jobstores={'default': MemoryJobStore()},
+                                         executors={'default': MeteredThreadPoolExecutor(1)}, timezone='UTC')
+        self.registry.attach(self.sched)
+        self.done = threading.Event()
+        self.finished = []
+
+        def listener(event):
+            self.finished.append(event.job_id)
+            if len(self.finished) >= self.expected:
+                self.done.set()
+
+        self.sched.add_listener(listener, EVENT_JOB_EXECUTED)
+
+    def tearDown(self):
+        self.sched.shutdown(wait=True)
+        patch.stopall()
+
+    def test_records_start_lag_duration_and_queue_depth(self):
+        self.expected = 3
+        self.sched.start(paused=True)
+        for name in ('a', 'b', 'c'):
+            self.sched.add_job(sleeper, args=[0.1], id=name, misfire_grace_time=None)
+        self.sched.resume()
+        self.assertTrue(self.done.wait(10))
+
+        durations = self.registry.histogram('orchestr8_job_duration_seconds', job='c')
+        self.assertEqual(durations.count, 1)
+        self.assertGreaterEqual(durations.sum, 0.1)
+        # c waited for a and b on the single worker
+        self.assertGreaterEqual(self.registry.histogram('orchestr8_job_start_lag_seconds', job='c').sum, 0.19)
+        depth = self.registry.histogram('orchestr8_executor_queue_depth', executor='default')
+        self.assertEqual((depth.count, depth.sum), (3, 3))
+        self.assertEqual(self.registry.value('orchestr8_executor_max_workers', executor='default'), 1)
+        self.assertEqual(self.registry.value('orchestr8_job_runs_total', job='c', outcome='success'), 1)
+
+    def test_counts_coalesced_runs(self):
+        self.expected = 1
+        self.sched.start()
+        start = datetime.now(timezone.utc) - timedelta(seconds=5.5)
+        self.sched.add_job(sleeper, 'interval', seconds=1, args=[0], id='a', next_run_time=start,
+                           coalesce=True, misfire_grace_time=None)
+        self.assertTrue(self.done.wait(10))
+
+        self.assertEqual(self.registry.value('orchestr8_job_coalesced_total', job='a'), 5)
+
+
+class TestMeteredProcessPoolExecutor(unittest.TestCase):
+    def test_large_results_are_shared_by_the_worker(self):
+        events = {}
+        done = threading.Event()
+
+        def listener(event):
+            events[event.job_id] = event
+            if len(events) == 2:
+                done.set()
+
+        sched = BackgroundScheduler(jobstores={'default': MemoryJobStore()},
+                                    executors={'default': MeteredProcessPoolExecutor(1)}, timezone='UTC')
+        sched.add_listener(listener, EVENT_JOB_EXECUTED)
+        sched.start()
+        size = result_store.shared_min_bytes
+        try:
+            sched.add_job(sized_result, args=[size], id='process_pool_large')
+            sched.add_job(sized_result, args=[4], id='process_pool_small')
+            self.assertTrue(done.wait(30))
+
+            self.assertEqual(events['process_pool_large'].retval, StoredResult('process_pool_large'))
+            self.assertEqual(len(result_store.get('process_pool_large')), size)
+            self.assertEqual(events['process_pool_small'].retval, b'xxxx')
+        finally:
+            sched.shutdown(wait=True)
+            result_store.remove('process_pool_large')
+
+
+class TestMetricsEndpoint(unittest.TestCase):
+    def test_serves_and_filters_metrics(self):
+        registry = MetricsRegistry()
+        registry.inc('orchestr8_job_runs_total', (('job', 'a'), ('outcome', 'success')))
+        registry.inc('orchestr8_job_runs_total', (('job', 'b'), ('outcome', 'error')))
+        with patch('Scheduler.src.metrics.metrics', registry):
+            server = serve_metrics('127.0.0.1', 0)
+            try:
+                port = server.server_address[1]
+                text = fetch_metrics(host='127.0.0.1', port=port)
+                only_a = fetch_metrics('a', host='127.0.0.1', port=port)
+            finally:
+                server.shutdown()
+                server.server_close()
+
+        self.assertIn('orchestr8_job_runs_total{job="b",outcome="error"} 1', text)
+        self.assertEqual(only_a, 'orchestr8_job_runs_total{job="a",outcome="success"} 1\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -15,6 +15,7 @@ import unittest
 from typing import List, Dict, Any, Union
 import ast
 from Scheduler.src.create_task import parse_command
+from Scheduler.src.result_store import ResultRef
 
 
 # Redefine the private function _separate_args_kwargs
@@ -144,11 +145,14 @@ class TestParseCommand(unittest.TestCase):
         action, task_name, params = parse_command(command)
         expected_params = {
             'server': '1',
+            'executor': None,
             'schedule': "'10 MINUTE'",
             'cron_expr': None,
             'time_zone': 'UTC',
             'allow_overlapping_execution': True,
             'after': 'some_task',
+            'cache': None,
+            'probe': None,
             'function': 'my_function',
             'args': ['arg1'],
             'kwargs': {'arg2': 2}
@@ -171,11 +175,14 @@ class TestParseCommand(unittest.TestCase):
         action, task_name, params = parse_command(command)
         expected_params = {
             'server': '1',
+            'executor': None,
             'schedule': None,
             'cron_expr': '0 12 * * *',
             'time_zone': 'UTC',
             'allow_overlapping_execution': None,
             'after': None,
+            'cache': None,
+            'probe': None,
             'function': 'my_function',
             'args': [],
             'kwargs': {'arg1': 'value'}
@@ -188,6 +195,12 @@ class TestParseCommand(unittest.TestCase):
         self.assertEqual(params['args'], expected_args)
         self.assertEqual(params['kwargs'], expected_kwargs)
 
+    def test_result_arguments(self):
+        command = "CREATE TASK divide SERVER = 1 AFTER plus AS divides(RESULT(plus), 6, rest=RESULT(minus))"
+        action, task_name, params = parse_command(command)
+        self.assertEqual(params['args'], [ResultRef('plus'), 6])
+        self.assertEqual(params['kwargs'], {'rest': ResultRef('minus')})
+
     def test_invalid_command(self):
         command = "INVALID COMMAND"
         with self.assertRaises(ValueError):
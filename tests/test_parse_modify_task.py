@@ -47,6 +47,7 @@ class TestModifyCommand(unittest.TestCase):
         expected = {
             'task_name': 'my_task',
             'server': 'my_server',
+            'executor': None,
             'schedule': "'5 MINUTE'",
             'cron_expr': None,
             'time_zone': 'UTC',
@@ -61,6 +62,7 @@ class TestModifyCommand(unittest.TestCase):
         expected = {
             'task_name': 'my_task',
             'server': None,
+            'executor': None,
             'schedule': None,
             'cron_expr': '0 0 * * *',
             'time_zone': 'UTC',
@@ -75,6 +77,7 @@ class TestModifyCommand(unittest.TestCase):
         expected = {
             'task_name': 'my_task',
             'server': 'my_server',
+            'executor': None,
             'schedule': None,
             'cron_expr': None,
             'time_zone': 'UTC',
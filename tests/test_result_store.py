@@ -0,0 +1,177 @@
+# Copyright 2024 Sola Richard Olorunfemi
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import pickle
+import tempfile
+import time
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+from unittest.mock import patch
+
+from Scheduler.src.result_store import (ResultRef, ResultStore, StoredResult, result_ref, result_refs,
+                                        run_with_results)
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def _read_result(directory, task):
+    value = ResultStore(directory, shared_min_bytes=1024).get(task)
+    return type(value).__name__, len(value), bytes(value[:4])
+
+
+class TestResultRef(unittest.TestCase):
+    def test_result_ref_parses_result_calls_only(self):
+        self.assertEqual(result_ref('RESULT(plus)'), ResultRef('plus'))
+        self.assertEqual(result_ref(' result( plus_2 ) '), ResultRef('plus_2'))
+        self.assertEqual(result_ref('RESULTS(plus)'), 'RESULTS(plus)')
+        self.assertEqual(result_ref(6), 6)
+
+    def test_result_refs_lists_referenced_tasks(self):
+        self.assertEqual(result_refs([ResultRef('a'), 1], {'x': ResultRef('b'), 'y': 2}), ['a', 'b'])
+
+    def test_refs_pickle_by_value(self):
+        self.assertEqual(pickle.loads(pickle.dumps(ResultRef('plus'))), ResultRef('plus'))
+        self.assertIsInstance(pickle.loads(pickle.dumps(StoredResult('plus'))), StoredResult)
+
+
+class TestResultStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = ResultStore(self.directory.name, shared_min_bytes=1024)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_small_values_round_trip(self):
+        self.store.put('plus', {'sum': 3})
+        self.store.put('none', None)
+
+        self.assertEqual(self.store.get('plus'), {'sum': 3})
+        self.assertIsNone(self.store.get('none'))
+
+    def test_new_result_replaces_previous(self):
+        self.store.put('plus', 1)
+        self.store.put('plus', 2)
+
+        self.assertEqual(self.store.get('plus'), 2)
+        self.assertEqual(os.listdir(self.directory.name), ['plus.result'])
+
+    def test_large_buffers_are_memory_mapped(self):
+        payload = os.urandom(4096)
+        self.store.put('raw', payload)
+        self.store.put('buffer', bytearray(payload))
+        self.store.put('view', memoryview(payload))
+
+        self.assertEqual(self.store.get('raw'), payload)
+        self.assertIsInstance(self.store.get('buffer'), bytearray)
+        view = self.store.get('view')
+        self.assertEqual(view.tobytes(), payload)
+        self.assertTrue(view.readonly)
+
+    def test_mapping_survives_replacement(self):
+        self.store.put('view', memoryview(b'a' * 2048))
+        view = self.store.get('view')
+        self.store.put('view', memoryview(b'b' * 2048))
+
+        self.assertEqual(view.tobytes(), b'a' * 2048)
+        self.assertEqual(self.store.get('view').tobytes(), b'b' * 2048)
+
+    @unittest.skipIf(numpy is None, 'numpy is not installed')
+    def test_numpy_arrays_are_zero_copy_views(self):
+        array = numpy.arange(1024, dtype=numpy.float64).reshape(32, 32)
+        self.store.put('array', array)
+        self.store.put('strided', array[:, ::2])
+
+        loaded = self.store.get('array')
+        self.assertEqual(loaded.shape, (32, 32))
+        self.assertTrue(numpy.array_equal(loaded, array))
+        self.assertFalse(loaded.flags.writeable)
+        self.assertTrue(numpy.array_equal(self.store.get('strided'), array[:, ::2]))
+
+    def test_missing_result_raises_lookup_error(self):
+        with self.assertRaises(LookupError):
+            self.store.get('plus')
+
+    def test_expired_result_raises_lookup_error(self):
+        self.store.put('plus', 3)
+        self.store.max_age = 60
+        past = time.time() - 120
+        os.utime(os.path.join(self.directory.name, 'plus.result'), (past, past))
+
+        with self.assertRaises(LookupError):
+            self.store.get('plus')
+
+    def test_eviction_drops_expired_and_oldest_results(self):
+        for number, task in enumerate(['old', 'older', 'recent']):
+            self.store.put(task, b'x' * 2048)
+            stamp = time.time() - 100 + number * 10
+            os.utime(os.path.join(self.directory.name, task + '.result'), (stamp, stamp))
+        self.store.max_bytes = 3 * 4096 + 2048
+        self.store.max_age = 95
+
+        self.store.put('latest', b'y' * 2048)
+
+        self.assertEqual(sorted(os.listdir(self.directory.name)), ['latest.result', 'recent.result'])
+
+    def test_puts_keep_a_running_total_instead_of_listing_the_directory(self):
+        with patch('Scheduler.src.result_store.os.scandir', wraps=os.scandir) as scandir:
+            for number in range(20):
+                self.store.put(f'task_{number}', number)
+            self.store.remove('task_0')
+            self.store.put('task_1', b'x' * 2048)
+
+        self.assertEqual(scandir.call_count, 1)
+        self.assertEqual(self.store._total, sum(os.path.getsize(os.path.join(self.directory.name, name))
+                                                for name in os.listdir(self.directory.name)))
+
+    def test_results_stored_by_workers_are_counted(self):
+        self.store.put('old', b'x' * 2048)
+        worker = ResultStore(self.directory.name, shared_min_bytes=1024)
+        self.store.max_bytes = 4096 + 2048 + 1
+
+        self.store.put('new', worker.share('new', b'y' * 2048))
+
+        self.assertEqual(os.listdir(self.directory.name), ['new.result'])
+
+    def test_share_stores_large_values_only(self):
+        self.assertEqual(self.store.share('small', 3), 3)
+        self.assertEqual(self.store.share('large', b'x' * 2048), StoredResult('large'))
+        self.assertEqual(self.store.get('large'), b'x' * 2048)
+
+        self.store.put('large', StoredResult('large'))
+        self.assertEqual(self.store.get('large'), b'x' * 2048)
+
+    def test_run_with_results_resolves_references(self):
+        self.store.put('plus', 3)
+        self.store.put('minus', 1)
+
+        with patch('Scheduler.src.result_store.result_store', self.store):
+            result = run_with_results(lambda a, b, c=0: (a, b, c), ResultRef('plus'), 6, c=ResultRef('minus'))
+
+        self.assertEqual(result, (3, 6, 1))
+
+    def test_other_processes_read_shared_results(self):
+        self.store.put('raw', b'ab' * 4096)
+
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            kind, size, head = pool.submit(_read_result, self.directory.name, 'raw').result()
+
+        self.assertEqual((kind, size, head), ('bytes', 8192, b'abab'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+# Copyright 2024 Sola Richard Olorunfemi
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sqlite3
+import unittest
+from Job.sampled_validation import plan_sampled, sample_source, split_sampled, wilson_interval
+
+
+def config_with(sample):
+    return [{'target_tables': ['items'], 'tests': [
+        {'type': 'row_count'},
+        {'type': 'null_check', 'column': 'name', 'sample': sample},
+        {'type': 'data_range_check', 'column': 'created', 'start_date': '2024-01-01', 'end_date': '2024-12-31',
+         'sample': sample},
+    ]}]
+
+
+class TestSampledValidation(unittest.TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:')
+        self.conn.execute("CREATE TABLE items (id INTEGER, name TEXT, created TEXT)")
+        # One row in ten has no name; every date is in range
+        self.conn.executemany("INSERT INTO items VALUES (?, ?, '2024-06-01')",
+                              [(i, None if i % 10 == 0 else 'x') for i in range(10000)])
+
+    def tearDown(self):
+        self.conn.close()
+
+    def run_sampled(self, sample):
+        _, sampled = split_sampled(config_with(sample))
+        results = []
+        for query, finish in plan_sampled(sampled, 'sqlite'):
+            results.extend(finish(self.conn.execute(query.sql).fetchall()))
+        return results
+
+    def test_split_keeps_unsampled_checks_exact(self):
+        exact, sampled = split_sampled(config_with({'rows': 10}))
+        self.assertEqual([test['type'] for test in exact[0]['tests']], ['row_count'])
+        self.assertEqual([test['type'] for test in sampled[0]['tests']], ['null_check', 'data_range_check'])
+        self.assertEqual(split_sampled([{'target_tables': ['items'], 'tests': [{'type': 'row_count'}]}])[1], [])
+
+    def test_fraction_sample_is_reproducible_and_estimates_the_rate(self):
+        sample = {'fraction': 0.1, 'seed': 7}
+        _, sampled = split_sampled(config_with(sample))
+        plan = plan_sampled(sampled, 'sqlite')
+        self.assertEqual(len(plan), 1)  # both checks count the same sample in one scan
+        results = self.run_sampled(sample)
+        self.assertEqual(results, self.run_sampled(sample))
+
+        (null_type, _, null_error, null_estimate), (range_type, _, range_error, range_estimate) = results
+        self.assertEqual((null_type, null_error, range_type, range_error), ('null_check', True, 'data_range_check', False))
+        self.assertTrue(500 < null_estimate.sampled < 1500)
+        self.assertTrue(null_estimate.low < 0.1 < null_estimate.high)
+        self.assertEqual(range_estimate.failing, 0)
+        self.assertAlmostEqual(range_estimate.low, 0.0)
+        self.assertIn('sampled rows failing', str(null_estimate))
+        self.assertNotEqual(results, self.run_sampled({'fraction': 0.1, 'seed': 8}))
+
+    def test_rows_sample_has_a_fixed_size(self):
+        estimate = self.run_sampled({'rows': 250, 'seed': 1})[0][3]
+        self.assertEqual(estimate.sampled, 250)
+
+    def test_sqlite_sample_reads_only_the_sampled_rows(self):
+        source = sample_source('items', {'fraction': 0.01, 'seed': 3}, 'sqlite')
+        plan = [row[3] for row in self.conn.execute(f"EXPLAIN QUERY PLAN SELECT COUNT(*) FROM {source} AS s")]
+        self.assertIn('SEARCH items USING INTEGER PRIMARY KEY (rowid=?)', plan)
+        self.assertNotIn('SCAN items', plan)
+
+        self.conn.execute("CREATE TABLE few (id INTEGER)")
+        few = sample_source('few', {'rows': 5}, 'sqlite')
+        self.assertEqual(self.conn.execute(f"SELECT * FROM {few} AS s").fetchall(), [])
+        self.conn.executemany("INSERT INTO few VALUES (?)", [(1,), (2,), (3,)])
+        self.assertEqual(self.conn.execute(f"SELECT id FROM {few} AS s").fetchall(), [(1,), (2,), (3,)])
+
+    def test_wilson_interval(self):
+        low, high = wilson_interval(0, 100)
+        self.assertAlmostEqual(low, 0.0)
+        self.assertAlmostEqual(high, 0.037, places=3)
+        low, high = wilson_interval(10, 100, confidence=0.99)
+        self.assertTrue(low < 0.1 < high)
+        self.assertEqual(wilson_interval(0, 0), (0.0, 1.0))
+
+    def test_snowflake_sampling_sql(self):
+        self.assertEqual(sample_source('db.s.items', {'fraction': 0.015, 'seed': 3}, 'snowflake'),
+                         "(SELECT * FROM db.s.items SAMPLE BERNOULLI (1.5) SEED (3))")
+        self.assertEqual(sample_source('items', {'rows': 1000}, 'Snowflake'), "(SELECT * FROM items SAMPLE (1000 ROWS))")
+
+    def test_invalid_samples(self):
+        for sample in ({}, {'fraction': 0.1, 'rows': 10}, {'fraction': 0}, {'rows': 0}):
+            with self.assertRaises(ValueError):
+                sample_source('items', sample, 'sqlite')
+        with self.assertRaises(ValueError):
+            sample_source('items', {'rows': 10}, 'oracle')
+
+
+if __name__ == '__main__':
+    unittest.main()
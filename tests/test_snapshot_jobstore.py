@@ -0,0 +1,118 @@
+# Copyright 2024 Sola Richard Olorunfemi
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+from apscheduler.schedulers.background import BackgroundScheduler
+from sqlalchemy import func, select
+from Scheduler.src.snapshot_jobstore import SnapshotJobStore
+
+
+def job_function(*args):
+    pass
+
+
+class TestSnapshotJobStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.url = f"sqlite:///{os.path.join(self.directory.name, 'jobs.sqlite')}"
+        self.schedulers = []
+
+    def tearDown(self):
+        for sched in self.schedulers:
+            if sched.running:
+                sched.shutdown(wait=False)
+        self.directory.cleanup()
+
+    def _scheduler(self, store):
+        sched = BackgroundScheduler(jobstores={'default': store}, timezone='UTC')
+        sched.start(paused=True)
+        self.schedulers.append(sched)
+        return sched
+
+    def _snapshot_ids(self, store):
+        with store.engine.connect() as connection:
+            return {row.id for row in connection.execute(select(store.snapshot_t.c.id))}
+
+    def test_writes_stay_in_memory_until_flushed(self):
+        store = SnapshotJobStore(url=self.url, flush_interval=3600)
+        sched = self._scheduler(store)
+        sched.add_job(job_function, 'interval', seconds=1, id='job')
+        sched.modify_job('job', args=[1])
+        self.assertEqual(self._snapshot_ids(store), set())
+
+        self.assertEqual(store.flush(), 1)
+        self.assertEqual(self._snapshot_ids(store), {'job'})
+        self.assertEqual(store.flush(), 0)
+
+        sched.remove_job('job')
+        store.flush()
+        self.assertEqual(self._snapshot_ids(store), set())
+
+    def test_shutdown_flushes_and_start_recovers(self):
+        sched = self._scheduler(SnapshotJobStore(url=self.url, flush_interval=3600))
+        sched.add_job(job_function, 'interval', seconds=1, id='job', args=[1])
+        sched.shutdown(wait=False)
+
+        sched = self._scheduler(SnapshotJobStore(url=self.url, flush_interval=3600))
+        job = sched.get_job('job')
+        self.assertEqual(job.args, (1,))
+        self.assertIsNotNone(job.next_run_time)
+
+    def test_crash_keeps_the_last_snapshot(self):
+        store = SnapshotJobStore(url=self.url, flush_interval=3600)
+        sched = self._scheduler(store)
+        sched.add_job(job_function, 'interval', seconds=1, id='flushed')
+        store.flush()
+        sched.add_job(job_function, 'interval', seconds=1, id='lost')
+
+        # A second process starting from the file only sees what was flushed
+        recovered = self._scheduler(SnapshotJobStore(url=self.url, flush_interval=3600))
+        self.assertEqual([job.id for job in recovered.get_jobs()], ['flushed'])
+
+    def test_failed_flush_is_retried(self):
+        store = SnapshotJobStore(url=self.url, flush_interval=3600)
+        sched = self._scheduler(store)
+        sched.add_job(job_function, 'interval', seconds=1, id='job')
+
+        with patch.object(store.engine, 'begin', side_effect=RuntimeError('database is locked')):
+            with self.assertRaises(RuntimeError):
+                store.flush()
+        self.assertEqual(store.flush(), 1)
+        self.assertEqual(self._snapshot_ids(store), {'job'})
+
+    def test_snapshot_is_readable_by_the_sqlalchemy_store(self):
+        store = SnapshotJobStore(url=self.url, flush_interval=3600)
+        sched = self._scheduler(store)
+        sched.add_job(job_function, 'interval', seconds=1, id='job')
+        store.flush()
+
+        plain = SQLAlchemyJobStore(url=self.url)
+        with plain.engine.connect() as connection:
+            self.assertEqual(connection.execute(select(func.count()).select_from(plain.jobs_t)).scalar(), 1)
+
+    def test_background_flush(self):
+        store = SnapshotJobStore(url=self.url, flush_interval=0.05)
+        sched = self._scheduler(store)
+        sched.add_job(job_function, 'interval', seconds=1, id='job')
+        with patch.object(store, 'flush', wraps=store.flush) as flush:
+            store._stop.wait(0.3)
+        self.assertTrue(flush.called)
+        self.assertEqual(self._snapshot_ids(store), {'job'})
+
+
+if __name__ == '__main__':
+    unittest.main()
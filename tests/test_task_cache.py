@@ -0,0 +1,123 @@
+# Copyright 2024 Sola Richard Olorunfemi
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+from Scheduler.src.result_store import ResultRef, ResultStore
+from Scheduler.src.task_cache import CachePolicy, TaskCache, run_cached
+
+
+class TestTaskCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = TaskCache(f"sqlite:///{os.path.join(self.directory.name, 'cache.sqlite')}", max_bytes=4096)
+
+    def tearDown(self):
+        self.cache.engine.dispose()
+        self.directory.cleanup()
+
+    def test_put_and_get(self):
+        self.assertEqual(self.cache.get('k'), (False, None))
+        self.assertTrue(self.cache.put('k', 'plus', 60, {'sum': 3}))
+        self.assertEqual(self.cache.get('k'), (True, {'sum': 3}))
+
+    def test_none_results_are_cached(self):
+        self.cache.put('k', 'plus', 60, None)
+        self.assertEqual(self.cache.get('k'), (True, None))
+
+    def test_expired_entries_are_misses(self):
+        self.cache.put('k', 'plus', 0.01, 3)
+        time.sleep(0.02)
+        self.assertEqual(self.cache.get('k'), (False, None))
+
+    def test_least_recently_used_entries_are_evicted(self):
+        for key in ('a', 'b', 'c'):
+            self.cache.put(key, 'plus', 60, b'x' * 1200)
+        self.cache.get('a')
+
+        self.cache.put('d', 'plus', 60, b'x' * 1200)
+
+        self.assertTrue(self.cache.get('a')[0])
+        self.assertFalse(self.cache.get('b')[0])
+        self.assertTrue(self.cache.get('d')[0])
+
+    def test_oversized_and_unpicklable_results_are_not_cached(self):
+        self.assertFalse(self.cache.put('big', 'plus', 60, b'x' * 8192))
+        self.assertFalse(self.cache.put('lambda', 'plus', 60, lambda: None))
+
+    def test_clear_by_function(self):
+        self.cache.put('a', 'plus', 60, 1)
+        self.cache.put('b', 'minus', 60, 2)
+        self.cache.clear('plus')
+        self.assertEqual((self.cache.get('a')[0], self.cache.get('b')[0]), (False, True))
+
+
+class TestRunCached(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = TaskCache(f"sqlite:///{os.path.join(self.directory.name, 'cache.sqlite')}")
+        self.store = ResultStore(os.path.join(self.directory.name, 'results'))
+        patch('Scheduler.src.task_cache.task_cache', self.cache).start()
+        patch('Scheduler.src.result_store.result_store', self.store).start()
+        self.calls = []
+        self.watermark = '2024-01-01'
+
+    def tearDown(self):
+        patch.stopall()
+        self.cache.engine.dispose()
+        self.directory.cleanup()
+
+    def add(self, a, b):
+        self.calls.append((a, b))
+        return a + b
+
+    def probe(self, table):
+        return (table, self.watermark)
+
+    def test_same_arguments_reuse_the_result(self):
+        policy = CachePolicy('plus', 60)
+
+        self.assertEqual(run_cached(policy, self.add, 1, 2), 3)
+        self.assertEqual(run_cached(policy, self.add, 1, 2), 3)
+        self.assertEqual(run_cached(policy, self.add, 2, b=2), 4)
+
+        self.assertEqual(self.calls, [(1, 2), (2, 2)])
+
+    def test_probe_change_invalidates(self):
+        policy = CachePolicy('plus', 60, self.probe, ('sales',))
+
+        run_cached(policy, self.add, 1, 2)
+        run_cached(policy, self.add, 1, 2)
+        self.watermark = '2024-01-02'
+        run_cached(policy, self.add, 1, 2)
+
+        self.assertEqual(len(self.calls), 2)
+
+    def test_keys_on_resolved_results(self):
+        policy = CachePolicy('plus', 60)
+
+        self.store.put('upstream', 1)
+        run_cached(policy, self.add, ResultRef('upstream'), 2)
+        run_cached(policy, self.add, ResultRef('upstream'), 2)
+        self.store.put('upstream', 5)
+        self.assertEqual(run_cached(policy, self.add, ResultRef('upstream'), 2), 7)
+
+        self.assertEqual(self.calls, [(1, 2), (5, 2)])
+
+
+if __name__ == '__main__':
+    unittest.main()
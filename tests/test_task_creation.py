@@ -11,14 +11,31 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import json
 import logging
+import os
+import subprocess
+import sys
+import tempfile
 import unittest
 from unittest.mock import patch, MagicMock, call
+from sqlalchemy import event
+from apscheduler.executors.asyncio import AsyncIOExecutor
+from apscheduler.jobstores.memory import MemoryJobStore
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
 from apscheduler.triggers.interval import IntervalTrigger
 from Scheduler.src.module_registry import get_function, register_function
-from Scheduler.src.create_task import event_listener, add_task, execute_command, task_conditions
-from Scheduler.src.job_scheduler import scheduler
+from Scheduler.src.create_task import event_listener, add_task, apply_commands, execute_command
+from Scheduler.src.dependency_store import DependencyStore
+from Scheduler.src.task_graph import TaskGraph
+from Scheduler.src.job_index import JobIndex
+from Scheduler.src import create_task
+from Scheduler.src.job_scheduler import add_jobs, get_scheduler, scheduler, shutdown_scheduler
+from Scheduler.src.result_store import ResultRef, ResultStore
+from Scheduler.src.task_cache import CachePolicy, TaskCache, run_cached
+from Scheduler.src.warm_pool import WarmProcessPoolExecutor
 
 # Setup logging
 logging.basicConfig(level=logging.DEBUG)
@@ -30,10 +47,52 @@ def test_function():
     assert True
 
 
+async def async_test_function():
+    assert True
+
+
+def divide_function(a, b):
+    return a / b
+
+
+class Divider:
+    def divide(self, a, b):
+        return a / b
+
+
+divide_calls = []
+
+
+def counted_divide(a, b):
+    divide_calls.append((a, b))
+    return a / b
+
+
+def watermark(table):
+    return 1
+
+
+def _job(job_id, next_run_time=None):
+    return MagicMock(id=job_id, func_ref='tests:job', args=(), kwargs={}, trigger=None,
+                     max_instances=1, next_run_time=next_run_time)
+
+
+def _index(*jobs):
+    """A JobIndex over a stub scheduler holding `jobs` in a process-local jobstore."""
+    stub = MagicMock()
+    stub.get_jobs.return_value = list(jobs)
+    stub._lookup_jobstore.return_value = MemoryJobStore()
+    return JobIndex(stub)
+
+
 class TestTaskScheduler(unittest.TestCase):
     def setUp(self):
         # Register the test function
         register_function('test_function', test_function)
+        patch('Scheduler.src.create_task.job_index', _index()).start()
+
+    def tearDown(self):
+        patch.stopall()
 
     @patch('Scheduler.src.create_task.logger')  # Mock the loger
     def test_event_listener_success(self, mock_logger):
@@ -55,6 +114,23 @@ class TestTaskScheduler(unittest.TestCase):
 
         mock_logger.error.assert_called_with('Job test_task failed')
 
+    @patch('Scheduler.src.job_scheduler.get_scheduler_start_paused', return_value=True)
+    @patch('Scheduler.src.job_scheduler._build_scheduler', side_effect=BackgroundScheduler)
+    @patch('Scheduler.src.create_task.task_graph', TaskGraph())
+    @patch('Scheduler.src.create_task.sched', None)
+    def test_scheduler_is_rewired_after_shutdown(self, mock_build, mock_paused):
+        first = create_task._scheduler()
+        self.assertIs(create_task._scheduler(), first)
+
+        shutdown_scheduler(wait=False)
+        second = create_task._scheduler()
+
+        self.assertIsNot(second, first)
+        self.assertTrue(second.running)
+        self.assertIs(get_scheduler(), second)
+        shutdown_scheduler(wait=False)
+        self.assertIsNone(create_task.sched)
+
     @patch('Scheduler.src.create_task.sched')  # Mock the scheduler
     @patch('Scheduler.src.module_registry.get_function')  # Mock the get_function
     @patch('Scheduler.src.create_task.logger')
@@ -151,15 +227,16 @@ class TestTaskScheduler(unittest.TestCase):
         })
         mock_logger.error.assert_not_called()
 
+    @patch('Scheduler.src.create_task.task_graph', new_callable=TaskGraph)
     @patch('Scheduler.src.module_registry.get_function')
     @patch('Scheduler.src.create_task.sched')
     @patch('Scheduler.src.create_task.logger')
-    def test_add_task_with_after(self, mock_logger, mock_sched, mock_get_function):
+    def test_add_task_with_after(self, mock_logger, mock_sched, mock_get_function, mock_task_graph):
 
         mock_get_function.return_value = test_function
 
-        # Mock the scheduler's `get_job` method to return a mock job if 'existing_task' is queried
-        mock_sched.get_job.side_effect = lambda job_id: MagicMock() if job_id == 'my_test_task' else None
+        # Only 'my_test_task' exists
+        patch('Scheduler.src.create_task.job_index', _index(_job('my_test_task'))).start()
         mock_sched.add_job = MagicMock()
 
         params = {
@@ -174,8 +251,8 @@ class TestTaskScheduler(unittest.TestCase):
         add_task('test_task', params)
 
         # Assert
-        self.assertIn('test_task', task_conditions)
-        self.assertEqual(task_conditions['test_task']['after'], ['my_test_task'])
+        self.assertIn('test_task', mock_task_graph)
+        self.assertEqual(mock_task_graph.upstream('test_task'), {'my_test_task'})
 
         mock_sched.add_job.assert_called_with(
             mock_get_function.return_value,
@@ -184,7 +261,9 @@ class TestTaskScheduler(unittest.TestCase):
             replace_existing=True,
             args=[],
             kwargs={},
-            max_instances=1
+            max_instances=1,
+            executor='default',
+            name='test_function'
         )
 
         # mock_sched.pause_job.assert_called_with('test_task')
@@ -196,7 +275,92 @@ class TestTaskScheduler(unittest.TestCase):
 
         # Assert that the job was added
         mock_sched.add_job.assert_called()
-        mock_sched.add_job.assert_called_with(test_function, trigger=None, id='test_task', replace_existing=True, args=[], kwargs={}, max_instances=1)
+        mock_sched.add_job.assert_called_with(test_function, trigger=None, id='test_task', replace_existing=True, args=[], kwargs={}, max_instances=1, executor='default', name='test_function')
+
+    @patch('Scheduler.src.create_task.task_graph', new_callable=TaskGraph)
+    @patch('Scheduler.src.create_task.sched')
+    def test_event_listener_releases_only_ready_successors(self, mock_sched, mock_task_graph):
+        mock_task_graph.add_task('divides_task', ['plus', 'minus'])
+        mock_task_graph.add_task('unrelated_task', ['other'])
+        patch('Scheduler.src.create_task.job_index', _index(_job('divides_task'), _job('unrelated_task'))).start()
+
+        event = MagicMock(exception=None, job_id='plus')
+        event_listener(event)
+        mock_sched.modify_job.assert_not_called()
+
+        event.job_id = 'minus'
+        event_listener(event)
+        mock_sched.get_job.assert_not_called()
+        self.assertEqual(mock_sched.modify_job.call_args[0], ('divides_task',))
+
+    @patch('Scheduler.src.create_task.sched')
+    @patch('Scheduler.src.create_task.logger')
+    def test_add_task_skips_unchanged_definition(self, mock_logger, mock_sched):
+        mock_sched.add_job.side_effect = lambda func, **options: MagicMock(
+            func_ref=None, func=func, next_run_time=None, **options)
+        params = {
+            'function': 'test_function',
+            'args': [1],
+            'kwargs': {},
+            'server': '1',
+            'schedule': "'1 MINUTE'",
+            'time_zone': 'UTC'
+        }
+
+        add_task('test_task', params)
+        add_task('test_task', dict(params))
+        self.assertEqual(mock_sched.add_job.call_count, 1)
+        mock_logger.info.assert_called_with("Job test_task already exists, skipping addition.")
+
+        add_task('test_task', dict(params, args=[2]))
+        self.assertEqual(mock_sched.add_job.call_count, 2)
+        self.assertEqual(mock_sched.add_job.call_args[1]['args'], [2])
+        mock_sched.get_job.assert_not_called()
+
+    @patch('Scheduler.src.create_task.sched')
+    def test_add_task_on_named_executor(self, mock_sched):
+        mock_sched._lookup_executor.side_effect = lambda name: {'processpool': MagicMock()}[name]
+        params = {
+            'function': 'test_function',
+            'args': [],
+            'kwargs': {},
+            'server': '1',
+            'executor': 'processpool',
+            'schedule': "'1 MINUTE'",
+            'time_zone': 'UTC'
+        }
+
+        add_task('cpu_task', params)
+        self.assertEqual(mock_sched.add_job.call_args[1]['executor'], 'processpool')
+
+        with self.assertRaises(ValueError):
+            add_task('other_task', dict(params, executor='gpu'))
+
+    @patch('Scheduler.src.create_task.sched')
+    def test_add_async_task_routes_to_asyncio_executor(self, mock_sched):
+        register_function('async_test_function', async_test_function)
+        executors = {'default': MagicMock(), 'asyncio': AsyncIOExecutor()}
+        mock_sched._executors = executors
+        mock_sched._lookup_executor.side_effect = lambda name: executors[name]
+        params = {
+            'function': 'async_test_function',
+            'args': [],
+            'kwargs': {},
+            'server': '1',
+            'executor': None,
+            'schedule': "'1 MINUTE'",
+            'time_zone': 'UTC'
+        }
+
+        add_task('io_task', params)
+        self.assertEqual(mock_sched.add_job.call_args[1]['executor'], 'asyncio')
+
+        with self.assertRaises(ValueError):
+            add_task('pinned_task', dict(params, executor='default'))
+
+        del executors['asyncio']
+        with self.assertRaises(ValueError):
+            add_task('other_task', params)
 
     @patch('Scheduler.src.create_task.logger')
     def test_execute_command_unknown_action(self, mock_logger):
@@ -207,5 +371,282 @@ class TestTaskScheduler(unittest.TestCase):
         mock_logger.error.assert_called_with("Error: Invalid command format")
 
 
+# Applies the script in argv[2] to the SQLite jobstore at argv[1] and prints the summary
+APPLY_IN_NEW_PROCESS = """
+import json, sys
+from unittest.mock import patch
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+from apscheduler.schedulers.background import BackgroundScheduler
+from Scheduler.src.create_task import apply_commands
+from Scheduler.src.dependency_store import DependencyStore
+from Scheduler.src.job_index import JobIndex
+from Scheduler.src.module_registry import register_function
+from Scheduler.src.task_graph import TaskGraph
+from tests.test_task_creation import Divider, divide_function, test_function
+
+register_function('test_function', test_function)
+register_function('divide_function', divide_function)
+# A bound method is stored with its instance, so each process loads a new object
+register_function('divide_method', Divider().divide)
+store = SQLAlchemyJobStore(url=sys.argv[1])
+sched = BackgroundScheduler(jobstores={'default': store})
+sched.start(paused=True)
+with patch('Scheduler.src.create_task.sched', sched), \\
+        patch('Scheduler.src.create_task.task_graph', TaskGraph(DependencyStore(store.engine))), \\
+        patch('Scheduler.src.create_task.job_index', JobIndex(sched)):
+    print(json.dumps(apply_commands(json.loads(sys.argv[2]))))
+sched.shutdown(wait=False)
+"""
+
+
+class TestApplyCommands(unittest.TestCase):
+    def setUp(self):
+        register_function('test_function', test_function)
+        self.directory = tempfile.TemporaryDirectory()
+        url = f"sqlite:///{os.path.join(self.directory.name, 'jobs.sqlite')}"
+        self.sched = BackgroundScheduler(jobstores={'default': SQLAlchemyJobStore(url=url)})
+        self.sched.start(paused=True)
+        self.graph = TaskGraph()
+        patch('Scheduler.src.create_task.sched', self.sched).start()
+        patch('Scheduler.src.create_task.task_graph', self.graph).start()
+        patch('Scheduler.src.create_task.job_index', JobIndex(self.sched)).start()
+
+    def tearDown(self):
+        patch.stopall()
+        self.sched.shutdown(wait=False)
+        self.directory.cleanup()
+
+    def test_apply_commands_creates_tasks_in_order(self):
+        summary = apply_commands([
+            "-- comment",
+            "CREATE TASK second SERVER = 1 AFTER first AS test_function()",
+            "",
+            "CREATE TASK first SERVER = 2 SCHEDULE = '1 MINUTE' AS test_function()",
+        ])
+
+        self.assertEqual(summary, {'created': ['second', 'first'], 'updated': [], 'unchanged': [], 'failed': {}})
+        self.assertIsNone(self.sched.get_job('second').next_run_time)
+        self.assertIsNotNone(self.sched.get_job('first').next_run_time)
+        self.assertEqual(self.sched.get_job('first').max_instances, 2)
+        self.assertEqual(self.sched.get_job('first').name, 'test_function')
+        self.assertEqual(self.graph.upstream('second'), {'first'})
+
+    def test_apply_commands_reports_unchanged_and_failed(self):
+        apply_commands(["CREATE TASK first SERVER = 1 SCHEDULE = '1 MINUTE' AS test_function()"])
+
+        summary = apply_commands([
+            "CREATE TASK first SERVER = 1 SCHEDULE = '1 MINUTE' AS test_function()",
+            "CREATE TASK orphan SERVER = 1 AFTER missing AS test_function()",
+            "CREATE TASK orphan_child SERVER = 1 AFTER orphan AS test_function()",
+            "CREATE TASK unknown SERVER = 1 SCHEDULE = '1 MINUTE' AS unknown_function()",
+            "CREATE TASK child SERVER = 1 AFTER first AS test_function()",
+            "NOT A COMMAND",
+        ])
+
+        self.assertEqual(summary['created'], ['child'])
+        self.assertEqual(summary['unchanged'], ['first'])
+        self.assertEqual(set(summary['failed']), {'orphan', 'orphan_child', 'unknown', 'NOT A COMMAND'})
+        self.assertIsNone(self.sched.get_job('orphan'))
+
+    def test_apply_commands_replaces_changed_definitions(self):
+        apply_commands([
+            "CREATE TASK first SERVER = 1 SCHEDULE = '1 MINUTE' AS test_function()",
+            "CREATE TASK second SERVER = 1 AFTER first AS test_function()",
+        ])
+
+        summary = apply_commands([
+            "CREATE TASK first SERVER = 1 SCHEDULE = '5 MINUTE' AS test_function()",
+            "CREATE TASK second SERVER = 1 SCHEDULE = '1 MINUTE' AS test_function()",
+        ])
+
+        self.assertEqual(summary['updated'], ['first', 'second'])
+        self.assertEqual(summary['created'], [])
+        self.assertEqual(self.sched.get_job('first').trigger.interval.total_seconds(), 300)
+        self.assertNotIn('second', self.graph)
+
+    def test_apply_commands_with_executor(self):
+        summary = apply_commands([
+            "CREATE TASK io SERVER = 1 EXECUTOR = default SCHEDULE = '1 MINUTE' AS test_function()",
+            "CREATE TASK gpu SERVER = 1 EXECUTOR = gpu SCHEDULE = '1 MINUTE' AS test_function()",
+        ])
+
+        self.assertEqual(summary['created'], ['io'])
+        self.assertEqual(summary['failed'], {'gpu': "Executor 'gpu' is not configured in EXECUTORS"})
+        self.assertEqual(self.sched.get_job('io').executor, 'default')
+
+    def test_warm_pool_refuses_functions_its_workers_cannot_load(self):
+        import_file = os.path.join(self.directory.name, 'imports.py')
+        with open(import_file, 'w') as file:
+            file.write("from tests.test_task_creation import divide_function\n")
+        register_function('divide_function', divide_function)
+        pool = WarmProcessPoolExecutor(1, import_file=import_file, prewarm=False)
+        self.sched.add_executor(pool, 'warm')
+
+        summary = apply_commands([
+            "CREATE TASK imported SERVER = 1 EXECUTOR = warm SCHEDULE = '1 MINUTE' AS divide_function(8, 4)",
+            "CREATE TASK runtime SERVER = 1 EXECUTOR = warm SCHEDULE = '1 MINUTE' AS test_function()",
+        ])
+
+        self.assertEqual(summary['created'], ['imported'])
+        self.assertIn("executor 'warm' cannot run it", summary['failed']['runtime'])
+
+    def test_apply_commands_rejects_cycles(self):
+        summary = apply_commands([
+            "CREATE TASK a SERVER = 1 AFTER c AS test_function()",
+            "CREATE TASK b SERVER = 1 AFTER a AS test_function()",
+            "CREATE TASK c SERVER = 1 AFTER b AS test_function()",
+            "CREATE TASK d SERVER = 1 SCHEDULE = '1 MINUTE' AS test_function()",
+        ])
+
+        self.assertEqual(summary['created'], ['d'])
+        self.assertEqual(set(summary['failed']), {'a', 'b', 'c'})
+        self.assertEqual(len(self.graph), 0)
+
+    def test_apply_commands_rejects_cycles_through_kept_tasks(self):
+        apply_commands([
+            "CREATE TASK x SERVER = 1 SCHEDULE = '1 MINUTE' AS test_function()",
+            "CREATE TASK y SERVER = 1 AFTER x AS test_function()",
+        ])
+
+        summary = apply_commands(["CREATE TASK x SERVER = 1 AFTER y AS test_function()"])
+
+        self.assertEqual(summary['updated'], [])
+        self.assertEqual(summary['failed'], {'x': "Task x is part of a cyclic AFTER dependency"})
+        self.assertEqual(self.graph.upstream('x'), set())
+        self.assertIsNotNone(self.sched.get_job('x').next_run_time)
+
+    def test_apply_commands_writes_edges_with_the_jobs(self):
+        store = DependencyStore(self.sched._lookup_jobstore('default').engine)
+        self.graph.attach(store)
+
+        summary = apply_commands([
+            "CREATE TASK first SERVER = 1 SCHEDULE = '1 MINUTE' AS test_function()",
+            "CREATE TASK second SERVER = 1 AFTER first AS test_function()",
+        ])
+        self.assertEqual(summary['created'], ['first', 'second'])
+        self.assertEqual(store.load()[1], [('second', 'first', False)])
+
+        # Another process adds 'taken' after it was looked up, so inserting it fails and
+        # the batch rolls back with its edges
+        def add_jobs_after_another_process(sched, jobs, **kwargs):
+            other = BackgroundScheduler(jobstores={'default': SQLAlchemyJobStore(engine=self.sched._lookup_jobstore('default').engine)})
+            other.add_job(test_function, 'interval', minutes=1, id='taken')
+            other.start(paused=True)
+            other.shutdown(wait=False)
+            return add_jobs(sched, jobs, **kwargs)
+
+        with patch('Scheduler.src.create_task.add_jobs', add_jobs_after_another_process):
+            summary = apply_commands([
+                "CREATE TASK taken SERVER = 1 AFTER first AS test_function()",
+                "CREATE TASK third SERVER = 1 AFTER second AS test_function()",
+            ])
+        self.assertEqual(summary['created'], [])
+        self.assertEqual(set(summary['failed']), {'taken', 'third'})
+        self.assertEqual(store.load()[1], [('second', 'first', False)])
+        self.assertEqual(self.graph.upstream('third'), set())
+
+    def test_apply_commands_passes_results(self):
+        register_function('divide_function', divide_function)
+        store = ResultStore(os.path.join(self.directory.name, 'results'))
+        patch('Scheduler.src.result_store.result_store', store).start()
+
+        summary = apply_commands([
+            "CREATE TASK plus SERVER = 1 SCHEDULE = '1 MINUTE' AS test_function()",
+            "CREATE TASK divide SERVER = 1 AFTER plus AS divide_function(RESULT(plus), 4)",
+            "CREATE TASK orphan SERVER = 1 AFTER plus AS divide_function(RESULT(missing), 4)",
+        ])
+        self.assertEqual(summary['created'], ['plus', 'divide'])
+        self.assertIn('missing', summary['failed']['orphan'])
+
+        with patch('Scheduler.src.create_task._release_task') as release:
+            event_listener(MagicMock(job_id='plus', exception=None, retval=10))
+        release.assert_called_once_with('divide')
+        job = self.sched.get_job('divide')
+
+        self.assertEqual(job.args[1:], (ResultRef('plus'), 4))
+        self.assertEqual(job.name, 'divide_function')
+        self.assertEqual(job.func(*job.args, **job.kwargs), 2.5)
+        self.assertEqual(apply_commands([
+            "CREATE TASK divide SERVER = 1 AFTER plus AS divide_function(RESULT(plus), 4)",
+        ])['unchanged'], ['divide'])
+
+    def test_only_results_that_are_read_are_stored(self):
+        register_function('divide_function', divide_function)
+        store = ResultStore(os.path.join(self.directory.name, 'results'))
+        patch('Scheduler.src.result_store.result_store', store).start()
+        apply_commands([
+            "CREATE TASK plus SERVER = 1 SCHEDULE = '1 MINUTE' AS test_function()",
+            "CREATE TASK lone SERVER = 1 SCHEDULE = '1 MINUTE' AS test_function()",
+            "CREATE TASK report SERVER = 1 SCHEDULE = '1 MINUTE' AS divide_function(RESULT(plus), 4)",
+        ])
+
+        for job_id in ('plus', 'lone', 'report'):
+            event_listener(MagicMock(job_id=job_id, exception=None, retval=10))
+        self.assertEqual(store.get('plus'), 10)
+        self.assertRaises(LookupError, store.get, 'lone')
+        self.assertRaises(LookupError, store.get, 'report')
+
+        # Once nothing reads 'plus' its results are no longer kept
+        self.assertEqual(apply_commands([
+            "CREATE TASK report SERVER = 1 SCHEDULE = '1 MINUTE' AS divide_function(8, 4)",
+        ])['updated'], ['report'])
+        store.remove('plus')
+        event_listener(MagicMock(job_id='plus', exception=None, retval=11))
+        self.assertRaises(LookupError, store.get, 'plus')
+
+    def test_apply_commands_looks_tasks_up_in_one_query(self):
+        commands = ["CREATE TASK t0 SERVER = 1 SCHEDULE = '1 MINUTE' AS test_function()"]
+        commands += [f"CREATE TASK t{i} SERVER = 1 AFTER t{i - 1} AS test_function()" for i in range(1, 20)]
+        apply_commands(commands)
+        statements = []
+        event.listen(self.sched._lookup_jobstore('default').engine, 'before_cursor_execute',
+                     lambda conn, cursor, statement, *args: statements.append(statement))
+
+        self.assertEqual(len(apply_commands(commands)['unchanged']), 20)
+        self.assertEqual(len(statements), 1)
+
+    def test_reapplying_in_a_new_process_changes_nothing(self):
+        url = f"sqlite:///{os.path.join(self.directory.name, 'restarted.sqlite')}"
+        script = json.dumps([
+            "CREATE TASK p SERVER = 1 SCHEDULE = '1 MINUTE' AS test_function()",
+            "CREATE TASK c SERVER = 1 CACHE = '1 HOUR' SCHEDULE = '1 MINUTE' AS divide_function(8, 4)",
+            "CREATE TASK r SERVER = 1 AFTER p AS divide_function(RESULT(p), 4)",
+            "CREATE TASK m SERVER = 1 AFTER p AS divide_method(RESULT(p), 4)",
+        ])
+        environment = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        summaries = [
+            json.loads(subprocess.run([sys.executable, '-c', APPLY_IN_NEW_PROCESS, url, script], env=environment,
+                                      capture_output=True, text=True, check=True).stdout.splitlines()[-1])
+            for _ in range(2)
+        ]
+
+        self.assertEqual(summaries[0]['created'], ['p', 'c', 'r', 'm'])
+        self.assertEqual(summaries[1], {'created': [], 'updated': [], 'unchanged': ['p', 'c', 'r', 'm'], 'failed': {}})
+
+    def test_apply_commands_with_cache(self):
+        divide_calls.clear()
+        register_function('counted_divide', counted_divide)
+        register_function('watermark', watermark)
+        cache = TaskCache(f"sqlite:///{os.path.join(self.directory.name, 'cache.sqlite')}")
+        patch('Scheduler.src.task_cache.task_cache', cache).start()
+
+        summary = apply_commands([
+            "CREATE TASK cached SERVER = 1 CACHE = '1 HOUR' PROBE = watermark('sales') "
+            "SCHEDULE = '1 MINUTE' AS counted_divide(6, 3)",
+            "CREATE TASK no_cache SERVER = 1 PROBE = watermark('sales') SCHEDULE = '1 MINUTE' AS counted_divide(6, 3)",
+            "CREATE TASK no_probe SERVER = 1 CACHE = '1 HOUR' PROBE = missing() SCHEDULE = '1 MINUTE' AS test_function()",
+        ])
+        self.assertEqual(summary['created'], ['cached'])
+        self.assertEqual(set(summary['failed']), {'no_cache', 'no_probe'})
+
+        job = self.sched.get_job('cached')
+        policy = job.args[0]
+        self.assertIs(job.func, run_cached)
+        self.assertEqual((policy.function, policy.ttl, policy.probe_args), ('counted_divide', 3600, ('sales',)))
+        self.assertEqual([job.func(*job.args, **job.kwargs) for _ in range(2)], [2, 2])
+        self.assertEqual(divide_calls, [(6, 3)])
+        cache.engine.dispose()
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,150 @@
+# Copyright 2024 Sola Richard Olorunfemi
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import ast
+import unittest
+from Scheduler.src.task_dsl import ParseCache, ParseError, normalize_command, parse_alter, parse_create
+from Scheduler.src.parse_create_task import _literal_eval, parse_command
+
+
+class TestTokenize(unittest.TestCase):
+    def test_tokens_keep_values_and_positions(self):
+        self.assertEqual(parse_create("CREATE TASK t SCHEDULE = '5 MINUTE' AS f()")['schedule'], "'5 MINUTE'")
+        with self.assertRaises(ParseError) as cm:
+            parse_create("CREATE TASK t SCHEDULE = 'soon' AS f()")
+        self.assertEqual(cm.exception.position, 25)
+
+    def test_normalize_only_collapses_whitespace_outside_strings(self):
+        command = "  CREATE   TASK t\n  AS f('a   b',  1)  "
+        self.assertEqual(normalize_command(command), "CREATE TASK t AS f('a   b', 1)")
+
+
+class TestParser(unittest.TestCase):
+    def test_clauses_in_any_order(self):
+        params = parse_create("create task t after a,b allow_overlapping_execution = false "
+                              "using cron */5 * * * * Europe/London executor = processpool server = 2 "
+                              "as f(1, [2, ')'])")
+        self.assertEqual(params['after'], 'a, b')
+        self.assertEqual(params['cron_expr'], '*/5 * * * *')
+        self.assertEqual(params['time_zone'], 'Europe/London')
+        self.assertEqual(params['server'], '2')
+        self.assertEqual(params['executor'], 'processpool')
+        self.assertIs(params['allow_overlapping_execution'], False)
+        self.assertEqual(params['args'], "1, [2, ')']")
+
+    def test_cache_and_probe(self):
+        params = parse_command("CREATE TASK t CACHE = '2 HOUR' PROBE = max_created('sales', column='CREATED_DATETIME') "
+                               "SCHEDULE = '5 MINUTE' AS f(1)")[2]
+        self.assertEqual(params['cache'], "'2 HOUR'")
+        self.assertEqual(params['probe'], {'function': 'max_created', 'args': ['sales'],
+                                           'kwargs': {'column': 'CREATED_DATETIME'}})
+        self.assertEqual(params['args'], [1])
+
+        with self.assertRaises(ParseError):
+            parse_create("CREATE TASK t CACHE = 'forever' AS f()")
+
+    def test_error_position(self):
+        with self.assertRaises(ParseError) as cm:
+            parse_create("CREATE TASK t\nSCHEDULE = '5 MINUTE'\nAS f(1, 2")
+        self.assertIn('unbalanced', str(cm.exception))
+        self.assertEqual((cm.exception.line, cm.exception.column), (3, 5))
+
+        with self.assertRaises(ParseError) as cm:
+            parse_create("CREATE TASK t SCHEDULE = '5 MINUTE' SCHEDULE = '1 DAY' AS f()")
+        self.assertEqual(cm.exception.position, 36)
+
+    def test_error_position_after_an_argument_list(self):
+        command = "CREATE TASK t PROBE = p('(', [1]) SCHEDULE = '5 MINUTE' SCHEDULE = '1 DAY' AS f()"
+        with self.assertRaises(ParseError) as cm:
+            parse_create(command)
+        self.assertEqual(cm.exception.position, command.index("SCHEDULE = '1 DAY'"))
+
+        with self.assertRaises(ParseError) as cm:
+            parse_create("CREATE TASK t AS f(1) extra")
+        self.assertEqual(cm.exception.position, 22)
+
+        params = parse_create("CREATE TASK t PROBE = p(\"(\") AFTER a AS f(g(1), '(')")
+        self.assertEqual((params['probe'], params['after'], params['args']), (('p', '"("'), 'a', "g(1), '('"))
+
+    def test_after_needs_a_task_name(self):
+        with self.assertRaises(ParseError) as cm:
+            parse_create("CREATE TASK t AFTER AS f()")
+        self.assertEqual(str(cm.exception), "Invalid command format: expected a task name but found 'AS'")
+
+    def test_trailing_input_is_rejected(self):
+        with self.assertRaises(ParseError):
+            parse_alter("ALTER TASK t SET SCHEDULE = '1 HOUR' extra")
+        self.assertEqual(parse_alter("ALTER TASK t RESUME;"), {'task_name': 't', 'action': 'RESUME'})
+
+    def test_alter_set_executor(self):
+        params = parse_alter("ALTER TASK t SET EXECUTOR = processpool")
+        self.assertEqual(params['executor'], 'processpool')
+        self.assertIsNone(params['schedule'])
+
+    def test_task_named_after_an_action(self):
+        params = parse_alter("ALTER TASK resume_job SET SCHEDULE = '2 DAY'")
+        self.assertEqual(params['task_name'], 'resume_job')
+        self.assertEqual(params['schedule'], "'2 DAY'")
+
+
+class TestParseCache(unittest.TestCase):
+    def test_reformatted_commands_share_an_entry(self):
+        cache = ParseCache(maxsize=2)
+        calls = []
+
+        def parse(command):
+            calls.append(command)
+            return parse_alter(command)
+
+        cache.get_or_parse("ALTER TASK t RESUME", parse)
+        cache.get_or_parse("ALTER  TASK t\n RESUME ", parse)
+        self.assertEqual(len(calls), 1)
+
+        cache.get_or_parse("ALTER TASK u RESUME", parse)
+        cache.get_or_parse("ALTER TASK v RESUME", parse)  # evicts the least recently used entry
+        self.assertEqual(len(cache), 2)
+        cache.get_or_parse("ALTER TASK t RESUME", parse)
+        self.assertEqual(len(calls), 4)
+
+    def test_errors_are_not_cached(self):
+        cache = ParseCache()
+        with self.assertRaises(ParseError):
+            cache.get_or_parse("ALTER TASK t", parse_alter)
+        self.assertEqual(len(cache), 0)
+
+    def test_parse_command_returns_independent_copies(self):
+        command = "CREATE TASK t SCHEDULE = '5 MINUTE' AS f([1, [2, 3]])"
+        _, _, first = parse_command(command)
+        first['args'][1].append(99)
+        _, _, second = parse_command(command)
+        self.assertEqual(second['args'], [1, [2, 3]])
+
+
+class TestLiteralEval(unittest.TestCase):
+    def test_matches_ast(self):
+        pieces = ['0', '12', '007', '00', '-1', '1.5', "'fast'", '"it\'s"', "''", "'a=b'", "'a', 'b'", '[1', '3]',
+                  "{'low': 0", "'high': 0}", "mode='fast'", "{'a': [1, 2]}", 'x', "'(' + ')'", '1 # a=b',
+                  "'''x'='y'''", "'a\\'=b'", '(1, [2])', '1 == 1']
+        for piece in pieces:
+            with self.subTest(piece=piece):
+                try:
+                    expected = ast.literal_eval(piece)
+                except (ValueError, SyntaxError):
+                    with self.assertRaises((ValueError, SyntaxError)):
+                        _literal_eval(piece)
+                else:
+                    self.assertEqual(_literal_eval(piece), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+# Copyright 2024 Sola Richard Olorunfemi
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from Scheduler.src.task_graph import TaskGraph
+
+
+class TestTaskGraph(unittest.TestCase):
+    def setUp(self):
+        self.graph = TaskGraph()
+        self.graph.add_task('divides_task', ['plus', 'minus'])
+        self.graph.add_task('plusminus_task', ['times_task'])
+
+    def test_add_task_indexes_both_directions(self):
+        self.assertEqual(self.graph.upstream('divides_task'), {'plus', 'minus'})
+        self.assertEqual(self.graph.downstream('plus'), {'divides_task'})
+        self.assertEqual(self.graph.pending('divides_task'), {'plus', 'minus'})
+        self.assertEqual(len(self.graph), 2)
+
+    def test_complete_releases_when_all_predecessors_ran(self):
+        self.assertEqual(self.graph.complete('plus'), [])
+        self.assertEqual(self.graph.complete('plus'), [])  # repeated completion counts once
+        self.assertEqual(self.graph.complete('minus'), ['divides_task'])
+
+        # The pending set is re-armed for the next run
+        self.assertEqual(self.graph.pending('divides_task'), {'plus', 'minus'})
+
+    def test_complete_of_unrelated_task(self):
+        self.assertEqual(self.graph.complete('unknown_task'), [])
+
+    def test_add_task_replaces_predecessors(self):
+        self.graph.add_task('divides_task', ['times_task'])
+
+        self.assertEqual(self.graph.downstream('plus'), set())
+        self.assertEqual(self.graph.downstream('times_task'), {'divides_task', 'plusminus_task'})
+
+    def test_remove_dependencies(self):
+        self.graph.complete('plus')
+        left = self.graph.remove_dependencies('divides_task', ['minus'])
+
+        self.assertEqual(left, {'plus'})
+        self.assertEqual(self.graph.downstream('minus'), set())
+        self.assertEqual(self.graph.complete('plus'), ['divides_task'])
+
+        self.assertEqual(self.graph.remove_dependencies('divides_task'), set())
+        self.assertNotIn('divides_task', self.graph)
+
+    def test_remove_task(self):
+        self.graph.remove_task('times_task')
+
+        self.assertNotIn('plusminus_task', self.graph)
+        self.assertEqual(self.graph.downstream('times_task'), set())
+
+        self.graph.remove_task('divides_task')
+        self.assertEqual(self.graph.downstream('plus'), set())
+        self.assertEqual(len(self.graph), 0)
+
+    def test_result_readers(self):
+        self.assertTrue(self.graph.result_needed('plus'))
+        self.assertFalse(self.graph.result_needed('divides_task'))
+
+        self.graph.set_results({'report': ['divides_task', 'plus']})
+        self.assertTrue(self.graph.result_needed('divides_task'))
+        self.assertEqual(self.graph.reads('report'), {'divides_task', 'plus'})
+
+        self.graph.set_results({'report': ['plus']})
+        self.assertFalse(self.graph.result_needed('divides_task'))
+
+        self.graph.set_results({'report': ['divides_task']})
+        self.graph.remove_task('report')
+        self.assertEqual(self.graph.reads('report'), set())
+        self.assertFalse(self.graph.result_needed('divides_task'))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -11,13 +11,33 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
+import tempfile
 import unittest
 from unittest.mock import patch, MagicMock, call
-from Scheduler.src.modify_task import _alter_task, execute_command, _update_task_graph, task_conditions
+from apscheduler.executors.asyncio import AsyncIOExecutor
+from apscheduler.executors.pool import ThreadPoolExecutor
+from apscheduler.jobstores.memory import MemoryJobStore
+from apscheduler.schedulers.background import BackgroundScheduler
+from Scheduler.src import modify_task
+from Scheduler.src.module_registry import register_function
+from Scheduler.src.warm_pool import WarmProcessPoolExecutor
+from Scheduler.src.job_scheduler import shutdown_scheduler
+from Scheduler.src.modify_task import _alter_task, execute_command, _update_task_graph
+from Scheduler.src.task_graph import TaskGraph
+from Scheduler.src.job_index import JobIndex
 from apscheduler.triggers.cron import CronTrigger
 from apscheduler.triggers.interval import IntervalTrigger
 
 
+def plain_function():
+    pass
+
+
+async def async_function():
+    pass
+
+
 class TestSchedulerFunctions(unittest.TestCase):
     def setUp(self):
         # Set up mock scheduler
@@ -27,50 +47,76 @@ class TestSchedulerFunctions(unittest.TestCase):
         self.mock_scheduler.pause_job = MagicMock()
         self.mock_scheduler.remove_job = MagicMock()
         self.mock_scheduler.modify_job = MagicMock()
+        self.mock_scheduler._lookup_jobstore.return_value = MemoryJobStore()
 
         # Patch the scheduler with mock
         patch('Scheduler.src.modify_task.scheduler', self.mock_scheduler).start()
 
-        # Set up task_conditions
-        self.mock_task_conditions = {}
+        # Set up the dependency graph
+        self.mock_task_graph = TaskGraph()
+
+        patch('Scheduler.src.modify_task.task_graph', self.mock_task_graph).start()
 
-        patch('Scheduler.src.modify_task.task_conditions', self.mock_task_conditions).start()
+        # Index the jobs the tests alter
+        self.mock_scheduler.get_jobs.return_value = [
+            MagicMock(id=f'task{i}', func_ref='tests:job', args=(), kwargs={}, trigger=None, max_instances=1)
+            for i in range(1, 7)
+        ]
+        patch('Scheduler.src.modify_task.job_index', JobIndex(self.mock_scheduler)).start()
 
     def tearDown(self):
         patch.stopall()
 
+    @patch('Scheduler.src.job_scheduler.get_scheduler_start_paused', return_value=True)
+    @patch('Scheduler.src.job_scheduler._build_scheduler', side_effect=BackgroundScheduler)
+    def test_scheduler_is_rewired_after_shutdown(self, mock_build, mock_paused):
+        patch('Scheduler.src.modify_task.scheduler', None).start()
+        first = modify_task._scheduler()
+
+        shutdown_scheduler(wait=False)
+        second = modify_task._scheduler()
+
+        self.assertIsNot(second, first)
+        self.assertTrue(second.running)
+        shutdown_scheduler(wait=False)
+        self.assertIsNone(modify_task.scheduler)
+
     def test_alter_task_resume(self):
-        self.mock_scheduler.get_job.return_value = MagicMock()  # Simulate a found job
         params = {'task_name': 'task1', 'action': 'RESUME'}
         _alter_task(params)
         self.mock_scheduler.resume_job.assert_called_with('task1')
 
     def test_alter_task_suspend(self):
-        self.mock_scheduler.get_job.return_value = MagicMock()  # Simulate a found job
         params = {'task_name': 'task2', 'action': 'SUSPEND'}
         _alter_task(params)
         self.mock_scheduler.pause_job.assert_called_with('task2')
 
     def test_alter_task_remove(self):
-        self.mock_scheduler.get_job.return_value = MagicMock()  # Simulate a found job
         params = {'task_name': 'task3', 'action': 'REMOVE'}
         _alter_task(params)
         self.mock_scheduler.remove_job.assert_called_with('task3')
 
     def test_alter_task_remove_after(self):
-        self.mock_task_conditions['task3'] = {'after': ['task4', 'task5']}
+        self.mock_task_graph.add_task('task3', ['task4', 'task5'])
         params = {'task_name': 'task3', 'action': 'REMOVE', 'after': 'task4, task5'}
         _alter_task(params)
 
-        # Check if task's 'after' key is removed when empty
-        self.assertNotIn('after', self.mock_task_conditions['task3'])
-        self.assertEqual({'task3': {}}, self.mock_task_conditions)
+        # Check if the task has no predecessors left
+        self.assertNotIn('task3', self.mock_task_graph)
+        self.assertEqual(self.mock_task_graph.downstream('task4'), set())
 
         # Check if the _update_task_graph is called properly
         self.mock_scheduler.pause_job.assert_called_with('task3')
 
+    def test_alter_task_remove_some_after(self):
+        self.mock_task_graph.add_task('task3', ['task4', 'task5'])
+        params = {'task_name': 'task3', 'action': 'REMOVE', 'after': 'task4'}
+        _alter_task(params)
+
+        self.assertEqual(self.mock_task_graph.upstream('task3'), {'task5'})
+        self.mock_scheduler.pause_job.assert_not_called()
+
     def test_alter_task_interval_schedule(self):
-        self.mock_scheduler.get_job.return_value = MagicMock()
         params = {'task_name': 'task4', 'schedule': "'2 MINUTE'", 'time_zone': 'UTC'}
         _alter_task(params)
 
@@ -83,7 +129,6 @@ class TestSchedulerFunctions(unittest.TestCase):
         self.assertEqual(trigger_call.timezone.zone, 'UTC')
 
     def test_alter_task_cron_schedule(self):
-        self.mock_scheduler.get_job.return_value = MagicMock()
         params = {'task_name': 'task5', 'cron_expr': '0 0 * * *', 'time_zone': 'UTC'}
         _alter_task(params)
 
@@ -106,17 +151,55 @@ class TestSchedulerFunctions(unittest.TestCase):
         self.assertEqual(str(actual_trigger), str(expected_trigger))
 
     def test_alter_task_allow_overlapping_execution(self):
-        self.mock_scheduler.get_job.return_value = MagicMock()  # Simulate a found job
         params = {'task_name': 'task6', 'allow_overlapping_execution': '3'}
         _alter_task(params)
         self.mock_scheduler.modify_job.assert_called_with('task6', max_instances=3)
 
+    def test_alter_unknown_task(self):
+        _alter_task({'task_name': 'missing_task', 'action': 'RESUME'})
+        self.mock_scheduler.resume_job.assert_not_called()
+        self.mock_scheduler.get_job.assert_not_called()
+
+    def _job_of(self, function_name, function):
+        register_function(function_name, function)
+        job = MagicMock()
+        job.name = function_name
+        self.mock_scheduler.get_job.return_value = job
+
+    def test_alter_task_executor(self):
+        self._job_of('plain_function', plain_function)
+        self.mock_scheduler._lookup_executor.side_effect = lambda name: {'processpool': MagicMock()}[name]
+        _alter_task({'task_name': 'task6', 'executor': 'processpool'})
+        self.mock_scheduler.modify_job.assert_called_with('task6', executor='processpool')
+
+        self.mock_scheduler.modify_job.reset_mock()
+        with self.assertRaises(ValueError):
+            _alter_task({'task_name': 'task6', 'executor': 'gpu', 'allow_overlapping_execution': '2'})
+        self.mock_scheduler.modify_job.assert_not_called()
+
+    @patch('Scheduler.src.modify_task.logger')
+    def test_alter_task_executor_refuses_pools_that_cannot_run_the_function(self, mock_logger):
+        with tempfile.TemporaryDirectory() as directory:
+            import_file = os.path.join(directory, 'imports.py')
+            open(import_file, 'w').close()
+            pools = {'threadpool': ThreadPoolExecutor(), 'asyncio': AsyncIOExecutor(),
+                     'warm': WarmProcessPoolExecutor(1, import_file=import_file, prewarm=False)}
+            self.mock_scheduler._lookup_executor.side_effect = lambda name: pools[name]
+
+            self._job_of('async_function', async_function)
+            execute_command("ALTER TASK task6 SET EXECUTOR = threadpool")
+            mock_logger.error.assert_called_with(
+                "Error: async_function is an async def function; executor 'threadpool' cannot run it")
+
+            # Registered at runtime, so the warm pool's workers do not have it
+            self._job_of('plain_function', plain_function)
+            execute_command("ALTER TASK task6 SET EXECUTOR = warm")
+            self.assertIn("executor 'warm' cannot run it", mock_logger.error.call_args[0][0])
+        self.mock_scheduler.modify_job.assert_not_called()
+
     def test_update_task_graph(self):
-        self.mock_task_conditions['task3'] = {'after': ['task7', 'task8']}
         _update_task_graph('task3')
 
-        self.assertNotIn('task7', self.mock_task_conditions)
-        self.assertNotIn('task8', self.mock_task_conditions)
         self.mock_scheduler.pause_job.assert_called_with('task3')
 
     def test_execute_command(self):
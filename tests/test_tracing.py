@@ -0,0 +1,169 @@
+# Copyright 2024 Sola Richard Olorunfemi
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import tempfile
+import unittest
+from datetime import datetime, timezone
+from unittest.mock import MagicMock, patch
+
+from apscheduler.events import EVENT_JOB_ERROR, JobExecutionEvent
+from apscheduler.schedulers.background import BackgroundScheduler
+
+from Scheduler.src.job_index import JobIndex
+from Scheduler.src.job_scheduler import _sqlalchemy_jobstore
+from Scheduler.src.module_registry import register_function
+from Scheduler.src.task_graph import TaskGraph
+from Scheduler.src.tracing import InMemoryExporter, JsonLinesExporter, Tracer, build_exporter, tracer
+import Scheduler.src.create_task as create_task
+import Scheduler.src.modify_task as modify_task
+
+
+def traced_function():
+    pass
+
+
+class TestTracer(unittest.TestCase):
+    def setUp(self):
+        self.exporter = InMemoryExporter()
+        self.tracer = Tracer(self.exporter)
+
+    def test_disabled_tracer_hands_out_one_noop_span(self):
+        disabled = Tracer()
+        with disabled.span('a', key=1) as span:
+            span.set_attribute('b', 2)
+        self.assertIs(disabled.span('a'), disabled.span('b'))
+        self.assertFalse(disabled.enabled)
+
+    def test_nested_spans_share_the_trace(self):
+        with self.tracer.span('outer', task='t') as outer:
+            with self.tracer.span('inner') as inner:
+                inner.set_attribute('rows', 3)
+        with self.tracer.span('other') as other:
+            pass
+
+        self.assertEqual([span.name for span in self.exporter.spans], ['inner', 'outer', 'other'])
+        self.assertEqual(inner.parent_id, outer.span_id)
+        self.assertEqual(inner.trace_id, outer.trace_id)
+        self.assertIsNone(other.parent_id)
+        self.assertNotEqual(other.trace_id, outer.trace_id)
+        self.assertEqual(inner.attributes, {'rows': 3})
+        self.assertGreaterEqual(outer.duration, inner.duration)
+
+    def test_errors_are_recorded_and_propagated(self):
+        with self.assertRaises(KeyError):
+            with self.tracer.span('failing'):
+                raise KeyError('missing')
+        self.assertEqual(self.exporter.spans[0].error, "KeyError: 'missing'")
+
+    def test_exporter_errors_do_not_reach_traced_code(self):
+        broken = MagicMock()
+        broken.export.side_effect = OSError('disk full')
+        self.tracer.set_exporter(broken)
+        with self.tracer.span('phase'):
+            pass
+        broken.export.assert_called_once()
+
+    def test_job_runs_are_recorded_from_timed_events(self):
+        scheduled = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        event = JobExecutionEvent(EVENT_JOB_ERROR, 'a', 'default', scheduled, exception=ValueError('bad'))
+        event.started_at, event.duration = scheduled.timestamp() + 2, 0.5
+
+        self.tracer._on_event(event)
+        self.tracer._on_event(JobExecutionEvent(EVENT_JOB_ERROR, 'b', 'default', scheduled))
+
+        span, = self.exporter.spans
+        self.assertEqual((span.name, span.duration, span.error), ('job.run', 0.5, 'ValueError: bad'))
+        self.assertEqual(span.attributes['start_lag'], 2)
+
+
+class TestExporters(unittest.TestCase):
+    def test_json_lines_exporter(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'traces.jsonl')
+            exporter = build_exporter('jsonl', path)
+            self.assertIsInstance(exporter, JsonLinesExporter)
+            traced = Tracer(exporter)
+            with traced.span('outer'):
+                with traced.span('inner', when=datetime(2024, 1, 1)):
+                    pass
+            exporter.shutdown()
+
+            with open(path) as file:
+                lines = [json.loads(line) for line in file]
+
+        self.assertEqual([line['name'] for line in lines], ['inner', 'outer'])
+        self.assertEqual(lines[0]['parent_id'], lines[1]['span_id'])
+        self.assertEqual(lines[0]['attributes'], {'when': '2024-01-01 00:00:00'})
+
+    def test_build_exporter_from_reference(self):
+        self.assertIsNone(build_exporter(None))
+        self.assertIsInstance(build_exporter('Scheduler.src.tracing:InMemoryExporter'), InMemoryExporter)
+
+
+class TestCommandTracing(unittest.TestCase):
+    def setUp(self):
+        register_function('traced_function', traced_function)
+        self.directory = tempfile.TemporaryDirectory()
+        store = _sqlalchemy_jobstore(f"sqlite:///{os.path.join(self.directory.name, 'jobs.sqlite')}")
+        self.sched = BackgroundScheduler(jobstores={'default': store}, timezone='UTC')
+        self.sched.start(paused=True)
+        index = JobIndex(self.sched)
+        for module, scheduler_name in ((create_task, 'sched'), (modify_task, 'scheduler')):
+            patch.object(module, scheduler_name, self.sched).start()
+            patch.object(module, 'job_index', index).start()
+            patch.object(module, 'task_graph', TaskGraph()).start()
+        self.exporter = InMemoryExporter()
+        tracer.set_exporter(self.exporter)
+
+    def tearDown(self):
+        tracer.set_exporter(None)
+        patch.stopall()
+        self.sched.shutdown(wait=False)
+        self.directory.cleanup()
+
+    def _tree(self):
+        spans = {span.span_id: span for span in self.exporter.spans}
+        return {span.name: spans[span.parent_id].name if span.parent_id else None for span in self.exporter.spans}
+
+    def test_create_task_phases(self):
+        create_task.execute_command("CREATE TASK t SERVER = 1 SCHEDULE = '1 MINUTE' AS traced_function()")
+
+        self.assertEqual(self._tree(), {
+            'parse_command': 'create_task',
+            'get_function': 'create_task',
+            'build_trigger': 'create_task',
+            'job_lookup': 'create_task',
+            'jobstore.serialize': 'add_job',
+            'jobstore.commit': 'add_job',
+            'add_job': 'create_task',
+            'resume_job': 'create_task',
+            'jobstore.update_job': 'resume_job',
+            'create_task': None,
+        })
+        self.assertEqual(self.exporter.spans[-1].attributes, {'task': 't'})
+
+    def test_alter_task_phases(self):
+        create_task.execute_command("CREATE TASK t SERVER = 1 SCHEDULE = '1 MINUTE' AS traced_function()")
+        self.exporter.spans.clear()
+
+        modify_task.execute_command("ALTER TASK t SUSPEND")
+
+        self.assertEqual(self._tree()['pause_job'], 'alter_task')
+        self.assertEqual(self._tree()['job_lookup'], 'alter_task')
+        self.assertEqual(self._tree()['parse_command'], 'alter_task')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+# Copyright 2024 Sola Richard Olorunfemi
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sqlite3
+import unittest
+from Job.validation_planner import plan_validation, validation_sql
+
+TESTS = [
+    {
+        'target_tables': ['orders', 'customers'],
+        'tests': [
+            {'type': 'row_count', 'threshold': 3},
+            {'type': 'null_check', 'column': 'name'},
+            {'type': 'default_value_check', 'column': 'status', 'default_value': 'new'},
+            {'type': 'primary_key_uniqueness', 'column': {'orders': 'id', 'customers': 'id'}},
+            {'type': 'unique_value_check', 'column': 'id'},
+        ]
+    },
+    {
+        'target_tables': ['orders'],
+        'tests': [
+            {'type': 'data_range_check', 'column': 'placed', 'start_date': '2024-01-01', 'end_date': '2024-12-31'},
+            {'type': 'foreign_key', 'foreign_key': 'customer_id', 'reference_table': 'customers', 'reference_key': 'id'},
+            {'type': 'custom_query', 'query': "SELECT 'custom_query' AS test_type, 'orders' AS table_name, 1 AS error"},
+        ]
+    },
+]
+
+
+class TestValidationPlanner(unittest.TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:')
+        self.conn.executescript("""
+            CREATE TABLE customers (id INTEGER, name TEXT, status TEXT);
+            INSERT INTO customers VALUES (1, 'a', 'new'), (2, 'b', 'new'), (3, 'c', 'new');
+            CREATE TABLE orders (id INTEGER, name TEXT, status TEXT, placed TEXT, customer_id INTEGER);
+            INSERT INTO orders VALUES (1, 'x', 'new', '2024-02-01', 1), (1, NULL, 'paid', '2025-01-01', 9),
+                                      (2, 'y', 'new', '2024-03-01', 1);
+        """)
+
+    def tearDown(self):
+        self.conn.close()
+
+    def results(self, tests):
+        return sorted((test_type, table, bool(error))
+                      for test_type, table, error in self.conn.execute(validation_sql(tests)).fetchall())
+
+    def test_one_row_level_query_per_table(self):
+        plan = plan_validation(TESTS)
+        row_level = [query for query in plan if 'row_count' in query.checks]
+        self.assertEqual([query.table for query in row_level], ['orders', 'customers'])
+        self.assertEqual(row_level[0].checks, ('row_count', 'null_check', 'default_value_check', 'data_range_check'))
+        # Both uniqueness checks on the same column share a query
+        self.assertIn(('orders', ('primary_key_uniqueness', 'unique_value_check')),
+                      [(query.table, query.checks) for query in plan])
+        self.assertEqual(len(plan), 6)
+
+    def test_results_match_each_check(self):
+        self.assertEqual(self.results(TESTS), [
+            ('custom_query', 'orders', True),
+            ('data_range_check', 'orders', True),
+            ('default_value_check', 'customers', False),
+            ('default_value_check', 'orders', True),
+            ('foreign_key', 'orders', True),
+            ('null_check', 'customers', False),
+            ('null_check', 'orders', True),
+            ('primary_key_uniqueness', 'customers', False),
+            ('primary_key_uniqueness', 'orders', True),
+            ('row_count', 'customers', False),
+            ('row_count', 'orders', False),
+            ('unique_value_check', 'customers', False),
+            ('unique_value_check', 'orders', True),
+        ])
+
+    def test_clean_table_passes(self):
+        self.conn.executescript("""
+            DELETE FROM orders WHERE customer_id = 9;
+            INSERT INTO orders VALUES (3, 'z', 'new', '2024-04-01', 2);
+        """)
+        failed = [result for result in self.results(TESTS) if result[2]]
+        self.assertEqual(failed, [('custom_query', 'orders', True)])
+
+    def test_single_check_and_empty_table(self):
+        self.conn.execute("DELETE FROM orders")
+        tests = [{'target_tables': ['orders'], 'tests': [{'type': 'null_check', 'column': 'name'}]}]
+        self.assertEqual(len(plan_validation(tests)), 1)
+        self.assertEqual(self.results(tests), [('null_check', 'orders', False)])
+
+    def test_missing_table_in_column_map_is_skipped(self):
+        tests = [{'target_tables': ['orders'], 'tests': [{'type': 'primary_key_uniqueness', 'column': {'other': 'id'}}]}]
+        self.assertEqual(plan_validation(tests), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
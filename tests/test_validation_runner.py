@@ -0,0 +1,109 @@
+# Copyright 2024 Sola Richard Olorunfemi
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+from Job.validation_planner import PlannedQuery, plan_validation
+from Job.validation_runner import run_concurrently
+
+SLOW_QUERY = ("WITH RECURSIVE counter(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM counter) "
+              "SELECT 'custom_query', 'slow', MAX(x) > 0 FROM (SELECT x FROM counter LIMIT 1000000000)")
+
+
+class TestValidationRunner(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'validation.db')
+        with sqlite3.connect(self.path) as conn:
+            conn.executescript("""
+                CREATE TABLE orders (id INTEGER, name TEXT);
+                INSERT INTO orders VALUES (1, 'x'), (1, NULL);
+                CREATE TABLE customers (id INTEGER, name TEXT);
+                INSERT INTO customers VALUES (1, 'a');
+            """)
+        conn.close()
+        self.opened = []
+        self.lock = threading.Lock()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def connect(self):
+        conn = sqlite3.connect(self.path)
+        with self.lock:
+            self.opened.append(threading.current_thread().name)
+        return conn
+
+    def test_results_match_the_plan(self):
+        tests = [{'target_tables': ['orders', 'customers'],
+                  'tests': [{'type': 'null_check', 'column': 'name'}, {'type': 'unique_value_check', 'column': 'id'}]}]
+        plan = plan_validation(tests)
+        outcomes = list(run_concurrently(plan, self.connect, 2))
+        self.assertEqual(sorted(outcome.query for outcome in outcomes), sorted(plan))
+        self.assertTrue(all(outcome.failure is None for outcome in outcomes))
+        rows = sorted((test_type, table, bool(error)) for outcome in outcomes for test_type, table, error in outcome.rows)
+        self.assertEqual(rows, [('null_check', 'customers', False), ('null_check', 'orders', True),
+                                ('unique_value_check', 'customers', False), ('unique_value_check', 'orders', True)])
+        # Each worker opens one connection and keeps it for its later queries
+        self.assertLessEqual(len(self.opened), 2)
+        self.assertEqual(len(self.opened), len(set(self.opened)))
+
+    def test_slow_query_times_out_after_the_others_stream_back(self):
+        plan = [PlannedQuery(None, ('custom_query',), SLOW_QUERY)] + plan_validation(
+            [{'target_tables': ['orders'], 'tests': [{'type': 'null_check', 'column': 'name'}]}])
+        outcomes = list(run_concurrently(plan, self.connect, 2, timeout=0.5))
+        self.assertEqual(outcomes[0].query.checks, ('null_check',))
+        self.assertIsNone(outcomes[0].failure)
+        self.assertEqual(outcomes[1].query.sql, SLOW_QUERY)
+        self.assertEqual(outcomes[1].failure, 'timed out after 0.5s')
+        self.assertEqual(outcomes[1].rows, [])
+
+    def test_failing_query_is_reported_and_connection_replaced(self):
+        plan = [PlannedQuery('missing', ('null_check',), "SELECT * FROM missing")] + plan_validation(
+            [{'target_tables': ['orders'], 'tests': [{'type': 'row_count'}]}])
+        outcomes = list(run_concurrently(plan, self.connect, 1))
+        self.assertIn('no such table: missing', outcomes[0].failure)
+        self.assertIsNone(outcomes[1].failure)
+        self.assertEqual(len(self.opened), 2)
+
+    def test_connection_errors_are_reported(self):
+        def connect():
+            raise RuntimeError('database unreachable')
+        plan = plan_validation([{'target_tables': ['orders'], 'tests': [{'type': 'row_count'}]}])
+        outcomes = list(run_concurrently(plan, connect, 4))
+        self.assertEqual(outcomes[0].failure, 'RuntimeError: database unreachable')
+
+    def test_fetchers_read_rows_in_the_worker_thread(self):
+        query = PlannedQuery('orders', ('unique_value_check',), "SELECT id FROM orders")
+        threads = []
+
+        def fetch(cursor):
+            threads.append(threading.current_thread().name)
+            batches = list(iter(lambda: cursor.fetchmany(1), []))
+            return [('unique_value_check', 'orders', len(batches))]
+
+        outcome, = run_concurrently([query], self.connect, 1, fetchers={query: fetch})
+        self.assertIsNone(outcome.failure)
+        self.assertEqual(outcome.rows, [('unique_value_check', 'orders', 2)])
+        self.assertEqual(threads, self.opened)
+
+    def test_requires_a_connection(self):
+        with self.assertRaises(ValueError):
+            list(run_concurrently([], self.connect, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+# Copyright 2024 Sola Richard Olorunfemi
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import tempfile
+import threading
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+from apscheduler.events import EVENT_JOB_ERROR, EVENT_JOB_EXECUTED, EVENT_JOB_MISSED
+from apscheduler.jobstores.memory import MemoryJobStore
+from apscheduler.schedulers.background import BackgroundScheduler
+from Scheduler.src.module_registry import register_function
+from Scheduler.src.result_store import ResultRef, StoredResult, result_store, run_with_results
+from Scheduler.src.warm_pool import WarmProcessPoolExecutor
+
+
+def worker_pid(x):
+    return os.getpid(), x * x
+
+
+def large_result(size):
+    return b'x' * size
+
+
+def failing_task():
+    raise KeyError('missing')
+
+
+# Cannot be pickled by reference, so APScheduler's process pool cannot run it
+double = lambda x: x * 2  # noqa: E731
+
+IMPORTS = """
+from tests.test_warm_pool import worker_pid
+from tests.test_warm_pool import failing_task
+from tests.test_warm_pool import large_result
+from tests.test_warm_pool import double
+"""
+
+
+class TestWarmProcessPoolExecutor(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.import_file = os.path.join(cls.directory.name, 'import_file.py')
+        with open(cls.import_file, 'w') as file:
+            file.write(IMPORTS)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+
+    def setUp(self):
+        self.sched = BackgroundScheduler(
+            jobstores={'default': MemoryJobStore()},
+            executors={'default': WarmProcessPoolExecutor(2, import_file=self.import_file)}, timezone='UTC')
+        self.events = []
+        self.done = threading.Event()
+        self.expected = 1
+
+        def listener(event):
+            self.events.append(event)
+            if len(self.events) >= self.expected:
+                self.done.set()
+
+        self.sched.add_listener(listener, EVENT_JOB_EXECUTED | EVENT_JOB_ERROR | EVENT_JOB_MISSED)
+        self.sched.start()
+
+    def tearDown(self):
+        self.sched.shutdown(wait=True)
+
+    def _run(self, *jobs):
+        self.expected = len(jobs)
+        for job in jobs:
+            self.sched.add_job(**job)
+        self.assertTrue(self.done.wait(30))
+        return {event.job_id: event for event in self.events}
+
+    def test_runs_task_by_registry_name_in_a_worker_process(self):
+        events = self._run({'func': worker_pid, 'args': [3], 'id': 'square', 'name': 'worker_pid'})
+
+        pid, result = events['square'].retval
+        self.assertEqual(result, 9)
+        self.assertNotEqual(pid, os.getpid())
+        self.assertGreaterEqual(events['square'].started_at, events['square'].scheduled_run_time.timestamp())
+        self.assertGreaterEqual(events['square'].duration, 0)
+
+    def test_runs_functions_that_cannot_be_pickled(self):
+        events = self._run({'func': double, 'args': [21], 'id': 'lambda', 'name': 'double'})
+        self.assertEqual(events['lambda'].retval, 42)
+
+    def test_reports_task_errors(self):
+        events = self._run(
+            {'func': failing_task, 'id': 'fails', 'name': 'failing_task'},
+            {'func': worker_pid, 'args': [1], 'id': 'unregistered', 'name': 'not_in_import_file'},
+        )
+
+        self.assertIsInstance(events['fails'].exception, KeyError)
+        self.assertIn('failing_task', events['fails'].traceback)
+        self.assertIsInstance(events['unregistered'].exception, ValueError)
+
+    def test_runtime_registered_functions_fail_without_reaching_a_worker(self):
+        register_function('runtime_only', worker_pid)
+        executor = self.sched._lookup_executor('default')
+        self.assertTrue(executor.can_run('worker_pid'))
+        self.assertFalse(executor.can_run('runtime_only'))
+
+        with patch.object(executor._pool, 'submit') as submit:
+            events = self._run({'func': worker_pid, 'args': [1], 'id': 'runtime', 'name': 'runtime_only'})
+        submit.assert_not_called()
+        self.assertIsInstance(events['runtime'].exception, ValueError)
+        self.assertIn('not registered by the import file', str(events['runtime'].exception))
+
+    def test_resolves_results_and_shares_large_ones_in_the_worker(self):
+        result_store.put('warm_pool_upstream', 5)
+        size = result_store.shared_min_bytes
+        try:
+            events = self._run(
+                {'func': run_with_results, 'args': [worker_pid, ResultRef('warm_pool_upstream')],
+                 'id': 'warm_pool_square', 'name': 'worker_pid'},
+                {'func': large_result, 'args': [size], 'id': 'warm_pool_large', 'name': 'large_result'},
+            )
+
+            self.assertEqual(events['warm_pool_square'].retval[1], 25)
+            self.assertEqual(events['warm_pool_large'].retval, StoredResult('warm_pool_large'))
+            self.assertEqual(len(result_store.get('warm_pool_large')), size)
+        finally:
+            for task in ('warm_pool_upstream', 'warm_pool_large'):
+                result_store.remove(task)
+
+    def test_misfires_are_checked_in_the_worker(self):
+        late = datetime.now(timezone.utc) - timedelta(seconds=10)
+        events = self._run({'func': worker_pid, 'args': [1], 'id': 'late', 'name': 'worker_pid',
+                            'trigger': 'date', 'run_date': late, 'misfire_grace_time': 1})
+        self.assertEqual(events['late'].code, EVENT_JOB_MISSED)
+
+
+if __name__ == '__main__':
+    unittest.main()